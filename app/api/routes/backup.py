@@ -59,7 +59,7 @@ def send_backup_email_manual(
         )
     
     try:
-        success = send_backup_to_user_email(current_user.email)
+        success = send_backup_to_user_email(current_user.email, db=db)
         if success:
             return {
                 "message": f"Backup wysłany na email: {current_user.email}",
@@ -0,0 +1,59 @@
+"""
+Endpointy API wspólne dla rachunków wszystkich mediów.
+"""
+
+import re
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.services.combined.bill_archive import ARCHIVE_MEDIA, collect_archive_entries, stream_archive
+
+router = APIRouter(prefix="/api/bills", tags=["bills"])
+
+PERIOD_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+@router.get("/archive")
+def download_bills_archive(
+    period_from: str = Query(..., alias="from"),
+    period_to: str = Query(..., alias="to"),
+    media: str = ",".join(ARCHIVE_MEDIA),
+    db: Session = Depends(get_db)
+):
+    """
+    Strumieniuje archiwum ZIP z PDF rachunków za zakres okresów.
+    
+    Aktualne pliki są kopiowane z bills/, brakujące lub nieaktualne renderowane
+    w pamięci (równolegle) - eksport niczego nie zapisuje.
+    
+    Args:
+        period_from: Pierwszy okres (YYYY-MM)
+        period_to: Ostatni okres (YYYY-MM, włącznie)
+        media: Lista mediów po przecinku (water, gas, electricity, combined)
+    """
+    if not PERIOD_PATTERN.match(period_from) or not PERIOD_PATTERN.match(period_to):
+        raise HTTPException(status_code=400, detail="Okresy muszą mieć format YYYY-MM")
+    if period_from > period_to:
+        raise HTTPException(status_code=400, detail="Okres 'from' jest późniejszy niż 'to'")
+    
+    selected = [medium.strip() for medium in media.split(",") if medium.strip()]
+    unknown = [medium for medium in selected if medium not in ARCHIVE_MEDIA]
+    if unknown or not selected:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nieznane media: {', '.join(unknown) or '-'} (dostępne: {', '.join(ARCHIVE_MEDIA)})"
+        )
+    
+    # Dane z bazy są zbierane przed odpowiedzią - strumień korzysta już tylko z plików i modeli widoku
+    entries = collect_archive_entries(db, period_from, period_to, selected)
+    if not entries:
+        raise HTTPException(status_code=404, detail=f"Brak rachunków w okresie {period_from} - {period_to}")
+    
+    filename = f"rachunki_{period_from}_{period_to}.zip"
+    return StreamingResponse(
+        stream_archive(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -3,38 +3,49 @@ Endpointy API dla rachunków łączonych (wszystkie media).
 """
 
 from typing import List, Optional
-from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session, joinedload
 
 from app.core.database import get_db
+from app.core.email_outbox import deliver_outbox, retry_failed
+from app.core.pdf_pipeline import render_and_save
+from app.core.pdf_response import pdf_file_response, pdf_preview_response
+from app.core.response_cache import cached_json_response
 from app.models.combined import CombinedBill
 from app.services.combined.manager import CombinedBillingManager
-from app.services.combined.bill_generator import generate_combined_bill_pdf
-from app.services.combined.email_sender import send_combined_bill_email
-from datetime import date
+from app.services.combined.bill_generator import (
+    build_combined_bill_view,
+    build_combined_bill_views,
+    generate_combined_bill_pdf,
+)
+from app.services.combined.email_sender import enqueue_combined_bill_email
+from app.services.combined.period_index import BILL_TABLES, get_bill_period_index
+from app.services.combined.meter_anomalies import MEDIA, get_meter_anomalies, update_meter_anomalies
+from app.services.combined import invoice_validation
 
 router = APIRouter(prefix="/api/combined", tags=["combined"])
 
 
 @router.get("/available-periods")
-def get_available_periods(db: Session = Depends(get_db)):
+def get_available_periods(request: Request, db: Session = Depends(get_db)):
     """
     Zwraca listę dostępnych okresów dwumiesięcznych dla rachunków łączonych.
     Okresy muszą mieć rachunki dla wszystkich trzech mediów (woda, gaz, prąd).
-    """
-    from app.models.water import Bill
-    from app.models.gas import GasBill
-    from app.models.electricity import ElectricityBill
-    
-    # Pobierz wszystkie okresy dla diagnostyki
-    water_periods = {b.data for b in db.query(Bill.data).distinct().all()}
-    gas_periods = {b.data for b in db.query(GasBill.data).distinct().all()}
-    electricity_periods = {b.data for b in db.query(ElectricityBill.data).distinct().all()}
     
-    manager = CombinedBillingManager()
-    periods = manager.get_two_month_periods(db)
+    Odpowiedź jest zapamiętywana do zmiany rachunków mediów lub rachunków łączonych (ETag).
+    """
+    tables = (*BILL_TABLES, CombinedBill.__tablename__)
+    return cached_json_response(request, "combined_available_periods", tables, lambda: _available_periods(db))
+
+
+def _available_periods(db: Session) -> dict:
+    """Buduje listę dostępnych okresów z diagnostyką."""
+    # Okresy rachunków z indeksu w pamięci (przebudowywanego po zapisie rachunków)
+    index = get_bill_period_index(db)
+    water_periods = index.periods('water')
+    gas_periods = index.periods('gas')
+    electricity_periods = index.periods('electricity')
+    periods = index.two_month_periods()
     
     # Pobierz okresy, które już mają wygenerowane rachunki łączone
     existing_periods = db.query(CombinedBill.period_start, CombinedBill.period_end).distinct().all()
@@ -44,18 +55,9 @@ def get_available_periods(db: Session = Depends(get_db)):
     periods_with_bills = [p for p in periods if p in existing_set]
     periods_without_bills = [p for p in periods if p not in existing_set]
     
-    # Sprawdź wszystkie możliwe pary kolejnych miesięcy dla diagnostyki
-    all_periods_sorted = sorted(water_periods | gas_periods | electricity_periods)
-    possible_pairs = []
-    for i in range(len(all_periods_sorted) - 1):
-        period_start = all_periods_sorted[i]
-        period_end = all_periods_sorted[i + 1]
-        from datetime import datetime
-        current = datetime.strptime(period_start, '%Y-%m')
-        next_period = datetime.strptime(period_end, '%Y-%m')
-        months_diff = (next_period.year - current.year) * 12 + (next_period.month - current.month)
-        if months_diff == 1:
-            possible_pairs.append((period_start, period_end))
+    # Wszystkie możliwe pary kolejnych miesięcy dla diagnostyki
+    all_periods_sorted = index.all_periods()
+    possible_pairs = index.consecutive_pairs()
     
     return {
         "available_periods": periods,
@@ -189,30 +191,24 @@ def generate_combined_bills_pdf(
             detail=f"Brak rachunków łączonych dla okresu {period_start} - {period_end}"
         )
     
-    pdf_files = []
+    # Modele widoku budowane tutaj (dane okresu pobierane raz dla wszystkich lokali);
+    # renderowane (równolegle) są tylko rachunki zmienione od ostatniego PDF
+    try:
+        views = build_combined_bill_views(db, bills)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Błąd generowania PDF: {str(e)}")
     
-    for bill in bills:
-        try:
-            # Sprawdź czy plik już istnieje
-            if bill.pdf_path:
-                from pathlib import Path
-                if Path(bill.pdf_path).exists():
-                    pdf_files.append(bill.pdf_path)
-                    continue
-            
-            # Wygeneruj plik PDF
-            pdf_path = generate_combined_bill_pdf(db, bill)
-            
-            # Zaktualizuj ścieżkę w bazie
-            bill.pdf_path = pdf_path
-            db.commit()
-            
-            pdf_files.append(pdf_path)
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Błąd generowania PDF dla rachunku {bill.id}: {str(e)}"
-            )
+    # Ścieżki i skróty zapisywane jednym UPDATE (także gdy część rachunków się nie wygenerowała)
+    rendered, unchanged, errors = render_and_save(db, CombinedBill, views)
+    db.commit()
+    if errors:
+        bill_id, error = next(iter(errors.items()))
+        raise HTTPException(
+            status_code=500,
+            detail=f"Błąd generowania PDF dla rachunku {bill_id}: {error}"
+        )
+    
+    pdf_files = [view['path'] for view in views]
     
     return {
         "message": f"Wygenerowano {len(pdf_files)} plików PDF",
@@ -223,22 +219,27 @@ def generate_combined_bills_pdf(
 
 
 @router.get("/bills/download/{bill_id}")
-def download_combined_bill(bill_id: int, db: Session = Depends(get_db)):
-    """Pobiera plik PDF rachunku łączonego."""
+def download_combined_bill(bill_id: int, request: Request, preview: bool = False, db: Session = Depends(get_db)):
+    """
+    Pobiera plik PDF rachunku łączonego (ETag = pdf_hash, obsługa Range).
+    Z preview=true PDF jest renderowany w pamięci, bez zapisu w bills/.
+    """
     bill = db.query(CombinedBill).options(joinedload(CombinedBill.local_obj)).filter(CombinedBill.id == bill_id).first()
     
     if not bill:
         raise HTTPException(status_code=404, detail="Rachunek nie znaleziony")
     
-    if not bill.pdf_path or not Path(bill.pdf_path).exists():
-        # Wygeneruj plik jeśli nie istnieje
-        try:
-            bill.pdf_path = generate_combined_bill_pdf(db, bill)
-            db.commit()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Nie można wygenerować pliku PDF: {str(e)}")
+    if preview:
+        return pdf_preview_response(request, build_combined_bill_view(db, bill))
+    
+    # Wygeneruj plik, jeśli nie istnieje lub dane rachunku zmieniły się od ostatniego PDF (pdf_hash)
+    try:
+        bill.pdf_path = generate_combined_bill_pdf(db, bill)
+        db.commit()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Nie można wygenerować pliku PDF: {str(e)}")
     
-    return FileResponse(bill.pdf_path, media_type="application/pdf")
+    return pdf_file_response(request, bill.pdf_path, bill.pdf_hash)
 
 
 @router.post("/bills/{bill_id}/send-email")
@@ -261,38 +262,30 @@ def send_combined_bill_email_endpoint(bill_id: int, db: Session = Depends(get_db
             detail=f"Lokal {bill.local} nie ma przypisanego adresu email"
         )
     
-    # Sprawdź czy PDF istnieje
-    if not bill.pdf_path or not Path(bill.pdf_path).exists():
-        # Wygeneruj PDF jeśli nie istnieje
-        try:
-            bill.pdf_path = generate_combined_bill_pdf(db, bill)
-            db.commit()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Nie można wygenerować pliku PDF: {str(e)}")
+    # Wygeneruj PDF, jeśli nie istnieje lub jest nieaktualny (pdf_hash)
+    try:
+        bill.pdf_path = generate_combined_bill_pdf(db, bill)
+        db.commit()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Nie można wygenerować pliku PDF: {str(e)}")
     
-    # Wyślij email
+    # Wyślij email przez kolejkę wiadomości (data wysłania zapisywana przez worker)
     try:
-        success = send_combined_bill_email(
-            recipient_email=bill.local_obj.email,
-            bill=bill,
-            pdf_path=bill.pdf_path
-        )
-        
-        if success:
-            # Zaktualizuj datę wysłania
-            bill.email_sent_date = date.today()
-            db.commit()
-            
-            return {
-                "message": f"Rachunek wysłany na email: {bill.local_obj.email}",
-                "bill_id": bill_id,
-                "email": bill.local_obj.email,
-                "email_sent_date": bill.email_sent_date.isoformat()
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Nie udało się wysłać emaila")
+        entry = enqueue_combined_bill_email(db, bill, bill.local_obj.email)
+        db.commit()
+        result = deliver_outbox(db, ids=[entry.id])[entry.id]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Błąd wysyłania emaila: {str(e)}")
+    
+    if result['status'] != 'sent':
+        raise HTTPException(status_code=500, detail=f"Nie udało się wysłać emaila: {result['last_error']}")
+    
+    return {
+        "message": f"Rachunek wysłany na email: {bill.local_obj.email}",
+        "bill_id": bill_id,
+        "email": bill.local_obj.email,
+        "email_sent_date": bill.email_sent_date.isoformat()
+    }
 
 
 @router.post("/send-emails")
@@ -322,59 +315,54 @@ def send_combined_bills_emails(
     results = []
     errors = []
     
+    # Lokale bez adresu email
+    recipients = [bill for bill in bills if bill.local_obj and bill.local_obj.email]
     for bill in bills:
-        # Sprawdź czy lokal ma email
         if not bill.local_obj or not bill.local_obj.email:
             errors.append({
                 "bill_id": bill.id,
                 "local": bill.local,
                 "error": "Brak adresu email"
             })
+    
+    # PDF generowane tylko dla rachunków nowych lub zmienionych (pdf_hash), w puli procesów
+    try:
+        views = build_combined_bill_views(db, recipients)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Nie można wygenerować PDF: {str(e)}")
+    _, _, pdf_errors = render_and_save(db, CombinedBill, views)
+    db.commit()
+    
+    # Wiadomości trafiają do kolejki i są wysyłane równolegle przez współdzielone połączenia SMTP
+    entries = {}
+    for bill in recipients:
+        if bill.id in pdf_errors:
+            errors.append({
+                "bill_id": bill.id,
+                "local": bill.local,
+                "error": f"Nie można wygenerować PDF: {pdf_errors[bill.id]}"
+            })
             continue
-        
-        # Sprawdź czy PDF istnieje
-        if not bill.pdf_path or not Path(bill.pdf_path).exists():
-            try:
-                bill.pdf_path = generate_combined_bill_pdf(db, bill)
-                db.commit()
-            except Exception as e:
-                errors.append({
-                    "bill_id": bill.id,
-                    "local": bill.local,
-                    "error": f"Nie można wygenerować PDF: {str(e)}"
-                })
-                continue
-        
-        # Wyślij email
-        try:
-            success = send_combined_bill_email(
-                recipient_email=bill.local_obj.email,
-                bill=bill,
-                pdf_path=bill.pdf_path
-            )
-            
-            if success:
-                # Zaktualizuj datę wysłania
-                bill.email_sent_date = date.today()
-                db.commit()
-                
-                results.append({
-                    "bill_id": bill.id,
-                    "local": bill.local,
-                    "email": bill.local_obj.email,
-                    "status": "sent"
-                })
-            else:
-                errors.append({
-                    "bill_id": bill.id,
-                    "local": bill.local,
-                    "error": "Nie udało się wysłać emaila"
-                })
-        except Exception as e:
+        entries[bill.id] = enqueue_combined_bill_email(db, bill, bill.local_obj.email).id
+    db.commit()
+    delivery = deliver_outbox(db, ids=list(entries.values()))
+    
+    for bill in recipients:
+        if bill.id not in entries:
+            continue
+        result = delivery.get(entries[bill.id])
+        if result and result['status'] == 'sent':
+            results.append({
+                "bill_id": bill.id,
+                "local": bill.local,
+                "email": bill.local_obj.email,
+                "status": "sent"
+            })
+        else:
             errors.append({
                 "bill_id": bill.id,
                 "local": bill.local,
-                "error": str(e)
+                "error": result['last_error'] if result else "Nie udało się wysłać emaila"
             })
     
     return {
@@ -386,3 +374,143 @@ def send_combined_bills_emails(
         "errors": errors
     }
 
+
+@router.post("/email-outbox/retry")
+def retry_failed_emails(ids: Optional[List[int]] = Query(None), db: Session = Depends(get_db)):
+    """
+    Ponawia wysyłkę nieudanych wiadomości z kolejki email.
+    
+    Args:
+        ids: ID wiadomości (opcjonalnie - domyślnie wszystkie nieudane)
+    """
+    retried = retry_failed(db, ids)
+    db.commit()
+    delivery = deliver_outbox(db, ids=retried) if retried else {}
+    
+    sent = [entry_id for entry_id, result in delivery.items() if result['status'] == 'sent']
+    return {
+        "message": f"Wysłano {len(sent)} z {len(retried)} ponowionych wiadomości",
+        "retried_count": len(retried),
+        "sent_count": len(sent),
+        "errors": [
+            {"id": entry_id, "error": result['last_error']}
+            for entry_id, result in delivery.items() if result['status'] != 'sent'
+        ]
+    }
+
+
+@router.get("/meter-anomalies")
+def list_meter_anomalies(
+    media: Optional[str] = None,
+    meter: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Zwraca zapisane anomalie odczytów liczników (woda, prąd) - tylko odczyt.
+    Odczyty są przetwarzane przy zapisie i przez POST /meter-anomalies/refresh.
+    
+    Args:
+        media: 'water' lub 'electricity' (opcjonalnie)
+        meter: Klucz licznika, np. 'electricity.dom_I' (opcjonalnie)
+    """
+    if media is not None and media not in MEDIA:
+        raise HTTPException(status_code=400, detail=f"Nieznane medium: {media}. Dostępne: {', '.join(MEDIA)}")
+    
+    anomalies = get_meter_anomalies(db, media, meter)
+    return {
+        "count": len(anomalies),
+        "anomalies": [
+            {
+                "id": anomaly.id,
+                "media": anomaly.media,
+                "meter": anomaly.meter,
+                "data": anomaly.data,
+                "kind": anomaly.kind,
+                "value": anomaly.value,
+                "previous_value": anomaly.previous_value,
+                "delta": anomaly.delta,
+                "median": anomaly.median,
+                "mad": anomaly.mad,
+                "score": anomaly.score
+            }
+            for anomaly in anomalies
+        ]
+    }
+
+
+@router.post("/meter-anomalies/refresh")
+def refresh_meter_anomalies(media: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Przetwarza odczyty jeszcze nieprzetworzone (np. zapisane z pominięciem sesji ORM).
+    
+    Args:
+        media: 'water' lub 'electricity' (opcjonalnie - domyślnie wszystkie media)
+    """
+    if media is not None and media not in MEDIA:
+        raise HTTPException(status_code=400, detail=f"Nieznane medium: {media}. Dostępne: {', '.join(MEDIA)}")
+    stats = update_meter_anomalies(db, media)
+    db.commit()
+    return stats
+
+
+@router.get("/invoice-validation")
+def list_invoice_validation(
+    media: Optional[str] = None,
+    status: Optional[str] = "failed",
+    db: Session = Depends(get_db)
+):
+    """
+    Zwraca zapisane wyniki walidacji faktur (woda, gaz, prąd) - tylko odczyt.
+    Faktury są walidowane przy zapisie (w transakcji zmiany) i przez POST /invoice-validation/refresh.
+    
+    Args:
+        media: 'water', 'gas' lub 'electricity' (opcjonalnie)
+        status: 'failed' (domyślnie), 'ok', 'skipped' lub pusty (wszystkie wyniki)
+    """
+    if media is not None and media not in invoice_validation.MEDIA:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nieznane medium: {media}. Dostępne: {', '.join(invoice_validation.MEDIA)}"
+        )
+    
+    results = invoice_validation.get_validation_results(db, media, status or None)
+    return {
+        "count": len(results),
+        "results": [
+            {
+                "media": result.media,
+                "invoice_id": result.invoice_id,
+                "rule": result.rule,
+                "status": result.status,
+                "severity": result.severity,
+                "expected": result.expected,
+                "actual": result.actual,
+                "message": result.message
+            }
+            for result in results
+        ]
+    }
+
+
+@router.get("/invoice-validation/summary")
+def get_invoice_validation_summary(db: Session = Depends(get_db)):
+    """Podsumowanie walidacji faktur per medium (dla dashboardu) - tylko odczyt."""
+    return invoice_validation.get_validation_summary(db)
+
+
+@router.post("/invoice-validation/refresh")
+def refresh_invoice_validation(media: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Waliduje faktury bez aktualnych wyników (np. sprzed wdrożenia walidacji lub po dodaniu reguły).
+    
+    Args:
+        media: 'water', 'gas' lub 'electricity' (opcjonalnie - domyślnie wszystkie media)
+    """
+    if media is not None and media not in invoice_validation.MEDIA:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nieznane medium: {media}. Dostępne: {', '.join(invoice_validation.MEDIA)}"
+        )
+    stats = invoice_validation.validate_invoices(db, media)
+    db.commit()
+    return {"validated": stats}
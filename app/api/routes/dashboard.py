@@ -0,0 +1,25 @@
+"""
+Endpointy API strony głównej dashboardu.
+"""
+
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.core.response_cache import cached_json_response
+from app.services.combined.dashboard_summary import SUMMARY_TABLES, get_dashboard_summary
+
+router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
+
+
+@router.get("/summary")
+def get_summary(request: Request, db: Session = Depends(get_db)):
+    """
+    Zwraca podsumowanie wszystkich mediów potrzebne do pierwszego wyświetlenia dashboardu.
+    
+    Jedno zapytanie na medium (wykonywane równolegle); odpowiedź jest zapamiętywana
+    do zmiany którejkolwiek z tabel podsumowania (ETag).
+    """
+    return cached_json_response(
+        request, "dashboard_summary", SUMMARY_TABLES, lambda: get_dashboard_summary(db.get_bind())
+    )
@@ -2,16 +2,22 @@
 API endpoints for electricity billing.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body, Request, Response
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import desc, func
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date
 from pathlib import Path
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, field_validator
 
 from app.core.database import get_db
+from app.core.pagination import (
+    Page, keyset_page, keyset_query, model_columns, page_size, paginated, select_fields,
+    split_page
+)
+from app.core.pdf_response import pdf_file_response, pdf_preview_response
+from app.core.response_cache import cached_json_response
+from app.core.response_models import RowModel, row_model
 from app.models.electricity import ElectricityReading, ElectricityBill
 from app.models.electricity_invoice import (
     ElectricityInvoice,
@@ -22,9 +28,17 @@ from app.models.electricity_invoice import (
     ElectricityInvoiceRozliczenieOkres
 )
 from app.models.water import Local
-from app.services.electricity.manager import ElectricityBillingManager
+from app.services.electricity.manager import ElectricityBillingManager, match_blankiet_for_period
 from app.services.electricity.calculator import calculate_all_usage, get_previous_reading
-from app.services.electricity.cost_calculator import calculate_kwh_cost, calculate_kwh_cost_for_blankiet
+from app.services.electricity.cost_calculator import calculate_kwh_cost_for_blankiet, compute_kwh_cost
+from app.services.electricity.cost_model import get_invoice_cost_models
+from app.services.electricity.invoice_index import get_invoice_period_index
+from app.services.electricity.tariff_timeline import sorted_by_date
+from app.services.electricity.invoice_persistence import (
+    insert_invoice_children,
+    normalize_invoice_children,
+    sync_invoice_children
+)
 from app.services.electricity.invoice_reader import (
     extract_text_from_pdf,
     parse_invoice_data,
@@ -51,85 +65,234 @@ class ElectricityReadingCreate(BaseModel):
     local_id: Optional[int] = None
 
 
-@router.get("/readings")
+class InvoiceDetailedListItem(BaseModel):
+    """Pozycja listy szczegółowych faktur prądu (z kosztem 1 kWh)."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    rok: int
+    numer_faktury: str
+    data_wystawienia: Optional[date] = None
+    data_poczatku_okresu: Optional[date] = None
+    data_konca_okresu: Optional[date] = None
+    naleznosc_za_okres: float
+    wynik_rozliczenia: float
+    saldo_z_rozliczenia: float
+    zuzycie_kwh: int
+    ogolem_sprzedaz_energii: float
+    ogolem_usluga_dystrybucji: float
+    grupa_taryfowa: str
+    typ_taryfy: str
+    do_zaplaty: float
+    koszt_1kwh_dzienna: Optional[float] = None
+    koszt_1kwh_nocna: Optional[float] = None
+    koszt_1kwh_calodobowa: Optional[float] = None
+    koszty_kwh_szczegolowe: Dict[str, Dict[str, float]] = {}
+    is_flagged: bool = False
+
+    @field_validator("is_flagged", mode="before")
+    @classmethod
+    def _flag_default(cls, value):
+        return bool(value)
+
+
+class InvoiceDetailedHeader(BaseModel):
+    """Dane główne szczegółowej faktury prądu."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    rok: int
+    numer_faktury: str
+    data_wystawienia: Optional[date] = None
+    data_poczatku_okresu: Optional[date] = None
+    data_konca_okresu: Optional[date] = None
+    naleznosc_za_okres: float
+    wartosc_prognozy: float
+    faktury_korygujace: float
+    odsetki: float
+    wynik_rozliczenia: float
+    kwota_nadplacona: float
+    saldo_z_rozliczenia: float
+    niedoplata_nadplata: float
+    energia_do_akcyzy_kwh: int
+    akcyza: float
+    do_zaplaty: float
+    zuzycie_kwh: int
+    ogolem_sprzedaz_energii: float
+    ogolem_usluga_dystrybucji: float
+    grupa_taryfowa: str
+    typ_taryfy: str
+    energia_lacznie_zuzyta_w_roku_kwh: int
+    is_flagged: bool = False
+
+    @field_validator("is_flagged", mode="before")
+    @classmethod
+    def _flag_default(cls, value):
+        return bool(value)
+
+
+class InvoiceBlankietOut(BaseModel):
+    """Blankiet prognozowy faktury."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    numer_blankietu: str
+    poczatek_podokresu: Optional[date] = None
+    koniec_podokresu: Optional[date] = None
+    ilosc_dzienna_kwh: Optional[int] = None
+    ilosc_nocna_kwh: Optional[int] = None
+    ilosc_calodobowa_kwh: Optional[int] = None
+    kwota_brutto: float
+    akcyza: float
+    energia_do_akcyzy_kwh: int
+    nadplata_niedoplata: float
+    odsetki: float
+    termin_platnosci: Optional[date] = None
+    do_zaplaty: float
+
+
+class InvoiceOdczytOut(BaseModel):
+    """Odczyt licznika z faktury."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    typ_energii: str
+    strefa: Optional[str] = None
+    data_odczytu: Optional[date] = None
+    biezacy_odczyt: int
+    poprzedni_odczyt: int
+    mnozna: int
+    ilosc_kwh: int
+    straty_kwh: int
+    razem_kwh: int
+
+
+class InvoiceSprzedazOut(BaseModel):
+    """Pozycja sprzedaży energii."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    data: Optional[date] = None
+    strefa: Optional[str] = None
+    ilosc_kwh: int
+    cena_za_kwh: float
+    naleznosc: float
+    vat_procent: float
+
+
+class InvoiceOplataOut(BaseModel):
+    """Opłata dystrybucyjna."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    typ_oplaty: str
+    strefa: Optional[str] = None
+    jednostka: str
+    data: Optional[date] = None
+    ilosc_kwh: Optional[int] = None
+    ilosc_miesiecy: Optional[float] = None  # Może być ułamkowa (np. 4,9333)
+    wspolczynnik: Optional[float] = None
+    cena: float
+    naleznosc: float
+    vat_procent: float
+
+    @field_validator("wspolczynnik", mode="before")
+    @classmethod
+    def _empty_factor(cls, value):
+        # Współczynnik 0 jest wyświetlany jako brak współczynnika
+        return value if value else None
+
+
+class InvoiceRozliczenieOkresOut(BaseModel):
+    """Okres rozliczenia faktury."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    data_okresu: Optional[date] = None
+    numer_okresu: int
+
+
+class InvoiceDetailedResponse(BaseModel):
+    """Szczegółowa faktura prądu ze wszystkimi pozycjami."""
+    invoice: InvoiceDetailedHeader
+    blankiety: List[InvoiceBlankietOut]
+    odczyty: List[InvoiceOdczytOut]
+    sprzedaz_energii: List[InvoiceSprzedazOut]
+    oplaty_dystrybucyjne: List[InvoiceOplataOut]
+    rozliczenie_okresy: List[InvoiceRozliczenieOkresOut]
+
+
+def _by_id(rows):
+    """Wiersze podrzędne w kolejności zapisu (selectinload nie gwarantuje kolejności)."""
+    return sorted(rows, key=lambda row: row.id)
+
+
+# Pola listy odczytów (nazwy oczekiwane przez dashboard) i kolumny, z których pochodzą
+READING_LIST_COLUMNS = {
+    "id": ElectricityReading.id,
+    "data": ElectricityReading.data,
+    "data_odczytu_licznika": ElectricityReading.data_odczytu_licznika,
+    "is_main_meter_single_tariff": ElectricityReading.licznik_dom_jednotaryfowy,
+    "main_reading": ElectricityReading.odczyt_dom,
+    "main_reading_t1": ElectricityReading.odczyt_dom_I,
+    "main_reading_t2": ElectricityReading.odczyt_dom_II,
+    "is_dol_meter_single_tariff": ElectricityReading.licznik_dol_jednotaryfowy,
+    "dol_reading": ElectricityReading.odczyt_dol,
+    "dol_reading_t1": ElectricityReading.odczyt_dol_I,
+    "dol_reading_t2": ElectricityReading.odczyt_dol_II,
+    "gabinet_reading": ElectricityReading.odczyt_gabinet,
+    "is_flagged": ElectricityReading.is_flagged,
+}
+
+
+def _safe_float(value, default=None):
+    """Bezpieczna konwersja wartości odczytu na float."""
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+class ReadingListRow(RowModel):
+    """Wiersz listy odczytów: flagi liczników jako bool, odczyty jako float (None dla nieprawidłowych)."""
+
+    @field_validator("is_main_meter_single_tariff", "is_dol_meter_single_tariff", "is_flagged",
+                     mode="before", check_fields=False)
+    @classmethod
+    def _as_bool(cls, value):
+        return bool(value)
+
+    @field_validator("main_reading", "main_reading_t1", "main_reading_t2", "dol_reading", "dol_reading_t1",
+                     "dol_reading_t2", mode="before", check_fields=False)
+    @classmethod
+    def _as_float(cls, value):
+        return _safe_float(value)
+
+    @field_validator("gabinet_reading", mode="before", check_fields=False)
+    @classmethod
+    def _gabinet_as_float(cls, value):
+        return _safe_float(value, 0.0)
+
+
+# Modele odpowiedzi list (pola z kolumn listy, walidacja i serializacja w pydantic-core)
+ElectricityReadingListItem = row_model("ElectricityReadingListItem", READING_LIST_COLUMNS, base=ReadingListRow)
+ElectricityInvoiceListItem = row_model("ElectricityInvoiceListItem", model_columns(ElectricityInvoice))
+
+
+@router.get("/readings", response_model=List[ElectricityReadingListItem], response_model_exclude_unset=True)
 def get_readings(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Gets list of electricity meter readings."""
-    readings = db.query(ElectricityReading).order_by(desc(ElectricityReading.data)).offset(skip).limit(limit).all()
-    
-    # Map field names from database to format expected by dashboard
-    result = []
-    for r in readings:
-        # Safe value conversion
-        main_reading = None
-        if r.odczyt_dom is not None:
-            try:
-                main_reading = float(r.odczyt_dom)
-            except (ValueError, TypeError):
-                main_reading = None
-        
-        main_reading_t1 = None
-        if r.odczyt_dom_I is not None:
-            try:
-                main_reading_t1 = float(r.odczyt_dom_I)
-            except (ValueError, TypeError):
-                main_reading_t1 = None
-        
-        main_reading_t2 = None
-        if r.odczyt_dom_II is not None:
-            try:
-                main_reading_t2 = float(r.odczyt_dom_II)
-            except (ValueError, TypeError):
-                main_reading_t2 = None
-        
-        dol_reading = None
-        if r.odczyt_dol is not None:
-            try:
-                dol_reading = float(r.odczyt_dol)
-            except (ValueError, TypeError):
-                dol_reading = None
-        
-        dol_reading_t1 = None
-        if r.odczyt_dol_I is not None:
-            try:
-                dol_reading_t1 = float(r.odczyt_dol_I)
-            except (ValueError, TypeError):
-                dol_reading_t1 = None
-        
-        dol_reading_t2 = None
-        if r.odczyt_dol_II is not None:
-            try:
-                dol_reading_t2 = float(r.odczyt_dol_II)
-            except (ValueError, TypeError):
-                dol_reading_t2 = None
-        
-        gabinet_reading = 0.0
-        if r.odczyt_gabinet is not None:
-            try:
-                gabinet_reading = float(r.odczyt_gabinet)
-            except (ValueError, TypeError):
-                gabinet_reading = 0.0
-        
-        result.append({
-            "id": r.id,
-            "data": r.data,
-            "data_odczytu_licznika": r.data_odczytu_licznika.isoformat() if r.data_odczytu_licznika else None,
-            "is_main_meter_single_tariff": bool(r.licznik_dom_jednotaryfowy),
-            "main_reading": main_reading,
-            "main_reading_t1": main_reading_t1,
-            "main_reading_t2": main_reading_t2,
-            "is_dol_meter_single_tariff": bool(r.licznik_dol_jednotaryfowy),
-            "dol_reading": dol_reading,
-            "dol_reading_t1": dol_reading_t1,
-            "dol_reading_t2": dol_reading_t2,
-            "gabinet_reading": gabinet_reading,
-            "is_flagged": bool(r.is_flagged) if hasattr(r, 'is_flagged') else False
-        })
-    
-    return result
+    """Gets electricity meter readings (newest first); with limit= or cursor= one page, next page cursor in X-Next-Cursor header."""
+    columns = select_fields(READING_LIST_COLUMNS, fields)
+    page = keyset_page(db, columns, (ElectricityReading.data, ElectricityReading.id), cursor, limit)
+    return paginated(response, page)
 
 
 @router.get("/readings/{data}/usage")
@@ -436,15 +599,18 @@ def create_reading(
     return reading
 
 
-@router.get("/invoices")
+@router.get("/invoices", response_model=List[ElectricityInvoiceListItem], response_model_exclude_unset=True)
 def get_invoices(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Gets list of electricity invoices."""
-    invoices = db.query(ElectricityInvoice).offset(skip).limit(limit).all()
-    return invoices
+    """Gets electricity invoices (newest period first); with limit= or cursor= one page, next page cursor in X-Next-Cursor header."""
+    columns = select_fields(model_columns(ElectricityInvoice), fields)
+    keys = (ElectricityInvoice.data_poczatku_okresu, ElectricityInvoice.id)
+    return paginated(response, keyset_page(db, columns, keys, cursor, limit))
 
 
 @router.get("/invoices/{data}")
@@ -632,78 +798,124 @@ def verify_and_save_invoice(
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.get("/bills/")
+# Pola listy rachunków pochodzące z kolumn rachunku
+BILL_LIST_COLUMNS = {
+    name: getattr(ElectricityBill, name)
+    for name in (
+        "id", "data", "local", "reading_id", "invoice_id", "local_id", "usage_kwh", "usage_kwh_dzienna",
+        "usage_kwh_nocna", "energy_cost_gross", "distribution_cost_gross", "total_net_sum", "total_gross_sum",
+        "pdf_path"
+    )
+}
+# Pola listy rachunków wyliczane z faktury i blankietu (obecne tylko dla rachunków z fakturą)
+BILL_INVOICE_FIELDS = (
+    "koszt_1kwh_dzienna", "koszt_1kwh_nocna", "koszt_1kwh_calodobowa", "numer_faktury",
+    "okres_rozliczeniowy", "blankiet_numer", "blankiet_poczatek", "blankiet_koniec"
+)
+
+
+# Kolumny faktury potrzebne do pól wyliczanych (dołączane do zapytania o rachunki)
+BILL_INVOICE_COLUMNS = {
+    "_data": ElectricityBill.data,
+    "_invoice_id": ElectricityInvoice.id,
+    "_typ_taryfy": ElectricityInvoice.typ_taryfy,
+    "_numer_faktury": ElectricityInvoice.numer_faktury,
+    "_data_poczatku_okresu": ElectricityInvoice.data_poczatku_okresu,
+    "_data_konca_okresu": ElectricityInvoice.data_konca_okresu,
+}
+
+
+def _bill_invoice_fields(row: Dict[str, Any], cost_model, blankiety) -> Dict[str, Any]:
+    """Koszt 1 kWh, numer faktury, okres rozliczeniowy i blankiet dla rachunku (wiersz z BILL_INVOICE_COLUMNS)."""
+    fields = {}
+    koszty_kwh = cost_model.zone_costs if cost_model else {}
+    blankiet = match_blankiet_for_period(blankiety, row["_data"])
+    
+    if row["_typ_taryfy"] == "DWUTARYFOWA":
+        fields["koszt_1kwh_dzienna"] = round(koszty_kwh.get("DZIENNA", {}).get("suma", 0), 4) if "DZIENNA" in koszty_kwh else None
+        fields["koszt_1kwh_nocna"] = round(koszty_kwh.get("NOCNA", {}).get("suma", 0), 4) if "NOCNA" in koszty_kwh else None
+        fields["koszt_1kwh_calodobowa"] = None
+    elif row["_typ_taryfy"] == "CAŁODOBOWA":
+        fields["koszt_1kwh_dzienna"] = None
+        fields["koszt_1kwh_nocna"] = None
+        fields["koszt_1kwh_calodobowa"] = round(koszty_kwh.get("CAŁODOBOWA", {}).get("suma", 0), 4) if "CAŁODOBOWA" in koszty_kwh else None
+    
+    # Add invoice and blankiet information
+    fields["numer_faktury"] = row["_numer_faktury"]
+    # Billing period as invoice start and end dates
+    if row["_data_poczatku_okresu"] and row["_data_konca_okresu"]:
+        fields["okres_rozliczeniowy"] = f"{row['_data_poczatku_okresu'].strftime('%d.%m.%Y')} - {row['_data_konca_okresu'].strftime('%d.%m.%Y')}"
+    else:
+        fields["okres_rozliczeniowy"] = row["_data"]
+    if blankiet:
+        fields["blankiet_numer"] = blankiet.numer_blankietu
+        fields["blankiet_poczatek"] = blankiet.poczatek_podokresu
+        fields["blankiet_koniec"] = blankiet.koniec_podokresu
+    return fields
+
+
+ElectricityBillListItem = row_model(
+    "ElectricityBillListItem", BILL_LIST_COLUMNS,
+    koszt_1kwh_dzienna=float, koszt_1kwh_nocna=float, koszt_1kwh_calodobowa=float, numer_faktury=str,
+    okres_rozliczeniowy=str, blankiet_numer=str, blankiet_poczatek=date, blankiet_koniec=date
+)
+
+
+@router.get("/bills/", response_model=List[ElectricityBillListItem], response_model_exclude_unset=True)
 def get_bills(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
     data: Optional[str] = None,
     local: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Pobiera listę rachunków za prąd z kosztem 1 kWh."""
-    query = db.query(ElectricityBill)
+    """
+    Pobiera rachunki za prąd (od najnowszych) z kosztem 1 kWh.
     
+    Z limit= lub cursor= zwracana jest strona, a kursor następnej strony jest w nagłówku X-Next-Cursor. Liczba zapytań nie zależy
+    od liczby rachunków: rachunki z kolumnami faktur (JOIN, tylko wybrane kolumny),
+    blankiety faktur ze strony (IN) i modele kosztów dla różnych faktur (z cache).
+    Bez pól z faktury w fields= wykonywane jest tylko zapytanie o rachunki.
+    """
+    selected = select_fields({**BILL_LIST_COLUMNS, **dict.fromkeys(BILL_INVOICE_FIELDS)}, fields)
+    columns = {name: column for name, column in selected.items() if column is not None}
+    invoice_fields = [name for name, column in selected.items() if column is None]
+    outerjoins = []
+    if invoice_fields:
+        columns.update(BILL_INVOICE_COLUMNS)
+        outerjoins.append((ElectricityInvoice, ElectricityBill.invoice_id == ElectricityInvoice.id))
+    
+    filters = []
     if data:
-        query = query.filter(ElectricityBill.data == data)
+        filters.append(ElectricityBill.data == data)
     if local:
-        query = query.filter(ElectricityBill.local == local)
-    
-    bills = query.offset(skip).limit(limit).all()
+        filters.append(ElectricityBill.local == local)
+    
+    page = keyset_page(db, columns, (ElectricityBill.data, ElectricityBill.id), cursor, limit, filters, outerjoins)
+    items = paginated(response, page)
+    if not invoice_fields:
+        return items
+    
+    # Blankiety i modele kosztów dla wszystkich faktur ze strony naraz
+    invoice_ids = {item["_invoice_id"] for item in items if item["_invoice_id"] is not None}
+    blankiety_by_invoice: Dict[int, List[ElectricityInvoiceBlankiet]] = {}
+    if invoice_ids:
+        blankiety = db.query(ElectricityInvoiceBlankiet).filter(
+            ElectricityInvoiceBlankiet.invoice_id.in_(invoice_ids)
+        ).order_by(ElectricityInvoiceBlankiet.id).all()
+        for blankiet in blankiety:
+            blankiety_by_invoice.setdefault(blankiet.invoice_id, []).append(blankiet)
+    cost_models = get_invoice_cost_models(db, invoice_ids)
     
-    # Dodaj koszt 1 kWh dla każdego rachunku
     result = []
-    for bill in bills:
-        bill_dict = {
-            "id": bill.id,
-            "data": bill.data,
-            "local": bill.local,
-            "reading_id": bill.reading_id,
-            "invoice_id": bill.invoice_id,
-            "local_id": bill.local_id,
-            "usage_kwh": bill.usage_kwh,
-            "usage_kwh_dzienna": bill.usage_kwh_dzienna,
-            "usage_kwh_nocna": bill.usage_kwh_nocna,
-            "energy_cost_gross": bill.energy_cost_gross,
-            "distribution_cost_gross": bill.distribution_cost_gross,
-            "total_net_sum": bill.total_net_sum,
-            "total_gross_sum": bill.total_gross_sum,
-            "pdf_path": bill.pdf_path,
-        }
-        
-        # Oblicz koszt 1 kWh dla faktury
-        if bill.invoice_id:
-            koszty_kwh = calculate_kwh_cost(bill.invoice_id, db)
-            
-            # Find blankiet for bill period
-            from app.services.electricity.manager import ElectricityBillingManager
-            manager = ElectricityBillingManager()
-            blankiet = manager.find_blankiet_for_period(db, bill.invoice_id, bill.data)
-            
-            # Get invoice to check tariff type
-            invoice = db.query(ElectricityInvoice).filter(ElectricityInvoice.id == bill.invoice_id).first()
-            
-            if invoice:
-                if invoice.typ_taryfy == "DWUTARYFOWA":
-                    bill_dict["koszt_1kwh_dzienna"] = round(koszty_kwh.get("DZIENNA", {}).get("suma", 0), 4) if "DZIENNA" in koszty_kwh else None
-                    bill_dict["koszt_1kwh_nocna"] = round(koszty_kwh.get("NOCNA", {}).get("suma", 0), 4) if "NOCNA" in koszty_kwh else None
-                    bill_dict["koszt_1kwh_calodobowa"] = None
-                elif invoice.typ_taryfy == "CAŁODOBOWA":
-                    bill_dict["koszt_1kwh_dzienna"] = None
-                    bill_dict["koszt_1kwh_nocna"] = None
-                    bill_dict["koszt_1kwh_calodobowa"] = round(koszty_kwh.get("CAŁODOBOWA", {}).get("suma", 0), 4) if "CAŁODOBOWA" in koszty_kwh else None
-                
-                # Add invoice and blankiet information
-                bill_dict["numer_faktury"] = invoice.numer_faktury
-                # Billing period as invoice start and end dates
-                if invoice.data_poczatku_okresu and invoice.data_konca_okresu:
-                    bill_dict["okres_rozliczeniowy"] = f"{invoice.data_poczatku_okresu.strftime('%d.%m.%Y')} - {invoice.data_konca_okresu.strftime('%d.%m.%Y')}"
-                else:
-                    bill_dict["okres_rozliczeniowy"] = bill.data
-                if blankiet:
-                    bill_dict["blankiet_numer"] = blankiet.numer_blankietu
-                    bill_dict["blankiet_poczatek"] = blankiet.poczatek_podokresu.isoformat() if blankiet.poczatek_podokresu else None
-                    bill_dict["blankiet_koniec"] = blankiet.koniec_podokresu.isoformat() if blankiet.koniec_podokresu else None
-        
+    for item in items:
+        bill_dict = {name: value for name, value in item.items() if name not in BILL_INVOICE_COLUMNS}
+        invoice_id = item["_invoice_id"]
+        if invoice_id is not None:
+            details = _bill_invoice_fields(item, cost_models.get(invoice_id), blankiety_by_invoice.get(invoice_id, []))
+            bill_dict.update((name, details[name]) for name in invoice_fields if name in details)
         result.append(bill_dict)
     
     return result
@@ -776,6 +988,38 @@ def regenerate_bills(period: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/bills/generate-all")
+def generate_all_bills(db: Session = Depends(get_db)):
+    """
+    Generuje rachunki dla wszystkich okresów z odczytami i fakturą.
+    Istniejące rachunki są aktualizowane, brakujące - dodawane (jeden zapis zbiorczy).
+    """
+    manager = ElectricityBillingManager()
+    result = manager.generate_all_bills(db)
+    return {
+        "message": f"Wygenerowano {result['bills_count']} rachunków dla {len(result['periods_processed'])} okresów",
+        **result
+    }
+
+
+@router.post("/bills/regenerate-range")
+def regenerate_bills_range(start: str, end: str, db: Session = Depends(get_db)):
+    """Regeneruje rachunki prądu dla okresów od start do end (YYYY-MM, włącznie)."""
+    manager = ElectricityBillingManager()
+    
+    try:
+        result = manager.regenerate_bills_range(db, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "message": "Rachunki prądu zregenerowane",
+        "start": start,
+        "end": end,
+        **result
+    }
+
+
 @router.get("/bills/{bill_id}")
 def get_bill(bill_id: int, db: Session = Depends(get_db)):
     """Pobiera rachunek po ID."""
@@ -876,24 +1120,34 @@ def generate_bill_pdf_endpoint(bill_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/bills/download/{bill_id}")
-def download_bill(bill_id: int, db: Session = Depends(get_db)):
-    """Pobiera plik PDF rachunku prądu. Generuje PDF jeśli nie istnieje."""
+def download_bill(bill_id: int, request: Request, preview: bool = False, db: Session = Depends(get_db)):
+    """
+    Pobiera plik PDF rachunku prądu (ETag = pdf_hash, obsługa Range). Generuje PDF jeśli nie istnieje.
+    Z preview=true PDF jest renderowany w pamięci, bez zapisu w bills/.
+    """
     bill = db.query(ElectricityBill).filter(ElectricityBill.id == bill_id).first()
     
     if not bill:
         raise HTTPException(status_code=404, detail="Rachunek nie znaleziony")
     
-    # Jeśli plik PDF nie istnieje, wygeneruj go
-    if not bill.pdf_path or not Path(bill.pdf_path).exists():
+    if preview:
+        from app.services.electricity.bill_generator import build_bill_views
         try:
-            from app.services.electricity.bill_generator import generate_bill_pdf
-            pdf_path = generate_bill_pdf(db, bill)
-            bill.pdf_path = pdf_path
-            db.commit()
-        except Exception as e:
+            view = build_bill_views(db, [bill])[0]
+        except ValueError as e:
             raise HTTPException(status_code=500, detail=f"Nie można wygenerować pliku PDF: {str(e)}")
+        return pdf_preview_response(request, view)
     
-    return FileResponse(bill.pdf_path, media_type="application/pdf")
+    # Wygeneruj PDF, jeśli nie istnieje lub dane rachunku zmieniły się od ostatniego pliku (pdf_hash)
+    try:
+        from app.services.electricity.bill_generator import generate_bill_pdf
+        pdf_path = generate_bill_pdf(db, bill)
+        bill.pdf_path = pdf_path
+        db.commit()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Nie można wygenerować pliku PDF: {str(e)}")
+    
+    return pdf_file_response(request, bill.pdf_path, bill.pdf_hash)
 
 
 @router.delete("/bills/{bill_id}")
@@ -955,9 +1209,18 @@ def delete_all_bills(db: Session = Depends(get_db)):
     }
 
 
+# Tabele, z których budowane są statystyki i lista dostępnych okresów
+PERIOD_TABLES = ("electricity_readings", "electricity_invoices", "electricity_bills")
+
+
 @router.get("/stats")
-def get_electricity_stats(db: Session = Depends(get_db)):
-    """Returns statistics for electricity dashboard."""
+def get_electricity_stats(request: Request, db: Session = Depends(get_db)):
+    """Returns statistics for electricity dashboard (cached until one of PERIOD_TABLES changes; ETag)."""
+    return cached_json_response(request, "electricity_stats", PERIOD_TABLES, lambda: _electricity_stats(db))
+
+
+def _electricity_stats(db: Session) -> Dict[str, Any]:
+    """Builds statistics for electricity dashboard."""
     stats = {
         "readings_count": db.query(ElectricityReading).count(),
         "invoices_count": db.query(ElectricityInvoice).count(),
@@ -985,60 +1248,28 @@ def get_electricity_stats(db: Session = Depends(get_db)):
 
 
 @router.get("/available-periods")
-def get_available_periods(db: Session = Depends(get_db)):
+def get_available_periods(request: Request, db: Session = Depends(get_db)):
     """
     Returns periods available for bill generation (having both invoices and readings).
+    Cached until one of PERIOD_TABLES changes (ETag).
     """
-    from datetime import datetime, date
-    
+    return cached_json_response(
+        request, "electricity_available_periods", PERIOD_TABLES, lambda: _available_periods(db)
+    )
+
+
+def _available_periods(db: Session) -> Dict[str, Any]:
+    """Builds periods available for bill generation with diagnostics."""
     # Get periods from readings
-    reading_periods = set()
     readings = db.query(ElectricityReading.data).distinct().all()
-    for r in readings:
-        reading_periods.add(r.data)
+    reading_periods = {r.data for r in readings}
     
-    # Get all months from invoice periods and check if they have readings
-    available_periods = set()
-    invoices = db.query(ElectricityInvoice).all()
-    
-    for invoice in invoices:
-        # For each month in invoice period
-        start = invoice.data_poczatku_okresu
-        end = invoice.data_konca_okresu
-        
-        # Ensure start is the first day of the month
-        period_start = start.replace(day=1) if start.day != 1 else start
-        
-        # Iterate through all months in invoice period
-        current = period_start
-        while current <= end:
-            period_str = current.strftime('%Y-%m')
-            
-            # Check if there is a reading for this period
-            if period_str in reading_periods:
-                available_periods.add(period_str)
-            
-            # Move to next month
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1, day=1)
-            else:
-                current = current.replace(month=current.month + 1, day=1)
+    # Months covered by invoices come from the interval index (rebuilt only on invoice writes)
+    invoice_index = get_invoice_period_index(db)
+    all_invoice_periods = set(invoice_index.covered_months())
     
     # Available periods are those that have both readings and invoices
-    available = sorted(available_periods, reverse=True)
-    
-    # Get all periods from invoices (for debugging)
-    all_invoice_periods = set()
-    for invoice in invoices:
-        start = invoice.data_poczatku_okresu.replace(day=1) if invoice.data_poczatku_okresu.day != 1 else invoice.data_poczatku_okresu
-        end = invoice.data_konca_okresu
-        current = start
-        while current <= end:
-            all_invoice_periods.add(current.strftime('%Y-%m'))
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1, day=1)
-            else:
-                current = current.replace(month=current.month + 1, day=1)
+    available = sorted(all_invoice_periods & reading_periods, reverse=True)
     
     # Periods from invoices but without readings (for diagnostics)
     periods_without_readings = sorted(all_invoice_periods - reading_periods, reverse=True)
@@ -1059,7 +1290,7 @@ def get_available_periods(db: Session = Depends(get_db)):
         "all_invoice_periods": sorted(all_invoice_periods, reverse=True),
         "periods_without_readings": periods_without_readings,
         "diagnostics": {
-            "total_invoices": len(invoices),
+            "total_invoices": invoice_index.invoice_count,
             "total_readings": len(readings),
             "available_count": len(available),
             "available_without_bills_count": len(available_without_bills),
@@ -1073,38 +1304,43 @@ def get_available_periods(db: Session = Depends(get_db)):
 # NOWE ENDPOINTY DLA SZCZEGÓŁOWYCH FAKTUR (zgodnie ze schematem)
 # ============================================================================
 
-@router.get("/invoices-detailed/")
+@router.get("/invoices-detailed/", response_model=List[InvoiceDetailedListItem])
 def get_invoices_detailed(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
     rok: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    """Pobiera listę szczegółowych faktur prądu."""
-    query = db.query(ElectricityInvoice)
+    """
+    Pobiera szczegółowe faktury prądu (od najnowszego okresu).
+    
+    Z limit= lub cursor= zwracana jest strona, a kursor następnej strony jest w nagłówku X-Next-Cursor. Sprzedaż energii i opłaty
+    dystrybucyjne są wczytywane razem z fakturami (selectinload), więc koszt 1 kWh
+    liczony jest bez dodatkowych zapytań - 3 zapytania niezależnie od liczby faktur.
+    """
+    query = db.query(ElectricityInvoice).options(
+        selectinload(ElectricityInvoice.sprzedaz_energii),
+        selectinload(ElectricityInvoice.oplaty_dystrybucyjne)
+    )
     
     if rok:
         query = query.filter(ElectricityInvoice.rok == rok)
     
-    invoices = query.order_by(desc(ElectricityInvoice.rok), desc(ElectricityInvoice.data_poczatku_okresu)).offset(skip).limit(limit).all()
+    limit = page_size(limit, cursor)
+    keys = (ElectricityInvoice.data_poczatku_okresu, ElectricityInvoice.id)
+    invoices, next_cursor = split_page(
+        keyset_query(query, keys, cursor, limit).all(), limit,
+        lambda invoice: (invoice.data_poczatku_okresu, invoice.id)
+    )
     
     result = []
     for inv in invoices:
-        # Oblicz koszt 1 kWh dla tej faktury
-        koszty_kwh = calculate_kwh_cost(inv.id, db)
-        
-        # Określ główny koszt (dzienna dla dwutaryfowej, całodobowa dla całodobowej)
-        glowny_koszt = None
-        if inv.typ_taryfy == "DWUTARYFOWA":
-            if "DZIENNA" in koszty_kwh:
-                glowny_koszt = koszty_kwh["DZIENNA"]["suma"]
-        elif inv.typ_taryfy == "CAŁODOBOWA":
-            if "CAŁODOBOWA" in koszty_kwh:
-                glowny_koszt = koszty_kwh["CAŁODOBOWA"]["suma"]
-        
-        # Jeśli nie ma głównego kosztu, użyj pierwszej dostępnej strefy
-        if glowny_koszt is None and koszty_kwh:
-            glowny_koszt = list(koszty_kwh.values())[0]["suma"]
+        # Oblicz koszt 1 kWh dla tej faktury z wczytanych pozycji
+        koszty_kwh = compute_kwh_cost(
+            sorted_by_date(inv.sprzedaz_energii),
+            sorted_by_date(inv.oplaty_dystrybucyjne)
+        )
         
         # Przygotuj koszty dla wyświetlenia
         koszt_dzienna = None
@@ -1118,157 +1354,41 @@ def get_invoices_detailed(
         if "CAŁODOBOWA" in koszty_kwh:
             koszt_calodobowa = round(koszty_kwh["CAŁODOBOWA"]["suma"], 4)
         
-        result.append({
-            "id": inv.id,
-            "rok": inv.rok,
-            "numer_faktury": inv.numer_faktury,
-            "data_wystawienia": inv.data_wystawienia.isoformat() if inv.data_wystawienia else None,
-            "data_poczatku_okresu": inv.data_poczatku_okresu.isoformat() if inv.data_poczatku_okresu else None,
-            "data_konca_okresu": inv.data_konca_okresu.isoformat() if inv.data_konca_okresu else None,
-            "naleznosc_za_okres": float(inv.naleznosc_za_okres),
-            "wynik_rozliczenia": float(inv.wynik_rozliczenia),
-            "saldo_z_rozliczenia": float(inv.saldo_z_rozliczenia),
-            "zuzycie_kwh": inv.zuzycie_kwh,
-            "ogolem_sprzedaz_energii": float(inv.ogolem_sprzedaz_energii),
-            "ogolem_usluga_dystrybucji": float(inv.ogolem_usluga_dystrybucji),
-            "grupa_taryfowa": inv.grupa_taryfowa,
-            "typ_taryfy": inv.typ_taryfy,
-            "do_zaplaty": float(inv.do_zaplaty),
-            "koszt_1kwh_dzienna": koszt_dzienna,
-            "koszt_1kwh_nocna": koszt_nocna,
-            "koszt_1kwh_calodobowa": koszt_calodobowa,
-            "koszty_kwh_szczegolowe": koszty_kwh,
-            "is_flagged": bool(inv.is_flagged) if hasattr(inv, 'is_flagged') else False,
-        })
+        item = InvoiceDetailedListItem.model_validate(inv)
+        item.koszt_1kwh_dzienna = koszt_dzienna
+        item.koszt_1kwh_nocna = koszt_nocna
+        item.koszt_1kwh_calodobowa = koszt_calodobowa
+        item.koszty_kwh_szczegolowe = koszty_kwh
+        result.append(item)
     
-    return result
+    return paginated(response, Page(result, next_cursor))
 
 
-@router.get("/invoices-detailed/{invoice_id}")
+@router.get("/invoices-detailed/{invoice_id}", response_model=InvoiceDetailedResponse)
 def get_invoice_detailed(
     invoice_id: int,
     db: Session = Depends(get_db)
 ):
-    """Pobiera szczegółową fakturę z wszystkimi danymi."""
-    invoice = db.query(ElectricityInvoice).filter(ElectricityInvoice.id == invoice_id).first()
+    """Pobiera szczegółową fakturę z wszystkimi danymi (faktura + po jednym selectinload na tabelę)."""
+    invoice = db.query(ElectricityInvoice).options(
+        selectinload(ElectricityInvoice.blankiety),
+        selectinload(ElectricityInvoice.odczyty),
+        selectinload(ElectricityInvoice.sprzedaz_energii),
+        selectinload(ElectricityInvoice.oplaty_dystrybucyjne),
+        selectinload(ElectricityInvoice.rozliczenie_okresy)
+    ).filter(ElectricityInvoice.id == invoice_id).first()
     
     if not invoice:
         raise HTTPException(status_code=404, detail=f"Faktura o ID {invoice_id} nie istnieje")
     
-    # Get all related data
-    blankiety = db.query(ElectricityInvoiceBlankiet).filter(
-        ElectricityInvoiceBlankiet.invoice_id == invoice_id
-    ).all()
-    
-    odczyty = db.query(ElectricityInvoiceOdczyt).filter(
-        ElectricityInvoiceOdczyt.invoice_id == invoice_id
-    ).all()
-    
-    sprzedaz = db.query(ElectricityInvoiceSprzedazEnergii).filter(
-        ElectricityInvoiceSprzedazEnergii.invoice_id == invoice_id
-    ).all()
-    
-    oplaty = db.query(ElectricityInvoiceOplataDystrybucyjna).filter(
-        ElectricityInvoiceOplataDystrybucyjna.invoice_id == invoice_id
-    ).all()
-    
-    okresy = db.query(ElectricityInvoiceRozliczenieOkres).filter(
-        ElectricityInvoiceRozliczenieOkres.invoice_id == invoice_id
-    ).all()
-    
-    return {
-        "invoice": {
-            "id": invoice.id,
-            "rok": invoice.rok,
-            "numer_faktury": invoice.numer_faktury,
-            "data_wystawienia": invoice.data_wystawienia.isoformat() if invoice.data_wystawienia else None,
-            "data_poczatku_okresu": invoice.data_poczatku_okresu.isoformat() if invoice.data_poczatku_okresu else None,
-            "data_konca_okresu": invoice.data_konca_okresu.isoformat() if invoice.data_konca_okresu else None,
-            "naleznosc_za_okres": float(invoice.naleznosc_za_okres),
-            "wartosc_prognozy": float(invoice.wartosc_prognozy),
-            "faktury_korygujace": float(invoice.faktury_korygujace),
-            "odsetki": float(invoice.odsetki),
-            "wynik_rozliczenia": float(invoice.wynik_rozliczenia),
-            "kwota_nadplacona": float(invoice.kwota_nadplacona),
-            "saldo_z_rozliczenia": float(invoice.saldo_z_rozliczenia),
-            "niedoplata_nadplata": float(invoice.niedoplata_nadplata),
-            "energia_do_akcyzy_kwh": invoice.energia_do_akcyzy_kwh,
-            "akcyza": float(invoice.akcyza),
-            "do_zaplaty": float(invoice.do_zaplaty),
-            "zuzycie_kwh": invoice.zuzycie_kwh,
-            "ogolem_sprzedaz_energii": float(invoice.ogolem_sprzedaz_energii),
-            "ogolem_usluga_dystrybucji": float(invoice.ogolem_usluga_dystrybucji),
-            "grupa_taryfowa": invoice.grupa_taryfowa,
-            "typ_taryfy": invoice.typ_taryfy,
-            "energia_lacznie_zuzyta_w_roku_kwh": invoice.energia_lacznie_zuzyta_w_roku_kwh,
-            "is_flagged": bool(invoice.is_flagged) if hasattr(invoice, 'is_flagged') else False,
-        },
-        "blankiety": [
-            {
-                "id": b.id,
-                "numer_blankietu": b.numer_blankietu,
-                "poczatek_podokresu": b.poczatek_podokresu.isoformat() if b.poczatek_podokresu else None,
-                "koniec_podokresu": b.koniec_podokresu.isoformat() if b.koniec_podokresu else None,
-                "ilosc_dzienna_kwh": b.ilosc_dzienna_kwh,
-                "ilosc_nocna_kwh": b.ilosc_nocna_kwh,
-                "ilosc_calodobowa_kwh": b.ilosc_calodobowa_kwh,
-                "kwota_brutto": float(b.kwota_brutto),
-                "akcyza": float(b.akcyza),
-                "energia_do_akcyzy_kwh": b.energia_do_akcyzy_kwh,
-                "nadplata_niedoplata": float(b.nadplata_niedoplata),
-                "odsetki": float(b.odsetki),
-                "termin_platnosci": b.termin_platnosci.isoformat() if b.termin_platnosci else None,
-                "do_zaplaty": float(b.do_zaplaty),
-            } for b in blankiety
-        ],
-        "odczyty": [
-            {
-                "id": o.id,
-                "typ_energii": o.typ_energii,
-                "strefa": o.strefa,
-                "data_odczytu": o.data_odczytu.isoformat() if o.data_odczytu else None,
-                "biezacy_odczyt": o.biezacy_odczyt,
-                "poprzedni_odczyt": o.poprzedni_odczyt,
-                "mnozna": o.mnozna,
-                "ilosc_kwh": o.ilosc_kwh,
-                "straty_kwh": o.straty_kwh,
-                "razem_kwh": o.razem_kwh,
-            } for o in odczyty
-        ],
-        "sprzedaz_energii": [
-            {
-                "id": s.id,
-                "data": s.data.isoformat() if s.data else None,
-                "strefa": s.strefa,
-                "ilosc_kwh": s.ilosc_kwh,
-                "cena_za_kwh": float(s.cena_za_kwh),
-                "naleznosc": float(s.naleznosc),
-                "vat_procent": float(s.vat_procent),
-            } for s in sprzedaz
-        ],
-        "oplaty_dystrybucyjne": [
-            {
-                "id": op.id,
-                "typ_oplaty": op.typ_oplaty,
-                "strefa": op.strefa,
-                "jednostka": op.jednostka,
-                "data": op.data.isoformat() if op.data else None,
-                "ilosc_kwh": op.ilosc_kwh,
-                "ilosc_miesiecy": op.ilosc_miesiecy,
-                "wspolczynnik": float(op.wspolczynnik) if op.wspolczynnik else None,
-                "cena": float(op.cena),
-                "naleznosc": float(op.naleznosc),
-                "vat_procent": float(op.vat_procent),
-            } for op in oplaty
-        ],
-        "rozliczenie_okresy": [
-            {
-                "id": r.id,
-                "data_okresu": r.data_okresu.isoformat() if r.data_okresu else None,
-                "numer_okresu": r.numer_okresu,
-            } for r in okresy
-        ],
-    }
+    return InvoiceDetailedResponse(
+        invoice=InvoiceDetailedHeader.model_validate(invoice),
+        blankiety=[InvoiceBlankietOut.model_validate(b) for b in _by_id(invoice.blankiety)],
+        odczyty=[InvoiceOdczytOut.model_validate(o) for o in _by_id(invoice.odczyty)],
+        sprzedaz_energii=[InvoiceSprzedazOut.model_validate(s) for s in _by_id(invoice.sprzedaz_energii)],
+        oplaty_dystrybucyjne=[InvoiceOplataOut.model_validate(op) for op in _by_id(invoice.oplaty_dystrybucyjne)],
+        rozliczenie_okresy=[InvoiceRozliczenieOkresOut.model_validate(r) for r in _by_id(invoice.rozliczenie_okresy)],
+    )
 
 
 @router.post("/invoices-detailed/parse")
@@ -1414,371 +1534,12 @@ def verify_and_save_invoice_detailed(
         db.add(invoice)
         db.flush()  # Flush aby uzyskać invoice.id
         
-        # Funkcje pomocnicze do parsowania wartości
-        def parse_value(data_dict, key, default=0.0):
-            """
-            Parsuje wartość numeryczną z formatu polskiego.
-            Dla małych wartości (< 10) bez kropek, przecinek jest separatorem dziesiętnym.
-            Dla większych wartości z kropkami, kropki są separatorami tysięcy.
-            Jeśli wartość jest już float, zwraca ją bez parsowania.
-            """
-            if key in data_dict and data_dict[key] is not None and data_dict[key] != '':
-                try:
-                    # Jeśli wartość jest już float, zwróć ją bez parsowania
-                    if isinstance(data_dict[key], (int, float)):
-                        return float(data_dict[key])
-                    
-                    value_str = str(data_dict[key]).strip()
-                    # Jeśli wartość zawiera kropki, to są to separatory tysięcy
-                    if '.' in value_str:
-                        # Format: "1.234,56" -> usuń kropki -> "1234,56" -> zamień przecinek -> "1234.56"
-                        return float(value_str.replace('.', '').replace(',', '.'))
-                    else:
-                        # Jeśli nie ma kropek, przecinek jest separatorem dziesiętnym
-                        # Format: "0,3640" -> zamień przecinek -> "0.3640"
-                        return float(value_str.replace(',', '.'))
-                except (ValueError, AttributeError, TypeError):
-                    pass
-            return default
-        
-        def parse_int_value(data_dict, key, default=0):
-            """Parsuje wartość całkowitą z formatu polskiego."""
-            if key in data_dict and data_dict[key] is not None and data_dict[key] != '':
-                try:
-                    # Jeśli wartość jest już liczbą, zwróć ją jako int
-                    if isinstance(data_dict[key], (int, float)):
-                        return int(data_dict[key])
-                    
-                    value_str = str(data_dict[key]).strip()
-                    
-                    # Jeśli wartość zawiera kropki, sprawdź czy są to separatory tysięcy
-                    if '.' in value_str:
-                        # Jeśli jest też przecinek, to kropki są separatorami tysięcy
-                        if ',' in value_str:
-                            # Format: "24.320,50" -> usuń kropki -> "24320,50" -> zamień przecinek -> "24320.50"
-                            value_str = value_str.replace('.', '').replace(',', '.')
-                        else:
-                            # Tylko kropki - sprawdź czy to separatory tysięcy
-                            # W formacie polskim separatory tysięcy to kropki, a każda grupa ma 3 cyfry
-                            # Format: "24.320" lub "1.234.567" -> wszystkie kropki to separatory tysięcy
-                            parts = value_str.split('.')
-                            # Jeśli wszystkie części po pierwszej mają 3 cyfry, to są to separatory tysięcy
-                            if len(parts) > 1 and all(len(part) == 3 for part in parts[1:]):
-                                # Format: "24.320" lub "1.234.567" -> usuń wszystkie kropki
-                                value_str = value_str.replace('.', '')
-                            # W przeciwnym razie kropka jest separatorem dziesiętnym (zostaw)
-                    elif ',' in value_str:
-                        # Tylko przecinek - zamień na kropkę (separator dziesiętny)
-                        value_str = value_str.replace(',', '.')
-                    
-                    return int(float(value_str))
-                except (ValueError, AttributeError, TypeError):
-                    pass
-            return default
-        
-        # Zapisz blankiety
-        if 'blankiety' in invoice_data and invoice_data['blankiety']:
-            for blankiet_data in invoice_data['blankiety']:
-                # Pomiń "Ogółem" jeśli jest
-                if blankiet_data.get('ogolem'):
-                    continue
-                
-                # Parsuj daty
-                poczatek_podokresu = None
-                koniec_podokresu = None
-                termin_platnosci = None
-                
-                # Parsuj daty - obsługa zarówno ISO (YYYY-MM-DD) jak i DD/MM/YYYY
-                if blankiet_data.get('okres_od'):
-                    try:
-                        date_str = blankiet_data['okres_od']
-                        if '/' in date_str:
-                            poczatek_podokresu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                        else:
-                            poczatek_podokresu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    except (ValueError, KeyError):
-                        pass
-                
-                if blankiet_data.get('okres_do'):
-                    try:
-                        date_str = blankiet_data['okres_do']
-                        if '/' in date_str:
-                            koniec_podokresu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                        else:
-                            koniec_podokresu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    except (ValueError, KeyError):
-                        pass
-                
-                if blankiet_data.get('termin_platnosci'):
-                    try:
-                        date_str = blankiet_data['termin_platnosci']
-                        if '/' in date_str:
-                            termin_platnosci = datetime.strptime(date_str, "%d/%m/%Y").date()
-                        else:
-                            termin_platnosci = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    except (ValueError, KeyError):
-                        pass
-                
-                # Określ ilości energii - dla taryfy dwutaryfowej: ilosc_d i ilosc_c
-                # Dla taryfy całodobowej: może być jedna wartość w polu ilosc_calodobowa
-                ilosc_dzienna = parse_int_value(blankiet_data, 'ilosc_d') if blankiet_data.get('ilosc_d') else None
-                ilosc_nocna = parse_int_value(blankiet_data, 'ilosc_c') if blankiet_data.get('ilosc_c') else None
-                ilosc_calodobowa = None
-                
-                # Jeśli typ taryfy to całodobowa, sprawdź ilosc_calodobowa (z parsera) lub ilosc_c (fallback)
-                if invoice.typ_taryfy == "CAŁODOBOWA":
-                    if blankiet_data.get('ilosc_calodobowa'):
-                        ilosc_calodobowa = parse_int_value(blankiet_data, 'ilosc_calodobowa')
-                    elif blankiet_data.get('ilosc_c'):
-                        ilosc_calodobowa = parse_int_value(blankiet_data, 'ilosc_c')
-                    ilosc_dzienna = None
-                    ilosc_nocna = None
-                
-                blankiet = ElectricityInvoiceBlankiet(
-                    invoice_id=invoice.id,
-                    rok=invoice.rok,
-                    numer_blankietu=blankiet_data.get('nr_blankietu', ''),
-                    poczatek_podokresu=poczatek_podokresu,
-                    koniec_podokresu=koniec_podokresu,
-                    ilosc_dzienna_kwh=ilosc_dzienna,
-                    ilosc_nocna_kwh=ilosc_nocna,
-                    ilosc_calodobowa_kwh=ilosc_calodobowa,
-                    kwota_brutto=parse_value(blankiet_data, 'kwota_brutto', 0.0),
-                    akcyza=parse_value(blankiet_data, 'akcyza', 0.0),
-                    energia_do_akcyzy_kwh=parse_int_value(blankiet_data, 'energia_do_akcyzy', 0),
-                    nadplata_niedoplata=parse_value(blankiet_data, 'nadplata_niedoplata', 0.0),
-                    odsetki=parse_value(blankiet_data, 'odsetki', 0.0),
-                    termin_platnosci=termin_platnosci if termin_platnosci else data_konca_okresu,
-                    do_zaplaty=parse_value(blankiet_data, 'do_zaplaty', 0.0)
-                )
-                db.add(blankiet)
-        
-        # Zapisz odczyty
-        if 'odczyty' in invoice_data and invoice_data['odczyty']:
-            # Użyj set do deduplikacji odczytów w ramach tej faktury (typ_energii, strefa)
-            # Dla nowej faktury nie sprawdzamy bazy - tylko deduplikujemy w danych wejściowych
-            seen_odczyty = set()
-            for odczyt_data in invoice_data['odczyty']:
-                # Parsuj datę - obsługa zarówno ISO (YYYY-MM-DD) jak i DD/MM/YYYY
-                data_odczytu = None
-                if odczyt_data.get('data'):
-                    try:
-                        date_str = odczyt_data['data']
-                        if '/' in date_str:
-                            data_odczytu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                        else:
-                            data_odczytu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    except (ValueError, KeyError):
-                        pass
-                
-                if not data_odczytu:
-                    continue
-                
-                # Określ typ energii i strefę
-                typ_energii = "POBRANA" if odczyt_data.get('typ') == 'pobrana' else "ODDANA"
-                strefa = None
-                if odczyt_data.get('strefa'):
-                    strefa_str = odczyt_data['strefa'].upper()
-                    if strefa_str in ['DZIENNA', 'NOCNA']:
-                        strefa = strefa_str
-                
-                # Jeśli typ taryfy to całodobowa, strefa = NULL
-                if invoice.typ_taryfy == "CAŁODOBOWA":
-                    strefa = None
-                
-                # Sprawdź czy już przetworzyliśmy ten odczyt w ramach tej faktury (deduplikacja)
-                # Używamy typ_energii, strefa i data_odczytu, aby umożliwić wiele okresów dla tej samej strefy
-                odczyt_key = (typ_energii, strefa, data_odczytu)
-                if odczyt_key in seen_odczyty:
-                    # Pomiń duplikat - już mamy odczyt z tym typem energii, strefą i datą dla tej faktury
-                    continue
-                seen_odczyty.add(odczyt_key)
-                
-                # Utwórz nowy odczyt (dla nowej faktury zawsze tworzymy nowe odczyty)
-                odczyt = ElectricityInvoiceOdczyt(
-                    invoice_id=invoice.id,
-                    rok=invoice.rok,
-                    typ_energii=typ_energii,
-                    strefa=strefa,
-                    data_odczytu=data_odczytu,
-                    biezacy_odczyt=parse_int_value(odczyt_data, 'biezace', 0),
-                    poprzedni_odczyt=parse_int_value(odczyt_data, 'poprzednie', 0),
-                    mnozna=parse_int_value(odczyt_data, 'mnozna', 1),
-                    ilosc_kwh=parse_int_value(odczyt_data, 'ilosc', 0),
-                    straty_kwh=parse_int_value(odczyt_data, 'straty', 0),
-                    razem_kwh=parse_int_value(odczyt_data, 'razem', 0)
-                )
-                db.add(odczyt)
-        
-        # Zapisz sprzedaż energii
-        if 'sprzedaz_energii' in invoice_data and invoice_data['sprzedaz_energii']:
-            for sprzedaz_data in invoice_data['sprzedaz_energii']:
-                # Pomiń upusty (będą zapisane jako osobne pozycje jeśli potrzebne)
-                if sprzedaz_data.get('typ') == 'upust':
-                    continue
-                
-                # Parsuj datę (jeśli jest) - obsługa zarówno ISO (YYYY-MM-DD) jak i DD/MM/YYYY
-                data_sprzedazy = None
-                if sprzedaz_data.get('data'):
-                    try:
-                        date_str = sprzedaz_data['data']
-                        if '/' in date_str:
-                            data_sprzedazy = datetime.strptime(date_str, "%d/%m/%Y").date()
-                        else:
-                            data_sprzedazy = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    except (ValueError, KeyError):
-                        pass
-                
-                # Określ strefę
-                strefa = None
-                if sprzedaz_data.get('strefa'):
-                    strefa_str = sprzedaz_data['strefa'].upper()
-                    if strefa_str in ['DZIENNA', 'NOCNA']:
-                        strefa = strefa_str
-                
-                # Jeśli typ taryfy to całodobowa, strefa = NULL
-                if invoice.typ_taryfy == "CAŁODOBOWA":
-                    strefa = None
-                
-                # Określ ilość kWh
-                ilosc_kwh = 0
-                if 'ilosc_kwh' in sprzedaz_data:
-                    ilosc_kwh = parse_int_value(sprzedaz_data, 'ilosc_kwh', 0)
-                elif 'ilosc' in sprzedaz_data:
-                    ilosc_kwh = parse_int_value(sprzedaz_data, 'ilosc', 0)
-                
-                sprzedaz = ElectricityInvoiceSprzedazEnergii(
-                    invoice_id=invoice.id,
-                    rok=invoice.rok,
-                    data=data_sprzedazy,
-                    strefa=strefa,
-                    ilosc_kwh=ilosc_kwh,
-                    cena_za_kwh=parse_value(sprzedaz_data, 'cena', 0.0),
-                    naleznosc=parse_value(sprzedaz_data, 'naleznosc', 0.0),
-                    vat_procent=parse_value(sprzedaz_data, 'vat', 23.0)
-                )
-                db.add(sprzedaz)
-        
-        # Zapisz opłaty dystrybucyjne
-        if 'oplaty_dystrybucyjne' in invoice_data and invoice_data['oplaty_dystrybucyjne']:
-            for oplata_data in invoice_data['oplaty_dystrybucyjne']:
-                # Parsuj datę - obsługa zarówno ISO (YYYY-MM-DD) jak i DD/MM/YYYY
-                data_oplaty = None
-                if oplata_data.get('data'):
-                    try:
-                        date_str = oplata_data['data']
-                        if '/' in date_str:
-                            data_oplaty = datetime.strptime(date_str, "%d/%m/%Y").date()
-                        else:
-                            data_oplaty = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    except (ValueError, KeyError):
-                        pass
-                
-                if not data_oplaty:
-                    # Jeśli nie ma daty, użyj daty początku okresu
-                    data_oplaty = data_poczatku_okresu
-                
-                # Określ strefę
-                strefa = None
-                if oplata_data.get('strefa'):
-                    strefa_str = oplata_data['strefa'].upper()
-                    if strefa_str in ['DZIENNA', 'NOCNA']:
-                        strefa = strefa_str
-                
-                # Jeśli typ taryfy to całodobowa, strefa = NULL
-                if invoice.typ_taryfy == "CAŁODOBOWA":
-                    strefa = None
-                
-                # Określ jednostkę i ilości
-                jednostka = oplata_data.get('jednostka', 'kWh')
-                ilosc_kwh = None
-                ilosc_miesiecy = None
-                wspolczynnik = None
-                
-                if jednostka == 'kWh':
-                    if 'ilosc_kwh' in oplata_data:
-                        ilosc_kwh = parse_int_value(oplata_data, 'ilosc_kwh', 0)
-                    elif 'ilosc' in oplata_data:
-                        ilosc_kwh = parse_int_value(oplata_data, 'ilosc', 0)
-                elif jednostka == 'zł/mc':
-                    if 'ilosc_miesiecy' in oplata_data:
-                        ilosc_miesiecy = parse_value(oplata_data, 'ilosc_miesiecy', 0.0)  # Float, bo może być np. 4,9333
-                    elif 'ilosc' in oplata_data:
-                        ilosc_miesiecy = parse_value(oplata_data, 'ilosc', 0.0)
-                
-                # Współczynnik (dla opłaty stałej sieciowej)
-                if 'wspolczynnik1' in oplata_data:
-                    wspolczynnik = parse_value(oplata_data, 'wspolczynnik1', 0.0)
-                elif 'wspolczynnik' in oplata_data:
-                    wspolczynnik = parse_value(oplata_data, 'wspolczynnik', 0.0)
-                
-                oplata = ElectricityInvoiceOplataDystrybucyjna(
-                    invoice_id=invoice.id,
-                    rok=invoice.rok,
-                    typ_oplaty=oplata_data.get('nazwa', ''),
-                    strefa=strefa,
-                    jednostka=jednostka,
-                    data=data_oplaty,
-                    ilosc_kwh=ilosc_kwh,
-                    ilosc_miesiecy=ilosc_miesiecy,
-                    wspolczynnik=wspolczynnik,
-                    cena=parse_value(oplata_data, 'cena', 0.0),
-                    naleznosc=parse_value(oplata_data, 'naleznosc', 0.0),
-                    vat_procent=parse_value(oplata_data, 'vat', 23.0)
-                )
-                db.add(oplata)
-        
-        # Zapisz rozliczenie okresów - jeśli są w invoice_data
-        if 'rozliczenie_okresy' in invoice_data and invoice_data['rozliczenie_okresy']:
-            for okres_data in invoice_data['rozliczenie_okresy']:
-                data_okresu = None
-                if okres_data.get('data_okresu'):
-                    try:
-                        date_str = okres_data['data_okresu']
-                        if '/' in date_str:
-                            data_okresu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                        else:
-                            data_okresu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    except (ValueError, KeyError):
-                        pass
-                
-                if data_okresu:
-                    rozliczenie_okres = ElectricityInvoiceRozliczenieOkres(
-                        invoice_id=invoice.id,
-                        rok=invoice.rok,
-                        data_okresu=data_okresu,
-                        numer_okresu=okres_data.get('numer_okresu', 1)
-                    )
-                    db.add(rozliczenie_okres)
-        elif 'blankiety' in invoice_data and invoice_data['blankiety']:
-            # Fallback: generuj z blankietów jeśli nie ma rozliczenie_okresy
-            okres_num = 1
-            for blankiet_data in invoice_data['blankiety']:
-                # Pomiń "Ogółem"
-                if blankiet_data.get('ogolem'):
-                    continue
-                
-                # Parsuj datę okresu (użyj końca podokresu)
-                data_okresu = None
-                if blankiet_data.get('okres_do'):
-                    try:
-                        date_str = blankiet_data['okres_do']
-                        if '/' in date_str:
-                            data_okresu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                        else:
-                            data_okresu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    except (ValueError, KeyError):
-                        pass
-                
-                if data_okresu:
-                    rozliczenie_okres = ElectricityInvoiceRozliczenieOkres(
-                        invoice_id=invoice.id,
-                        rok=invoice.rok,
-                        data_okresu=data_okresu,
-                        numer_okresu=okres_num
-                    )
-                    db.add(rozliczenie_okres)
-                    okres_num += 1
+        # Zapisz blankiety, odczyty, sprzedaż energii, opłaty dystrybucyjne i rozliczenie okresów
+        # (dane normalizowane raz, jedno zbiorcze INSERT na tabelę)
+        children = normalize_invoice_children(
+            invoice_data, invoice.typ_taryfy, data_poczatku_okresu, data_konca_okresu
+        )
+        insert_invoice_children(db, invoice, children)
         
         db.commit()
         db.refresh(invoice)
@@ -1864,347 +1625,12 @@ def update_invoice_detailed(
     
     db.flush()
     
-    # Funkcje pomocnicze do parsowania wartości
-    def parse_value(data_dict, key, default=0.0):
-        """
-        Parsuje wartość numeryczną z formatu polskiego.
-        Dla małych wartości (< 10) bez kropek, przecinek jest separatorem dziesiętnym.
-        Dla większych wartości z kropkami, kropki są separatorami tysięcy.
-        Jeśli wartość jest już float, zwraca ją bez parsowania.
-        """
-        if key in data_dict and data_dict[key] is not None and data_dict[key] != '':
-            try:
-                # Jeśli wartość jest już float, zwróć ją bez parsowania
-                if isinstance(data_dict[key], (int, float)):
-                    return float(data_dict[key])
-                
-                value_str = str(data_dict[key]).strip()
-                # Jeśli wartość zawiera kropki, to są to separatory tysięcy
-                if '.' in value_str:
-                    # Format: "1.234,56" -> usuń kropki -> "1234,56" -> zamień przecinek -> "1234.56"
-                    return float(value_str.replace('.', '').replace(',', '.'))
-                else:
-                    # Jeśli nie ma kropek, przecinek jest separatorem dziesiętnym
-                    # Format: "0,3640" -> zamień przecinek -> "0.3640"
-                    return float(value_str.replace(',', '.'))
-            except (ValueError, AttributeError, TypeError):
-                pass
-        return default
-    
-    def parse_int_value(data_dict, key, default=0):
-        """Parsuje wartość całkowitą z formatu polskiego."""
-        if key in data_dict and data_dict[key] is not None and data_dict[key] != '':
-            try:
-                # Jeśli wartość jest już liczbą, zwróć ją jako int
-                if isinstance(data_dict[key], (int, float)):
-                    return int(data_dict[key])
-                
-                value_str = str(data_dict[key]).strip()
-                
-                # Jeśli wartość zawiera kropki, sprawdź czy są to separatory tysięcy
-                if '.' in value_str:
-                    # Jeśli jest też przecinek, to kropki są separatorami tysięcy
-                    if ',' in value_str:
-                        # Format: "24.320,50" -> usuń kropki -> "24320,50" -> zamień przecinek -> "24320.50"
-                        value_str = value_str.replace('.', '').replace(',', '.')
-                    else:
-                        # Tylko kropki - sprawdź czy to separatory tysięcy
-                        # W formacie polskim separatory tysięcy to kropki, a każda grupa ma 3 cyfry
-                        # Format: "24.320" lub "1.234.567" -> wszystkie kropki to separatory tysięcy
-                        parts = value_str.split('.')
-                        # Jeśli wszystkie części po pierwszej mają 3 cyfry, to są to separatory tysięcy
-                        if len(parts) > 1 and all(len(part) == 3 for part in parts[1:]):
-                            # Format: "24.320" lub "1.234.567" -> usuń wszystkie kropki
-                            value_str = value_str.replace('.', '')
-                        # W przeciwnym razie kropka jest separatorem dziesiętnym (zostaw)
-                elif ',' in value_str:
-                    # Tylko przecinek - zamień na kropkę (separator dziesiętny)
-                    value_str = value_str.replace(',', '.')
-                
-                return int(float(value_str))
-            except (ValueError, AttributeError, TypeError):
-                pass
-        return default
-    
-    # Usuń stare szczegółowe dane i dodaj nowe (jeśli są w invoice_data)
-    if 'blankiety' in invoice_data and invoice_data['blankiety']:
-        # Usuń stare blankiety
-        db.query(ElectricityInvoiceBlankiet).filter(ElectricityInvoiceBlankiet.invoice_id == invoice_id).delete()
-        
-        # Dodaj nowe blankiety (ten sam kod co w verify_and_save_invoice_detailed)
-        for blankiet_data in invoice_data['blankiety']:
-            if blankiet_data.get('ogolem'):
-                continue
-            
-            poczatek_podokresu = None
-            koniec_podokresu = None
-            termin_platnosci = None
-            
-            # Parsuj daty - obsługa zarówno ISO (YYYY-MM-DD) jak i DD/MM/YYYY
-            if blankiet_data.get('okres_od'):
-                try:
-                    date_str = blankiet_data['okres_od']
-                    if '/' in date_str:
-                        poczatek_podokresu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    else:
-                        poczatek_podokresu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except (ValueError, KeyError):
-                    pass
-            
-            if blankiet_data.get('okres_do'):
-                try:
-                    date_str = blankiet_data['okres_do']
-                    if '/' in date_str:
-                        koniec_podokresu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    else:
-                        koniec_podokresu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except (ValueError, KeyError):
-                    pass
-            
-            if blankiet_data.get('termin_platnosci'):
-                try:
-                    date_str = blankiet_data['termin_platnosci']
-                    if '/' in date_str:
-                        termin_platnosci = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    else:
-                        termin_platnosci = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except (ValueError, KeyError):
-                    pass
-            
-            ilosc_dzienna = parse_int_value(blankiet_data, 'ilosc_d') if blankiet_data.get('ilosc_d') else None
-            ilosc_nocna = parse_int_value(blankiet_data, 'ilosc_c') if blankiet_data.get('ilosc_c') else None
-            ilosc_calodobowa = None
-            
-            # Jeśli typ taryfy to całodobowa, sprawdź ilosc_calodobowa (z parsera) lub ilosc_c (fallback)
-            if invoice.typ_taryfy == "CAŁODOBOWA":
-                if blankiet_data.get('ilosc_calodobowa'):
-                    ilosc_calodobowa = parse_int_value(blankiet_data, 'ilosc_calodobowa')
-                elif blankiet_data.get('ilosc_c'):
-                    ilosc_calodobowa = parse_int_value(blankiet_data, 'ilosc_c')
-                ilosc_dzienna = None
-                ilosc_nocna = None
-            
-            blankiet = ElectricityInvoiceBlankiet(
-                invoice_id=invoice.id,
-                rok=invoice.rok,
-                numer_blankietu=blankiet_data.get('nr_blankietu', ''),
-                poczatek_podokresu=poczatek_podokresu,
-                koniec_podokresu=koniec_podokresu,
-                ilosc_dzienna_kwh=ilosc_dzienna,
-                ilosc_nocna_kwh=ilosc_nocna,
-                ilosc_calodobowa_kwh=ilosc_calodobowa,
-                kwota_brutto=parse_value(blankiet_data, 'kwota_brutto', 0.0),
-                akcyza=parse_value(blankiet_data, 'akcyza', 0.0),
-                energia_do_akcyzy_kwh=parse_int_value(blankiet_data, 'energia_do_akcyzy', 0),
-                nadplata_niedoplata=parse_value(blankiet_data, 'nadplata_niedoplata', 0.0),
-                odsetki=parse_value(blankiet_data, 'odsetki', 0.0),
-                termin_platnosci=termin_platnosci or data_konca_okresu,
-                do_zaplaty=parse_value(blankiet_data, 'do_zaplaty', 0.0)
-            )
-            db.add(blankiet)
-    
-    # Podobnie dla pozostałych tabel (odczyty, sprzedaż, opłaty, rozliczenie okresów)
-    # Dla uproszczenia, jeśli są dane w invoice_data, usuń stare i dodaj nowe
-    if 'odczyty' in invoice_data and invoice_data['odczyty']:
-        db.query(ElectricityInvoiceOdczyt).filter(ElectricityInvoiceOdczyt.invoice_id == invoice_id).delete()
-        for odczyt_data in invoice_data['odczyty']:
-            data_odczytu = None
-            if odczyt_data.get('data'):
-                try:
-                    date_str = odczyt_data['data']
-                    if '/' in date_str:
-                        data_odczytu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    else:
-                        data_odczytu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except (ValueError, KeyError):
-                    pass
-            
-            if not data_odczytu:
-                continue
-            
-            typ_energii = "POBRANA" if odczyt_data.get('typ') == 'pobrana' else "ODDANA"
-            strefa = None
-            if odczyt_data.get('strefa'):
-                strefa_str = odczyt_data['strefa'].upper()
-                if strefa_str in ['DZIENNA', 'NOCNA']:
-                    strefa = strefa_str
-            
-            if invoice.typ_taryfy == "CAŁODOBOWA":
-                strefa = None
-            
-            odczyt = ElectricityInvoiceOdczyt(
-                invoice_id=invoice.id,
-                rok=invoice.rok,
-                typ_energii=typ_energii,
-                strefa=strefa,
-                data_odczytu=data_odczytu,
-                biezacy_odczyt=parse_int_value(odczyt_data, 'biezace', 0),
-                poprzedni_odczyt=parse_int_value(odczyt_data, 'poprzednie', 0),
-                mnozna=parse_int_value(odczyt_data, 'mnozna', 1),
-                ilosc_kwh=parse_int_value(odczyt_data, 'ilosc', 0),
-                straty_kwh=parse_int_value(odczyt_data, 'straty', 0),
-                razem_kwh=parse_int_value(odczyt_data, 'razem', 0)
-            )
-            db.add(odczyt)
-    
-    if 'sprzedaz_energii' in invoice_data and invoice_data['sprzedaz_energii']:
-        db.query(ElectricityInvoiceSprzedazEnergii).filter(ElectricityInvoiceSprzedazEnergii.invoice_id == invoice_id).delete()
-        for sprzedaz_data in invoice_data['sprzedaz_energii']:
-            if sprzedaz_data.get('typ') == 'upust':
-                continue
-            
-            data_sprzedazy = None
-            if sprzedaz_data.get('data'):
-                try:
-                    date_str = sprzedaz_data['data']
-                    if '/' in date_str:
-                        data_sprzedazy = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    else:
-                        data_sprzedazy = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except (ValueError, KeyError):
-                    pass
-            
-            strefa = None
-            if sprzedaz_data.get('strefa'):
-                strefa_str = sprzedaz_data['strefa'].upper()
-                if strefa_str in ['DZIENNA', 'NOCNA']:
-                    strefa = strefa_str
-            
-            if invoice.typ_taryfy == "CAŁODOBOWA":
-                strefa = None
-            
-            ilosc_kwh = 0
-            if 'ilosc_kwh' in sprzedaz_data:
-                ilosc_kwh = parse_int_value(sprzedaz_data, 'ilosc_kwh', 0)
-            elif 'ilosc' in sprzedaz_data:
-                ilosc_kwh = parse_int_value(sprzedaz_data, 'ilosc', 0)
-            
-            sprzedaz = ElectricityInvoiceSprzedazEnergii(
-                invoice_id=invoice.id,
-                rok=invoice.rok,
-                data=data_sprzedazy,
-                strefa=strefa,
-                ilosc_kwh=ilosc_kwh,
-                cena_za_kwh=parse_value(sprzedaz_data, 'cena', 0.0),
-                naleznosc=parse_value(sprzedaz_data, 'naleznosc', 0.0),
-                vat_procent=parse_value(sprzedaz_data, 'vat', 23.0)
-            )
-            db.add(sprzedaz)
-    
-    if 'oplaty_dystrybucyjne' in invoice_data and invoice_data['oplaty_dystrybucyjne']:
-        db.query(ElectricityInvoiceOplataDystrybucyjna).filter(ElectricityInvoiceOplataDystrybucyjna.invoice_id == invoice_id).delete()
-        for oplata_data in invoice_data['oplaty_dystrybucyjne']:
-            data_oplaty = None
-            if oplata_data.get('data'):
-                try:
-                    date_str = oplata_data['data']
-                    if '/' in date_str:
-                        data_oplaty = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    else:
-                        data_oplaty = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except (ValueError, KeyError):
-                    pass
-            
-            if not data_oplaty:
-                data_oplaty = data_poczatku_okresu
-            
-            strefa = None
-            if oplata_data.get('strefa'):
-                strefa_str = oplata_data['strefa'].upper()
-                if strefa_str in ['DZIENNA', 'NOCNA']:
-                    strefa = strefa_str
-            
-            if invoice.typ_taryfy == "CAŁODOBOWA":
-                strefa = None
-            
-            jednostka = oplata_data.get('jednostka', 'kWh')
-            ilosc_kwh = None
-            ilosc_miesiecy = None
-            wspolczynnik = None
-            
-            if jednostka == 'kWh':
-                if 'ilosc_kwh' in oplata_data:
-                    ilosc_kwh = parse_int_value(oplata_data, 'ilosc_kwh', 0)
-                elif 'ilosc' in oplata_data:
-                    ilosc_kwh = parse_int_value(oplata_data, 'ilosc', 0)
-            elif jednostka == 'zł/mc':
-                if 'ilosc_miesiecy' in oplata_data:
-                    ilosc_miesiecy = parse_value(oplata_data, 'ilosc_miesiecy', 0.0)  # Float, bo może być np. 4,9333
-                elif 'ilosc' in oplata_data:
-                    ilosc_miesiecy = parse_value(oplata_data, 'ilosc', 0.0)
-            
-            if 'wspolczynnik1' in oplata_data:
-                wspolczynnik = parse_value(oplata_data, 'wspolczynnik1', 0.0)
-            elif 'wspolczynnik' in oplata_data:
-                wspolczynnik = parse_value(oplata_data, 'wspolczynnik', 0.0)
-            
-            oplata = ElectricityInvoiceOplataDystrybucyjna(
-                invoice_id=invoice.id,
-                rok=invoice.rok,
-                typ_oplaty=oplata_data.get('nazwa', ''),
-                strefa=strefa,
-                jednostka=jednostka,
-                data=data_oplaty,
-                ilosc_kwh=ilosc_kwh,
-                ilosc_miesiecy=ilosc_miesiecy,
-                wspolczynnik=wspolczynnik,
-                cena=parse_value(oplata_data, 'cena', 0.0),
-                naleznosc=parse_value(oplata_data, 'naleznosc', 0.0),
-                vat_procent=parse_value(oplata_data, 'vat', 23.0)
-            )
-            db.add(oplata)
-    
-    # Rozliczenie okresów - jeśli są w invoice_data
-    if 'rozliczenie_okresy' in invoice_data and invoice_data['rozliczenie_okresy']:
-        db.query(ElectricityInvoiceRozliczenieOkres).filter(ElectricityInvoiceRozliczenieOkres.invoice_id == invoice_id).delete()
-        for okres_data in invoice_data['rozliczenie_okresy']:
-            data_okresu = None
-            if okres_data.get('data_okresu'):
-                try:
-                    date_str = okres_data['data_okresu']
-                    if '/' in date_str:
-                        data_okresu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    else:
-                        data_okresu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except (ValueError, KeyError):
-                    pass
-            
-            if data_okresu:
-                rozliczenie_okres = ElectricityInvoiceRozliczenieOkres(
-                    invoice_id=invoice.id,
-                    rok=invoice.rok,
-                    data_okresu=data_okresu,
-                    numer_okresu=okres_data.get('numer_okresu', 1)
-                )
-                db.add(rozliczenie_okres)
-    elif 'blankiety' in invoice_data and invoice_data['blankiety']:
-        # Fallback: generuj z blankietów jeśli nie ma rozliczenie_okresy
-        db.query(ElectricityInvoiceRozliczenieOkres).filter(ElectricityInvoiceRozliczenieOkres.invoice_id == invoice_id).delete()
-        okres_num = 1
-        for blankiet_data in invoice_data['blankiety']:
-            if blankiet_data.get('ogolem') or not blankiet_data.get('okres_do'):
-                continue
-            
-            data_okresu = None
-            if blankiet_data.get('okres_do'):
-                try:
-                    date_str = blankiet_data['okres_do']
-                    if '/' in date_str:
-                        data_okresu = datetime.strptime(date_str, "%d/%m/%Y").date()
-                    else:
-                        data_okresu = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except (ValueError, KeyError):
-                    pass
-            
-            if data_okresu:
-                rozliczenie_okres = ElectricityInvoiceRozliczenieOkres(
-                    invoice_id=invoice.id,
-                    rok=invoice.rok,
-                    data_okresu=data_okresu,
-                    numer_okresu=okres_num
-                )
-                db.add(rozliczenie_okres)
-                okres_num += 1
+    # Pozycje podrzędne obecne w invoice_data - porównanie po kluczu naturalnym,
+    # zmieniane są tylko wiersze, które się różnią
+    children = normalize_invoice_children(
+        invoice_data, invoice.typ_taryfy, data_poczatku_okresu, data_konca_okresu
+    )
+    sync_invoice_children(db, invoice, children)
     
     db.commit()
     db.refresh(invoice)
@@ -3,8 +3,7 @@ API endpoints for gas billing.
 All endpoints have prefix /api/gas/
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 from typing import List, Optional, Dict, Any
@@ -12,9 +11,15 @@ from pathlib import Path
 from datetime import datetime
 
 from app.core.database import get_db
-from app.models.gas import GasInvoice, GasBill
+from app.core.pagination import (
+    keyset_page, model_columns, paginated, select_fields
+)
+from app.core.pdf_response import pdf_file_response, pdf_preview_response
+from app.core.response_cache import cached_json_response
+from app.core.response_models import row_model
+from app.models.gas import GasInvoice, GasBill, GasAllocationRule
 from app.models.water import Local
-from app.services.gas.manager import GasBillingManager
+from app.services.gas.manager import AllocationSchedule, GasBillingManager, load_allocation_schedule
 from app.services.gas.bill_generator import generate_all_bills_for_period
 
 router = APIRouter(prefix="/api/gas", tags=["gas"])
@@ -22,21 +27,32 @@ router = APIRouter(prefix="/api/gas", tags=["gas"])
 # Manager instance
 gas_manager = GasBillingManager()
 
+# Pola list zwracane bez parametru fields=
+INVOICE_LIST_FIELDS = ("id", "data", "invoice_number", "period_start", "period_stop", "total_gross_sum")
+BILL_LIST_FIELDS = (
+    "id", "data", "local", "cost_share", "fuel_cost_gross", "subscription_cost_gross",
+    "distribution_fixed_cost_gross", "distribution_variable_cost_gross", "total_net_sum", "total_gross_sum", "pdf_path"
+)
+BILL_PERIOD_FIELDS = ("id", "data", "local", "total_gross_sum")
+
+# Modele odpowiedzi list (pola z kolumn listy, walidacja i serializacja w pydantic-core)
+GasInvoiceListItem = row_model("GasInvoiceListItem", model_columns(GasInvoice))
+GasBillListItem = row_model("GasBillListItem", model_columns(GasBill))
+
 
 # ========== GAS INVOICE ENDPOINTS ==========
 
-@router.get("/invoices/", response_model=List[dict])
-def get_gas_invoices(db: Session = Depends(get_db)):
-    """Gets list of all gas invoices."""
-    invoices = db.query(GasInvoice).order_by(desc(GasInvoice.data)).all()
-    return [{
-        "id": i.id,
-        "data": i.data,
-        "invoice_number": i.invoice_number,
-        "period_start": i.period_start.isoformat() if i.period_start else None,
-        "period_stop": i.period_stop.isoformat() if i.period_stop else None,
-        "total_gross_sum": i.total_gross_sum
-    } for i in invoices]
+@router.get("/invoices/", response_model=List[GasInvoiceListItem], response_model_exclude_unset=True)
+def get_gas_invoices(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Gets gas invoices (newest first); with limit= or cursor= one page, next page cursor in X-Next-Cursor header."""
+    columns = select_fields(model_columns(GasInvoice), fields, INVOICE_LIST_FIELDS)
+    return paginated(response, keyset_page(db, columns, (GasInvoice.data, GasInvoice.id), cursor, limit))
 
 
 @router.post("/invoices/")
@@ -289,36 +305,30 @@ def verify_and_save_gas_invoice(
 
 # ========== GAS BILL ENDPOINTS ==========
 
-@router.get("/bills/", response_model=List[dict])
-def get_gas_bills(db: Session = Depends(get_db)):
-    """Gets list of all gas bills."""
-    bills = db.query(GasBill).order_by(desc(GasBill.data)).all()
-    return [{
-        "id": b.id,
-        "data": b.data,
-        "local": b.local,
-        "cost_share": b.cost_share,
-        # Use values from database (updated by PDF generator)
-        "fuel_cost_gross": b.fuel_cost_gross,
-        "subscription_cost_gross": b.subscription_cost_gross,
-        "distribution_fixed_cost_gross": b.distribution_fixed_cost_gross,
-        "distribution_variable_cost_gross": b.distribution_variable_cost_gross,
-        "total_net_sum": b.total_net_sum,
-        "total_gross_sum": b.total_gross_sum,  # Final gross amount to pay (including interest for gora)
-        "pdf_path": b.pdf_path
-    } for b in bills]
-
-
-@router.get("/bills/period/{period}", response_model=List[dict])
+@router.get("/bills/", response_model=List[GasBillListItem], response_model_exclude_unset=True)
+def get_gas_bills(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Gets gas bills (newest first); with limit= or cursor= one page, next page cursor in X-Next-Cursor header.
+
+    Costs come from database (updated by PDF generator); total_gross_sum is the final
+    gross amount to pay (including interest for gora).
+    """
+    columns = select_fields(model_columns(GasBill), fields, BILL_LIST_FIELDS)
+    return paginated(response, keyset_page(db, columns, (GasBill.data, GasBill.id), cursor, limit))
+
+
+@router.get("/bills/period/{period}", response_model=List[GasBillListItem], response_model_exclude_unset=True)
 def get_gas_bills_for_period(period: str, db: Session = Depends(get_db)):
     """Gets gas bills for given period."""
-    bills = db.query(GasBill).filter(GasBill.data == period).all()
-    return [{
-        "id": b.id,
-        "data": b.data,
-        "local": b.local,
-        "total_gross_sum": b.total_gross_sum
-    } for b in bills]
+    columns = select_fields(model_columns(GasBill), None, BILL_PERIOD_FIELDS)
+    rows = db.query(*(column.label(name) for name, column in columns.items())).filter(GasBill.data == period).all()
+    return [row._asdict() for row in rows]
 
 
 @router.post("/bills/generate/{period}")
@@ -432,25 +442,116 @@ def regenerate_gas_bills(period: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/bills/generate-all")
+def generate_all_gas_bills(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Generates gas bills for all periods with invoices (optionally from start to end, 'YYYY-MM').
+    Generates ONLY missing bills (periods that already have bills are skipped).
+    """
+    result = gas_manager.generate_all_bills(db, start, end)
+    
+    # Generate PDF files
+    pdfs_generated = 0
+    for period in result["periods_processed"]:
+        try:
+            pdfs_generated += len(generate_all_bills_for_period(db, period))
+        except Exception as pdf_error:
+            # Log error but don't interrupt - bills are already generated
+            print(f"[ERROR] Error generating PDF for period {period}: {pdf_error}")
+    
+    return {
+        "message": "Gas bills generated",
+        **result,
+        "pdfs_generated": pdfs_generated
+    }
+
+
+# ========== GAS ALLOCATION RULES ==========
+
+@router.get("/allocation-rules")
+def get_allocation_rules(db: Session = Depends(get_db)):
+    """Gets gas cost allocation rules grouped into versions (by validity range)."""
+    schedule = load_allocation_schedule(db)
+    return [{
+        "valid_from": version.valid_from.isoformat() if version.valid_from else None,
+        "valid_to": version.valid_to.isoformat() if version.valid_to else None,
+        "shares": dict(zip(version.locals, version.shares)),
+        "interest_local": version.interest_local
+    } for version in schedule.versions]
+
+
+@router.post("/allocation-rules")
+def create_allocation_rules(rules_data: dict = Body(...), db: Session = Depends(get_db)):
+    """
+    Adds an allocation version: {"valid_from": "YYYY-MM-DD" | null, "valid_to": "YYYY-MM-DD" | null,
+    "shares": {"gora": 0.58, ...}, "interest_local": "gora" | null}.
+    Shares must sum to 1. Existing rules with the same validity range are replaced.
+    """
+    try:
+        valid_from = datetime.strptime(rules_data["valid_from"], "%Y-%m-%d").date() if rules_data.get("valid_from") else None
+        valid_to = datetime.strptime(rules_data["valid_to"], "%Y-%m-%d").date() if rules_data.get("valid_to") else None
+        interest_local = rules_data.get("interest_local")
+        rules = [
+            GasAllocationRule(
+                local=local,
+                share=float(share),
+                bears_interest=(local == interest_local),
+                valid_from=valid_from,
+                valid_to=valid_to
+            )
+            for local, share in rules_data["shares"].items()
+        ]
+        if interest_local is not None and interest_local not in rules_data["shares"]:
+            raise ValueError(f"Lokal płacący odsetki ({interest_local}) nie ma udziału w regułach")
+        if valid_from and valid_to and valid_from > valid_to:
+            raise ValueError("valid_from jest po valid_to")
+        AllocationSchedule.from_rules(rules)  # Walidacja sumy udziałów
+    except (KeyError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid allocation rules data: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    db.query(GasAllocationRule).filter(
+        GasAllocationRule.valid_from.is_(valid_from) if valid_from is None else GasAllocationRule.valid_from == valid_from,
+        GasAllocationRule.valid_to.is_(valid_to) if valid_to is None else GasAllocationRule.valid_to == valid_to
+    ).delete(synchronize_session=False)
+    db.add_all(rules)
+    db.commit()
+    
+    return {"message": "Allocation rules saved", "rules_count": len(rules)}
+
+
 @router.get("/bills/download/{bill_id}")
-def download_gas_bill(bill_id: int, db: Session = Depends(get_db)):
-    """Downloads gas bill PDF file."""
-    from app.services.gas.bill_generator import generate_bill_pdf
+def download_gas_bill(bill_id: int, request: Request, preview: bool = False, db: Session = Depends(get_db)):
+    """
+    Downloads gas bill PDF file (ETag = pdf_hash, Range supported).
+    With preview=true the PDF is rendered in memory and neither the file nor the bill is saved.
+    """
+    from app.services.gas.bill_generator import build_bill_views, generate_bill_pdf
     
     bill = db.query(GasBill).filter(GasBill.id == bill_id).first()
     
     if not bill:
         raise HTTPException(status_code=404, detail="Bill not found")
     
-    if not bill.pdf_path or not Path(bill.pdf_path).exists():
-        # Generate file if it doesn't exist
-        try:
-            bill.pdf_path = generate_bill_pdf(db, bill)
-            db.commit()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Cannot generate PDF file: {str(e)}")
+    if preview:
+        views, _, errors = build_bill_views(db, [bill])
+        if errors:
+            raise HTTPException(status_code=500, detail=f"Cannot generate PDF file: {errors[bill.id]}")
+        return pdf_preview_response(request, views[0])
     
-    return FileResponse(bill.pdf_path, media_type="application/pdf")
+    # Generate file if it doesn't exist or the bill changed since the last PDF (pdf_hash)
+    try:
+        bill.pdf_path = generate_bill_pdf(db, bill)
+        db.commit()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Cannot generate PDF file: {str(e)}")
+    
+    return pdf_file_response(request, bill.pdf_path, bill.pdf_hash)
 
 
 @router.get("/bills/{bill_id}")
@@ -674,9 +775,17 @@ def delete_gas_invoice(invoice_id: int, db: Session = Depends(get_db)):
     }
 
 
+STATS_TABLES = ("gas_invoices", "gas_bills")
+
+
 @router.get("/stats")
-def get_gas_stats(db: Session = Depends(get_db)):
-    """Returns statistics for gas dashboard."""
+def get_gas_stats(request: Request, db: Session = Depends(get_db)):
+    """Returns statistics for gas dashboard (cached until one of STATS_TABLES changes; ETag)."""
+    return cached_json_response(request, "gas_stats", STATS_TABLES, lambda: _gas_stats(db))
+
+
+def _gas_stats(db: Session) -> Dict[str, Any]:
+    """Builds statistics for gas dashboard."""
     stats = {
         "invoices_count": db.query(GasInvoice).count(),
         "bills_count": db.query(GasBill).count(),
@@ -3,8 +3,7 @@ API endpoints for water billing.
 All endpoints have prefix /api/water/
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 from sqlalchemy.exc import IntegrityError
@@ -14,6 +13,12 @@ from datetime import datetime
 import os
 
 from app.core.database import get_db
+from app.core.pagination import (
+    keyset_page, model_columns, paginated, select_fields
+)
+from app.core.pdf_response import pdf_file_response, pdf_preview_response
+from app.core.response_cache import cached_json_response
+from app.core.response_models import row_model
 from app.models.water import Local, Reading, Invoice, Bill
 from app.models.gas import GasBill
 from app.services.water.invoice_reader import (
@@ -38,21 +43,30 @@ from app.core.water_credentials import (
 
 router = APIRouter(prefix="/api/water", tags=["water"])
 
+# Pola list zwracane bez parametru fields=
+READING_LIST_FIELDS = ("data", "water_meter_main", "water_meter_5", "water_meter_5a", "water_meter_5b")
+INVOICE_LIST_FIELDS = ("id", "data", "invoice_number", "usage", "water_cost_m3", "sewage_cost_m3", "gross_sum")
+BILL_LIST_FIELDS = (
+    "id", "data", "local", "reading_value", "usage_m3", "cost_water", "cost_sewage", "cost_usage_total",
+    "abonament_water_share", "abonament_sewage_share", "abonament_total", "net_sum", "gross_sum", "pdf_path"
+)
+LOCAL_LIST_FIELDS = ("id", "water_meter_name", "gas_meter_name", "tenant", "local", "email")
+BILL_PERIOD_FIELDS = ("id", "data", "local", "usage_m3", "gross_sum")
+
+# Modele odpowiedzi list (pola z kolumn listy, walidacja i serializacja w pydantic-core)
+LocalListItem = row_model("LocalListItem", model_columns(Local))
+ReadingListItem = row_model("ReadingListItem", model_columns(Reading))
+InvoiceListItem = row_model("InvoiceListItem", model_columns(Invoice))
+BillListItem = row_model("BillListItem", model_columns(Bill))
+
 
 # ========== UNIT ENDPOINTS ==========
 
-@router.get("/locals/", response_model=List[dict])
+@router.get("/locals/", response_model=List[LocalListItem], response_model_exclude_unset=True)
 def get_locals(db: Session = Depends(get_db)):
     """Gets list of all units."""
-    locals_list = db.query(Local).all()
-    return [{
-        "id": l.id,
-        "water_meter_name": l.water_meter_name,
-        "gas_meter_name": l.gas_meter_name,
-        "tenant": l.tenant,
-        "local": l.local,
-        "email": l.email
-    } for l in locals_list]
+    columns = select_fields(model_columns(Local), None, LOCAL_LIST_FIELDS)
+    return [row._asdict() for row in db.query(*(column.label(name) for name, column in columns.items())).all()]
 
 
 @router.post("/locals/")
@@ -219,17 +233,17 @@ def delete_local(local_id: int, db: Session = Depends(get_db)):
 
 # ========== READING ENDPOINTS ==========
 
-@router.get("/readings/", response_model=List[dict])
-def get_readings(db: Session = Depends(get_db)):
-    """Gets list of all readings."""
-    readings = db.query(Reading).order_by(desc(Reading.data)).all()
-    return [{
-        "data": r.data,
-        "water_meter_main": r.water_meter_main,
-        "water_meter_5": r.water_meter_5,
-        "water_meter_5a": r.water_meter_5a,
-        "water_meter_5b": r.water_meter_5b  # Stored in database
-    } for r in readings]
+@router.get("/readings/", response_model=List[ReadingListItem], response_model_exclude_unset=True)
+def get_readings(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Gets readings (newest first); with limit= or cursor= one page, next page cursor in X-Next-Cursor header."""
+    columns = select_fields(model_columns(Reading), fields, READING_LIST_FIELDS)
+    return paginated(response, keyset_page(db, columns, (Reading.data,), cursor, limit))
 
 
 @router.get("/readings/{period}")
@@ -344,19 +358,17 @@ def delete_reading(period: str, db: Session = Depends(get_db)):
 
 # ========== INVOICE ENDPOINTS ==========
 
-@router.get("/invoices/", response_model=List[dict])
-def get_invoices(db: Session = Depends(get_db)):
-    """Gets list of all invoices."""
-    invoices = db.query(Invoice).order_by(desc(Invoice.data)).all()
-    return [{
-        "id": i.id,
-        "data": i.data,
-        "invoice_number": i.invoice_number,
-        "usage": i.usage,
-        "water_cost_m3": i.water_cost_m3,
-        "sewage_cost_m3": i.sewage_cost_m3,
-        "gross_sum": i.gross_sum
-    } for i in invoices]
+@router.get("/invoices/", response_model=List[InvoiceListItem], response_model_exclude_unset=True)
+def get_invoices(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Gets invoices (newest first); with limit= or cursor= one page, next page cursor in X-Next-Cursor header."""
+    columns = select_fields(model_columns(Invoice), fields, INVOICE_LIST_FIELDS)
+    return paginated(response, keyset_page(db, columns, (Invoice.data, Invoice.id), cursor, limit))
 
 
 @router.post("/invoices/parse")
@@ -655,39 +667,25 @@ def delete_invoice(invoice_id: int, db: Session = Depends(get_db)):
 
 # ========== BILL ENDPOINTS ==========
 
-@router.get("/bills/", response_model=List[dict])
-def get_bills(db: Session = Depends(get_db)):
-    """Gets list of all bills."""
-    bills = db.query(Bill).order_by(desc(Bill.data)).all()
-    return [{
-        "id": b.id,
-        "data": b.data,
-        "local": b.local,
-        "reading_value": b.reading_value,
-        "usage_m3": b.usage_m3,
-        "cost_water": b.cost_water,
-        "cost_sewage": b.cost_sewage,
-        "cost_usage_total": b.cost_usage_total,
-        "abonament_water_share": b.abonament_water_share,
-        "abonament_sewage_share": b.abonament_sewage_share,
-        "abonament_total": b.abonament_total,
-        "net_sum": b.net_sum,
-        "gross_sum": b.gross_sum,
-        "pdf_path": b.pdf_path
-    } for b in bills]
-
-
-@router.get("/bills/period/{period}", response_model=List[dict])
+@router.get("/bills/", response_model=List[BillListItem], response_model_exclude_unset=True)
+def get_bills(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Gets bills (newest first); with limit= or cursor= one page, next page cursor in X-Next-Cursor header."""
+    columns = select_fields(model_columns(Bill), fields, BILL_LIST_FIELDS)
+    return paginated(response, keyset_page(db, columns, (Bill.data, Bill.id), cursor, limit))
+
+
+@router.get("/bills/period/{period}", response_model=List[BillListItem], response_model_exclude_unset=True)
 def get_bills_for_period(period: str, db: Session = Depends(get_db)):
     """Gets bills for given period."""
-    bills = db.query(Bill).filter(Bill.data == period).all()
-    return [{
-        "id": b.id,
-        "data": b.data,
-        "local": b.local,
-        "usage_m3": b.usage_m3,
-        "gross_sum": b.gross_sum
-    } for b in bills]
+    columns = select_fields(model_columns(Bill), None, BILL_PERIOD_FIELDS)
+    rows = db.query(*(column.label(name) for name, column in columns.items())).filter(Bill.data == period).all()
+    return [row._asdict() for row in rows]
 
 
 @router.post("/bills/generate/{period}")
@@ -876,19 +874,24 @@ def update_bill(
 
 
 @router.get("/bills/download/{bill_id}")
-def download_bill(bill_id: int, db: Session = Depends(get_db)):
-    """Downloads bill PDF file."""
+def download_bill(bill_id: int, request: Request, preview: bool = False, db: Session = Depends(get_db)):
+    """
+    Downloads bill PDF file (ETag = pdf_hash, Range supported).
+    With preview=true the PDF is rendered in memory and nothing is written to bills/.
+    """
     bill = db.query(Bill).filter(Bill.id == bill_id).first()
     
     if not bill:
         raise HTTPException(status_code=404, detail="Bill not found")
     
-    if not bill.pdf_path or not Path(bill.pdf_path).exists():
-        # Generate file if it doesn't exist
-        bill.pdf_path = bill_generator.generate_bill_pdf(db, bill)
-        db.commit()
+    if preview:
+        return pdf_preview_response(request, bill_generator.build_bill_views(db, [bill])[0])
     
-    return FileResponse(bill.pdf_path, media_type="application/pdf")
+    # Generate file if it doesn't exist or the bill changed since the last PDF (pdf_hash)
+    bill.pdf_path = bill_generator.generate_bill_pdf(db, bill)
+    db.commit()
+    
+    return pdf_file_response(request, bill.pdf_path, bill.pdf_hash)
 
 
 @router.delete("/bills/{bill_id}")
@@ -1069,9 +1072,17 @@ def import_invoices(
 
 # ========== STATISTICS ENDPOINTS ==========
 
+STATS_TABLES = ("locals", "readings", "invoices", "bills")
+
+
 @router.get("/stats")
-def get_stats(db: Session = Depends(get_db)):
-    """Returns statistics for dashboard."""
+def get_stats(request: Request, db: Session = Depends(get_db)):
+    """Returns statistics for dashboard (cached until one of STATS_TABLES changes; ETag)."""
+    return cached_json_response(request, "water_stats", STATS_TABLES, lambda: _stats(db))
+
+
+def _stats(db: Session) -> Dict[str, Any]:
+    """Builds statistics for dashboard."""
     stats = {
         "locals_count": db.query(Local).count(),
         "readings_count": db.query(Reading).count(),
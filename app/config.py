@@ -38,6 +38,7 @@ class Settings(BaseSettings):
     smtp_port: int = 587
     smtp_user: str = ""
     smtp_password: str = ""
+    smtp_max_message_size: int = 20 * 1024 * 1024  # Limit rozmiaru wiadomości serwera SMTP (bajty, po kodowaniu)
     
     class Config:
         env_file = ".env"
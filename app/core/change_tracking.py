@@ -0,0 +1,171 @@
+"""
+Śledzenie zmian w tabelach bazy danych.
+Pozwala indeksom i cache'om trzymanym w pamięci reagować na zapisy
+(zdarzenia SQLAlchemy: flush, masowe UPDATE/DELETE, commit, rollback).
+
+Każda tabela ma licznik wersji zwiększany przy każdym powiadomieniu o zmianie -
+cache może zapamiętać wersje tabel, z których zbudował wynik, zamiast rejestrować
+funkcję unieważniającą (patrz app.core.response_cache).
+
+Dane pochodne zapisywane w bazie (np. osie taryfowe, wyniki walidacji) rejestrują
+hook przed commitem (on_before_commit): zbierają zmiany w trakcie transakcji
+i aktualizują dane pochodne w tej samej transakcji, tuż przed jej zatwierdzeniem.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, Session
+
+# Klucz w session.info ze zbiorem tabel zmienionych w bieżącej transakcji
+_PENDING_KEY = "changed_tables"
+
+_listeners: List[Tuple[frozenset, Callable[[Set[str]], None]]] = []
+
+
+@dataclass(frozen=True)
+class _CommitHook:
+    key: str
+    apply: Callable[[Session, Any], None]
+    collect_flush: Optional[Callable[[Session], None]]
+    collect_bulk: Optional[Callable[[ORMExecuteState], None]]
+
+
+_commit_hooks: List[_CommitHook] = []
+
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def on_tables_changed(tables: Iterable[str], callback: Callable[[Set[str]], None]) -> None:
+    """
+    Rejestruje funkcję wywoływaną po zmianie którejkolwiek z podanych tabel.
+
+    Callback jest wywoływany po flushu (zmiana jest już widoczna w tej sesji)
+    oraz ponownie po commit/rollback - dzięki temu cache zbudowany w międzyczasie
+    przez inną sesję nie przetrwa ze starymi danymi.
+
+    Args:
+        tables: Nazwy tabel (np. 'electricity_invoices')
+        callback: Funkcja przyjmująca zbiór zmienionych tabel z listy
+    """
+    _listeners.append((frozenset(tables), callback))
+
+
+def on_before_commit(
+    key: str,
+    apply: Callable[[Session, Any], None],
+    collect_flush: Optional[Callable[[Session], None]] = None,
+    collect_bulk: Optional[Callable[[ORMExecuteState], None]] = None
+) -> None:
+    """
+    Rejestruje hook wykonywany przed commitem sesji, w tej samej transakcji.
+
+    collect_flush (po każdym flushu) i collect_bulk (przy zapisach z pominięciem unit
+    of work: query.delete(), insert()) zapisują zmiany w pending_changes(session, key).
+    Przed commitem sesja jest flushowana, a apply dostaje zebrane zmiany - tylko gdy
+    jakieś są. Zapisy wykonane przez apply są flushowane i mogą uruchomić kolejne hooki.
+    Po rollbacku zebrane zmiany są odrzucane.
+
+    Args:
+        key: Klucz w session.info na zmiany zebrane w bieżącej transakcji
+        apply: Funkcja (sesja, zebrane zmiany) aktualizująca dane pochodne
+        collect_flush: Funkcja (sesja) wywoływana po flushu
+        collect_bulk: Funkcja (ORMExecuteState) wywoływana przy masowym INSERT/UPDATE/DELETE
+    """
+    _commit_hooks.append(_CommitHook(key, apply, collect_flush, collect_bulk))
+
+
+def pending_changes(session: Session, key: str, factory: Callable[[], Any] = set) -> Any:
+    """Zwraca (tworząc w razie potrzeby) kontener zmian hooka `key` w bieżącej transakcji."""
+    return session.info.setdefault(key, factory())
+
+
+def table_versions(tables: Iterable[str]) -> Tuple[int, ...]:
+    """
+    Zwraca bieżące wersje tabel (w kolejności podanych nazw).
+
+    Wersję należy odczytać przed zbudowaniem wyniku z tabel - zapis w trakcie
+    budowy zmieni wersję, więc wynik zapamiętany pod starą nie zostanie użyty.
+    """
+    return tuple(_versions.get(table, 0) for table in tables)
+
+
+def _notify(changed: Set[str]) -> None:
+    """Zwiększa wersje zmienionych tabel i wywołuje zarejestrowane funkcje."""
+    with _versions_lock:
+        for table in changed:
+            _versions[table] = _versions.get(table, 0) + 1
+    for watched, callback in list(_listeners):
+        hit = watched & changed
+        if hit:
+            callback(set(hit))
+
+
+def _mark_changed(session: Session, changed: Set[str]) -> None:
+    """Zapamiętuje zmienione tabele w sesji i powiadamia słuchaczy."""
+    if not changed:
+        return
+    session.info.setdefault(_PENDING_KEY, set()).update(changed)
+    _notify(changed)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context) -> None:
+    """Zbiera tabele obiektów dodanych, zmienionych i usuniętych we flushu."""
+    changed = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            changed.add(table.name)
+    _mark_changed(session, changed)
+    for hook in _commit_hooks:
+        if hook.collect_flush is not None:
+            hook.collect_flush(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state) -> None:
+    """Obsługuje zapisy z pominięciem unit of work (query.delete(), insert().values(...))."""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    name = getattr(table, "name", None)
+    if name:
+        _mark_changed(orm_execute_state.session, {name})
+    for hook in _commit_hooks:
+        if hook.collect_bulk is not None:
+            hook.collect_bulk(orm_execute_state)
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session: Session) -> None:
+    """Wykonuje hooki z zebranymi zmianami, aż żaden nie ma nic do zrobienia."""
+    while True:
+        if session.new or session.dirty or session.deleted:
+            session.flush()
+        ready = [(hook, session.info.pop(hook.key)) for hook in _commit_hooks if session.info.get(hook.key)]
+        if not ready:
+            return
+        for hook, pending in ready:
+            hook.apply(session, pending)
+
+
+def _flush_pending(session: Session) -> None:
+    """Powiadamia ponownie o tabelach zmienionych w zakończonej transakcji."""
+    changed = session.info.pop(_PENDING_KEY, None)
+    if changed:
+        _notify(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    _flush_pending(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    _flush_pending(session)
+    for hook in _commit_hooks:
+        session.info.pop(hook.key, None)
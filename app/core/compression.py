@@ -0,0 +1,82 @@
+"""
+Kompresja odpowiedzi HTTP.
+
+GZipMiddleware ze Starlette kompresuje każdą odpowiedź, także PDF, ZIP i odpowiedzi
+częściowe (206). TextGZipMiddleware kompresuje tylko odpowiedzi tekstowe (JSON,
+HTML, CSS, JS). Odpowiedzi z ustawionym Content-Encoding, np. prekompresowane
+zasoby statyczne, przechodzą bez zmian.
+"""
+
+from typing import Set
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Typy treści kompresowane w locie (prefiksy Content-Type)
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "text/")
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    """
+    Kodowania akceptowane przez klienta (nagłówek Accept-Encoding).
+
+    Pomija kodowania z q=0; '*' oznacza dowolne kodowanie.
+    """
+    encodings = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        if name:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+# Tymczasowa wartość Content-Encoding odpowiedzi nietekstowych: GZipMiddleware przepuszcza
+# odpowiedzi z ustawionym Content-Encoding bez zmian, a znacznik jest usuwany przed wysłaniem
+_SKIP_ENCODING = b"x-skip-gzip"
+
+
+class TextGZipMiddleware:
+    """
+    GZipMiddleware tylko dla odpowiedzi tekstowych (patrz COMPRESSIBLE_TYPES).
+
+    Zwykły wrapper ASGI wokół publicznego GZipMiddleware - bez zależności od
+    wewnętrznych klas Starlette.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, compresslevel: int = 9) -> None:
+        self.app = app
+        self.gzip = GZipMiddleware(self._mark_non_text, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or "gzip" not in accepted_encodings(Headers(scope=scope).get("accept-encoding", "")):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_unmarked(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [
+                    (name, value) for name, value in message["headers"]
+                    if not (name.lower() == b"content-encoding" and value == _SKIP_ENCODING)
+                ]}
+            await send(message)
+
+        await self.gzip(scope, receive, send_unmarked)
+
+    async def _mark_non_text(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Oznacza odpowiedzi o typach spoza COMPRESSIBLE_TYPES jako już zakodowane."""
+        async def send_marked(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                text = headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                if not text and "content-encoding" not in headers:
+                    message = {**message, "headers": [*message["headers"], (b"content-encoding", _SKIP_ENCODING)]}
+            await send(message)
+
+        await self.app(scope, receive, send_marked)
@@ -42,7 +42,7 @@ def init_db():
     Obsługuje błędy związane z już istniejącymi indeksami.
     """
     from app.models.water import Local, Reading, Invoice, Bill
-    from app.models.gas import GasInvoice, GasBill
+    from app.models.gas import GasInvoice, GasBill, GasAllocationRule
     from app.models.electricity import ElectricityReading, ElectricityBill
     from app.models.electricity_invoice import (
         ElectricityInvoice,
@@ -50,11 +50,15 @@ def init_db():
         ElectricityInvoiceOdczyt,
         ElectricityInvoiceSprzedazEnergii,
         ElectricityInvoiceOplataDystrybucyjna,
-        ElectricityInvoiceRozliczenieOkres
+        ElectricityInvoiceRozliczenieOkres,
+        ElectricityInvoiceTariffTimeline
     )
     from app.models.user import User
     from app.models.password_reset import PasswordResetCode
     from app.models.combined import CombinedBill
+    from app.models.meter_anomaly import MeterStreamState, MeterStatistic, MeterAnomaly
+    from app.models.validation import ValidationResult
+    from app.models.email_outbox import EmailOutbox
     
     try:
         Base.metadata.create_all(bind=engine, checkfirst=True)
@@ -0,0 +1,396 @@
+"""
+Kolejka wiadomości email (outbox) i worker dostarczający je przez SMTP.
+
+Wiadomości są najpierw zapisywane w tabeli email_outbox (enqueue_email), a worker
+(deliver_outbox) wysyła je w ograniczonej liczbie wątków. Każdy wątek bierze połączenie
+z puli - połączenie jest otwierane (STARTTLS, logowanie) raz i używane dla kolejnych
+wiadomości. Błędy przejściowe (kody 4xx, zerwane połączenie) są ponawiane z rosnącym
+opóźnieniem. Status wiadomości i email_sent_date rachunków łączonych są zapisywane
+zbiorczo po wysyłce.
+
+Wiadomość pobrana do wysyłki ma status 'sending' i czas pobrania (claimed_at). Jeśli
+proces zakończył się w trakcie wysyłki, po SENDING_TIMEOUT wiadomość jest pobierana
+ponownie. Nieudane wiadomości wracają do kolejki przez retry_failed.
+
+Wiadomości są budowane i wysyłane strumieniowo (app.core.mime_stream) - załącznik
+nie jest trzymany w pamięci, a zbyt duży jest dzielony na części.
+"""
+
+import os
+import queue
+import smtplib
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.file_encryption import encrypt_file
+from app.core.mime_stream import AttachmentPart, file_sha256, send_message_file, spool_message, split_attachment
+from app.models.combined import CombinedBill
+from app.models.email_outbox import EmailOutbox
+
+MAX_WORKERS = 4
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 2.0
+SMTP_TIMEOUT = 30
+SENDING_TIMEOUT = timedelta(hours=1)  # Po tym czasie wiadomość 'sending' uznawana jest za przerwaną
+
+_ENTRY_COLUMNS = (
+    'id', 'recipient', 'subject', 'body', 'attachment_path', 'attachment_name',
+    'encrypt_attachment', 'combined_bill_id', 'attempts'
+)
+
+
+@dataclass(frozen=True)
+class SmtpConfig:
+    """Parametry połączenia SMTP."""
+    server: str
+    port: int
+    user: Optional[str] = None
+    password: Optional[str] = None
+    use_tls: bool = True
+    max_message_size: int = settings.smtp_max_message_size  # Większe załączniki są dzielone na części
+
+    @property
+    def sender(self) -> str:
+        """Adres nadawcy - użytkownik SMTP."""
+        return self.user or f"noreply@{self.server}"
+
+
+def smtp_config(
+    smtp_server: str = None,
+    smtp_port: int = None,
+    smtp_user: str = None,
+    smtp_password: str = None,
+    use_tls: bool = True
+) -> Optional[SmtpConfig]:
+    """
+    Konfiguracja SMTP z argumentów, ustawień (Pydantic Settings wczytuje z .env) lub zmiennych środowiskowych.
+
+    Returns:
+        Konfiguracja lub None, jeśli brakuje użytkownika lub hasła SMTP
+    """
+    if smtp_server is None:
+        smtp_server = settings.smtp_server or os.getenv("SMTP_SERVER", "smtp.gmail.com")
+    if smtp_port is None:
+        smtp_port = settings.smtp_port or int(os.getenv("SMTP_PORT", "587"))
+    if smtp_user is None:
+        smtp_user = settings.smtp_user or os.getenv("SMTP_USER")
+    if smtp_password is None:
+        smtp_password = settings.smtp_password or os.getenv("SMTP_PASSWORD")
+
+    # Usuń spacje z hasła (hasła aplikacji Gmail mogą mieć spacje, ale SMTP ich nie akceptuje)
+    if smtp_password:
+        smtp_password = smtp_password.replace(" ", "")
+
+    if not smtp_user or not smtp_password:
+        print("[WARN] Brak konfiguracji SMTP. Ustaw zmienne środowiskowe SMTP_USER i SMTP_PASSWORD")
+        return None
+    return SmtpConfig(smtp_server, smtp_port, smtp_user, smtp_password, use_tls)
+
+
+class SmtpConnectionPool:
+    """Uwierzytelnione połączenia SMTP używane ponownie dla kolejnych wiadomości."""
+
+    def __init__(self, config: SmtpConfig):
+        self.config = config
+        self.opened = 0  # Liczba otwartych połączeń (diagnostyka)
+        self._idle: "queue.LifoQueue[smtplib.SMTP]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.config.server, self.config.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.config.use_tls:
+                server.starttls()
+            if self.config.user:
+                server.login(self.config.user, self.config.password)
+        except Exception:
+            server.close()
+            raise
+        with self._lock:
+            self.opened += 1
+        return server
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """Połączenie z puli (lub nowe); po użyciu wraca do puli, jeśli nadal jest sprawne."""
+        try:
+            server = self._idle.get_nowait()
+        except queue.Empty:
+            server = self._connect()
+        try:
+            yield server
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+            # Serwer odrzucił wiadomość, ale połączenie jest sprawne (poza 421 - serwer je zamyka)
+            if getattr(e, 'smtp_code', None) == 421:
+                server.close()
+            else:
+                self._idle.put(server)
+            raise
+        except Exception:
+            server.close()
+            raise
+        else:
+            self._idle.put(server)
+
+    def close(self) -> None:
+        """Zamyka wszystkie połączenia z puli."""
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+
+def is_transient(error: Exception) -> bool:
+    """Czy błąd wysyłki jest przejściowy (warto ponowić): kody 4xx, zerwane połączenie, timeout."""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return isinstance(error, OSError)
+
+
+def enqueue_email(
+    db: Session,
+    kind: str,
+    recipient: str,
+    subject: str,
+    body: str,
+    attachment_path: Optional[str] = None,
+    attachment_name: Optional[str] = None,
+    encrypt_attachment: bool = False,
+    combined_bill_id: Optional[int] = None
+) -> EmailOutbox:
+    """
+    Zapisuje wiadomość w kolejce (bez commit - wiadomość jest częścią transakcji wywołującego).
+
+    Args:
+        db: Sesja bazy danych
+        kind: Rodzaj wiadomości ('combined_bill', 'backup')
+        recipient: Email odbiorcy
+        subject: Temat
+        body: Treść (tekst)
+        attachment_path: Ścieżka załącznika (czytanego przy wysyłce)
+        attachment_name: Nazwa załącznika w wiadomości
+        encrypt_attachment: Czy zaszyfrować załącznik (app.core.file_encryption)
+        combined_bill_id: Rachunek łączony, któremu po wysyłce ustawiane jest email_sent_date
+
+    Returns:
+        Wiadomość z nadanym ID
+    """
+    entry = EmailOutbox(
+        kind=kind, recipient=recipient, subject=subject, body=body,
+        attachment_path=attachment_path, attachment_name=attachment_name,
+        encrypt_attachment=encrypt_attachment, combined_bill_id=combined_bill_id,
+        status='pending', attempts=0, created_at=datetime.now()
+    )
+    db.add(entry)
+    db.flush()
+    return entry
+
+
+def retry_failed(db: Session, ids: Optional[Iterable[int]] = None) -> List[int]:
+    """
+    Przywraca nieudane wiadomości do kolejki (bez commit).
+
+    Args:
+        db: Sesja bazy danych
+        ids: Ponawiane wiadomości (domyślnie wszystkie nieudane)
+
+    Returns:
+        ID wiadomości przywróconych do kolejki
+    """
+    query = db.query(EmailOutbox.id).filter(EmailOutbox.status == 'failed')
+    if ids is not None:
+        query = query.filter(EmailOutbox.id.in_(list(ids)))
+    retried = [row.id for row in query.order_by(EmailOutbox.id)]
+    if retried:
+        db.execute(update(EmailOutbox), [{'id': entry_id, 'status': 'pending'} for entry_id in retried])
+    return retried
+
+
+def _message_parts(
+    entry: Dict[str, Any],
+    attachment_path: Optional[str],
+    max_message_size: int
+) -> List[Tuple[str, str, Optional[AttachmentPart]]]:
+    """
+    Wiadomości do wysłania dla wiersza kolejki: (temat, treść, załącznik).
+    Załącznik przekraczający limit rozmiaru jest dzielony na numerowane części, każda w osobnej wiadomości.
+    """
+    if not attachment_path:
+        return [(entry['subject'], entry['body'], None)]
+    parts = split_attachment(attachment_path, entry['attachment_name'], max_message_size)
+    if len(parts) == 1:
+        return [(entry['subject'], entry['body'], parts[0])]
+
+    checksum = file_sha256(attachment_path)
+    note = (
+        f"\n\nZałącznik {entry['attachment_name']} został podzielony na {len(parts)} części "
+        f"(limit rozmiaru wiadomości). Zapisz wszystkie części w jednym katalogu i połącz je poleceniem:\n"
+        f"    python tools/join_attachment_parts.py {parts[0].name} --sha256 {checksum}\n"
+    )
+    return [
+        (f"{entry['subject']} (część {index}/{len(parts)})", entry['body'] + note, part)
+        for index, part in enumerate(parts, start=1)
+    ]
+
+
+@contextmanager
+def _attachment_file(entry: Dict[str, Any]) -> Iterator[Optional[str]]:
+    """Ścieżka załącznika do wysłania - dla szyfrowanych załączników plik tymczasowy usuwany po wysyłce."""
+    if not entry['attachment_path'] or not entry['encrypt_attachment']:
+        yield entry['attachment_path']
+        return
+    handle, encrypted_path = tempfile.mkstemp(suffix=".encrypted")
+    os.close(handle)
+    try:
+        encrypt_file(entry['attachment_path'], encrypted_path)
+        yield encrypted_path
+    finally:
+        Path(encrypted_path).unlink(missing_ok=True)
+
+
+def _send_with_retry(
+    pool: SmtpConnectionPool,
+    recipient: str,
+    message,
+    result: Dict[str, Any],
+    max_attempts: int,
+    backoff: float,
+    sleep: Callable[[float], None]
+) -> bool:
+    """Wysyła wiadomość z pliku, ponawiając błędy przejściowe; liczy próby i błąd w result."""
+    for attempt in range(1, max_attempts + 1):
+        result['attempts'] += 1
+        try:
+            with pool.connection() as server:
+                send_message_file(server, pool.config.sender, recipient, message)
+            return True
+        except Exception as e:
+            result['last_error'] = f"{type(e).__name__}: {e}"[:500]
+            if not is_transient(e) or attempt == max_attempts:
+                return False
+            sleep(backoff * 2 ** (attempt - 1))
+    return False
+
+
+def _deliver(
+    pool: SmtpConnectionPool,
+    entry: Dict[str, Any],
+    max_attempts: int,
+    backoff: float,
+    sleep: Callable[[float], None]
+) -> Dict[str, Any]:
+    """Wysyła wiadomość, ponawiając błędy przejściowe; zwraca wiersz do zbiorczego UPDATE kolejki."""
+    result = {'id': entry['id'], 'status': 'failed', 'attempts': entry['attempts'], 'last_error': None, 'sent_at': None}
+    try:
+        with _attachment_file(entry) as attachment_path:
+            # Każda wiadomość (część załącznika) jest budowana w pliku tymczasowym tuż przed wysyłką
+            for subject, body, attachment in _message_parts(entry, attachment_path, pool.config.max_message_size):
+                with spool_message(pool.config.sender, entry['recipient'], subject, body, attachment) as message:
+                    if not _send_with_retry(pool, entry['recipient'], message, result, max_attempts, backoff, sleep):
+                        print(f"[ERROR] Nie wysłano wiadomości {entry['id']} do {entry['recipient']}: {result['last_error']}")
+                        return result
+    except Exception as e:
+        result['attempts'] += 1
+        result['last_error'] = f"Nie można zbudować wiadomości: {e}"[:500]
+        return result
+
+    result.update(status='sent', last_error=None, sent_at=datetime.now())
+    return result
+
+
+def deliver_outbox(
+    db: Session,
+    config: Optional[SmtpConfig] = None,
+    ids: Optional[Iterable[int]] = None,
+    max_workers: int = MAX_WORKERS,
+    max_attempts: int = MAX_ATTEMPTS,
+    backoff: float = BACKOFF_SECONDS,
+    sleep: Callable[[float], None] = time.sleep,
+    sending_timeout: timedelta = SENDING_TIMEOUT
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Wysyła oczekujące wiadomości z kolejki oraz wiadomości, których wysyłka została przerwana.
+
+    Args:
+        db: Sesja bazy danych
+        config: Konfiguracja SMTP (domyślnie smtp_config())
+        ids: Wysyłane wiadomości (domyślnie wszystkie oczekujące)
+        max_workers: Maksymalna liczba równoległych wysyłek (i połączeń SMTP)
+        max_attempts: Liczba prób dla błędów przejściowych
+        backoff: Opóźnienie przed pierwszym ponowieniem (sekundy, podwajane przy kolejnych)
+        sleep: Funkcja oczekiwania (testy)
+        sending_timeout: Czas, po którym wiadomość 'sending' jest pobierana ponownie
+
+    Returns:
+        {id wiadomości: {'status', 'attempts', 'last_error', 'sent_at'}}
+    """
+    # Pobranie do wysyłki jednym warunkowym UPDATE - wiadomość pobrana przez równoległe
+    # wywołanie nie spełnia już warunku, więc każda wiadomość jest wysyłana raz
+    now = datetime.now()
+    claim = update(EmailOutbox).where(or_(
+        EmailOutbox.status == 'pending',
+        and_(
+            EmailOutbox.status == 'sending',
+            or_(EmailOutbox.claimed_at.is_(None), EmailOutbox.claimed_at < now - sending_timeout)
+        )
+    ))
+    if ids is not None:
+        claim = claim.where(EmailOutbox.id.in_(list(ids)))
+    claimed = db.execute(
+        claim.values(status='sending', claimed_at=now)
+        .returning(*(getattr(EmailOutbox, column) for column in _ENTRY_COLUMNS)),
+        execution_options={'synchronize_session': False}
+    )
+    entries = sorted((dict(row._mapping) for row in claimed), key=lambda entry: entry['id'])
+    db.commit()
+    if not entries:
+        return {}
+
+    if config is None:
+        config = smtp_config()
+    if config is None:
+        results = [
+            {'id': entry['id'], 'status': 'failed', 'attempts': entry['attempts'],
+             'last_error': "Brak konfiguracji SMTP", 'sent_at': None}
+            for entry in entries
+        ]
+    else:
+        pool = SmtpConnectionPool(config)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(entries)))) as executor:
+                results = list(executor.map(
+                    lambda entry: _deliver(pool, entry, max_attempts, backoff, sleep), entries
+                ))
+        finally:
+            pool.close()
+
+    # Statusy wiadomości i daty wysłania rachunków - zbiorczo
+    db.execute(update(EmailOutbox), results)
+    today = date.today()
+    sent_bills = [
+        {'id': entry['combined_bill_id'], 'email_sent_date': today}
+        for entry, result in zip(entries, results)
+        if result['status'] == 'sent' and entry['combined_bill_id'] is not None
+    ]
+    if sent_bills:
+        db.execute(update(CombinedBill), sent_bills)
+    db.commit()
+    return {result['id']: result for result in results}
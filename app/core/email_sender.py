@@ -1,18 +1,20 @@
 """
 Moduł wysyłania emaili z backupami bazy danych.
 Pliki są szyfrowane przed wysłaniem - tylko aplikacja może je odszyfrować.
+Backupy są wysyłane przez kolejkę wiadomości (app.core.email_outbox).
 """
 
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from pathlib import Path
 from typing import Optional, List
 import os
 
-from app.core.file_encryption import encrypt_file_in_memory
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.core.email_outbox import deliver_outbox, enqueue_email, smtp_config
 from app.config import settings
 
 
@@ -23,10 +25,13 @@ def send_backup_email(
     smtp_port: int = 587,
     smtp_user: str = None,
     smtp_password: str = None,
-    use_tls: bool = True
+    use_tls: bool = True,
+    db: Optional[Session] = None
 ) -> bool:
     """
     Wysyła backup bazy danych na email.
+    Wiadomość trafia do kolejki (app.core.email_outbox) i jest od razu wysyłana przez worker;
+    plik jest szyfrowany dopiero przy budowie wiadomości.
     
     Args:
         recipient_email: Email odbiorcy
@@ -36,26 +41,13 @@ def send_backup_email(
         smtp_user: Użytkownik SMTP (domyślnie z zmiennych środowiskowych)
         smtp_password: Hasło SMTP (domyślnie z zmiennych środowiskowych)
         use_tls: Czy używać TLS
+        db: Sesja bazy danych (domyślnie nowa sesja)
     
     Returns:
         True jeśli wysłano pomyślnie, False w przeciwnym razie
     """
-    # Pobierz konfigurację z ustawień (Pydantic Settings wczytuje z .env) lub zmiennych środowiskowych
-    if smtp_server is None:
-        smtp_server = settings.smtp_server or os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    if smtp_port is None:
-        smtp_port = settings.smtp_port or int(os.getenv("SMTP_PORT", "587"))
-    if smtp_user is None:
-        smtp_user = settings.smtp_user or os.getenv("SMTP_USER")
-    if smtp_password is None:
-        smtp_password = settings.smtp_password or os.getenv("SMTP_PASSWORD")
-    
-    # Usuń spacje z hasła (hasła aplikacji Gmail mogą mieć spacje, ale SMTP ich nie akceptuje)
-    if smtp_password:
-        smtp_password = smtp_password.replace(" ", "")
-    
-    if not smtp_user or not smtp_password:
-        print("[WARN] Brak konfiguracji SMTP. Ustaw zmienne środowiskowe SMTP_USER i SMTP_PASSWORD")
+    config = smtp_config(smtp_server, smtp_port, smtp_user, smtp_password, use_tls)
+    if config is None:
         print(f"[DEBUG] SMTP_USER z settings: '{settings.smtp_user}'")
         print(f"[DEBUG] SMTP_PASSWORD z settings: {'*' * len(settings.smtp_password) if settings.smtp_password else 'BRAK'}")
         print(f"[DEBUG] SMTP_USER z os.getenv: '{os.getenv('SMTP_USER')}'")
@@ -71,15 +63,9 @@ def send_backup_email(
         print(f"[ERROR] Plik backupu nie istnieje: {backup_file_path}")
         return False
     
-    try:
-        # Utwórz wiadomość
-        msg = MIMEMultipart()
-        msg['From'] = smtp_user
-        msg['To'] = recipient_email
-        msg['Subject'] = f"Backup bazy danych - {Path(backup_file_path).stem}"
-        
-        # Treść wiadomości
-        body = f"""
+    subject = f"Backup bazy danych - {Path(backup_file_path).stem}"
+    
+    body = f"""
 Witaj,
 
 W załączniku znajduje się zaszyfrowany backup bazy danych systemu rozliczania rachunków.
@@ -91,74 +77,33 @@ Data utworzenia: {Path(backup_file_path).stem.replace('water_billing_backup_', '
 
 Pozdrawiam,
 System rozliczania rachunków
-        """
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # Zaszyfruj plik przed wysłaniem
-        try:
-            encrypted_data = encrypt_file_in_memory(backup_file_path)
-            
-            # Utwórz nazwę pliku z rozszerzeniem .encrypted
-            original_filename = Path(backup_file_path).name
-            encrypted_filename = f"{original_filename}.encrypted"
-            
-            # Załącz zaszyfrowany plik
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(encrypted_data)
-            
-            encoders.encode_base64(part)
-            part.add_header(
-                'Content-Disposition',
-                f'attachment; filename= {encrypted_filename}'
-            )
-            msg.attach(part)
-            
-        except Exception as e:
-            print(f"[ERROR] Błąd szyfrowania pliku przed wysłaniem: {str(e)}")
-            raise
-        
-        # Wyślij email
-        print(f"[INFO] Próba połączenia z SMTP: {smtp_server}:{smtp_port}")
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.set_debuglevel(1)  # Włącz debugowanie SMTP
-        
-        if use_tls:
-            print("[INFO] Włączanie TLS...")
-            server.starttls()
-        
-        print("[INFO] Logowanie do serwera SMTP...")
-        server.login(smtp_user, smtp_password)
-        print("[INFO] Zalogowano pomyślnie")
-        
-        print(f"[INFO] Wysyłanie emaila do: {recipient_email}")
-        text = msg.as_string()
-        server.sendmail(smtp_user, recipient_email, text)
-        server.quit()
-        
-        print(f"[OK] Wysłano backup na email: {recipient_email}")
-        return True
-        
-    except smtplib.SMTPAuthenticationError as e:
-        print(f"[ERROR] Błąd autentykacji SMTP: {str(e)}")
-        print(f"[ERROR] Sprawdź czy:")
-        print(f"[ERROR]   1. Hasło aplikacji jest poprawne (bez spacji)")
-        print(f"[ERROR]   2. Włączona jest weryfikacja dwuetapowa w Gmail")
-        print(f"[ERROR]   3. Używasz hasła aplikacji, nie hasła konta Gmail")
-        return False
-    except smtplib.SMTPException as e:
-        print(f"[ERROR] Błąd SMTP: {str(e)}")
-        return False
-    except Exception as e:
-        print(f"[ERROR] Błąd wysyłania email: {str(e)}")
-        print(f"[ERROR] Typ błędu: {type(e).__name__}")
-        import traceback
-        print(f"[ERROR] Szczegóły: {traceback.format_exc()}")
+    """
+    
+    session = db if db is not None else SessionLocal()
+    try:
+        entry = enqueue_email(
+            session, 'backup', recipient_email, subject, body,
+            attachment_path=backup_file_path,
+            attachment_name=f"{Path(backup_file_path).name}.encrypted",
+            encrypt_attachment=True
+        )
+        session.commit()
+        result = deliver_outbox(session, config, ids=[entry.id])[entry.id]
+    finally:
+        if db is None:
+            session.close()
+    
+    if result['status'] != 'sent':
+        print(f"[ERROR] Nie wysłano backupu na email {recipient_email}: {result['last_error']}")
         return False
+    print(f"[OK] Wysłano backup na email: {recipient_email}")
+    return True
 
 
 def send_backup_to_user_email(
     user_email: str,
-    backup_file_path: str = None
+    backup_file_path: str = None,
+    db: Optional[Session] = None
 ) -> bool:
     """
     Wysyła backup na email użytkownika.
@@ -167,6 +112,7 @@ def send_backup_to_user_email(
     Args:
         user_email: Email użytkownika
         backup_file_path: Ścieżka do pliku backupu (opcjonalnie)
+        db: Sesja bazy danych (opcjonalnie)
     
     Returns:
         True jeśli wysłano pomyślnie, False w przeciwnym razie
@@ -179,7 +125,7 @@ def send_backup_to_user_email(
             print("[ERROR] Brak dostępnego backupu do wysłania")
             return False
     
-    return send_backup_email(recipient_email=user_email, backup_file_path=backup_file_path)
+    return send_backup_email(recipient_email=user_email, backup_file_path=backup_file_path, db=db)
 
 
 def send_password_reset_code(
@@ -0,0 +1,215 @@
+"""
+Strumieniowe budowanie i wysyłanie wiadomości email z dużymi załącznikami.
+
+Załącznik jest czytany z dysku porcjami i kodowany base64 bezpośrednio do pliku
+tymczasowego (SpooledTemporaryFile - małe wiadomości zostają w pamięci, duże trafiają
+na dysk). Wiadomość jest wysyłana z tego pliku komendą DATA, również porcjami,
+więc w pamięci nie ma ani całego załącznika, ani całej zakodowanej wiadomości.
+
+Załącznik większy niż limit rozmiaru wiadomości serwera jest dzielony na numerowane
+części (nazwa.part001, nazwa.part002, ...) wysyłane w osobnych wiadomościach;
+tools/join_attachment_parts.py składa je z powrotem.
+"""
+
+import base64
+import hashlib
+import secrets
+import smtplib
+import tempfile
+from dataclasses import dataclass
+from email import policy
+from email.header import Header
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from pathlib import Path
+from typing import BinaryIO, List, Optional
+
+LINE_BYTES = 57  # Bajty załącznika na linię base64 (76 znaków)
+CHUNK_SIZE = LINE_BYTES * 1024  # Wielokrotność LINE_BYTES - porcje kodowane niezależnie
+SPOOL_MAX_SIZE = 1024 * 1024  # Większe wiadomości są buforowane na dysku
+SEND_BUFFER_SIZE = 64 * 1024
+MESSAGE_OVERHEAD = 16 * 1024  # Zapas na nagłówki i treść wiadomości przy dzieleniu załącznika
+
+
+@dataclass(frozen=True)
+class AttachmentPart:
+    """Fragment pliku wysyłany jako załącznik."""
+    path: str
+    name: str
+    offset: int = 0
+    length: Optional[int] = None  # None - do końca pliku
+
+
+def encoded_size(length: int) -> int:
+    """Rozmiar danych po kodowaniu base64 w liniach po 76 znaków z CRLF."""
+    lines = -(-length // LINE_BYTES)
+    return -(-length // 3) * 4 + lines * 2
+
+
+def split_attachment(path: str, name: str, max_message_size: int) -> List[AttachmentPart]:
+    """
+    Dzieli plik na części mieszczące się (po zakodowaniu) w limicie rozmiaru wiadomości.
+
+    Args:
+        path: Ścieżka pliku
+        name: Nazwa załącznika
+        max_message_size: Limit rozmiaru wiadomości serwera SMTP (bajty)
+
+    Returns:
+        Jedna część z oryginalną nazwą lub części nazwa.part001, nazwa.part002, ...
+    """
+    size = Path(path).stat().st_size
+    budget = max_message_size - MESSAGE_OVERHEAD
+    if encoded_size(size) <= budget:
+        return [AttachmentPart(path, name)]
+
+    # Największa liczba bajtów (wielokrotność linii), której kodowanie mieści się w limicie
+    part_size = budget // (4 * LINE_BYTES // 3 + 2) * LINE_BYTES
+    if part_size <= 0:
+        raise ValueError(f"Limit rozmiaru wiadomości {max_message_size} B jest za mały na załącznik")
+    offsets = range(0, size, part_size)
+    return [
+        AttachmentPart(path, f"{name}.part{index:03d}", offset, min(part_size, size - offset))
+        for index, offset in enumerate(offsets, start=1)
+    ]
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 pliku liczony porcjami."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_base64(target: BinaryIO, attachment: AttachmentPart) -> None:
+    """Koduje fragment pliku base64 porcjami (linie 76 znaków zakończone CRLF)."""
+    with open(attachment.path, "rb") as source:
+        source.seek(attachment.offset)
+        remaining = attachment.length
+        while remaining is None or remaining > 0:
+            chunk = source.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            target.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+
+
+def write_message(
+    target: BinaryIO,
+    sender: str,
+    recipient: str,
+    subject: str,
+    body: str,
+    attachment: Optional[AttachmentPart] = None
+) -> None:
+    """
+    Zapisuje wiadomość (multipart/mixed, linie CRLF) do pliku, kodując załącznik porcjami.
+
+    Args:
+        target: Plik binarny
+        sender: Nadawca
+        recipient: Odbiorca
+        subject: Temat
+        body: Treść (tekst)
+        attachment: Załącznik (opcjonalny)
+    """
+    boundary = f"==============={secrets.token_hex(16)}=="
+    encoded_subject = Header(subject, 'utf-8').encode(linesep="\r\n")
+    headers = [
+        f"From: {sender}",
+        f"To: {recipient}",
+        f"Subject: {encoded_subject}",
+        f"Date: {formatdate(localtime=True)}",
+        f"Message-ID: {make_msgid()}",
+        "MIME-Version: 1.0",
+        f'Content-Type: multipart/mixed; boundary="{boundary}"',
+    ]
+    target.write(("\r\n".join(headers) + "\r\n\r\n").encode("ascii"))
+
+    text = MIMEText(body, 'plain', 'utf-8')
+    del text['MIME-Version']
+    target.write(f"--{boundary}\r\n".encode("ascii"))
+    target.write(text.as_bytes(policy=policy.SMTP))
+
+    if attachment is not None:
+        target.write((
+            f"\r\n--{boundary}\r\n"
+            "Content-Type: application/octet-stream\r\n"
+            "Content-Transfer-Encoding: base64\r\n"
+            f"Content-Disposition: attachment; filename= {attachment.name}\r\n\r\n"
+        ).encode("utf-8"))
+        _write_base64(target, attachment)
+    target.write(f"\r\n--{boundary}--\r\n".encode("ascii"))
+
+
+def spool_message(*args, **kwargs) -> BinaryIO:
+    """Buduje wiadomość (argumenty jak write_message) w pliku tymczasowym ustawionym na początek."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        write_message(spool, *args, **kwargs)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _reset(server: smtplib.SMTP, code: int) -> None:
+    """Przerywa transakcję po odrzuceniu (421 - serwer zamyka połączenie)."""
+    if code == 421:
+        server.close()
+    else:
+        server.rset()
+
+
+def send_message_file(server: smtplib.SMTP, sender: str, recipient: str, message: BinaryIO) -> None:
+    """
+    Wysyła wiadomość z pliku (MAIL, RCPT, DATA) porcjami - odpowiednik SMTP.sendmail,
+    który nie wymaga całej wiadomości w pamięci.
+
+    Raises:
+        SMTPSenderRefused, SMTPRecipientsRefused, SMTPDataError: jak SMTP.sendmail
+    """
+    message.seek(0, 2)
+    size = message.tell()
+    message.seek(0)
+
+    server.ehlo_or_helo_if_needed()
+    options = [f"size={size}"] if server.does_esmtp and server.has_extn('size') else []
+    code, response = server.mail(sender, options)
+    if code != 250:
+        _reset(server, code)
+        raise smtplib.SMTPSenderRefused(code, response, sender)
+    code, response = server.rcpt(recipient)
+    if code not in (250, 251):
+        _reset(server, code)
+        raise smtplib.SMTPRecipientsRefused({recipient: (code, response)})
+
+    server.putcmd("data")
+    code, response = server.getreply()
+    if code != 354:
+        _reset(server, code)
+        raise smtplib.SMTPDataError(code, response)
+
+    buffer = bytearray()
+    line = b"\r\n"
+    for line in message:
+        # Linie zaczynające się od kropki są podwajane (RFC 5321, 4.5.2)
+        if line.startswith(b"."):
+            buffer += b"."
+        buffer += line
+        if len(buffer) >= SEND_BUFFER_SIZE:
+            server.send(bytes(buffer))
+            buffer.clear()
+    if not line.endswith(b"\r\n"):
+        buffer += b"\r\n"
+    buffer += b".\r\n"
+    server.send(bytes(buffer))
+
+    code, response = server.getreply()
+    if code != 250:
+        _reset(server, code)
+        raise smtplib.SMTPDataError(code, response)
@@ -0,0 +1,175 @@
+"""
+Stronicowanie kursorowe (keyset) i wybór pól dla endpointów list.
+
+Strona jest wyznaczana warunkiem na kluczu sortowania (data, id) zamiast OFFSET,
+więc koszt pobrania strony nie rośnie z jej numerem (indeks na (data, id)).
+Kursor następnej strony to zakodowany klucz ostatniego wiersza - zwracany
+w nagłówku X-Next-Cursor, dzięki czemu odpowiedź pozostaje listą.
+
+Stronicowanie jest opcjonalne: żądanie bez limit= i cursor= zwraca całą listę
+(jak przed wprowadzeniem stronicowania). Kursor bez limitu oznacza stronę
+DEFAULT_PAGE_SIZE wierszy.
+
+Parametr fields= ogranicza zapytanie SQL do wybranych kolumn (bez tworzenia
+obiektów ORM).
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import desc, tuple_
+from sqlalchemy.orm import Session
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+@dataclass(frozen=True)
+class Page:
+    """Strona wyników: wiersze (słowniki kolumn lub obiekty) i kursor następnej strony."""
+    items: List[Any]
+    next_cursor: Optional[str]
+
+
+def model_columns(model) -> Dict[str, Any]:
+    """Wszystkie kolumny modelu jako {nazwa atrybutu: kolumna}."""
+    return {attr.key: getattr(model, attr.key) for attr in model.__mapper__.column_attrs}
+
+
+def select_fields(columns: Dict[str, Any], fields: Optional[str], default: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Wybiera kolumny podane w fields= (lista rozdzielona przecinkami).
+
+    Args:
+        columns: Dostępne pola {nazwa: kolumna}
+        fields: Parametr zapytania (None - pola domyślne)
+        default: Pola domyślne (None - wszystkie dostępne)
+
+    Returns:
+        {nazwa: kolumna} w kolejności żądania
+
+    Raises:
+        HTTPException: 400 przy nieznanym polu
+    """
+    if fields is None:
+        names = list(default) if default is not None else list(columns)
+    else:
+        names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in names if name not in columns]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Nieznane pola: {', '.join(unknown)}. Dostępne: {', '.join(columns)}"
+            )
+    return {name: columns[name] for name in names}
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Koduje klucz wiersza (data, id) jako kursor."""
+    payload = [value.isoformat() if isinstance(value, date) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[Any]) -> List[Any]:
+    """
+    Dekoduje kursor do wartości kolumn klucza.
+
+    Raises:
+        HTTPException: 400 przy nieprawidłowym kursorze
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        return [
+            date.fromisoformat(value) if key.type.python_type is date else value
+            for key, value in zip(keys, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Nieprawidłowy kursor stronicowania")
+
+
+def page_size(limit: Optional[int], cursor: Optional[str] = None) -> Optional[int]:
+    """
+    Rozmiar strony ograniczony do 1..MAX_PAGE_SIZE.
+
+    Bez limitu: None (cała lista), a przy podanym kursorze DEFAULT_PAGE_SIZE.
+    """
+    if limit is None:
+        return None if cursor is None else DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_query(query, keys: Sequence[Any], cursor: Optional[str], limit: Optional[int]):
+    """
+    Ogranicza zapytanie (kolumny lub obiekty ORM) do strony za kursorem.
+
+    Pobiera limit + 1 wierszy - nadmiarowy wiersz oznacza, że jest następna strona
+    (patrz split_page). Bez limitu (None) pobiera wszystkie wiersze.
+    """
+    if cursor:
+        query = query.filter(tuple_(*keys) < tuple_(*decode_cursor(cursor, keys)))
+    query = query.order_by(*(desc(key) for key in keys))
+    return query if limit is None else query.limit(limit + 1)
+
+
+def split_page(
+    rows: List[Any], limit: Optional[int], key: Callable[[Any], Sequence[Any]]
+) -> Tuple[List[Any], Optional[str]]:
+    """Obcina wiersze z keyset_query do strony; zwraca (wiersze, kursor następnej strony lub None)."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def keyset_page(
+    db: Session,
+    columns: Dict[str, Any],
+    keys: Sequence[Any],
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    filters: Sequence[Any] = (),
+    outerjoins: Sequence[Tuple[Any, Any]] = ()
+) -> Page:
+    """
+    Pobiera stronę wierszy posortowanych malejąco po kluczu (np. data, id).
+
+    Args:
+        db: Sesja bazy danych
+        columns: Wybrane kolumny {nazwa: kolumna} - tylko one trafiają do SELECT
+        keys: Kolumny klucza sortowania (razem unikalne)
+        cursor: Kursor z poprzedniej strony (None - pierwsza strona)
+        limit: Rozmiar strony (ograniczany do MAX_PAGE_SIZE; None - patrz page_size)
+        filters: Dodatkowe warunki WHERE
+        outerjoins: Tabele dołączane LEFT JOIN [(model, warunek)] - dla kolumn z innych tabel
+
+    Returns:
+        Page z wierszami jako słownikami {nazwa: wartość}
+    """
+    limit = page_size(limit, cursor)
+    key_labels = [f"_key{index}" for index in range(len(keys))]
+    query = db.query(
+        *(column.label(name) for name, column in columns.items()),
+        *(key.label(label) for key, label in zip(keys, key_labels))
+    ).select_from(keys[0].class_)
+    for target, onclause in outerjoins:
+        query = query.outerjoin(target, onclause)
+    query = query.filter(*filters)
+    rows, next_cursor = split_page(
+        keyset_query(query, keys, cursor, limit).all(), limit,
+        lambda row: [row._mapping[label] for label in key_labels]
+    )
+    return Page([{name: row._mapping[name] for name in columns} for row in rows], next_cursor)
+
+
+def paginated(response: Response, page: Page) -> List[Any]:
+    """Ustawia nagłówek X-Next-Cursor (jeśli jest następna strona) i zwraca wiersze."""
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    return page.items
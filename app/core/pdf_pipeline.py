@@ -0,0 +1,247 @@
+"""
+Równoległe renderowanie PDF rachunków z modeli widoku (app.core.pdf_toolkit).
+
+Modele widoku są budowane w procesie głównym (jedna sesja bazy, zapytania
+zbiorcze), a renderowane w puli procesów - reportlab jest czystym Pythonem,
+więc wątki nie przyspieszają składania dokumentów. Każdy proces roboczy
+rejestruje czcionkę i buduje style raz, przy starcie.
+
+Pliki są zapisywane atomowo (plik tymczasowy + os.replace), więc przerwane
+renderowanie nie zostawia uciętego PDF pod docelową ścieżką. Ścieżki
+wygenerowanych plików zapisuje się w bazie jednym zbiorczym UPDATE.
+
+Rachunek przechowuje w pdf_hash skrót danych wejściowych PDF (bloki modelu
+widoku, ścieżka, wersja szablonu) - jeśli skrót się nie zmienił, a plik
+istnieje, rachunek nie jest renderowany ponownie.
+"""
+
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.pdf_toolkit import PDF_TEMPLATE_VERSION, get_default_font, get_paragraph_styles, render_view
+
+# Do tylu rachunków renderowanie odbywa się w bieżącym procesie (start puli kosztuje więcej)
+INLINE_THRESHOLD = 2
+
+
+def _init_worker() -> None:
+    """Rejestruje czcionkę i buduje style raz na proces roboczy."""
+    get_paragraph_styles(get_default_font())
+
+
+def _hash_default(value: Any) -> str:
+    """Serializacja funkcji komend stylu tabel (po nazwie) i innych wartości spoza JSON."""
+    if callable(value):
+        return f"{value.__module__}.{value.__qualname__}"
+    return str(value)
+
+
+def view_hash(view: Dict[str, Any]) -> str:
+    """
+    Skrót SHA-256 danych wejściowych PDF: bloki modelu widoku (wartości rachunku,
+    faktury i najemcy w postaci drukowanej), ścieżka pliku i wersja szablonu.
+    """
+    payload = json.dumps(
+        [PDF_TEMPLATE_VERSION, view['path'], view['blocks']],
+        default=_hash_default,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_unchanged(view: Dict[str, Any], stored_hash: Optional[str]) -> bool:
+    """Czy PDF rachunku jest aktualny (ten sam skrót i plik istnieje)."""
+    return stored_hash is not None and stored_hash == view_hash(view) and Path(view['path']).exists()
+
+
+def write_pdf(view: Dict[str, Any]) -> str:
+    """
+    Renderuje model widoku do pliku view['path'] atomowo.
+
+    Returns:
+        Ścieżka pliku (view['path'])
+    """
+    path = Path(view['path'])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        render_view(view, str(tmp_path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return view['path']
+
+
+def _render(view: Dict[str, Any]) -> Tuple[int, Optional[str], Optional[str]]:
+    """Renderuje jeden rachunek w procesie roboczym: (bill_id, ścieżka, błąd)."""
+    try:
+        return view['bill_id'], write_pdf(view), None
+    except Exception as e:
+        return view['bill_id'], None, str(e)
+
+
+def render_bytes(view: Dict[str, Any]) -> bytes:
+    """Renderuje model widoku do pamięci (bez zapisu na dysk)."""
+    buffer = BytesIO()
+    render_view(view, buffer)
+    return buffer.getvalue()
+
+
+class RenderQueue:
+    """
+    Renderuje modele widoku do bajtów w kolejności, w puli procesów, z wyprzedzeniem
+    co najwyżej `window` rachunków - w pamięci czeka najwyżej tyle gotowych PDF.
+    Renderowanie rusza od razu przy utworzeniu kolejki.
+    """
+
+    def __init__(self, views: List[Dict[str, Any]], max_workers: Optional[int] = None, window: Optional[int] = None):
+        self.views = views
+        self.next_index = 0
+        self.pool = None
+        self.futures = deque()
+        workers = min(max_workers or os.cpu_count() or 1, len(views))
+        if len(views) > INLINE_THRESHOLD and workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            self.window = window or workers * 2
+            self._submit()
+
+    def _submit(self) -> None:
+        while len(self.futures) < self.window and self.next_index < len(self.views):
+            self.futures.append(self.pool.submit(render_bytes, self.views[self.next_index]))
+            self.next_index += 1
+
+    def next(self) -> bytes:
+        """PDF kolejnego modelu widoku (w kolejności `views`)."""
+        if self.pool is None:
+            view = self.views[self.next_index]
+            self.next_index += 1
+            return render_bytes(view)
+        data = self.futures.popleft().result()
+        self._submit()
+        return data
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def __enter__(self) -> "RenderQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def render_views(
+    views: List[Dict[str, Any]],
+    max_workers: Optional[int] = None
+) -> Tuple[Dict[int, str], Dict[int, str]]:
+    """
+    Renderuje modele widoku rachunków, równolegle w puli procesów.
+
+    Args:
+        views: Modele widoku ({'bill_id', 'path', 'blocks'})
+        max_workers: Liczba procesów (domyślnie liczba CPU, 1 = w bieżącym procesie)
+
+    Returns:
+        Krotka ({bill_id: ścieżka}, {bill_id: komunikat błędu})
+    """
+    workers = min(max_workers or os.cpu_count() or 1, len(views))
+    if len(views) <= INLINE_THRESHOLD or workers <= 1:
+        results = [_render(view) for view in views]
+    else:
+        chunksize = max(1, len(views) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = list(pool.map(_render, views, chunksize=chunksize))
+
+    paths = {bill_id: path for bill_id, path, error in results if error is None}
+    errors = {bill_id: error for bill_id, path, error in results if error is not None}
+    return paths, errors
+
+
+def write_pdf_cached(bill, view: Dict[str, Any]) -> str:
+    """
+    Renderuje pojedynczy rachunek, chyba że jego PDF jest aktualny; ustawia bill.pdf_hash (bez commit).
+
+    Returns:
+        Ścieżka pliku (view['path'])
+    """
+    if is_unchanged(view, bill.pdf_hash):
+        return view['path']
+    path = write_pdf(view)
+    bill.pdf_hash = view_hash(view)
+    return path
+
+
+def save_pdf_paths(
+    db: Session,
+    model,
+    paths: Dict[int, str],
+    updates: Optional[Dict[int, Dict[str, Any]]] = None,
+    hashes: Optional[Dict[int, str]] = None
+) -> None:
+    """
+    Zapisuje pdf_path (i opcjonalnie pdf_hash oraz inne kolumny) rachunków jednym
+    zbiorczym UPDATE (bez commit).
+
+    Args:
+        db: Sesja bazy danych
+        model: Model rachunku z kolumnami id, pdf_path i pdf_hash
+        paths: {bill_id: ścieżka}
+        updates: Dodatkowe wartości kolumn {bill_id: {kolumna: wartość}}
+        hashes: Skróty danych wejściowych PDF {bill_id: skrót}
+    """
+    rows = []
+    for bill_id, path in paths.items():
+        row = {'id': bill_id, 'pdf_path': path, **(updates or {}).get(bill_id, {})}
+        if hashes and bill_id in hashes:
+            row['pdf_hash'] = hashes[bill_id]
+        rows.append(row)
+    if rows:
+        db.execute(update(model), rows)
+
+
+def render_and_save(
+    db: Session,
+    model,
+    views: List[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+    updates: Optional[Dict[int, Dict[str, Any]]] = None
+) -> Tuple[Dict[int, str], Dict[int, str], Dict[int, str]]:
+    """
+    Renderuje rachunki, których dane wejściowe zmieniły się od ostatniego PDF
+    (lub których pliku brakuje), i zapisuje ścieżki oraz skróty jednym UPDATE (bez commit).
+
+    Args:
+        db: Sesja bazy danych
+        model: Model rachunku z kolumnami id, pdf_path i pdf_hash
+        views: Modele widoku rachunków
+        max_workers: Liczba procesów renderujących
+        updates: Dodatkowe wartości kolumn {bill_id: {kolumna: wartość}}
+
+    Returns:
+        Krotka ({bill_id: ścieżka} wyrenderowanych, {bill_id: ścieżka} aktualnych, {bill_id: błąd})
+    """
+    if not views:
+        return {}, {}, {}
+    stored_hashes = dict(
+        db.query(model.id, model.pdf_hash).filter(model.id.in_([view['bill_id'] for view in views])).all()
+    )
+    hashes = {view['bill_id']: view_hash(view) for view in views}
+    unchanged = {
+        view['bill_id']: view['path'] for view in views
+        if stored_hashes.get(view['bill_id']) == hashes[view['bill_id']] and Path(view['path']).exists()
+    }
+    rendered, errors = render_views([view for view in views if view['bill_id'] not in unchanged], max_workers)
+    save_pdf_paths(db, model, {**unchanged, **rendered}, updates, hashes)
+    return rendered, unchanged, errors
@@ -0,0 +1,161 @@
+"""
+Odpowiedzi HTTP z PDF rachunków: podgląd renderowany w pamięci i pliki z bills/.
+
+ETag odpowiedzi to skrót danych wejściowych PDF (pdf_hash, app.core.pdf_pipeline),
+więc przeglądarka, która ma aktualną wersję rachunku, dostaje 304 bez renderowania
+i bez przesyłania pliku. ETag jest słaby (W/): PDF zawiera datę wygenerowania, więc
+te same dane wejściowe nie dają tych samych bajtów.
+
+Zapisane pliki obsługują nagłówek Range (jeden zakres). Wznowienie z If-Range
+wymaga silnego walidatora - jest nim Last-Modified pliku (słaby ETag w If-Range
+oznacza wysłanie całego pliku).
+"""
+
+from email.utils import formatdate
+
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.core.pdf_pipeline import view_hash
+from app.core.pdf_toolkit import render_view
+
+CHUNK_SIZE = 64 * 1024
+PDF_MEDIA_TYPE = "application/pdf"
+
+
+def etag_for(pdf_hash: Optional[str]) -> Optional[str]:
+    """ETag (słaby) ze skrótu danych wejściowych PDF."""
+    return f'W/"{pdf_hash}"' if pdf_hash else None
+
+
+def is_not_modified(request: Request, etag: Optional[str]) -> bool:
+    """Czy If-None-Match klienta zawiera aktualny ETag (lub '*') - porównanie słabe."""
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parsuje nagłówek Range z jednym zakresem bajtów.
+
+    Returns:
+        (start, koniec włącznie) lub None, gdy nagłówka nie ma albo zakresów jest kilka
+
+    Raises:
+        ValueError: Jeśli zakres jest niepoprawny lub poza plikiem (416)
+    """
+    if not header:
+        return None
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    start_text, _, end_text = ranges.strip().partition("-")
+    if not start_text:
+        # Sufiks: ostatnie N bajtów
+        length = int(end_text)
+        if length <= 0:
+            raise ValueError(f"Niepoprawny zakres: {header}")
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError(f"Zakres poza plikiem: {header}")
+    return start, min(end, size - 1)
+
+
+def _file_chunks(path: Path, start: int, end: int) -> Iterator[bytes]:
+    """Czyta fragment pliku [start, end] w porcjach CHUNK_SIZE."""
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _cache_headers(etag: Optional[str]) -> Dict[str, str]:
+    """Nagłówki walidacji cache - klient zawsze pyta serwer, a ten odpowiada 304 dla aktualnej wersji."""
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def pdf_preview_response(request: Request, view: Dict[str, Any]) -> Response:
+    """
+    Renderuje PDF rachunku w pamięci (BytesIO, bez zapisu na dysk) i strumieniuje go.
+
+    Args:
+        request: Żądanie HTTP (If-None-Match)
+        view: Model widoku rachunku
+
+    Returns:
+        304 dla aktualnego ETag, w przeciwnym razie StreamingResponse z PDF
+    """
+    etag = etag_for(view_hash(view))
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=_cache_headers(etag))
+
+    buffer = BytesIO()
+    render_view(view, buffer)
+    data = buffer.getvalue()
+    headers = _cache_headers(etag)
+    headers["Content-Length"] = str(len(data))
+    headers["Content-Disposition"] = f'inline; filename="{Path(view["path"]).name}"'
+    chunks = (data[offset:offset + CHUNK_SIZE] for offset in range(0, len(data), CHUNK_SIZE))
+    return StreamingResponse(chunks, media_type=PDF_MEDIA_TYPE, headers=headers)
+
+
+def pdf_file_response(request: Request, path: str, pdf_hash: Optional[str] = None) -> Response:
+    """
+    Zwraca zapisany PDF rachunku z ETag i obsługą Range.
+
+    Args:
+        request: Żądanie HTTP (If-None-Match, Range, If-Range)
+        path: Ścieżka pliku PDF
+        pdf_hash: Skrót danych wejściowych PDF rachunku (słaby ETag)
+
+    Returns:
+        304, 206 (fragment), 416 (zakres poza plikiem) lub 200 (cały plik)
+    """
+    etag = etag_for(pdf_hash)
+    headers = _cache_headers(etag)
+    headers["Accept-Ranges"] = "bytes"
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    file_path = Path(path)
+    stat = file_path.stat()
+    size = stat.st_size
+    headers["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != headers["Last-Modified"]:
+        # Klient ma inną wersję pliku (lub podał słaby ETag) - zwróć całość
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return FileResponse(path, media_type=PDF_MEDIA_TYPE, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _file_chunks(file_path, start, end), status_code=206, media_type=PDF_MEDIA_TYPE, headers=headers
+    )
@@ -0,0 +1,220 @@
+"""
+Wspólne narzędzia generowania PDF rachunków (woda, gaz, prąd, rachunki łączone).
+
+Czcionka z polskimi znakami jest rejestrowana raz na proces, a arkusz stylów,
+style akapitów i style tabel są budowane raz (na czcionkę) i współdzielone
+przez wszystkie generatory.
+
+Generatory budują z bazy model widoku rachunku - słownik ze zwykłymi danymi
+(ścieżka pliku i lista bloków dokumentu) - a render_view składa z niego PDF.
+Model widoku da się przekazać do innego procesu (app.core.pdf_pipeline).
+Bloki:
+    ('paragraph', klucz stylu z get_paragraph_styles, tekst)
+    ('spacer', wysokość w mm)
+    ('table', wiersze, szerokości kolumn w mm, funkcja komend stylu tabeli)
+"""
+
+import platform
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+FONT_NAME = 'Arial'
+FALLBACK_FONT = 'Helvetica'  # Bez polskich znaków
+WINDOWS_FONT_PATHS = (
+    'C:/Windows/Fonts/arial.ttf',
+    'C:/Windows/Fonts/Arial.ttf',
+)
+FONT_PATHS = (
+    '/usr/share/fonts/truetype/msttcorefonts/arial.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+)
+
+# Zwiększ po zmianie układu, stylów lub szablonu dokumentu - unieważnia skróty PDF rachunków
+PDF_TEMPLATE_VERSION = 1
+
+HEADING_COLOR = colors.HexColor('#2c5aa0')
+PAGE_MARGINS = {
+    'leftMargin': 15*mm,
+    'rightMargin': 15*mm,
+    'topMargin': 25*mm,
+    'bottomMargin': 15*mm,
+}
+
+
+@lru_cache(maxsize=None)
+def get_default_font() -> str:
+    """
+    Rejestruje czcionkę Arial (lub Liberation Sans) raz na proces.
+
+    Returns:
+        Nazwa czcionki do użycia: 'Arial' lub 'Helvetica', gdy żaden plik czcionki nie istnieje
+    """
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return FONT_NAME
+
+    font_paths = WINDOWS_FONT_PATHS if platform.system() == 'Windows' else FONT_PATHS
+    for font_path in font_paths:
+        if not Path(font_path).exists():
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+            return FONT_NAME
+        except Exception as e:
+            print(f"[DEBUG] Nie udało się zarejestrować czcionki {font_path}: {e}")
+
+    print("[WARNING] Nie znaleziono czcionki Arial, używam Helvetica (bez polskich znaków)")
+    return FALLBACK_FONT
+
+
+@lru_cache(maxsize=None)
+def get_paragraph_styles(font_name: str) -> Dict[str, ParagraphStyle]:
+    """
+    Style akapitów rachunków dla czcionki (budowane raz).
+
+    'title' i 'heading' - rachunki mediów; 'combined_title', 'combined_heading',
+    'subheading' i 'normal' - rachunki łączone.
+    """
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle', parent=styles['Heading5'], fontSize=12, textColor=HEADING_COLOR,
+            spaceAfter=1*mm, alignment=TA_LEFT, fontName=font_name
+        ),
+        'heading': ParagraphStyle(
+            'CustomHeading', parent=styles['Heading3'], fontSize=11, textColor=HEADING_COLOR,
+            spaceBefore=2*mm, spaceAfter=1*mm, fontName=font_name
+        ),
+        'combined_title': ParagraphStyle(
+            'CombinedTitle', parent=styles['Heading1'], fontSize=16, textColor=HEADING_COLOR,
+            spaceAfter=3*mm, alignment=TA_CENTER, fontName=font_name
+        ),
+        'combined_heading': ParagraphStyle(
+            'CombinedHeading', parent=styles['Heading3'], fontSize=12, textColor=HEADING_COLOR,
+            spaceBefore=4*mm, spaceAfter=2*mm, fontName=font_name
+        ),
+        'subheading': ParagraphStyle(
+            'CustomSubHeading', parent=styles['Heading4'], fontSize=11, textColor=HEADING_COLOR,
+            spaceBefore=2*mm, spaceAfter=1*mm, fontName=font_name
+        ),
+        'normal': ParagraphStyle(
+            'CustomNormal', parent=styles['Normal'], fontSize=10, fontName=font_name
+        ),
+    }
+
+
+@lru_cache(maxsize=None)
+def table_style(commands: Callable[[str], List[tuple]], font_name: str) -> TableStyle:
+    """
+    Styl tabeli z funkcji zwracającej komendy dla czcionki - budowany raz na (funkcję, czcionkę).
+    TableStyle jest tylko czytany przez Table.setStyle, więc może być współdzielony.
+    """
+    return TableStyle(commands(font_name))
+
+
+def info_table_commands(font_name: str) -> List[tuple]:
+    """Tabela danych lokalu w nagłówku rachunku (bez siatki i marginesów)."""
+    return [
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+    ]
+
+
+def summary_table_commands(font_name: str) -> List[tuple]:
+    """Tabela podsumowania (netto, VAT, brutto) - ostatni wiersz wyróżniony."""
+    return [
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('ALIGN', (1, 0), (1, 2), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 2), (-1, 2), 11),
+        ('FONTSIZE', (0, 0), (-1, 1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 2), (-1, 2), colors.lightgrey),
+    ]
+
+
+def details_table_commands(font_name: str) -> List[tuple]:
+    """Tabela szczegółów rachunku łączonego (etykieta - wartość)."""
+    return [
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ]
+
+
+class BillDocTemplate(SimpleDocTemplate):
+    """Dokument A4 rachunku z dopiskiem 'Wygenerowano: ...' w prawym górnym rogu każdej strony."""
+
+    def __init__(self, target, font_name: Optional[str] = None, **kwargs):
+        """
+        Args:
+            target: Ścieżka pliku lub obiekt plikowy (np. BytesIO)
+            font_name: Czcionka dopisku (domyślnie get_default_font())
+            **kwargs: Parametry SimpleDocTemplate (domyślnie A4 i marginesy PAGE_MARGINS)
+        """
+        kwargs.setdefault('pagesize', A4)
+        for key, value in PAGE_MARGINS.items():
+            kwargs.setdefault(key, value)
+        SimpleDocTemplate.__init__(self, target, **kwargs)
+        self.font_name = font_name or get_default_font()
+
+    def build(self, flowables, onFirstPage=None, onLaterPages=None, **kwargs):
+        generated_text = f"Wygenerowano: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+        font_name = self.font_name
+        page_width, page_height = self.pagesize
+
+        def add_header(canvas, doc):
+            canvas.saveState()
+            canvas.setFont(font_name, 9)
+            text_width = canvas.stringWidth(generated_text, font_name, 9)
+            canvas.drawString(page_width - self.rightMargin - text_width, page_height - 15*mm, generated_text)
+            canvas.restoreState()
+
+        return SimpleDocTemplate.build(self, flowables, onFirstPage=add_header, onLaterPages=add_header, **kwargs)
+
+
+def render_view(view: Dict[str, Any], target=None) -> None:
+    """
+    Składa PDF z modelu widoku rachunku.
+
+    Args:
+        view: Model widoku ({'path': ..., 'blocks': [...]})
+        target: Ścieżka pliku lub obiekt plikowy (domyślnie view['path'])
+    """
+    font_name = get_default_font()
+    styles = get_paragraph_styles(font_name)
+    story = []
+    for block in view['blocks']:
+        kind = block[0]
+        if kind == 'paragraph':
+            story.append(Paragraph(block[2], styles[block[1]]))
+        elif kind == 'spacer':
+            story.append(Spacer(1, block[1]*mm))
+        elif kind == 'table':
+            _, rows, widths, commands = block
+            table = Table(rows, colWidths=[width*mm for width in widths])
+            table.setStyle(table_style(commands, font_name))
+            story.append(table)
+        else:
+            raise ValueError(f"Nieznany blok dokumentu: {kind}")
+
+    doc = BillDocTemplate(target if target is not None else view['path'], font_name)
+    doc.build(story)
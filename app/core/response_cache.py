@@ -0,0 +1,84 @@
+"""
+Cache odpowiedzi JSON zależnych od tabel bazy danych (ETag, 304).
+
+Odpowiedź jest zapamiętywana razem z wersjami tabel, z których powstała
+(app.core.change_tracking). Dopóki żadna z tych tabel się nie zmieni, kolejne
+żądanie kosztuje odczyt wersji i jedno wyszukanie w słowniku - bez zapytań SQL
+i bez serializacji. ETag (silny) to skrót treści odpowiedzi, więc klient z aktualną
+wersją dostaje 304 bez treści.
+"""
+
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Sequence, Tuple
+
+import orjson
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from app.core.change_tracking import table_versions
+from app.core.pdf_response import is_not_modified
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    """Zserializowana odpowiedź i jej ETag."""
+    body: bytes
+    etag: str
+
+
+# {klucz: (wersje tabel, odpowiedź)} - jedna pozycja na klucz, zastępowana po zmianie tabel
+_cache: Dict[Hashable, Tuple[Tuple[int, ...], CachedBody]] = {}
+_cache_lock = threading.Lock()
+
+
+def serialize_json(content: Any) -> bytes:
+    """Serializuje treść jak ORJSONResponse (typy nieobsługiwane przez orjson - przez jsonable_encoder)."""
+    return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+
+
+def cached_body(key: Hashable, tables: Sequence[str], build: Callable[[], Any]) -> CachedBody:
+    """
+    Zwraca zapamiętaną odpowiedź lub buduje ją, gdy tabele zmieniły się od jej zapisania.
+
+    Args:
+        key: Klucz odpowiedzi (np. nazwa endpointu)
+        tables: Tabele, z których budowana jest odpowiedź
+        build: Funkcja budująca treść odpowiedzi (wywoływana tylko przy zmianie tabel)
+    """
+    versions = table_versions(tables)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+
+    body = serialize_json(build())
+    entry = CachedBody(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+    with _cache_lock:
+        _cache[key] = (versions, entry)
+    return entry
+
+
+def cached_json_response(request: Request, key: Hashable, tables: Sequence[str], build: Callable[[], Any]) -> Response:
+    """
+    Odpowiedź JSON z cache (patrz cached_body) z ETag i obsługą If-None-Match.
+
+    Returns:
+        304 dla aktualnego ETag, w przeciwnym razie 200 z treścią
+    """
+    entry = cached_body(key, tables, build)
+    # Klient zawsze pyta serwer, a ten odpowiada 304 dla aktualnej wersji
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if is_not_modified(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+def clear_response_cache() -> None:
+    """Usuwa wszystkie zapamiętane odpowiedzi."""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,49 @@
+"""
+Typowane modele odpowiedzi (Pydantic v2) dla endpointów list.
+
+Model jest budowany z kolumn listy ({nazwa: kolumna}, jak w app.core.pagination),
+więc jego pola zawsze odpowiadają kolumnom w SELECT. Wszystkie pola są opcjonalne:
+endpoint z fields= zwraca tylko wybrane kolumny, a response_model_exclude_unset=True
+pomija w odpowiedzi pola, których wiersz nie zawiera. Walidacja i serializacja
+(w tym dat do 'YYYY-MM-DD') odbywa się w pydantic-core, bez konwersji w pętlach Pythona.
+"""
+
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel, ConfigDict, create_model
+
+
+class RowModel(BaseModel):
+    """Bazowy model wiersza listy (słownik kolumn lub obiekt ORM)."""
+    model_config = ConfigDict(from_attributes=True)
+
+
+def column_type(column) -> Any:
+    """Typ Pythona kolumny (Any, gdy typ kolumny go nie określa)."""
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return Any
+
+
+def row_model(name: str, columns: Dict[str, Any], base: Type[RowModel] = RowModel, **extra_fields: Any) -> Type[RowModel]:
+    """
+    Tworzy model odpowiedzi z kolumn listy.
+
+    Args:
+        name: Nazwa modelu (widoczna w schemacie OpenAPI)
+        columns: Kolumny listy {nazwa pola: kolumna}
+        base: Model bazowy (np. z walidatorami pól)
+        **extra_fields: Dodatkowe pola spoza kolumn {nazwa: typ}
+
+    Returns:
+        Model z polami Optional[typ] = None
+    """
+    fields = {
+        field_name: (Optional[field_type], None)
+        for field_name, field_type in {
+            **{field_name: column_type(column) for field_name, column in columns.items()},
+            **extra_fields,
+        }.items()
+    }
+    return create_model(name, __base__=base, **fields)
@@ -0,0 +1,386 @@
+"""
+Budowanie i serwowanie zasobów statycznych stron (dashboard, logowanie).
+
+Budowanie (build_static_assets - przy starcie aplikacji lub tools/build_static_assets.py):
+- bloki <style> strony trafiają do jednego pliku CSS, a duże bloki <script> do
+  osobnych plików JS - w tym samym miejscu dokumentu, więc kolejność wykonania
+  skryptów się nie zmienia;
+- CSS i JS są minifikowane (komentarze, wcięcia, puste linie - bez zmiany treści
+  napisów i literałów szablonowych);
+- nazwy plików zawierają skrót treści (dashboard.<skrót>.js), więc mogą być
+  buforowane przez przeglądarkę bez końca - zmiana treści zmienia adres;
+- każdy plik (także zbudowana strona HTML) dostaje warianty .gz i .br. Pakiet
+  brotli jest w requirements.txt; bez niego (import opcjonalny) warianty .br są
+  pomijane i klienci dostają .gz.
+Wynik trafia do <static_dir>/build/ razem z manifest.json - strona jest budowana
+ponownie tylko po zmianie źródła lub dostępności brotli.
+
+Serwowanie: PrecompressedStaticFiles wybiera wariant .br/.gz według Accept-Encoding
+(bez kompresji w locie); page_response zwraca strony HTML z pamięci (ETag, 304).
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.core.compression import accepted_encodings
+from app.core.pdf_response import is_not_modified
+
+try:
+    import brotli
+except ImportError:  # brotli jest opcjonalny - bez niego zapisywane są tylko warianty .gz
+    brotli = None
+
+BUILD_DIR_NAME = "build"
+MANIFEST_NAME = "manifest.json"
+BUILD_PAGES = ("dashboard.html", "login.html")
+BUILD_VERSION = 1  # Zmiana sposobu budowania wymusza przebudowanie stron
+INLINE_SCRIPT_LIMIT = 4096  # Mniejsze skrypty (po minifikacji) zostają w HTML
+FINGERPRINT_LENGTH = 10
+
+# Warianty prekompresowane: (kodowanie, rozszerzenie) w kolejności preferencji
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_STYLE_BLOCK = re.compile(r"<style>(.*?)</style>", re.DOTALL)
+_SCRIPT_BLOCK = re.compile(r"<script>(.*?)</script>", re.DOTALL)
+_FINGERPRINTED = re.compile(rf"\.[0-9a-f]{{{FINGERPRINT_LENGTH}}}\.(css|js)$")
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_STRING = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')")
+# Znaki, po których '/' zaczyna wyrażenie regularne (a nie dzielenie)
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+
+# ========== MINIFIKACJA ==========
+
+def minify_css(source: str) -> str:
+    """Usuwa komentarze i zbędne białe znaki z CSS (bez zmiany napisów)."""
+    parts = _CSS_STRING.split(_CSS_COMMENT.sub("", source))
+    for index in range(0, len(parts), 2):  # Nieparzyste części to napisy
+        part = re.sub(r"\s+", " ", parts[index])
+        part = re.sub(r"\s*([{};,>])\s*", r"\1", part)
+        parts[index] = re.sub(r":\s+", ":", part).replace(";}", "}")
+    return "".join(parts).strip()
+
+
+def _js_line_starts(source: str) -> Optional[List[bool]]:
+    """
+    Dla każdej linii skryptu: czy zaczyna się w kodzie (poza napisem, literałem
+    szablonowym i komentarzem blokowym).
+
+    Returns:
+        Lista flag (jedna na linię) lub None, gdy skrypt nie kończy się w kodzie
+        (składnia nierozpoznana przez ten prosty skaner)
+    """
+    starts = [True]
+    stack: List[object] = []  # 'tpl' - literał szablonowy, liczba - głębokość { w ${...}
+    mode = "code"
+    previous = ""  # Ostatni znaczący znak kodu
+    index = 0
+    while index < len(source):
+        char = source[index]
+        if char == "\n":
+            if mode == "line":
+                mode = "code"
+            elif mode in ("single", "double", "regex", "class"):
+                return None
+            starts.append(mode == "code")
+        elif mode == "code":
+            if char in "'\"":
+                mode = "single" if char == "'" else "double"
+            elif char == "`":
+                stack.append("tpl")
+                mode = "tpl"
+            elif source.startswith("//", index):
+                mode = "line"
+            elif source.startswith("/*", index):
+                mode = "block"
+                index += 1
+            elif char == "/" and previous in _REGEX_PRECEDERS:
+                mode = "regex"
+            elif char == "{" and stack and stack[-1] != "tpl":
+                stack[-1] += 1
+            elif char == "}" and stack and stack[-1] != "tpl":
+                if stack[-1] == 0:
+                    stack.pop()
+                    mode = "tpl"
+                else:
+                    stack[-1] -= 1
+            if not char.isspace():
+                previous = char
+        elif char == "\\" and mode in ("single", "double", "tpl", "regex", "class"):
+            index += 1
+            if source[index:index + 1] == "\n":
+                starts.append(False)
+        elif mode in ("single", "double"):
+            if char == ("'" if mode == "single" else '"'):
+                mode = "code"
+                previous = char
+        elif mode == "tpl":
+            if char == "`":
+                stack.pop()
+                mode = "code"
+                previous = char
+            elif source.startswith("${", index):
+                stack.append(0)
+                mode = "code"
+                previous = "{"
+                index += 1
+        elif mode == "block":
+            if source.startswith("*/", index):
+                mode = "code"
+                index += 1
+        elif mode == "regex":
+            if char == "[":
+                mode = "class"
+            elif char == "/":
+                mode = "code"
+                previous = "a"  # Po wyrażeniu regularnym '/' to dzielenie
+        elif mode == "class" and char == "]":
+            mode = "regex"
+        index += 1
+    return starts if mode in ("code", "line") and not stack else None
+
+
+def minify_js(source: str) -> str:
+    """
+    Usuwa z JS wcięcia, puste linie i komentarze zajmujące całą linię.
+
+    Podział na linie jest zachowany (automatyczne średniki działają jak w źródle),
+    a linie wewnątrz literałów szablonowych i komentarzy blokowych pozostają bez zmian.
+    Skrypt nierozpoznany przez skaner jest zwracany bez zmian.
+    """
+    starts = _js_line_starts(source)
+    if starts is None:
+        return source
+    lines = source.split("\n")
+    result = []
+    for index, line in enumerate(lines):
+        ends_in_code = index + 1 == len(lines) or starts[index + 1]
+        if starts[index]:
+            line = line.lstrip()
+            if not line.strip() or line.startswith("//"):
+                continue
+        if ends_in_code:
+            line = line.rstrip()
+        result.append(line)
+    return "\n".join(result)
+
+
+# ========== BUDOWANIE ==========
+
+def fingerprint(data: bytes) -> str:
+    """Skrót treści używany w nazwie pliku."""
+    return hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def _write_asset(build_dir: Path, name: str, data: bytes) -> List[str]:
+    """Zapisuje plik i jego warianty prekompresowane; zwraca nazwy zapisanych plików."""
+    (build_dir / name).write_bytes(data)
+    written = [name]
+    # mtime=0 - ten sam plik .gz dla tej samej treści
+    (build_dir / f"{name}.gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(f"{name}.gz")
+    if brotli is not None:
+        (build_dir / f"{name}.br").write_bytes(brotli.compress(data, quality=11))
+        written.append(f"{name}.br")
+    return written
+
+
+def build_page(source: Path, build_dir: Path, url_prefix: str) -> List[str]:
+    """
+    Buduje stronę: wydziela i minifikuje CSS i JS, nadaje nazwy ze skrótem treści.
+
+    Args:
+        source: Plik HTML źródła
+        build_dir: Katalog wyników
+        url_prefix: Adres katalogu wyników (np. '/static/build')
+
+    Returns:
+        Nazwy zapisanych plików (strona, zasoby i ich warianty)
+    """
+    html = source.read_text(encoding="utf-8")
+    written: List[str] = []
+
+    css = "\n".join(minify_css(block) for block in _STYLE_BLOCK.findall(html))
+    if css:
+        css_name = f"{source.stem}.{fingerprint(css.encode())}.css"
+        written += _write_asset(build_dir, css_name, css.encode())
+        # Arkusz w miejscu pierwszego bloku <style>, pozostałe bloki usunięte
+        links = iter([f'<link rel="stylesheet" href="{url_prefix}/{css_name}">'])
+        html = _STYLE_BLOCK.sub(lambda match: next(links, ""), html)
+
+    def replace_script(match: re.Match) -> str:
+        script = minify_js(match.group(1))
+        if len(script) < INLINE_SCRIPT_LIMIT:
+            return f"<script>{script}</script>"
+        script_name = f"{source.stem}.{fingerprint(script.encode())}.js"
+        written.extend(_write_asset(build_dir, script_name, script.encode()))
+        return f'<script src="{url_prefix}/{script_name}"></script>'
+
+    html = _SCRIPT_BLOCK.sub(replace_script, html)
+    return _write_asset(build_dir, source.name, html.encode("utf-8")) + written
+
+
+def build_static_assets(static_dir: Path, url_prefix: str = "/static", force: bool = False) -> Dict[str, List[str]]:
+    """
+    Buduje strony BUILD_PAGES do <static_dir>/build/ (tylko zmienione od ostatniego budowania).
+
+    Args:
+        static_dir: Katalog plików statycznych (źródła stron)
+        url_prefix: Adres, pod którym serwowany jest static_dir
+        force: Buduje wszystkie strony, także niezmienione
+
+    Returns:
+        {strona: nazwy zapisanych plików} - tylko dla przebudowanych stron
+    """
+    static_dir = Path(static_dir)
+    build_dir = static_dir / BUILD_DIR_NAME
+    build_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = build_dir / MANIFEST_NAME
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    built = {}
+    for page in BUILD_PAGES:
+        source = static_dir / page
+        if not source.exists():
+            continue
+        # Instalacja brotli po zbudowaniu strony też wymaga przebudowy (warianty .br)
+        build_key = f"{BUILD_VERSION}:{'br' if brotli is not None else 'gz'}:"
+        source_hash = hashlib.sha256(build_key.encode() + source.read_bytes()).hexdigest()
+        previous = manifest.get(page, {})
+        if not force and previous.get("source_hash") == source_hash and all(
+            (build_dir / name).exists() for name in previous.get("files", [])
+        ):
+            continue
+        files = build_page(source, build_dir, f"{url_prefix}/{BUILD_DIR_NAME}")
+        # Usuń pliki poprzedniej wersji strony (inne skróty treści)
+        for name in set(previous.get("files", [])) - set(files):
+            (build_dir / name).unlink(missing_ok=True)
+        manifest[page] = {"source_hash": source_hash, "files": files}
+        built[page] = files
+
+    if built:
+        manifest_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        clear_page_cache()
+    return built
+
+
+# ========== SERWOWANIE ==========
+
+def _choose_encoding(accept_encoding: str, available: Tuple[str, ...]) -> Optional[str]:
+    """Pierwsze z ENCODINGS dostępne i akceptowane przez klienta (None - bez kodowania)."""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding, _ in ENCODINGS:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles serwujące wariant .br/.gz pliku według Accept-Encoding.
+
+    Pliki ze skrótem treści w nazwie dostają Cache-Control na rok (immutable),
+    pozostałe - no-cache (przeglądarka sprawdza ETag przy każdym użyciu).
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        variants = {}
+        for encoding, suffix in ENCODINGS:
+            try:
+                variants[encoding] = (f"{full_path}{suffix}", os.stat(f"{full_path}{suffix}"))
+            except OSError:
+                continue
+        encoding = _choose_encoding(request_headers.get("accept-encoding", ""), tuple(variants))
+
+        if encoding:
+            path, variant_stat = variants[encoding]
+            media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            response = FileResponse(path, status_code=status_code, stat_result=variant_stat, media_type=media_type)
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        fingerprinted = _FINGERPRINTED.search(str(full_path))
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# {ścieżka strony: (mtime_ns, {kodowanie: treść}, skrót treści)}
+_page_cache: Dict[Path, Tuple[int, Dict[str, bytes], str]] = {}
+_page_cache_lock = threading.Lock()
+
+
+def _load_page(path: Path) -> Optional[Tuple[Dict[str, bytes], str]]:
+    """Treść strony i jej wariantów z pamięci (wczytywana ponownie po zmianie pliku)."""
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _page_cache_lock:
+        cached = _page_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    bodies = {"identity": path.read_bytes()}
+    for encoding, suffix in ENCODINGS:
+        variant = path.with_name(path.name + suffix)
+        if variant.exists():
+            bodies[encoding] = variant.read_bytes()
+    digest = hashlib.sha256(bodies["identity"]).hexdigest()[:32]
+    with _page_cache_lock:
+        _page_cache[path] = (mtime, bodies, digest)
+    return bodies, digest
+
+
+def page_response(request: Request, static_dir: Path, page: str) -> Optional[Response]:
+    """
+    Strona HTML - zbudowana (build/) lub źródłowa, z pamięci, w kodowaniu akceptowanym przez klienta.
+
+    Returns:
+        Odpowiedź (304 dla aktualnego ETag) lub None, gdy strony nie ma
+    """
+    static_dir = Path(static_dir)
+    built = static_dir / BUILD_DIR_NAME / page
+    loaded = _load_page(built) or _load_page(static_dir / page)
+    if loaded is None:
+        return None
+    bodies, digest = loaded
+
+    encoding = _choose_encoding(request.headers.get("accept-encoding", ""), tuple(bodies))
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(bodies[encoding or "identity"], media_type="text/html", headers=headers)
+
+
+def clear_page_cache() -> None:
+    """Usuwa strony z pamięci."""
+    with _page_cache_lock:
+        _page_cache.clear()
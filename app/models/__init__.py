@@ -3,7 +3,7 @@ Modele bazy danych - eksport wszystkich modeli.
 """
 
 from app.models.water import Local, Reading, Invoice, Bill
-from app.models.gas import GasInvoice, GasBill
+from app.models.gas import GasInvoice, GasBill, GasAllocationRule
 from app.models.electricity import ElectricityReading, ElectricityBill
 from app.models.electricity_invoice import (
     ElectricityInvoice,
@@ -11,11 +11,15 @@ from app.models.electricity_invoice import (
     ElectricityInvoiceOdczyt,
     ElectricityInvoiceSprzedazEnergii,
     ElectricityInvoiceOplataDystrybucyjna,
-    ElectricityInvoiceRozliczenieOkres
+    ElectricityInvoiceRozliczenieOkres,
+    ElectricityInvoiceTariffTimeline
 )
 from app.models.user import User
 from app.models.password_reset import PasswordResetCode
 from app.models.combined import CombinedBill
+from app.models.meter_anomaly import MeterStreamState, MeterStatistic, MeterAnomaly
+from app.models.validation import ValidationResult
+from app.models.email_outbox import EmailOutbox
 
 __all__ = [
     "Local",
@@ -24,6 +28,7 @@ __all__ = [
     "Bill",
     "GasInvoice",
     "GasBill",
+    "GasAllocationRule",
     "ElectricityReading",
     "ElectricityInvoice",
     "ElectricityBill",
@@ -32,8 +37,14 @@ __all__ = [
     "ElectricityInvoiceSprzedazEnergii",
     "ElectricityInvoiceOplataDystrybucyjna",
     "ElectricityInvoiceRozliczenieOkres",
+    "ElectricityInvoiceTariffTimeline",
     "User",
     "PasswordResetCode",
-    "CombinedBill"
+    "CombinedBill",
+    "MeterStreamState",
+    "MeterStatistic",
+    "MeterAnomaly",
+    "ValidationResult",
+    "EmailOutbox"
 ]
 
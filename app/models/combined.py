@@ -42,6 +42,7 @@ class CombinedBill(Base):
     
     # PDF file
     pdf_path = Column(String(200))  # Path to generated PDF file
+    pdf_hash = Column(String(64))  # SHA-256 of PDF render inputs
     
     # Email status
     email_sent_date = Column(Date, nullable=True)  # Data wysłania emaila do najemcy
@@ -4,7 +4,7 @@ Defines tables: electricity_readings, electricity_bills.
 NOTE: ElectricityInvoice has been moved to app/models/electricity_invoice.py
 """
 
-from sqlalchemy import Column, String, Float, Boolean, Integer, Date, ForeignKey, CheckConstraint
+from sqlalchemy import Column, String, Float, Boolean, Integer, Date, ForeignKey, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -121,4 +121,9 @@ class ElectricityBill(Base):
     
     # PDF file
     pdf_path = Column(String(200))  # Path to generated PDF file
+    pdf_hash = Column(String(64))  # SHA-256 of PDF render inputs
+    
+    __table_args__ = (
+        Index('idx_electricity_bills_data_id', 'data', 'id'),  # Keyset pagination
+    )
 
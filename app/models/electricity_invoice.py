@@ -7,9 +7,10 @@ Definiuje tabele zgodnie ze schematem z propozycja_tabel_prąd.md:
 - electricity_invoice_sprzedaz_energii (sprzedaż energii szczegółowo)
 - electricity_invoice_oplaty_dystrybucyjne (opłaty dystrybucyjne)
 - electricity_invoice_rozliczenie_okresy (rozliczenie po okresach)
+- electricity_invoice_tariff_timelines (oś taryfowa - okresy cenowe faktury)
 """
 
-from sqlalchemy import Column, String, Float, Integer, Date, ForeignKey, UniqueConstraint, Index, Numeric, Boolean
+from sqlalchemy import Column, String, Float, Integer, Date, ForeignKey, UniqueConstraint, Index, Numeric, Boolean, LargeBinary
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -61,10 +62,12 @@ class ElectricityInvoice(Base):
     sprzedaz_energii = relationship("ElectricityInvoiceSprzedazEnergii", back_populates="invoice", cascade="all, delete-orphan")
     oplaty_dystrybucyjne = relationship("ElectricityInvoiceOplataDystrybucyjna", back_populates="invoice", cascade="all, delete-orphan")
     rozliczenie_okresy = relationship("ElectricityInvoiceRozliczenieOkres", back_populates="invoice", cascade="all, delete-orphan")
+    tariff_timeline = relationship("ElectricityInvoiceTariffTimeline", back_populates="invoice", uselist=False, cascade="all, delete-orphan")
     
     __table_args__ = (
         UniqueConstraint('numer_faktury', 'rok', name='uq_invoice_number_year'),
         Index('idx_rok', 'rok'),
+        Index('idx_electricity_invoices_period_id', 'data_poczatku_okresu', 'id'),  # Keyset pagination
     )
 
 
@@ -217,3 +220,28 @@ class ElectricityInvoiceRozliczenieOkres(Base):
         UniqueConstraint('invoice_id', 'numer_okresu', name='uq_invoice_period_number'),
     )
 
+
+class ElectricityInvoiceTariffTimeline(Base):
+    """
+    Oś taryfowa faktury - ciągłe przedziały dat z cenami netto 1 kWh dla stref,
+    miesięcznymi opłatami stałymi (netto) i stawką VAT.
+    
+    Przedziały są zapisane jako zwarte tablice (array.tobytes): segment i trwa
+    od segment_starts[i] do dnia przed segment_starts[i + 1] (ostatni do end_date).
+    Ceny None (brak strefy) są zapisane jako NaN.
+    Oś jest przebudowywana przy zapisie sprzedaży energii lub opłat dystrybucyjnych.
+    """
+    __tablename__ = "electricity_invoice_tariff_timelines"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    invoice_id = Column(Integer, ForeignKey('electricity_invoices.id'), nullable=False, unique=True)
+    end_date = Column(Date, nullable=False)  # Ostatni dzień osi (włącznie)
+    segment_starts = Column(LargeBinary, nullable=False)  # array('i') - date.toordinal() początków
+    prices_dzienna = Column(LargeBinary, nullable=False)  # array('d') - cena 1 kWh netto (strefa dzienna)
+    prices_nocna = Column(LargeBinary, nullable=False)  # array('d') - cena 1 kWh netto (strefa nocna)
+    prices_calodobowa = Column(LargeBinary, nullable=False)  # array('d') - cena 1 kWh netto (całodobowa)
+    fixed_fees = Column(LargeBinary, nullable=False)  # array('d') - suma opłat stałych netto (zł/mc)
+    vat_rates = Column(LargeBinary, nullable=False)  # array('d') - stawka VAT (np. 0.23)
+    
+    # Relacje
+    invoice = relationship("ElectricityInvoice", back_populates="tariff_timeline")
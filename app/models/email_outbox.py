@@ -0,0 +1,40 @@
+"""
+Model kolejki wiadomości email (outbox).
+Wiadomość jest zapisywana przed wysłaniem, a worker (app.core.email_outbox)
+dostarcza ją i zapisuje wynik - wysłane i nieudane wiadomości zostają w tabeli.
+Nieudane wiadomości można ponowić (retry_failed), a wiadomości, których wysyłka
+została przerwana (status 'sending' od dawna), worker przejmuje ponownie.
+"""
+
+from sqlalchemy import Column, String, Integer, Text, DateTime, Boolean, ForeignKey, Index
+from app.core.database import Base
+
+
+class EmailOutbox(Base):
+    """Wiadomość email oczekująca na wysłanie lub już wysłana."""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(20), nullable=False)  # 'combined_bill', 'backup'
+    recipient = Column(String(200), nullable=False)
+    subject = Column(String(300), nullable=False)
+    body = Column(Text, nullable=False)
+
+    # Załącznik (opcjonalny) - czytany z dysku dopiero przy wysyłce
+    attachment_path = Column(String(500), nullable=True)
+    attachment_name = Column(String(200), nullable=True)
+    encrypt_attachment = Column(Boolean, nullable=False, default=False)  # Szyfrowanie (backupy)
+
+    combined_bill_id = Column(Integer, ForeignKey('combined_bills.id'), nullable=True)
+
+    # Status dostarczenia
+    status = Column(String(10), nullable=False, default='pending')  # 'pending', 'sending', 'sent', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    claimed_at = Column(DateTime, nullable=True)  # Początek wysyłki (status 'sending')
+    last_error = Column(String(500), nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_email_outbox_status', 'status'),
+    )
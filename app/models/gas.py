@@ -1,10 +1,10 @@
 """
 SQLAlchemy models for gas billing.
-Defines tables: gas_invoices, gas_bills.
+Defines tables: gas_invoices, gas_bills, gas_allocation_rules.
 Note: Gas readings are not stored - all data is in the invoice.
 """
 
-from sqlalchemy import Column, String, Float, Integer, Date, ForeignKey
+from sqlalchemy import Column, String, Float, Integer, Date, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -87,16 +87,18 @@ class GasInvoice(Base):
     invoice_number = Column(String(100), nullable=False)  # Format: "Faktura VAT P/43562821/0003/25"
     
     bills = relationship("GasBill", back_populates="invoice", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index('idx_gas_invoices_data_id', 'data', 'id'),  # Keyset pagination
+    )
 
 
 class GasBill(Base):
     """
     Generated gas bills for units.
     
-    Cost distribution:
-    - "gora": 58% (0.58)
-    - "dol": 25% (0.25)
-    - "gabinet": 17% (0.17)
+    Cost distribution comes from gas_allocation_rules valid for the invoice
+    (default: "gora" 58%, "dol" 25%, "gabinet" 17%).
     """
     __tablename__ = "gas_bills"
     
@@ -108,7 +110,7 @@ class GasBill(Base):
     local_id = Column(Integer, ForeignKey('locals.id'))
     
     # Cost distribution
-    cost_share = Column(Float, nullable=False)  # 0.58 for gora, 0.25 for dol, 0.17 for gabinet
+    cost_share = Column(Float, nullable=False)  # Share from the allocation rule (e.g., 0.58 for gora)
     
     # Costs distributed proportionally from invoice (gross)
     fuel_cost_gross = Column(Float, nullable=False)
@@ -121,7 +123,30 @@ class GasBill(Base):
     total_gross_sum = Column(Float, nullable=False)  # Gross sum (proportional)
     
     pdf_path = Column(String(200))
+    pdf_hash = Column(String(64))  # SHA-256 of PDF render inputs
     
     invoice = relationship("GasInvoice", back_populates="bills")
     local_obj = relationship("Local", back_populates="gas_bills")
+    
+    __table_args__ = (
+        Index('idx_gas_bills_data_id', 'data', 'id'),  # Keyset pagination
+    )
+
 
+class GasAllocationRule(Base):
+    """
+    Gas cost allocation rule - share of a unit in invoice costs.
+    
+    Rules with the same validity range form one allocation version; shares
+    of a version must sum to 1. A version applies to invoices whose
+    period_start falls within [valid_from, valid_to] (None - unbounded).
+    The unit with bears_interest=True pays late payment interest.
+    """
+    __tablename__ = "gas_allocation_rules"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    local = Column(String(50), nullable=False)  # 'gora', 'gabinet', 'dol'
+    share = Column(Float, nullable=False)  # e.g., 0.58
+    bears_interest = Column(Boolean, nullable=False, default=False)  # Unit pays late payment interest
+    valid_from = Column(Date, nullable=True)  # First day of validity (None - since always)
+    valid_to = Column(Date, nullable=True)  # Last day of validity (None - until further notice)
@@ -0,0 +1,53 @@
+"""
+Modele wykrywania anomalii w historii odczytów liczników (woda i prąd).
+Stan strumienia i statystyki są trzymane per licznik, więc nowe odczyty
+aktualizują tylko dotknięte przez nie wiersze.
+"""
+
+from sqlalchemy import Column, String, Float, Integer, Text, UniqueConstraint
+from app.core.database import Base
+
+
+class MeterStreamState(Base):
+    """Ostatni przetworzony odczyt licznika (znacznik przyrostowego przetwarzania)."""
+    __tablename__ = "meter_stream_states"
+    
+    meter = Column(String(50), primary_key=True)  # np. 'water.water_meter_main', 'electricity.dom_I'
+    last_data = Column(String(7), nullable=False)  # 'YYYY-MM' ostatniego przetworzonego odczytu
+    last_value = Column(Float, nullable=True)  # Stan licznika w ostatnim odczycie (None - licznik bez odczytów)
+
+
+class MeterStatistic(Base):
+    """
+    Odporne statystyki zużycia licznika dla miesiąca kalendarzowego.
+    month = 1..12 - okresy z danego miesiąca, month = 0 - wszystkie okresy (baza zapasowa).
+    """
+    __tablename__ = "meter_statistics"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    meter = Column(String(50), nullable=False)
+    month = Column(Integer, nullable=False)
+    deltas = Column(Text, nullable=False)  # JSON - ostatnie zużycia (okno kroczące)
+    median = Column(Float, nullable=False)
+    mad = Column(Float, nullable=False)  # Mediana odchyleń bezwzględnych od mediany
+    
+    __table_args__ = (
+        UniqueConstraint('meter', 'month', name='uq_meter_statistics_meter_month'),
+    )
+
+
+class MeterAnomaly(Base):
+    """Wykryta anomalia odczytu licznika."""
+    __tablename__ = "meter_anomalies"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    media = Column(String(20), nullable=False)  # 'water', 'electricity'
+    meter = Column(String(50), nullable=False, index=True)
+    data = Column(String(7), nullable=False, index=True)  # 'YYYY-MM' odczytu
+    kind = Column(String(30), nullable=False)  # 'negative_delta', 'meter_replacement', 'outlier'
+    value = Column(Float, nullable=False)  # Stan licznika
+    previous_value = Column(Float, nullable=False)  # Poprzedni stan licznika
+    delta = Column(Float, nullable=False)  # Zużycie (value - previous_value)
+    median = Column(Float, nullable=True)  # Mediana zużycia bazy porównawczej
+    mad = Column(Float, nullable=True)  # MAD bazy porównawczej
+    score = Column(Float, nullable=True)  # Odporny z-score (0.6745 * (delta - median) / MAD)
@@ -0,0 +1,28 @@
+"""
+Model wyników walidacji faktur (woda, gaz, prąd).
+Jeden wiersz na fakturę i regułę; wyniki faktury są usuwane przy jej zmianie,
+więc ponownie walidowane są tylko faktury nowe lub zmienione.
+"""
+
+from sqlalchemy import Column, String, Float, Integer, UniqueConstraint, Index
+from app.core.database import Base
+
+
+class ValidationResult(Base):
+    """Wynik reguły walidacji dla faktury."""
+    __tablename__ = "validation_results"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    media = Column(String(20), nullable=False)  # 'water', 'gas', 'electricity'
+    invoice_id = Column(Integer, nullable=False)  # ID faktury w tabeli medium
+    rule = Column(String(60), nullable=False)  # Nazwa reguły, np. 'fuel_value_net'
+    status = Column(String(10), nullable=False)  # 'ok', 'failed', 'skipped' (warunek reguły niespełniony)
+    severity = Column(String(10), nullable=False)  # 'critical', 'warning', 'info'
+    expected = Column(Float, nullable=True)  # Wartość obliczona
+    actual = Column(Float, nullable=True)  # Wartość z faktury
+    message = Column(String(300), nullable=True)  # Opis błędu (dla 'failed')
+    
+    __table_args__ = (
+        UniqueConstraint('media', 'invoice_id', 'rule', name='uq_validation_results_invoice_rule'),
+        Index('idx_validation_results_status', 'media', 'status'),
+    )
@@ -3,7 +3,7 @@ SQLAlchemy models for water billing database.
 Defines tables: locals, readings, invoices, bills.
 """
 
-from sqlalchemy import Column, String, Float, Integer, Date, ForeignKey
+from sqlalchemy import Column, String, Float, Integer, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -57,6 +57,10 @@ class Invoice(Base):
     gross_sum = Column(Float, nullable=False)  # Invoice gross sum
     
     bills = relationship("Bill", back_populates="invoice")
+    
+    __table_args__ = (
+        Index('idx_invoices_data_id', 'data', 'id'),  # Keyset pagination
+    )
 
 
 class Bill(Base):
@@ -96,4 +100,9 @@ class Bill(Base):
     
     # PDF file
     pdf_path = Column(String(200))  # Path to generated PDF file
+    pdf_hash = Column(String(64))  # SHA-256 of PDF render inputs
+    
+    __table_args__ = (
+        Index('idx_bills_data_id', 'data', 'id'),  # Keyset pagination
+    )
 
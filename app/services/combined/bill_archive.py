@@ -0,0 +1,123 @@
+"""
+Archiwum ZIP PDF rachunków (woda, gaz, prąd, łączone) za zakres okresów.
+
+Archiwum jest budowane w locie i strumieniowane porcjami - bez pliku
+tymczasowego i bez trzymania całego ZIP w pamięci. Aktualne PDF (pdf_hash
+zgodny z danymi, plik istnieje) są kopiowane z bills/, pozostałe renderowane
+w pamięci w puli procesów, z wyprzedzeniem względem strumieniowanych wpisów.
+Eksport niczego nie zapisuje - ani plików, ani ścieżek w bazie.
+"""
+
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.pdf_pipeline import RenderQueue, is_unchanged
+from app.models.combined import CombinedBill
+from app.models.electricity import ElectricityBill
+from app.models.gas import GasBill
+from app.models.water import Bill
+from app.services.combined.bill_generator import build_combined_bill_views
+from app.services.electricity.bill_generator import build_bill_views as build_electricity_views
+from app.services.gas.bill_generator import build_bill_views as build_gas_views
+from app.services.water.bill_generator import build_bill_views as build_water_views
+
+ARCHIVE_MEDIA = ('water', 'gas', 'electricity', 'combined')
+CHUNK_SIZE = 64 * 1024
+
+
+def _media_views(db: Session, media: str, period_from: str, period_to: str) -> List[tuple]:
+    """Pary (rachunek, model widoku) medium w zakresie okresów, w kolejności okresu i lokalu."""
+    if media == 'combined':
+        bills = db.query(CombinedBill).filter(
+            CombinedBill.period_start >= period_from,
+            CombinedBill.period_end <= period_to
+        ).order_by(CombinedBill.period_start, CombinedBill.local).all()
+        return list(zip(bills, build_combined_bill_views(db, bills)))
+
+    model = {'water': Bill, 'gas': GasBill, 'electricity': ElectricityBill}[media]
+    query = db.query(model).filter(model.data >= period_from, model.data <= period_to)
+    if media == 'electricity':
+        # Rachunki bez faktury nie mają PDF
+        query = query.filter(ElectricityBill.invoice_id.isnot(None))
+    bills = query.order_by(model.data, model.local).all()
+
+    if media == 'water':
+        views = build_water_views(db, bills)
+    elif media == 'gas':
+        views = build_gas_views(db, bills)[0]
+    else:
+        views = build_electricity_views(db, bills)
+    bills_by_id = {bill.id: bill for bill in bills}
+    return [(bills_by_id[view['bill_id']], view) for view in views]
+
+
+def collect_archive_entries(db: Session, period_from: str, period_to: str, media: List[str]) -> List[Dict]:
+    """
+    Zbiera wpisy archiwum: {'name', 'path'} dla aktualnych plików lub {'name', 'view'} do renderowania.
+
+    Args:
+        db: Sesja bazy danych
+        period_from: Pierwszy okres (YYYY-MM)
+        period_to: Ostatni okres (YYYY-MM, włącznie)
+        media: Media z ARCHIVE_MEDIA
+
+    Returns:
+        Wpisy w kolejności medium, okresu i lokalu
+    """
+    entries = []
+    for medium in media:
+        for bill, view in _media_views(db, medium, period_from, period_to):
+            name = f"{medium}/{Path(view['path']).name}"
+            if is_unchanged(view, bill.pdf_hash):
+                entries.append({'name': name, 'path': view['path']})
+            else:
+                entries.append({'name': name, 'view': view})
+    return entries
+
+
+class _ZipSink:
+    """Strumień bez seek, do którego pisze ZipFile - kolejne porcje są odbierane przez drain()."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        """Oddaje zebrane bajty (jeśli są) i czyści bufor."""
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            yield data
+
+
+def stream_archive(entries: List[Dict], max_workers: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Strumieniuje archiwum ZIP z wpisów collect_archive_entries.
+
+    PDF są już skompresowane, więc wpisy są zapisywane bez kompresji (ZIP_STORED).
+    W pamięci jest najwyżej jedna porcja pliku i kilka wyrenderowanych PDF z wyprzedzeniem.
+    """
+    sink = _ZipSink()
+    with RenderQueue([entry['view'] for entry in entries if 'view' in entry], max_workers) as queue:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+            for entry in entries:
+                with archive.open(entry['name'], 'w', force_zip64=True) as target:
+                    if 'path' in entry:
+                        with open(entry['path'], 'rb') as source:
+                            while chunk := source.read(CHUNK_SIZE):
+                                target.write(chunk)
+                                yield from sink.drain()
+                    else:
+                        target.write(queue.next())
+                yield from sink.drain()
+        # Katalog centralny
+        yield from sink.drain()
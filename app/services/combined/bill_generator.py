@@ -2,163 +2,247 @@
 Generowanie PDF rachunków łączonych (wszystkie media).
 """
 
-from datetime import datetime, date
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
 from pathlib import Path
-from typing import Optional
-from sqlalchemy.orm import Session
-
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased, selectinload
 
+from app.core.pdf_pipeline import write_pdf_cached
+from app.core.pdf_toolkit import details_table_commands
 from app.models.combined import CombinedBill
-from app.models.water import Bill, Invoice as WaterInvoice, Reading as WaterReading
-from app.models.gas import GasBill, GasInvoice
-from app.models.electricity import ElectricityBill
-from app.models.electricity_invoice import ElectricityInvoice
-from app.services.electricity.cost_calculator import calculate_kwh_cost
-from app.services.electricity.manager import ElectricityBillingManager
+from app.models.water import Bill, Local, Reading as WaterReading
+from app.models.gas import GasBill
+from app.models.electricity import ElectricityBill, ElectricityReading
+from app.services.electricity.calculator import calculate_all_usage
+from app.services.electricity.cost_model import InvoiceCostModel, get_invoice_cost_models
+from app.services.electricity.period_context import compute_tenant_period_dates
 
 
-def get_font():
-    """Pobiera dostępną czcionkę z polskimi znakami."""
-    try:
-        import platform
-        
-        font_registered = False
-        if platform.system() == 'Windows':
-            font_paths = [
-                'C:/Windows/Fonts/arial.ttf',
-                'C:/Windows/Fonts/Arial.ttf',
-            ]
-        else:
-            font_paths = [
-                '/usr/share/fonts/truetype/msttcorefonts/arial.ttf',
-                '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
-            ]
-        
-        for font_path in font_paths:
-            try:
-                font_path_str = str(font_path)
-                if Path(font_path_str).exists():
-                    pdfmetrics.registerFont(TTFont('Arial', font_path_str))
-                    if 'Arial' in pdfmetrics.getRegisteredFontNames():
-                        font_registered = True
-                        break
-            except Exception:
-                continue
-        
-        return 'Arial' if font_registered else 'Helvetica'
-    except Exception:
-        return 'Helvetica'
+def header_table_commands(font_name: str) -> list:
+    """Styl tabeli danych lokalu i okresu."""
+    return [
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ('TOPPADDING', (0, 0), (-1, -1), 3),
+    ]
 
 
-def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
+def energy_table_commands(font_name: str) -> list:
+    """Styl tabeli szczegółów ceny 1 kWh (długie etykiety wyrównane do góry)."""
+    return [
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]
+
+
+def combined_bill_pdf_path(combined_bill: CombinedBill) -> Path:
+    """Ścieżka PDF rachunku łączonego, np. bills/combined/combined_bill_2025-01_2025-02_local_gora.pdf."""
+    filename = f"combined_bill_{combined_bill.period_start}_{combined_bill.period_end}_local_{combined_bill.local}.pdf"
+    return Path("bills/combined") / filename
+
+
+@dataclass(frozen=True)
+class CombinedWindow:
     """
-    Generuje plik PDF rachunku łączonego (wszystkie media).
+    Dane dwumiesięcznego okresu rachunków łączonych, wspólne dla wszystkich lokali.
     
-    Args:
-        db: Sesja bazy danych
-        combined_bill: Rachunek łączony
+    Attributes:
+        period_start: Pierwszy miesiąc okresu ('YYYY-MM')
+        period_end: Drugi miesiąc okresu ('YYYY-MM')
+        electricity_bills: Rachunki prądu z obu miesięcy po lokalu (w kolejności ID)
+        water_bills: Rachunki wody z obu miesięcy po lokalu
+        gas_bills: Rachunki gazu z obu miesięcy po lokalu
+        electricity_readings: Odczyty prądu rachunków po ID
+        previous_electricity: Poprzedni odczyt prądu po okresie odczytu
+        water_readings: Odczyty wody rachunków po okresie
+        previous_water: Poprzedni odczyt wody po okresie odczytu
+        usage: Zużycie lokali (calculate_all_usage) po ID odczytu prądu
+        cost_models: Modele kosztów faktur prądu po ID faktury
+        kwh_costs: Koszt 1 kWh (calculate_kwh_cost) po ID faktury
+        tenant_period: Daty (początek, koniec) okresu najemcy lub None bez odczytów
+    """
+    period_start: str
+    period_end: str
+    electricity_bills: Dict[str, List[ElectricityBill]]
+    water_bills: Dict[str, List[Bill]]
+    gas_bills: Dict[str, List[GasBill]]
+    electricity_readings: Dict[int, ElectricityReading]
+    previous_electricity: Dict[str, ElectricityReading]
+    water_readings: Dict[str, WaterReading]
+    previous_water: Dict[str, WaterReading]
+    usage: Dict[int, Dict[str, Any]]
+    cost_models: Dict[int, InvoiceCostModel]
+    kwh_costs: Dict[int, Dict[str, Any]]
+    tenant_period: Optional[Tuple[date, date]]
+
+
+def _group_by_local(bills: list) -> Dict[str, list]:
+    grouped = defaultdict(list)
+    for bill in bills:
+        grouped[bill.local].append(bill)
+    return grouped
+
+
+def _load_with_previous(db: Session, model, periods: set) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Odczyty z podanych okresów i ich poprzedniki (najnowszy odczyt przed okresem) - dwa zapytania.
     
     Returns:
-        Ścieżka do wygenerowanego pliku PDF
+        Tuple ({okres: odczyt}, {okres: poprzedni odczyt})
     """
-    # Utwórz folder dla rachunków łączonych
-    bills_folder = Path("bills/combined")
-    bills_folder.mkdir(parents=True, exist_ok=True)
-    
-    # Nazwa pliku: combined_bill_2025-01_2025-02_local_gora.pdf
-    filename = f"combined_bill_{combined_bill.period_start}_{combined_bill.period_end}_local_{combined_bill.local}.pdf"
-    filepath = bills_folder / filename
-    
-    # Pobierz czcionkę
-    default_font = get_font()
-    
-    # Funkcja do tworzenia CustomDocTemplate z nagłówkiem
-    class CustomDocTemplate(SimpleDocTemplate):
-        def __init__(self, font_name, *args, **kwargs):
-            SimpleDocTemplate.__init__(self, *args, **kwargs)
-            self.font_name = font_name
-            self.page_width = A4[0]
-            self.page_height = A4[1]
-        
-        def build(self, flowables, onFirstPage=None, onLaterPages=None):
-            now = datetime.now()
-            generated_text = f"Wygenerowano: {now.strftime('%d.%m.%Y %H:%M')}"
-            font_name = self.font_name
-            page_width = self.page_width
-            page_height = self.page_height
-            
-            def add_header(canvas, doc):
-                canvas.saveState()
-                canvas.setFont(font_name, 9)
-                right_margin = 15*mm
-                text_width = canvas.stringWidth(generated_text, font_name, 9)
-                x = page_width - right_margin - text_width
-                y = page_height - 15*mm
-                canvas.drawString(x, y, generated_text)
-                canvas.restoreState()
-            
-            return SimpleDocTemplate.build(self, flowables, onFirstPage=add_header, onLaterPages=add_header)
-    
-    # Stwórz dokument
-    doc = CustomDocTemplate(default_font, str(filepath), pagesize=A4,
-                           leftMargin=15*mm, rightMargin=15*mm,
-                           topMargin=25*mm, bottomMargin=15*mm)
-    
-    # Style
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#2c5aa0'),
-        spaceAfter=3*mm,
-        alignment=1,  # CENTER
-        fontName=default_font
+    if not periods:
+        return {}, {}
+    earlier = aliased(model)
+    previous_period = (
+        select(func.max(earlier.data))
+        .where(earlier.data < model.data)
+        .correlate(model)
+        .scalar_subquery()
     )
+    neighbors = dict(db.query(model.data, previous_period).filter(model.data.in_(periods)).all())
+    wanted = set(neighbors) | {period for period in neighbors.values() if period}
+    readings = {reading.data: reading for reading in db.query(model).filter(model.data.in_(wanted))}
+    current = {period: readings[period] for period in neighbors}
+    previous = {period: readings[prev] for period, prev in neighbors.items() if prev}
+    return current, previous
+
+
+def load_combined_window(db: Session, period_start: str, period_end: str, local_names: Optional[set] = None) -> CombinedWindow:
+    """
+    Pobiera dane okresu rachunków łączonych dla wszystkich (lub wybranych) lokali kilkoma
+    zapytaniami IN i zapytaniami o poprzednie odczyty; koszty kWh, zużycie i daty okresu
+    najemcy są liczone raz na okres.
     
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading3'],
-        fontSize=12,
-        textColor=colors.HexColor('#2c5aa0'),
-        spaceBefore=4*mm,
-        spaceAfter=2*mm,
-        fontName=default_font
-    )
+    Args:
+        db: Sesja bazy danych
+        period_start: Pierwszy miesiąc okresu ('YYYY-MM')
+        period_end: Drugi miesiąc okresu ('YYYY-MM')
+        local_names: Lokale do pobrania (domyślnie wszystkie)
+    """
+    periods = [period_start, period_end]
+    
+    def bills_query(model, *relations):
+        query = db.query(model).options(*(selectinload(relation) for relation in relations))
+        query = query.filter(model.data.in_(periods))
+        if local_names is not None:
+            query = query.filter(model.local.in_(local_names))
+        return query.order_by(model.id).all()
+    
+    electricity_bills = bills_query(ElectricityBill, ElectricityBill.invoice)
+    water_bills = bills_query(Bill, Bill.invoice)
+    gas_bills = bills_query(GasBill, GasBill.invoice)
+    
+    # Odczyty prądu: z rachunków i z obu miesięcy (daty okresu najemcy) wraz z poprzednikami
+    reading_ids = {bill.reading_id for bill in electricity_bills if bill.reading_id is not None}
+    reading_periods = set(periods)
+    if reading_ids:
+        reading_periods |= {
+            data for (data,) in db.query(ElectricityReading.data).filter(ElectricityReading.id.in_(reading_ids))
+        }
+    electricity_by_period, previous_electricity = _load_with_previous(db, ElectricityReading, reading_periods)
+    electricity_readings = {reading.id: reading for reading in electricity_by_period.values()}
     
-    subheading_style = ParagraphStyle(
-        'CustomSubHeading',
-        parent=styles['Heading4'],
-        fontSize=11,
-        textColor=colors.HexColor('#2c5aa0'),
-        spaceBefore=2*mm,
-        spaceAfter=1*mm,
-        fontName=default_font
+    water_readings, previous_water = _load_with_previous(
+        db, WaterReading, {bill.reading_id for bill in water_bills if bill.reading_id is not None}
     )
     
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=10,
-        fontName=default_font
+    usage = {
+        reading.id: calculate_all_usage(reading, previous_electricity[reading.data])
+        for reading in electricity_readings.values()
+        if reading.data in previous_electricity
+    }
+    
+    invoice_ids = {bill.invoice_id for bill in electricity_bills if bill.invoice_id is not None}
+    cost_models = get_invoice_cost_models(db, invoice_ids)
+    kwh_costs = {invoice_id: cost_model.kwh_costs() for invoice_id, cost_model in cost_models.items()}
+    
+    # Okres najemcy: od początku okresu pierwszego miesiąca do końca drugiego
+    tenant_period = None
+    if period_start in electricity_by_period and period_end in electricity_by_period:
+        first_dates = compute_tenant_period_dates(
+            period_start, electricity_by_period[period_start], previous_electricity.get(period_start)
+        )
+        last_dates = compute_tenant_period_dates(
+            period_end, electricity_by_period[period_end], previous_electricity.get(period_end)
+        )
+        tenant_period = (first_dates[0], last_dates[1])
+    
+    return CombinedWindow(
+        period_start=period_start,
+        period_end=period_end,
+        electricity_bills=_group_by_local(electricity_bills),
+        water_bills=_group_by_local(water_bills),
+        gas_bills=_group_by_local(gas_bills),
+        electricity_readings=electricity_readings,
+        previous_electricity=previous_electricity,
+        water_readings=water_readings,
+        previous_water=previous_water,
+        usage=usage,
+        cost_models=cost_models,
+        kwh_costs=kwh_costs,
+        tenant_period=tenant_period,
     )
+
+
+def build_combined_bill_views(db: Session, combined_bills: List[CombinedBill]) -> List[dict]:
+    """
+    Buduje modele widoku rachunków łączonych (app.core.pdf_toolkit.render_view).
+    Dane są pobierane raz na dwumiesięczny okres (load_combined_window), dla wszystkich lokali naraz.
     
-    story = []
+    Args:
+        db: Sesja bazy danych
+        combined_bills: Rachunki łączone (mogą pochodzić z różnych okresów)
+    
+    Returns:
+        Modele widoku w kolejności rachunków
+    """
+    windows = {}
+    by_window = defaultdict(set)
+    for bill in combined_bills:
+        by_window[(bill.period_start, bill.period_end)].add(bill.local)
+    for (period_start, period_end), local_names in by_window.items():
+        windows[(period_start, period_end)] = load_combined_window(db, period_start, period_end, local_names)
+    
+    local_ids = {bill.local_id for bill in combined_bills if bill.local_id is not None}
+    locals_by_id = {local.id: local for local in db.query(Local).filter(Local.id.in_(local_ids))} if local_ids else {}
+    return [
+        _combined_bill_view(bill, windows[(bill.period_start, bill.period_end)], locals_by_id.get(bill.local_id))
+        for bill in combined_bills
+    ]
+
+
+def build_combined_bill_view(db: Session, combined_bill: CombinedBill) -> dict:
+    """Model widoku pojedynczego rachunku łączonego (zob. build_combined_bill_views)."""
+    return build_combined_bill_views(db, [combined_bill])[0]
+
+
+def _combined_bill_view(combined_bill: CombinedBill, window: CombinedWindow, local_obj: Optional[Local]) -> dict:
+    """
+    Składa model widoku rachunku łączonego z danych okresu - bez zapytań do bazy.
+    
+    Args:
+        combined_bill: Rachunek łączony
+        window: Dane okresu (load_combined_window)
+        local_obj: Lokal rachunku
+    
+    Returns:
+        Model widoku ({'bill_id', 'path', 'blocks'})
+    """
+    blocks = []
     
     # Tytuł
-    story.append(Paragraph("RACHUNEK ZA MEDIA", title_style))
-    story.append(Spacer(1, 2*mm))
+    blocks.append(('paragraph', 'combined_title', "RACHUNEK ZA MEDIA"))
+    blocks.append(('spacer', 2))
     
     # Dane lokalu
-    local_obj = combined_bill.local_obj
     period_text = f"{combined_bill.period_start} do {combined_bill.period_end}"
     
     data = [
@@ -167,27 +251,15 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
         ['Data wygenerowania:', combined_bill.generated_date.strftime('%d.%m.%Y')],
     ]
     
-    table = Table(data, colWidths=[60*mm, 125*mm])
-    table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, -1), default_font),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-        ('TOPPADDING', (0, 0), (-1, -1), 3),
-    ]))
-    story.append(table)
-    story.append(Spacer(1, 5*mm))
+    blocks.append(('table', data, [60, 125], header_table_commands))
+    blocks.append(('spacer', 5))
     
     # ========== I. PRĄD ==========
-    story.append(Paragraph("I. PRĄD", heading_style))
-    story.append(Spacer(1, 2*mm))
+    blocks.append(('paragraph', 'combined_heading', "I. PRĄD"))
+    blocks.append(('spacer', 2))
     
-    # Pobierz wszystkie rachunki prądu z obu miesięcy
-    from app.models.electricity import ElectricityBill
-    electricity_bills = db.query(ElectricityBill).filter(
-        ElectricityBill.data.in_([combined_bill.period_start, combined_bill.period_end]),
-        ElectricityBill.local == combined_bill.local
-    ).all()
+    # Wszystkie rachunki prądu z obu miesięcy
+    electricity_bills = window.electricity_bills.get(combined_bill.local, [])
     
     if electricity_bills:
         # Sumuj zużycie i koszty z obu miesięcy
@@ -197,20 +269,12 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
         
         # Użyj pierwszego rachunku do szczegółów (odczyty, faktura)
         electricity_bill = electricity_bills[0]
-        # Pobierz odczyt
-        reading = electricity_bill.reading
-        previous_reading = None
-        if reading:
-            # Znajdź poprzedni odczyt
-            from app.models.electricity import ElectricityReading
-            all_readings = db.query(ElectricityReading).order_by(ElectricityReading.data).all()
-            for i, r in enumerate(all_readings):
-                if r.id == reading.id and i > 0:
-                    previous_reading = all_readings[i - 1]
-                    break
+        # Odczyt i poprzedni odczyt
+        reading = window.electricity_readings.get(electricity_bill.reading_id)
+        previous_reading = window.previous_electricity.get(reading.data) if reading else None
         
         # Zużycie kWh
-        story.append(Paragraph("ZUŻYCIE KWH:", subheading_style))
+        blocks.append(('paragraph', 'subheading', "ZUŻYCIE KWH:"))
         
         usage_data = []
         if reading:
@@ -234,31 +298,19 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
                 ['Zużycie:', f"{total_usage_kwh:.2f} kWh"],
             ]
         
-        usage_table = Table(usage_data, colWidths=[60*mm, 125*mm])
-        usage_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        story.append(usage_table)
-        story.append(Spacer(1, 2*mm))
+        blocks.append(('table', usage_data, [60, 125], details_table_commands))
+        blocks.append(('spacer', 2))
         
         # 1. Należność za energię czynną, opłata jakościowa, zmienna sieciowa, kogeneracyjna
-        story.append(Paragraph("1. NALEŻNOŚĆ ZA ENERGIĘ CZYNNĄ, OPŁATA JAKOŚCIOWA, ZMIENNA SIECIOWA, KOGENERACYJNA - ŁĄCZNIE (PROPORCJONALNIE DO ZUŻYCIA ENERGII)", subheading_style))
+        blocks.append(('paragraph', 'subheading', "1. NALEŻNOŚĆ ZA ENERGIĘ CZYNNĄ, OPŁATA JAKOŚCIOWA, ZMIENNA SIECIOWA, KOGENERACYJNA - ŁĄCZNIE (PROPORCJONALNIE DO ZUŻYCIA ENERGII)"))
         
         # Oblicz koszt 1 kWh
         invoice = electricity_bill.invoice
         if invoice:
-            koszty_kwh = calculate_kwh_cost(invoice.id, db)
+            koszty_kwh = window.kwh_costs.get(invoice.id, {})
             
-            # Pobierz szczegóły obliczeń
-            manager = ElectricityBillingManager()
-            from app.services.electricity.calculator import calculate_all_usage
-            if reading and previous_reading:
-                usage_data_dict = calculate_all_usage(reading, previous_reading)
-            else:
-                usage_data_dict = {}
+            # Szczegóły obliczeń (zużycie policzone raz na odczyt)
+            usage_data_dict = window.usage.get(reading.id, {}) if reading and previous_reading else {}
             
             # Oblicz szczegóły dla lokalu
             if combined_bill.local == 'gora':
@@ -268,8 +320,33 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
             else:
                 local_usage = usage_data_dict.get('gabinet', {}).get('zuzycie_gabinet', total_usage_kwh)
             
+            # Faktura z kilkoma okresami cenowymi - średnie ceny z osi taryfowej dla okresu najemcy
+            cost_model = window.cost_models.get(invoice.id)
+            timeline_prices = None
+            timeline_periods = []
+            if cost_model and cost_model.timeline.segment_count > 1:
+                if window.tenant_period:
+                    tenant_start, tenant_end = window.tenant_period
+                    timeline_prices = cost_model.timeline.average_prices(tenant_start, tenant_end)
+                    timeline_periods = [
+                        p for p in cost_model.distribution_periods
+                        if p["od"] <= tenant_end and p["do"] >= tenant_start
+                    ]
+            
             # Oblicz koszt za 1 kWh (średnia ważona dla dwutaryfowej lub całodobowa)
-            if invoice.typ_taryfy == "DWUTARYFOWA" and "DZIENNA" in koszty_kwh and "NOCNA" in koszty_kwh:
+            if timeline_prices and timeline_prices["days"]:
+                if invoice.typ_taryfy == "DWUTARYFOWA":
+                    koszt_dzienna = timeline_prices["dzienna"] or 0
+                    koszt_nocna = timeline_prices["nocna"] or 0
+                    cena_1kwh = round(koszt_dzienna * 0.7 + koszt_nocna * 0.3, 4)
+                    obliczenia_text = (
+                        f"Średnia ważona dniami ({timeline_prices['days']} dni): "
+                        f"{koszt_dzienna:.4f} × 0.7 + {koszt_nocna:.4f} × 0.3 = {cena_1kwh:.4f} zł/kWh"
+                    )
+                else:
+                    cena_1kwh = timeline_prices["calodobowa"] or 0
+                    obliczenia_text = f"Cena całodobowa ważona dniami ({timeline_prices['days']} dni): {cena_1kwh:.4f} zł/kWh"
+            elif invoice.typ_taryfy == "DWUTARYFOWA" and "DZIENNA" in koszty_kwh and "NOCNA" in koszty_kwh:
                 koszt_dzienna = koszty_kwh["DZIENNA"].get("suma", 0)
                 koszt_nocna = koszty_kwh["NOCNA"].get("suma", 0)
                 cena_1kwh = round(koszt_dzienna * 0.7 + koszt_nocna * 0.3, 4)
@@ -286,56 +363,46 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
                 ['Cena za 1 kWh (obliczana z pokrywania się okresów faktury i okresów rozliczeniowych):', f"{cena_1kwh:.4f} zł/kWh"],
                 ['Obliczenia:', obliczenia_text],
             ]
+            for period in timeline_periods:
+                if invoice.typ_taryfy == "DWUTARYFOWA":
+                    ceny_text = f"{period['cena_1kwh_dzienna'] or 0:.4f} / {period['cena_1kwh_nocna'] or 0:.4f} zł/kWh (dzienna / nocna)"
+                else:
+                    ceny_text = f"{period['cena_1kwh_calodobowa'] or 0:.4f} zł/kWh"
+                energy_cost_details.append([
+                    f"Okres {period['od'].strftime('%d.%m.%Y')} - {period['do'].strftime('%d.%m.%Y')} (VAT {period['vat_rate'] * 100:g}%):",
+                    ceny_text
+                ])
         else:
             energy_cost_details = [
                 ['Zużycie prądu:', f"{electricity_bill.usage_kwh:.2f} kWh"],
                 ['Cena za 1 kWh:', "Brak danych"],
             ]
         
-        energy_table = Table(energy_cost_details, colWidths=[100*mm, 85*mm])
-        energy_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
-        story.append(energy_table)
-        story.append(Spacer(1, 2*mm))
+        blocks.append(('table', energy_cost_details, [100, 85], energy_table_commands))
+        blocks.append(('spacer', 2))
         
         # 2. Opłata stała sieciowa, abonamentowa, przejściowa
-        story.append(Paragraph("2. OPŁATA STAŁA SIECIOWA, ABONAMENTOWA, PRZEJŚCIOWA (OBLICZANA Z POKRYWANIA SIĘ OKRESÓW FAKTURY I OKRESÓW ROZLICZENIOWYCH)", subheading_style))
-        story.append(Paragraph("Opłaty stałe są już uwzględnione w kosztach dystrybucji.", normal_style))
-        story.append(Spacer(1, 2*mm))
+        blocks.append(('paragraph', 'subheading', "2. OPŁATA STAŁA SIECIOWA, ABONAMENTOWA, PRZEJŚCIOWA (OBLICZANA Z POKRYWANIA SIĘ OKRESÓW FAKTURY I OKRESÓW ROZLICZENIOWYCH)"))
+        blocks.append(('paragraph', 'normal', "Opłaty stałe są już uwzględnione w kosztach dystrybucji."))
+        blocks.append(('spacer', 2))
         
         # 3. Koszty łącznie
-        story.append(Paragraph("3. KOSZTY ŁĄCZNIE (1.+2.):", subheading_style))
-        costs_table = Table([
+        blocks.append(('paragraph', 'subheading', "3. KOSZTY ŁĄCZNIE (1.+2.):"))
+        blocks.append(('table', [
             ['Netto:', f"{total_net:.2f} zł"],
             ['Brutto:', f"{total_gross:.2f} zł"],
-        ], colWidths=[60*mm, 125*mm])
-        costs_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        story.append(costs_table)
+        ], [60, 125], details_table_commands))
     else:
-        story.append(Paragraph("Brak danych o rachunku za prąd", normal_style))
+        blocks.append(('paragraph', 'normal', "Brak danych o rachunku za prąd"))
     
-    story.append(Spacer(1, 5*mm))
+    blocks.append(('spacer', 5))
     
     # ========== II. WODA I ŚCIEKI ==========
-    story.append(Paragraph("II. WODA I ŚCIEKI", heading_style))
-    story.append(Spacer(1, 2*mm))
+    blocks.append(('paragraph', 'combined_heading', "II. WODA I ŚCIEKI"))
+    blocks.append(('spacer', 2))
     
-    # Pobierz wszystkie rachunki wody z obu miesięcy
-    from app.models.water import Bill
-    water_bills = db.query(Bill).filter(
-        Bill.data.in_([combined_bill.period_start, combined_bill.period_end]),
-        Bill.local == combined_bill.local
-    ).all()
+    # Wszystkie rachunki wody z obu miesięcy
+    water_bills = window.water_bills.get(combined_bill.local, [])
     
     if water_bills:
         # Sumuj zużycie i koszty z obu miesięcy
@@ -350,15 +417,8 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
         # Użyj pierwszego rachunku do szczegółów (odczyty, faktura)
         water_bill = water_bills[0]
         # Odczyty
-        reading = water_bill.reading
-        previous_reading = None
-        if reading:
-            from app.models.water import Reading
-            all_readings = db.query(Reading).order_by(Reading.data).all()
-            for i, r in enumerate(all_readings):
-                if r.data == reading.data and i > 0:
-                    previous_reading = all_readings[i - 1]
-                    break
+        reading = window.water_readings.get(water_bill.reading_id)
+        previous_reading = window.previous_water.get(reading.data) if reading else None
         
         reading_data = []
         if reading and previous_reading:
@@ -382,18 +442,11 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
                 ['Zużycie:', f"{total_usage_m3:.2f} m³"],
             ]
         
-        reading_table = Table(reading_data, colWidths=[60*mm, 125*mm])
-        reading_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        story.append(reading_table)
-        story.append(Spacer(1, 2*mm))
+        blocks.append(('table', reading_data, [60, 125], details_table_commands))
+        blocks.append(('spacer', 2))
         
         # 1. Woda
-        story.append(Paragraph("1. WODA", subheading_style))
+        blocks.append(('paragraph', 'subheading', "1. WODA"))
         invoice = water_bill.invoice
         if invoice:
             water_details = [
@@ -407,18 +460,11 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
                 ['Koszt wody:', f"{total_cost_water:.2f} zł"],
             ]
         
-        water_table = Table(water_details, colWidths=[60*mm, 125*mm])
-        water_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        story.append(water_table)
-        story.append(Spacer(1, 2*mm))
+        blocks.append(('table', water_details, [60, 125], details_table_commands))
+        blocks.append(('spacer', 2))
         
         # 2. Ścieki
-        story.append(Paragraph("2. ŚCIEKI", subheading_style))
+        blocks.append(('paragraph', 'subheading', "2. ŚCIEKI"))
         if invoice:
             sewage_details = [
                 ['Zużycie:', f"{total_usage_m3:.2f} m³"],
@@ -431,44 +477,26 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
                 ['Koszt ścieków:', f"{total_cost_sewage:.2f} zł"],
             ]
         
-        sewage_table = Table(sewage_details, colWidths=[60*mm, 125*mm])
-        sewage_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        story.append(sewage_table)
-        story.append(Spacer(1, 2*mm))
+        blocks.append(('table', sewage_details, [60, 125], details_table_commands))
+        blocks.append(('spacer', 2))
         
         # 3. Koszty łącznie
-        story.append(Paragraph("3. KOSZTY ŁĄCZNIE (1.+2.):", subheading_style))
-        water_costs_table = Table([
+        blocks.append(('paragraph', 'subheading', "3. KOSZTY ŁĄCZNIE (1.+2.):"))
+        blocks.append(('table', [
             ['Netto:', f"{total_net:.2f} zł"],
             ['Brutto:', f"{total_gross:.2f} zł"],
-        ], colWidths=[60*mm, 125*mm])
-        water_costs_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        story.append(water_costs_table)
+        ], [60, 125], details_table_commands))
     else:
-        story.append(Paragraph("Brak danych o rachunku za wodę i ścieki", normal_style))
+        blocks.append(('paragraph', 'normal', "Brak danych o rachunku za wodę i ścieki"))
     
-    story.append(Spacer(1, 5*mm))
+    blocks.append(('spacer', 5))
     
     # ========== III. GAZ ==========
-    story.append(Paragraph("III. GAZ", heading_style))
-    story.append(Spacer(1, 2*mm))
+    blocks.append(('paragraph', 'combined_heading', "III. GAZ"))
+    blocks.append(('spacer', 2))
     
-    # Pobierz wszystkie rachunki gazu z obu miesięcy
-    from app.models.gas import GasBill
-    gas_bills = db.query(GasBill).filter(
-        GasBill.data.in_([combined_bill.period_start, combined_bill.period_end]),
-        GasBill.local == combined_bill.local
-    ).all()
+    # Wszystkie rachunki gazu z obu miesięcy
+    gas_bills = window.gas_bills.get(combined_bill.local, [])
     
     if gas_bills:
         # Sumuj koszty z obu miesięcy
@@ -482,12 +510,12 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
         # Użyj pierwszego rachunku do szczegółów (faktura, udział)
         gas_bill = gas_bills[0]
         # Odczyty (gaz nie ma odczytów w bazie, więc pokazujemy tylko koszty)
-        story.append(Paragraph("Odczyty licznika:", subheading_style))
-        story.append(Paragraph("Dane z faktury gazu", normal_style))
-        story.append(Spacer(1, 2*mm))
+        blocks.append(('paragraph', 'subheading', "Odczyty licznika:"))
+        blocks.append(('paragraph', 'normal', "Dane z faktury gazu"))
+        blocks.append(('spacer', 2))
         
         # Szczegóły obliczeń
-        story.append(Paragraph("Szczegóły obliczeń:", subheading_style))
+        blocks.append(('paragraph', 'subheading', "Szczegóły obliczeń:"))
         invoice = gas_bill.invoice
         if invoice:
             # Proporcje
@@ -506,34 +534,34 @@ def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
                 ['Koszt brutto:', f"{total_gross:.2f} zł"],
             ]
         
-        gas_table = Table(gas_details, colWidths=[60*mm, 125*mm])
-        gas_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        story.append(gas_table)
-        story.append(Spacer(1, 2*mm))
+        blocks.append(('table', gas_details, [60, 125], details_table_commands))
+        blocks.append(('spacer', 2))
         
         # Koszty łącznie
-        story.append(Paragraph("Koszty łącznie:", subheading_style))
-        gas_costs_table = Table([
+        blocks.append(('paragraph', 'subheading', "Koszty łącznie:"))
+        blocks.append(('table', [
             ['Netto:', f"{total_net:.2f} zł"],
             ['Brutto:', f"{total_gross:.2f} zł"],
-        ], colWidths=[60*mm, 125*mm])
-        gas_costs_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), default_font),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        story.append(gas_costs_table)
+        ], [60, 125], details_table_commands))
     else:
-        story.append(Paragraph("Brak danych o rachunku za gaz", normal_style))
+        blocks.append(('paragraph', 'normal', "Brak danych o rachunku za gaz"))
     
-    # Generuj PDF
-    doc.build(story)
-    
-    return str(filepath.resolve())
+    return {
+        'bill_id': combined_bill.id,
+        'path': str(combined_bill_pdf_path(combined_bill).resolve()),
+        'blocks': blocks,
+    }
+
 
+def generate_combined_bill_pdf(db: Session, combined_bill: CombinedBill) -> str:
+    """
+    Generuje plik PDF rachunku łączonego (wszystkie media).
+    
+    Args:
+        db: Sesja bazy danych
+        combined_bill: Rachunek łączony
+    
+    Returns:
+        Ścieżka do wygenerowanego pliku PDF
+    """
+    return write_pdf_cached(combined_bill, build_combined_bill_view(db, combined_bill))
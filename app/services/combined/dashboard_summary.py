@@ -0,0 +1,175 @@
+"""
+Podsumowanie wszystkich mediów dla strony głównej dashboardu.
+
+Dla każdego medium wykonywane jest jedno zapytanie SELECT z podzapytaniami
+skalarnymi: liczniki, najnowszy okres, suma brutto, okresy rachunków, okresy
+dostępne do wygenerowania rachunków, pozycje oznaczone flagą, zapisane wyniki
+walidacji faktur (validation_results) i anomalie odczytów (meter_anomalies).
+Zapytania mediów są wykonywane równolegle - każde na osobnym połączeniu z puli silnika.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import distinct, func, select
+from sqlalchemy.engine import Engine
+
+from app.models.combined import CombinedBill
+from app.models.electricity import ElectricityBill, ElectricityReading
+from app.models.electricity_invoice import ElectricityInvoice
+from app.models.gas import GasBill, GasInvoice
+from app.models.meter_anomaly import MeterAnomaly
+from app.models.validation import ValidationResult
+from app.models.water import Bill, Invoice, Local, Reading
+
+RECENT_PERIODS = 10  # Liczba ostatnich okresów rachunków w podsumowaniu
+SEVERITIES = ('critical', 'warning', 'info')  # Wagi reguł walidacji faktur
+
+
+def _count(model, *where):
+    """Podzapytanie: liczba wierszy tabeli."""
+    return select(func.count()).select_from(model).where(*where).scalar_subquery()
+
+
+def _scalar(expression, *where):
+    """Podzapytanie: pojedyncza wartość (agregat)."""
+    return select(expression).where(*where).scalar_subquery()
+
+
+def _count_distinct(column, *where):
+    """Podzapytanie: liczba różnych wartości kolumny."""
+    return select(func.count(distinct(column))).where(*where).scalar_subquery()
+
+
+def _validation(media: str):
+    """Kolumny podsumowania walidacji faktur medium (jak get_validation_summary)."""
+    failed = (ValidationResult.media == media, ValidationResult.status == 'failed')
+    return (
+        _count_distinct(ValidationResult.invoice_id, ValidationResult.media == media).label('invoices_validated'),
+        _count_distinct(ValidationResult.invoice_id, *failed).label('invoices_failed'),
+        *(
+            _count(ValidationResult, *failed, ValidationResult.severity == severity).label(f'failed_{severity}')
+            for severity in SEVERITIES
+        ),
+    )
+
+
+def _anomalies(media: str):
+    """Podzapytanie: liczba anomalii odczytów liczników medium."""
+    return _count(MeterAnomaly, MeterAnomaly.media == media).label('anomalies_count')
+
+
+def _periods(column, *where):
+    """Podzapytanie: różne okresy kolumny połączone przecinkami (kolejność dowolna)."""
+    return select(func.group_concat(distinct(column))).where(*where).scalar_subquery()
+
+
+# Miesiąc 'YYYY-MM' z daty faktury prądu (daty są zapisywane jako 'YYYY-MM-DD')
+_invoice_start_month = func.substr(ElectricityInvoice.data_poczatku_okresu, 1, 7)
+_invoice_end_month = func.substr(ElectricityInvoice.data_konca_okresu, 1, 7)
+
+SUMMARY_QUERIES = {
+    'water': select(
+        _count(Local).label('locals_count'),
+        _count(Reading).label('readings_count'),
+        _count(Invoice).label('invoices_count'),
+        _count(Bill).label('bills_count'),
+        _scalar(func.max(Reading.data)).label('latest_period'),
+        _scalar(func.sum(Bill.gross_sum)).label('total_gross_sum'),
+        _periods(Bill.data).label('bill_periods'),
+        # Okresy z odczytem i fakturą
+        _periods(Reading.data, Reading.data.in_(select(Invoice.data))).label('available_periods'),
+        *_validation('water'),
+        _anomalies('water'),
+    ),
+    'gas': select(
+        _count(GasInvoice).label('invoices_count'),
+        _count(GasBill).label('bills_count'),
+        _scalar(func.max(GasInvoice.data)).label('latest_period'),
+        _scalar(func.sum(GasBill.total_gross_sum)).label('total_gross_sum'),
+        _periods(GasBill.data).label('bill_periods'),
+        # Okresy faktur (odczyty gazu są zapisane w fakturze)
+        _periods(GasInvoice.data).label('available_periods'),
+        *_validation('gas'),
+    ),
+    'electricity': select(
+        _count(ElectricityReading).label('readings_count'),
+        _count(ElectricityInvoice).label('invoices_count'),
+        _count(ElectricityBill).label('bills_count'),
+        _scalar(func.max(ElectricityReading.data)).label('latest_period'),
+        _scalar(func.sum(ElectricityBill.total_gross_sum)).label('total_gross_sum'),
+        _periods(ElectricityBill.data).label('bill_periods'),
+        # Okresy odczytów pokryte okresem rozliczeniowym którejś faktury
+        _periods(
+            ElectricityReading.data,
+            select(ElectricityInvoice.id).where(
+                _invoice_start_month <= ElectricityReading.data,
+                _invoice_end_month >= ElectricityReading.data
+            ).exists()
+        ).label('available_periods'),
+        _count(ElectricityReading, ElectricityReading.is_flagged.is_(True)).label('flagged_readings'),
+        _count(ElectricityInvoice, ElectricityInvoice.is_flagged.is_(True)).label('flagged_invoices'),
+        *_validation('electricity'),
+        _anomalies('electricity'),
+    ),
+    'combined': select(
+        _count(CombinedBill).label('bills_count'),
+        _count(CombinedBill, CombinedBill.email_sent_date.is_(None)).label('unsent_count'),
+        _scalar(func.max(CombinedBill.period_end)).label('latest_period'),
+        _scalar(func.sum(CombinedBill.total_gross_sum)).label('total_gross_sum'),
+    ),
+}
+
+# Tabele, z których budowane jest podsumowanie (wersje dla cache odpowiedzi)
+SUMMARY_TABLES = tuple(sorted({
+    model.__tablename__
+    for model in (Local, Reading, Invoice, Bill, GasInvoice, GasBill, ElectricityReading, ElectricityInvoice,
+                  ElectricityBill, CombinedBill, ValidationResult, MeterAnomaly)
+}))
+
+
+def _split_periods(value: Optional[str], limit: Optional[int] = None) -> List[str]:
+    """Okresy z group_concat posortowane malejąco."""
+    periods = sorted(set(value.split(',')), reverse=True) if value else []
+    return periods[:limit] if limit else periods
+
+
+def _format(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Zamienia wiersz podsumowania medium na pola odpowiedzi."""
+    result = dict(row)
+    result['total_gross_sum'] = float(result['total_gross_sum'] or 0)
+    if 'bill_periods' in result:
+        result['bill_periods'] = _split_periods(result['bill_periods'], RECENT_PERIODS)
+    if 'available_periods' in result:
+        result['available_periods'] = _split_periods(result['available_periods'])
+    if 'invoices_validated' in result:
+        result['validation'] = {
+            'invoices_validated': result.pop('invoices_validated'),
+            'invoices_failed': result.pop('invoices_failed'),
+            'failed_checks': {severity: result.pop(f'failed_{severity}') for severity in SEVERITIES},
+        }
+    return result
+
+
+def _run_query(engine: Engine, statement) -> Dict[str, Any]:
+    """Wykonuje zapytanie podsumowania na osobnym połączeniu."""
+    with engine.connect() as connection:
+        return dict(connection.execute(statement).mappings().one())
+
+
+def get_dashboard_summary(engine: Engine) -> Dict[str, Dict[str, Any]]:
+    """
+    Zwraca podsumowanie wszystkich mediów - jedno zapytanie na medium, wykonywane równolegle.
+
+    Args:
+        engine: Silnik bazy danych (db.get_bind())
+
+    Returns:
+        {'water': {...}, 'gas': {...}, 'electricity': {...}, 'combined': {...}}
+    """
+    with ThreadPoolExecutor(max_workers=len(SUMMARY_QUERIES)) as executor:
+        futures = {
+            media: executor.submit(_run_query, engine, statement)
+            for media, statement in SUMMARY_QUERIES.items()
+        }
+        return {media: _format(future.result()) for media, future in futures.items()}
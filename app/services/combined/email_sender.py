@@ -1,81 +1,34 @@
 """
 Moduł wysyłania rachunków łączonych na email.
+Wiadomości trafiają do kolejki (app.core.email_outbox), z której wysyła je worker.
 """
 
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from pathlib import Path
-from typing import Optional, List
-import os
+from typing import Tuple
 
-from app.config import settings
+from sqlalchemy.orm import Session
+
+from app.core.email_outbox import enqueue_email
 from app.models.combined import CombinedBill
-from app.models.water import Local
+from app.models.email_outbox import EmailOutbox
 
 
-def send_combined_bill_email(
-    recipient_email: str,
-    bill: CombinedBill,
-    pdf_path: str,
-    smtp_server: str = None,
-    smtp_port: int = 587,
-    smtp_user: str = None,
-    smtp_password: str = None,
-    use_tls: bool = True
-) -> bool:
+def combined_bill_email(bill: CombinedBill) -> Tuple[str, str]:
     """
-    Wysyła rachunek łączony na email.
+    Temat i treść wiadomości z rachunkiem łączonym.
     
     Args:
-        recipient_email: Email odbiorcy
         bill: Rachunek łączony
-        pdf_path: Ścieżka do pliku PDF
-        smtp_server: Adres serwera SMTP (domyślnie z zmiennych środowiskowych)
-        smtp_port: Port SMTP (domyślnie 587)
-        smtp_user: Użytkownik SMTP (domyślnie z zmiennych środowiskowych)
-        smtp_password: Hasło SMTP (domyślnie z zmiennych środowiskowych)
-        use_tls: Czy używać TLS
     
     Returns:
-        True jeśli wysłano pomyślnie, False w przeciwnym razie
+        Tuple (temat, treść)
     """
-    # Pobierz konfigurację z ustawień
-    if smtp_server is None:
-        smtp_server = settings.smtp_server or os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    if smtp_port is None:
-        smtp_port = settings.smtp_port or int(os.getenv("SMTP_PORT", "587"))
-    if smtp_user is None:
-        smtp_user = settings.smtp_user or os.getenv("SMTP_USER")
-    if smtp_password is None:
-        smtp_password = settings.smtp_password or os.getenv("SMTP_PASSWORD")
-    
-    # Usuń spacje z hasła
-    if smtp_password:
-        smtp_password = smtp_password.replace(" ", "")
-    
-    if not smtp_user or not smtp_password:
-        print("[ERROR] Brak konfiguracji SMTP. Ustaw SMTP_USER i SMTP_PASSWORD w zmiennych środowiskowych lub pliku .env")
-        return False
+    subject = f"Rachunek za media - {bill.period_start} do {bill.period_end} - Lokal {bill.local}"
     
-    if not Path(pdf_path).exists():
-        print(f"[ERROR] Plik PDF nie istnieje: {pdf_path}")
-        return False
+    local_name = bill.local_obj.tenant if bill.local_obj and bill.local_obj.tenant else bill.local
+    period_text = f"{bill.period_start} do {bill.period_end}"
     
-    try:
-        # Utwórz wiadomość
-        msg = MIMEMultipart()
-        msg['From'] = smtp_user
-        msg['To'] = recipient_email
-        msg['Subject'] = f"Rachunek za media - {bill.period_start} do {bill.period_end} - Lokal {bill.local}"
-        
-        # Treść wiadomości
-        local_name = bill.local_obj.tenant if bill.local_obj and bill.local_obj.tenant else bill.local
-        period_text = f"{bill.period_start} do {bill.period_end}"
-        
-        body = f"""
+    body = f"""
 Witaj {local_name},
 
 W załączeniu przesyłamy rachunek za media za okres {period_text}.
@@ -96,50 +49,26 @@ W razie pytań prosimy o kontakt.
 
 Pozdrawiamy,
 System rozliczania rachunków
-        """
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # Załącz plik PDF
-        with open(pdf_path, "rb") as attachment:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment.read())
-        
-        encoders.encode_base64(part)
-        part.add_header(
-            'Content-Disposition',
-            f'attachment; filename= {Path(pdf_path).name}'
-        )
-        msg.attach(part)
-        
-        # Wyślij email
-        print(f"[INFO] Próba połączenia z SMTP: {smtp_server}:{smtp_port}")
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        
-        if use_tls:
-            print("[INFO] Włączanie TLS...")
-            server.starttls()
-        
-        print("[INFO] Logowanie do serwera SMTP...")
-        server.login(smtp_user, smtp_password)
-        print("[INFO] Zalogowano pomyślnie")
-        
-        print(f"[INFO] Wysyłanie rachunku na email: {recipient_email}")
-        text = msg.as_string()
-        server.sendmail(smtp_user, recipient_email, text)
-        server.quit()
-        
-        print(f"[OK] Wysłano rachunek na email: {recipient_email}")
-        return True
-        
-    except smtplib.SMTPAuthenticationError as e:
-        print(f"[ERROR] Błąd autentykacji SMTP: {str(e)}")
-        return False
-    except smtplib.SMTPException as e:
-        print(f"[ERROR] Błąd SMTP: {str(e)}")
-        return False
-    except Exception as e:
-        print(f"[ERROR] Błąd wysyłania email: {str(e)}")
-        import traceback
-        print(f"[ERROR] Szczegóły: {traceback.format_exc()}")
-        return False
+    """
+    return subject, body
+
 
+def enqueue_combined_bill_email(db: Session, bill: CombinedBill, recipient_email: str) -> EmailOutbox:
+    """
+    Zapisuje rachunek łączony (z PDF w załączniku) w kolejce wiadomości.
+    Wysyłka i zapis email_sent_date - app.core.email_outbox.deliver_outbox.
+    
+    Args:
+        db: Sesja bazy danych
+        bill: Rachunek łączony z wygenerowanym PDF (pdf_path)
+        recipient_email: Email odbiorcy
+    
+    Returns:
+        Wiadomość w kolejce
+    """
+    subject, body = combined_bill_email(bill)
+    return enqueue_email(
+        db, 'combined_bill', recipient_email, subject, body,
+        attachment_path=bill.pdf_path, attachment_name=Path(bill.pdf_path).name,
+        combined_bill_id=bill.id
+    )
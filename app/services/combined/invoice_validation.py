@@ -0,0 +1,372 @@
+"""
+Walidacja faktur wszystkich mediów (woda, gaz, prąd).
+
+Każda reguła to tożsamość arytmetyczna zapisana jako wyrażenie SQL
+(ilość × cena = netto, netto × VAT = kwota VAT, różnica odczytów = zużycie,
+suma pozycji = suma faktury). Reguły medium są liczone jednym zapytaniem -
+kolumnami dla wszystkich faktur naraz - a wyniki zapisywane w validation_results
+(faktura × reguła). Zmiana faktury (lub jej pozycji) waliduje ją ponownie przed
+commitem tej samej transakcji (hook app.core.change_tracking), więc odczyt wyników
+nie musi niczego przeliczać; validate_invoices uzupełnia wyniki faktur, które ich
+nie mają (np. po dodaniu reguły).
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy import Float, and_, case, exists, func, insert, literal, select, true, type_coerce
+from sqlalchemy.orm import Session
+
+from app.core.change_tracking import on_before_commit, pending_changes
+from app.models.electricity_invoice import (
+    ElectricityInvoice,
+    ElectricityInvoiceOdczyt,
+    ElectricityInvoiceOplataDystrybucyjna,
+    ElectricityInvoiceSprzedazEnergii
+)
+from app.models.gas import GasInvoice
+from app.models.validation import ValidationResult
+from app.models.water import Invoice as WaterInvoice, Reading
+
+# Tolerancje
+TOLERANCE_PLN = 0.01  # 1 grosz
+TOLERANCE_KWH = 1.0  # 1 kWh
+TOLERANCE_M3 = 0.01  # 0.01 m³
+
+# Klucz w session.info ze zbiorem zmienionych faktur {(medium, invoice_id)}
+_PENDING_KEY = "validation_changes"
+_ALL = None  # invoice_id oznaczający wszystkie faktury medium
+
+
+@dataclass(frozen=True)
+class ValidationRule:
+    """Reguła walidacji: wartość obliczona (expected) ≈ wartość z faktury (actual)."""
+    name: str
+    label: str
+    expected: Any  # Wyrażenie SQL
+    actual: Any  # Wyrażenie SQL
+    tolerance: float = TOLERANCE_PLN
+    severity: str = 'warning'
+    condition: Any = None  # Wyrażenie SQL - reguła sprawdzana tylko gdy prawdziwe
+    kind: str = 'compare'  # 'compare', 'deviation' (odchyłka pozycji, actual = 0) lub 'check' (warunek logiczny)
+
+    def message(self, expected: float, actual: float) -> str:
+        """Opis błędu reguły."""
+        if self.kind == 'check':
+            return f"{self.label}: warunek niespełniony"
+        if self.kind == 'deviation':
+            return f"{self.label}: maks. odchyłka pozycji {expected:.2f}"
+        return f"{self.label}: obliczone {expected:.2f} != faktura {actual:.2f}"
+
+
+def _check(name: str, label: str, predicate: Any, severity: str = 'warning') -> ValidationRule:
+    """Reguła logiczna (np. kolejność dat) - 1 gdy warunek spełniony."""
+    return ValidationRule(name, label, case((predicate, 1), else_=0), literal(1), 0.0, severity, kind='check')
+
+
+def _max_item_deviation(value: Any, *criteria: Any) -> Any:
+    """Maksymalna odchyłka bezwzględna pozycji faktury (podzapytanie skorelowane)."""
+    return select(func.max(func.abs(value))).where(*criteria).scalar_subquery()
+
+
+def _gas_component_rules(prefix: str, label: str, quantity: Any, price: Any, net, vat, gross) -> List[ValidationRule]:
+    """Reguły pozycji faktury gazu: ilość × cena = netto, netto × VAT = VAT, netto + VAT = brutto."""
+    condition = gross > 0
+    return [
+        ValidationRule(f"{prefix}_value_net", f"{label} - wartość netto", quantity * price, net, condition=condition),
+        ValidationRule(f"{prefix}_vat", f"{label} - VAT", net * GasInvoice.vat_rate, vat, condition=condition),
+        ValidationRule(f"{prefix}_value_gross", f"{label} - wartość brutto", net + vat, gross, condition=condition),
+    ]
+
+
+def _gas_rules() -> List[ValidationRule]:
+    G = GasInvoice
+    return [
+        ValidationRule("fuel_usage_from_readings", "Zużycie gazu z odczytów",
+                       G.current_reading - G.previous_reading, G.fuel_usage_m3, TOLERANCE_M3),
+        ValidationRule("fuel_usage_kwh", "Zużycie paliwa w kWh",
+                       G.fuel_usage_m3 * G.fuel_conversion_factor, G.fuel_usage_kwh),
+        *_gas_component_rules("fuel", "Paliwo gazowe", G.fuel_usage_m3, G.fuel_price_net,
+                              G.fuel_value_net, G.fuel_vat_amount, G.fuel_value_gross),
+        *_gas_component_rules("subscription", "Abonament", G.subscription_quantity, G.subscription_price_net,
+                              G.subscription_value_net, G.subscription_vat_amount, G.subscription_value_gross),
+        *_gas_component_rules("distribution_fixed", "Dystrybucja stała",
+                              G.distribution_fixed_quantity, G.distribution_fixed_price_net,
+                              G.distribution_fixed_value_net, G.distribution_fixed_vat_amount,
+                              G.distribution_fixed_value_gross),
+        ValidationRule("distribution_variable_kwh", "Dystrybucja zmienna - zużycie w kWh",
+                       G.distribution_variable_usage_m3 * G.distribution_variable_conversion_factor,
+                       G.distribution_variable_usage_kwh, condition=G.distribution_variable_value_gross > 0),
+        *_gas_component_rules("distribution_variable", "Dystrybucja zmienna",
+                              G.distribution_variable_usage_kwh, G.distribution_variable_price_net,
+                              G.distribution_variable_value_net, G.distribution_variable_vat_amount,
+                              G.distribution_variable_value_gross),
+        ValidationRule("total_vat", "Suma VAT",
+                       G.fuel_vat_amount + G.subscription_vat_amount
+                       + G.distribution_fixed_vat_amount + G.distribution_variable_vat_amount, G.vat_amount),
+        ValidationRule("total_net", "Suma netto",
+                       G.fuel_value_net + G.subscription_value_net
+                       + G.distribution_fixed_value_net + G.distribution_variable_value_net, G.total_net_sum),
+        ValidationRule("total_gross", "Suma brutto",
+                       G.fuel_value_gross + G.subscription_value_gross
+                       + G.distribution_fixed_value_gross + G.distribution_variable_value_gross, G.total_gross_sum),
+        ValidationRule("total_gross_from_net_vat", "Suma brutto (netto + VAT)",
+                       G.total_net_sum + G.vat_amount, G.total_gross_sum),
+        _check("period_dates", "Daty okresu (początek przed końcem)", G.period_start < G.period_stop, 'critical'),
+    ]
+
+
+def _water_rules() -> List[ValidationRule]:
+    W = WaterInvoice
+    current = select(Reading.water_meter_main).where(Reading.data == W.data).scalar_subquery()
+    previous = (
+        select(Reading.water_meter_main).where(Reading.data < W.data)
+        .order_by(Reading.data.desc()).limit(1).scalar_subquery()
+    )
+    # Faktur za okres może być kilka - porównujemy sumę ich zużycia
+    W2 = WaterInvoice.__table__.alias("period_invoices")
+    period_usage = select(func.sum(W2.c.usage)).where(W2.c.data == W.data).scalar_subquery()
+    return [
+        ValidationRule("gross_sum", "Suma brutto (pozycje × (1 + VAT))",
+                       (W.usage * (W.water_cost_m3 + W.sewage_cost_m3)
+                        + W.nr_of_subscription * (W.water_subscr_cost + W.sewage_subscr_cost)) * (1 + W.vat),
+                       W.gross_sum, TOLERANCE_PLN * 10),
+        ValidationRule("usage_from_readings", "Zużycie okresu z odczytów licznika głównego",
+                       current - previous, period_usage, TOLERANCE_M3 * 100, 'info',
+                       condition=and_(current.isnot(None), previous.isnot(None))),
+        _check("period_dates", "Daty okresu (początek przed końcem)", W.period_start < W.period_stop, 'critical'),
+    ]
+
+
+def _electricity_rules() -> List[ValidationRule]:
+    E = ElectricityInvoice
+    S = ElectricityInvoiceSprzedazEnergii
+    O = ElectricityInvoiceOplataDystrybucyjna
+    R = ElectricityInvoiceOdczyt
+    sales = and_(S.invoice_id == E.id, S.naleznosc >= 0)  # Bez upustów
+    fees_kwh = and_(O.invoice_id == E.id, O.jednostka == "kWh", O.ilosc_kwh != 0)
+    fees_monthly = and_(O.invoice_id == E.id, O.jednostka == "zł/mc", O.ilosc_miesiecy != 0)
+    return [
+        ValidationRule("sales_item_value", "Sprzedaż energii - cena × ilość",
+                       _max_item_deviation(S.ilosc_kwh * S.cena_za_kwh - S.naleznosc, sales), literal(0),
+                       condition=exists().where(sales), kind='deviation'),
+        ValidationRule("sales_usage_sum", "Sprzedaż energii - suma zużycia pozycji",
+                       select(func.sum(S.ilosc_kwh)).where(sales).scalar_subquery(), E.zuzycie_kwh,
+                       TOLERANCE_KWH, condition=exists().where(sales)),
+        ValidationRule("distribution_kwh_value", "Opłaty dystrybucyjne - cena × kWh",
+                       _max_item_deviation(O.cena * O.ilosc_kwh - O.naleznosc, fees_kwh), literal(0),
+                       condition=exists().where(fees_kwh), kind='deviation'),
+        ValidationRule("distribution_monthly_value", "Opłaty dystrybucyjne - cena × miesiące",
+                       _max_item_deviation(O.cena * O.ilosc_miesiecy - O.naleznosc, fees_monthly), literal(0),
+                       condition=exists().where(fees_monthly), kind='deviation'),
+        ValidationRule("reading_quantity", "Odczyty - (bieżący - poprzedni) × mnożna = ilość",
+                       _max_item_deviation((R.biezacy_odczyt - R.poprzedni_odczyt) * R.mnozna - R.ilosc_kwh,
+                                           R.invoice_id == E.id),
+                       literal(0), TOLERANCE_KWH, condition=exists().where(R.invoice_id == E.id), kind='deviation'),
+        ValidationRule("reading_total", "Odczyty - ilość + straty = razem",
+                       _max_item_deviation(R.ilosc_kwh + R.straty_kwh - R.razem_kwh, R.invoice_id == E.id),
+                       literal(0), TOLERANCE_KWH, condition=exists().where(R.invoice_id == E.id), kind='deviation'),
+        ValidationRule("settlement_balance", "Saldo z rozliczenia",
+                       E.naleznosc_za_okres + E.wynik_rozliczenia + E.odsetki - E.kwota_nadplacona,
+                       E.saldo_z_rozliczenia, TOLERANCE_PLN * 10),
+        _check("excise_energy", "Energia do akcyzy nie większa niż zużycie", E.energia_do_akcyzy_kwh <= E.zuzycie_kwh),
+        _check("issue_date", "Data wystawienia nie przed początkiem okresu", E.data_wystawienia >= E.data_poczatku_okresu),
+        _check("period_dates", "Daty okresu (początek przed końcem)",
+               E.data_poczatku_okresu < E.data_konca_okresu, 'critical'),
+    ]
+
+
+# Medium -> (model faktury, reguły)
+MEDIA = {
+    'water': (WaterInvoice, _water_rules()),
+    'gas': (GasInvoice, _gas_rules()),
+    'electricity': (ElectricityInvoice, _electricity_rules()),
+}
+
+
+def _rule_columns(rule: ValidationRule) -> List[Any]:
+    """Kolumny zapytania dla reguły: status, wartość obliczona, wartość z faktury."""
+    expected = type_coerce(rule.expected, Float)
+    actual = type_coerce(rule.actual, Float)
+    condition = rule.condition if rule.condition is not None else true()
+    status = case(
+        (~condition, 'skipped'),
+        (func.abs(expected - actual) > rule.tolerance + 1e-9, 'failed'),
+        else_='ok'
+    )
+    return [status.label(f"{rule.name}__status"), expected.label(f"{rule.name}__expected"),
+            actual.label(f"{rule.name}__actual")]
+
+
+def validate_invoices(db: Session, media: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Waliduje faktury bez aktualnych wyników (nowe, zmienione lub bez wyników nowych reguł). Bez commita.
+
+    Args:
+        db: Sesja bazy danych
+        media: 'water', 'gas', 'electricity' lub None (wszystkie media)
+
+    Returns:
+        Słownik {medium: {'validated': n, 'failed': n}}
+    """
+    stats = {}
+    for media_name in ([media] if media else list(MEDIA)):
+        model, rules = MEDIA[media_name]
+        names = [rule.name for rule in rules]
+
+        # Faktury z kompletem wyników dla bieżących reguł są pomijane
+        validated = (
+            select(ValidationResult.invoice_id)
+            .where(ValidationResult.media == media_name, ValidationResult.rule.in_(names))
+            .group_by(ValidationResult.invoice_id)
+            .having(func.count() == len(rules))
+        )
+        columns = [model.id]
+        for rule in rules:
+            columns.extend(_rule_columns(rule))
+        rows = db.execute(select(*columns).where(model.id.not_in(validated)).order_by(model.id)).all()
+
+        results = []
+        failed_invoices = set()
+        for row in rows:
+            values = row._mapping
+            for rule in rules:
+                status = values[f"{rule.name}__status"]
+                expected = values[f"{rule.name}__expected"]
+                actual = values[f"{rule.name}__actual"]
+                message = None
+                if status == 'failed':
+                    failed_invoices.add(row.id)
+                    message = rule.message(expected, actual)[:300]
+                results.append({
+                    'media': media_name,
+                    'invoice_id': row.id,
+                    'rule': rule.name,
+                    'status': status,
+                    'severity': rule.severity,
+                    'expected': None if status == 'skipped' else expected,
+                    'actual': None if status == 'skipped' else actual,
+                    'message': message
+                })
+
+        if rows:
+            # Niepełne wyniki (np. sprzed dodania reguły) są zastępowane
+            db.query(ValidationResult).filter(
+                ValidationResult.media == media_name,
+                ValidationResult.invoice_id.in_([row.id for row in rows])
+            ).delete(synchronize_session=False)
+            db.execute(insert(ValidationResult).execution_options(render_nulls=True), results)
+
+        stats[media_name] = {'validated': len(rows), 'failed': len(failed_invoices)}
+    return stats
+
+
+def get_validation_results(
+    db: Session,
+    media: Optional[str] = None,
+    status: Optional[str] = 'failed',
+    invoice_id: Optional[int] = None
+) -> List[ValidationResult]:
+    """Zwraca zapisane wyniki walidacji (domyślnie tylko błędy) posortowane po medium i fakturze."""
+    query = db.query(ValidationResult)
+    if media:
+        query = query.filter(ValidationResult.media == media)
+    if status:
+        query = query.filter(ValidationResult.status == status)
+    if invoice_id is not None:
+        query = query.filter(ValidationResult.invoice_id == invoice_id)
+    return query.order_by(ValidationResult.media, ValidationResult.invoice_id, ValidationResult.id).all()
+
+
+def get_validation_summary(db: Session) -> Dict[str, Dict[str, Any]]:
+    """
+    Podsumowanie walidacji per medium: liczba zwalidowanych faktur, faktur z błędami
+    i błędów według wagi (zapytania grupujące).
+    """
+    summary = {
+        media: {'invoices_validated': 0, 'invoices_failed': 0, 'failed_checks': {'critical': 0, 'warning': 0, 'info': 0}}
+        for media in MEDIA
+    }
+    for media, count in db.query(
+        ValidationResult.media, func.count(func.distinct(ValidationResult.invoice_id))
+    ).group_by(ValidationResult.media):
+        summary[media]['invoices_validated'] = count
+
+    failed = db.query(ValidationResult.media, ValidationResult.severity, ValidationResult.invoice_id).filter(
+        ValidationResult.status == 'failed'
+    ).subquery()
+    for media, count in db.query(failed.c.media, func.count(func.distinct(failed.c.invoice_id))).group_by(failed.c.media):
+        summary[media]['invoices_failed'] = count
+    for media, severity, count in db.query(failed.c.media, failed.c.severity, func.count()).group_by(
+        failed.c.media, failed.c.severity
+    ):
+        summary[media]['failed_checks'][severity] = count
+    return summary
+
+
+# Tabele źródłowe -> medium; pozycje faktur prądu wskazują fakturę przez invoice_id
+_INVOICE_TABLES = {
+    WaterInvoice.__tablename__: 'water',
+    GasInvoice.__tablename__: 'gas',
+    ElectricityInvoice.__tablename__: 'electricity',
+}
+_ELECTRICITY_CHILDREN = (ElectricityInvoiceSprzedazEnergii, ElectricityInvoiceOplataDystrybucyjna, ElectricityInvoiceOdczyt)
+_CHILD_TABLES = {model.__tablename__ for model in _ELECTRICITY_CHILDREN}
+
+
+def _collect_changed_invoices(session: Session) -> None:
+    """Zapamiętuje faktury (i pozycje faktur prądu) dodane, zmienione lub usunięte we flushu."""
+    changed = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, WaterInvoice):
+            changed.add(('water', obj.id))
+        elif isinstance(obj, GasInvoice):
+            changed.add(('gas', obj.id))
+        elif isinstance(obj, ElectricityInvoice):
+            changed.add(('electricity', obj.id))
+        elif isinstance(obj, _ELECTRICITY_CHILDREN):
+            changed.add(('electricity', obj.invoice_id))
+        elif isinstance(obj, Reading):
+            # Odczyt wpływa na zużycie faktur swojego i następnego okresu
+            changed.add(('water_since', obj.data))
+    if changed:
+        pending_changes(session, _PENDING_KEY).update(changed)
+
+
+def _collect_bulk_changes(orm_execute_state) -> None:
+    """Masowe zapisy faktur i pozycji (query.delete(), insert()) - po invoice_id lub całe medium."""
+    name = getattr(getattr(orm_execute_state.statement, "table", None), "name", None)
+    pending = None
+    if name in _INVOICE_TABLES:
+        pending = {(_INVOICE_TABLES[name], _ALL)}
+    elif name == Reading.__tablename__:
+        pending = {('water', _ALL)}
+    elif name in _CHILD_TABLES:
+        params = orm_execute_state.parameters
+        rows = params if isinstance(params, (list, tuple)) else [params] if params else []
+        if rows and all("invoice_id" in row for row in rows):
+            pending = {('electricity', row["invoice_id"]) for row in rows}
+        else:
+            pending = {('electricity', _ALL)}
+    if pending:
+        pending_changes(orm_execute_state.session, _PENDING_KEY).update(pending)
+
+
+def _revalidate_changed(session: Session, pending: Set[Tuple[str, Any]]) -> None:
+    """Waliduje ponownie zmienione faktury w tej samej transakcji (stare wyniki są usuwane)."""
+    by_media: Dict[str, Set[Any]] = {}
+    for media, key in pending:
+        if media == 'water_since':
+            ids = [i for (i,) in session.query(WaterInvoice.id).filter(WaterInvoice.data >= key)]
+            by_media.setdefault('water', set()).update(ids)
+        else:
+            by_media.setdefault(media, set()).add(key)
+
+    for media, ids in by_media.items():
+        query = session.query(ValidationResult).filter(ValidationResult.media == media)
+        if _ALL not in ids:
+            query = query.filter(ValidationResult.invoice_id.in_(ids))
+        query.delete(synchronize_session=False)
+        validate_invoices(session, media)
+
+
+on_before_commit(_PENDING_KEY, _revalidate_changed, _collect_changed_invoices, _collect_bulk_changes)
@@ -2,13 +2,14 @@
 Manager do generowania rachunków łączonych (wszystkie media).
 """
 
-from datetime import date, datetime
+from datetime import date
 from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
 from app.models.combined import CombinedBill
 from app.models.water import Bill, Local
 from app.models.gas import GasBill
 from app.models.electricity import ElectricityBill
+from app.services.combined.period_index import get_bill_period_index
 
 
 class CombinedBillingManager:
@@ -20,84 +21,13 @@ class CombinedBillingManager:
         Okresy są w formacie (YYYY-MM, YYYY-MM) - pierwszy i drugi miesiąc.
         
         Sprawdza, czy dla każdego okresu dwumiesięcznego są rachunki dla wszystkich trzech mediów
-        w obu miesiącach dla wszystkich lokali.
+        dla wszystkich lokali (łącznie z obu miesięcy). Wynik pochodzi z indeksu okresów
+        (period_index), przebudowywanego tylko po zapisie rachunków.
         
         Returns:
             Lista tupli (period_start, period_end) gdzie każda tupla to 2 miesiące
         """
-        # Pobierz wszystkie unikalne okresy z rachunków wody, gazu i prądu
-        water_periods = set()
-        gas_periods = set()
-        electricity_periods = set()
-        
-        # Woda
-        water_bills = db.query(Bill.data).distinct().all()
-        for bill in water_bills:
-            water_periods.add(bill.data)
-        
-        # Gaz
-        gas_bills = db.query(GasBill.data).distinct().all()
-        for bill in gas_bills:
-            gas_periods.add(bill.data)
-        
-        # Prąd
-        electricity_bills = db.query(ElectricityBill.data).distinct().all()
-        for bill in electricity_bills:
-            electricity_periods.add(bill.data)
-        
-        # Znajdź wszystkie możliwe okresy (suma wszystkich)
-        all_periods = water_periods | gas_periods | electricity_periods
-        sorted_periods = sorted(all_periods)
-        
-        two_month_periods = []
-        locals_list = ['gora', 'dol', 'gabinet']
-        
-        # Sprawdź każdą parę kolejnych miesięcy
-        for i in range(len(sorted_periods) - 1):
-            period_start = sorted_periods[i]
-            period_end = sorted_periods[i + 1]
-            
-            # Sprawdź czy to kolejne miesiące
-            current = datetime.strptime(period_start, '%Y-%m')
-            next_period = datetime.strptime(period_end, '%Y-%m')
-            months_diff = (next_period.year - current.year) * 12 + (next_period.month - current.month)
-            
-            if months_diff != 1:
-                continue  # Nie są kolejne miesiące
-            
-            # Sprawdź czy dla tego okresu dwumiesięcznego są rachunki dla wszystkich mediów i lokali
-            # Wymagamy, aby dla każdego lokalu były rachunki dla wszystkich trzech mediów
-            # (łącznie z obu miesięcy - niekoniecznie w każdym miesiącu osobno)
-            has_all_media = True
-            
-            for local_name in locals_list:
-                # Sprawdź wodę - czy są rachunki w którymkolwiek z dwóch miesięcy
-                water_bills = db.query(Bill).filter(
-                    Bill.data.in_([period_start, period_end]),
-                    Bill.local == local_name
-                ).all()
-                
-                # Sprawdź gaz - czy są rachunki w którymkolwiek z dwóch miesięcy
-                gas_bills = db.query(GasBill).filter(
-                    GasBill.data.in_([period_start, period_end]),
-                    GasBill.local == local_name
-                ).all()
-                
-                # Sprawdź prąd - czy są rachunki w którymkolwiek z dwóch miesięcy
-                electricity_bills = db.query(ElectricityBill).filter(
-                    ElectricityBill.data.in_([period_start, period_end]),
-                    ElectricityBill.local == local_name
-                ).all()
-                
-                # Wymagamy, aby były rachunki dla wszystkich trzech mediów (łącznie z obu miesięcy)
-                if len(water_bills) == 0 or len(gas_bills) == 0 or len(electricity_bills) == 0:
-                    has_all_media = False
-                    break
-            
-            if has_all_media:
-                two_month_periods.append((period_start, period_end))
-        
-        return two_month_periods
+        return get_bill_period_index(db).two_month_periods()
     
     def generate_bills_for_period(
         self,
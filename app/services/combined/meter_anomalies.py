@@ -0,0 +1,301 @@
+"""
+Wykrywanie anomalii w historii odczytów liczników wody i prądu.
+
+Odczyty każdego medium są czytane strumieniowo (yield_per) w kolejności okresów.
+Zużycie licznika (różnica względem poprzedniego odczytu) jest porównywane z odpornymi
+statystykami - medianą i MAD - zużyć z tego samego miesiąca kalendarzowego
+(a przy zbyt krótkiej historii - ze wszystkich miesięcy).
+
+Przetwarzanie jest przyrostowe: licznik pamięta ostatni przetworzony odczyt
+(meter_stream_states), a nowy odczyt aktualizuje tylko statystyki swojego miesiąca.
+Odczyty są przetwarzane przed commitem transakcji, która je zapisała (hook
+app.core.change_tracking). Zmiana, usunięcie lub dopisanie odczytu w już
+przetworzonej historii kasuje stan liczników medium - historia jest wtedy
+przeliczana od początku.
+
+Anomalie są zapisywane tylko w meter_anomalies - flaga is_flagged odczytu prądu
+pozostaje ręcznym oznaczeniem użytkownika.
+"""
+
+import json
+import statistics
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from app.core.change_tracking import on_before_commit, pending_changes
+from app.models.electricity import ElectricityReading
+from app.models.meter_anomaly import MeterAnomaly, MeterStatistic, MeterStreamState
+from app.models.water import Reading
+
+# Liczniki mediów: nazwa licznika -> kolumna odczytu
+MEDIA = {
+    'water': (Reading, {
+        'water_meter_main': 'water_meter_main',
+        'water_meter_5': 'water_meter_5',
+        'water_meter_5a': 'water_meter_5a',
+    }),
+    'electricity': (ElectricityReading, {
+        'dom': 'odczyt_dom',
+        'dom_I': 'odczyt_dom_I',
+        'dom_II': 'odczyt_dom_II',
+        'dol': 'odczyt_dol',
+        'dol_I': 'odczyt_dol_I',
+        'dol_II': 'odczyt_dol_II',
+        'gabinet': 'odczyt_gabinet',
+    }),
+}
+
+MONTH_WINDOW = 6  # Liczba ostatnich zużyć w statystykach miesiąca kalendarzowego
+FALLBACK_WINDOW = 12  # Liczba ostatnich zużyć w statystykach wszystkich miesięcy (month = 0)
+MIN_SAMPLES = 3  # Minimalna liczba zużyć, od której statystyki są używane
+OUTLIER_THRESHOLD = 3.5  # Próg odpornego z-score
+MAD_FLOOR = 0.1  # Minimalny MAD jako ułamek mediany (liczniki o stałym zużyciu)
+REPLACEMENT_DROP = 0.5  # Spadek stanu poniżej tej części poprzedniego - wymiana licznika
+REPLACEMENT_JUMP = 10.0  # Zużycie powyżej tej krotności mediany - wymiana licznika
+STREAM_BATCH = 500  # Liczba odczytów pobieranych naraz
+
+# Klucz w session.info: medium -> najwcześniejszy zmieniony okres
+_PENDING_KEY = "meter_anomaly_changes"
+
+
+def meter_key(media: str, name: str) -> str:
+    """Klucz licznika, np. 'electricity.dom_I'."""
+    return f"{media}.{name}"
+
+
+def robust_stats(values: List[float]) -> Tuple[float, float]:
+    """Zwraca (mediana, MAD) listy wartości."""
+    median = statistics.median(values)
+    mad = statistics.median(abs(value - median) for value in values)
+    return median, mad
+
+
+def classify_delta(
+    value: float,
+    previous: float,
+    baseline: Optional[List[float]]
+) -> Tuple[Optional[str], Optional[float], Optional[float], Optional[float]]:
+    """
+    Ocenia zużycie licznika względem bazy porównawczej.
+
+    Args:
+        value: Bieżący stan licznika
+        previous: Poprzedni stan licznika
+        baseline: Wcześniejsze zużycia do porównania lub None (za krótka historia)
+
+    Returns:
+        Tuple (rodzaj anomalii lub None, mediana, MAD, z-score)
+    """
+    delta = value - previous
+    if delta < 0:
+        kind = 'meter_replacement' if value < previous * REPLACEMENT_DROP else 'negative_delta'
+        return kind, None, None, None
+    if not baseline:
+        return None, None, None, None
+
+    median, mad = robust_stats(baseline)
+    scale = max(mad, MAD_FLOOR * abs(median))
+    if scale == 0:
+        return None, median, mad, None
+    score = round(0.6745 * (delta - median) / scale, 4)
+    if abs(score) <= OUTLIER_THRESHOLD:
+        return None, median, mad, score
+    if median > 0 and delta > REPLACEMENT_JUMP * median:
+        return 'meter_replacement', median, mad, score
+    return 'outlier', median, mad, score
+
+
+class _MeterStatistics:
+    """Okna zużyć liczników medium wczytane z meter_statistics (zapis tylko zmienionych)."""
+
+    def __init__(self, db: Session, keys: List[str]):
+        self.db = db
+        self.records: Dict[Tuple[str, int], MeterStatistic] = {
+            (record.meter, record.month): record
+            for record in db.query(MeterStatistic).filter(MeterStatistic.meter.in_(keys)).all()
+        }
+        self.windows: Dict[Tuple[str, int], List[float]] = {
+            key: json.loads(record.deltas) for key, record in self.records.items()
+        }
+        self.touched = set()
+
+    def baseline(self, meter: str, month: int) -> Optional[List[float]]:
+        """Zużycia z miesiąca kalendarzowego, a przy zbyt krótkiej historii - ze wszystkich miesięcy."""
+        for key in ((meter, month), (meter, 0)):
+            window = self.windows.get(key)
+            if window and len(window) >= MIN_SAMPLES:
+                return window
+        return None
+
+    def add(self, meter: str, month: int, delta: float) -> None:
+        """Dopisuje zużycie do okna miesiąca i okna wszystkich miesięcy."""
+        for key, size in (((meter, month), MONTH_WINDOW), ((meter, 0), FALLBACK_WINDOW)):
+            window = self.windows.setdefault(key, [])
+            window.append(delta)
+            del window[:-size]
+            self.touched.add(key)
+
+    def save(self) -> None:
+        """Zapisuje statystyki zmienionych okien."""
+        for key in self.touched:
+            window = self.windows[key]
+            median, mad = robust_stats(window)
+            record = self.records.get(key)
+            if record is None:
+                record = MeterStatistic(meter=key[0], month=key[1])
+                self.records[key] = record
+                self.db.add(record)
+            record.deltas = json.dumps(window)
+            record.median = median
+            record.mad = mad
+        self.touched.clear()
+
+
+def update_meter_anomalies(db: Session, media: Optional[str] = None) -> Dict[str, int]:
+    """
+    Przetwarza odczyty dodane od ostatniego uruchomienia i zapisuje wykryte anomalie. Bez commita.
+
+    Args:
+        db: Sesja bazy danych
+        media: 'water', 'electricity' lub None (wszystkie media)
+
+    Returns:
+        Słownik {'readings_processed': n, 'anomalies_found': n}
+    """
+    result = {'readings_processed': 0, 'anomalies_found': 0}
+    for media_name in ([media] if media else list(MEDIA)):
+        model, meters = MEDIA[media_name]
+        keys = {name: meter_key(media_name, name) for name in meters}
+        states = {
+            state.meter: state
+            for state in db.query(MeterStreamState).filter(MeterStreamState.meter.in_(keys.values())).all()
+        }
+        stats = _MeterStatistics(db, list(keys.values()))
+
+        # Wspólny znacznik medium - odczyty po najstarszym ostatnio przetworzonym okresie
+        query = db.query(model).order_by(model.data)
+        if len(states) == len(keys):
+            query = query.filter(model.data > min(state.last_data for state in states.values()))
+
+        anomalies = []
+        for reading in query.yield_per(STREAM_BATCH):
+            result['readings_processed'] += 1
+            month = int(reading.data[5:7])
+            for name, column in meters.items():
+                key = keys[name]
+                state = states.get(key)
+                if state is not None and state.last_data >= reading.data:
+                    continue
+                value = getattr(reading, column)
+                if state is None:
+                    state = MeterStreamState(meter=key, last_data=reading.data, last_value=None)
+                    states[key] = state
+                    db.add(state)
+                previous = state.last_value
+                state.last_data = reading.data
+                if value is None:
+                    continue
+                state.last_value = float(value)
+                if previous is None:
+                    continue
+
+                kind, median, mad, score = classify_delta(float(value), previous, stats.baseline(key, month))
+                if kind in (None, 'outlier'):
+                    stats.add(key, month, float(value) - previous)
+                if kind is None:
+                    continue
+                anomalies.append(MeterAnomaly(
+                    media=media_name,
+                    meter=key,
+                    data=reading.data,
+                    kind=kind,
+                    value=float(value),
+                    previous_value=previous,
+                    delta=round(float(value) - previous, 4),
+                    median=median,
+                    mad=mad,
+                    score=score
+                ))
+
+        stats.save()
+        db.add_all(anomalies)
+        result['anomalies_found'] += len(anomalies)
+    return result
+
+
+def reset_meter_anomalies(db: Session, media: str) -> None:
+    """Usuwa stan, statystyki i anomalie liczników medium (historia przeliczana od nowa)."""
+    keys = [meter_key(media, name) for name in MEDIA[media][1]]
+    db.query(MeterAnomaly).filter(MeterAnomaly.meter.in_(keys)).delete(synchronize_session=False)
+    db.query(MeterStatistic).filter(MeterStatistic.meter.in_(keys)).delete(synchronize_session=False)
+    db.query(MeterStreamState).filter(MeterStreamState.meter.in_(keys)).delete(synchronize_session=False)
+
+
+def get_meter_anomalies(
+    db: Session,
+    media: Optional[str] = None,
+    meter: Optional[str] = None
+) -> List[MeterAnomaly]:
+    """Zwraca zapisane anomalie posortowane po okresie i liczniku."""
+    query = db.query(MeterAnomaly)
+    if media:
+        query = query.filter(MeterAnomaly.media == media)
+    if meter:
+        query = query.filter(MeterAnomaly.meter == meter)
+    return query.order_by(MeterAnomaly.data, MeterAnomaly.meter).all()
+
+
+def _record_change(session: Session, media: str, periods: Iterable[str]) -> None:
+    """Zapamiętuje najwcześniejszy zmieniony okres medium."""
+    periods = [period for period in periods if period is not None]
+    if not periods:
+        return
+    pending = pending_changes(session, _PENDING_KEY, dict)
+    earliest = min(periods)
+    pending[media] = min(pending.get(media, earliest), earliest)
+
+
+def _collect_changed_readings(session: Session) -> None:
+    """Zbiera okresy odczytów dodanych, usuniętych lub ze zmienionym stanem licznika."""
+    for media, (model, meters) in MEDIA.items():
+        for obj in (*session.new, *session.deleted):
+            if isinstance(obj, model):
+                _record_change(session, media, [obj.data])
+        for obj in session.dirty:
+            if not isinstance(obj, model):
+                continue
+            state = inspect(obj)
+            changed = [
+                column for column in ('data', *meters.values())
+                if state.attrs[column].history.has_changes()
+            ]
+            if changed:
+                _record_change(session, media, [obj.data, *state.attrs['data'].history.deleted])
+
+
+def _collect_bulk_reading_changes(orm_execute_state) -> None:
+    """Masowe zapisy odczytów (query.update(), query.delete()) - cała historia medium."""
+    table = getattr(orm_execute_state.statement, "table", None)
+    for media, (model, _) in MEDIA.items():
+        if getattr(table, "name", None) == model.__tablename__:
+            _record_change(orm_execute_state.session, media, [""])
+
+
+def _process_changed(session: Session, pending: Dict[str, str]) -> None:
+    """
+    Przetwarza zmienione odczyty medium; gdy zmieniono już przetworzoną część historii,
+    najpierw kasuje stan liczników (historia przeliczana od początku).
+    """
+    for media, earliest in pending.items():
+        keys = [meter_key(media, name) for name in MEDIA[media][1]]
+        processed = session.query(MeterStreamState.meter).filter(
+            MeterStreamState.meter.in_(keys),
+            MeterStreamState.last_data >= earliest
+        ).first()
+        if processed:
+            reset_meter_anomalies(session, media)
+        update_meter_anomalies(session, media)
+
+
+on_before_commit(_PENDING_KEY, _process_changed, _collect_changed_readings, _collect_bulk_reading_changes)
@@ -0,0 +1,115 @@
+"""
+Indeks okresów rachunków wody, gazu i prądu dla rachunków łączonych.
+
+Indeks trzyma pary (okres, lokal), dla których istnieją rachunki każdego medium -
+pobrane jednym zapytaniem GROUP BY na medium. Dostępne okresy dwumiesięczne są
+wyznaczane na zbiorach w pamięci. Indeks jest budowany raz i przebudowywany
+dopiero po zapisie do tabel rachunków.
+"""
+
+import threading
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+
+from app.core.change_tracking import on_tables_changed
+from app.models.electricity import ElectricityBill
+from app.models.gas import GasBill
+from app.models.water import Bill
+from app.services.electricity.invoice_index import period_to_ordinal
+
+BILL_MODELS = {'water': Bill, 'gas': GasBill, 'electricity': ElectricityBill}
+BILL_TABLES = [model.__tablename__ for model in BILL_MODELS.values()]
+LOCALS = frozenset({'gora', 'dol', 'gabinet'})
+
+
+class BillPeriodIndex:
+    """Lokale z rachunkami każdego medium w poszczególnych okresach."""
+
+    def __init__(self, rows_by_media: Dict[str, List[Tuple[str, str]]]):
+        """
+        Args:
+            rows_by_media: {medium: [(okres, lokal), ...]} dla 'water', 'gas' i 'electricity'
+        """
+        self._locals: Dict[str, Dict[str, FrozenSet[str]]] = {}
+        for media, rows in rows_by_media.items():
+            grouped: Dict[str, Set[str]] = {}
+            for data, local in rows:
+                grouped.setdefault(data, set()).add(local)
+            self._locals[media] = {data: frozenset(locals_) for data, locals_ in grouped.items()}
+        self._two_month_periods = self._find_two_month_periods()
+
+    def periods(self, media: str) -> Set[str]:
+        """Okresy, w których są rachunki medium."""
+        return set(self._locals.get(media, {}))
+
+    def all_periods(self) -> List[str]:
+        """Posortowane okresy, w których są rachunki któregokolwiek medium."""
+        return sorted(set().union(*(self._locals[media] for media in BILL_MODELS)))
+
+    def consecutive_pairs(self) -> List[Tuple[str, str]]:
+        """Pary kolejnych okresów z all_periods, które są sąsiednimi miesiącami."""
+        periods = self.all_periods()
+        return [
+            (start, end) for start, end in zip(periods, periods[1:])
+            if (start_ordinal := period_to_ordinal(start)) is not None
+            and period_to_ordinal(end) == start_ordinal + 1
+        ]
+
+    def two_month_periods(self) -> List[Tuple[str, str]]:
+        """Okresy dwumiesięczne z rachunkami wszystkich mediów dla wszystkich lokali."""
+        return list(self._two_month_periods)
+
+    def _find_two_month_periods(self) -> List[Tuple[str, str]]:
+        # Każdy lokal musi mieć rachunek każdego medium w którymkolwiek z dwóch miesięcy
+        empty = frozenset()
+        return [
+            (start, end) for start, end in self.consecutive_pairs()
+            if all(
+                LOCALS <= locals_by_period.get(start, empty) | locals_by_period.get(end, empty)
+                for locals_by_period in self._locals.values()
+            )
+        ]
+
+
+_index: Optional[BillPeriodIndex] = None
+_index_generation = 0
+_index_lock = threading.Lock()
+
+
+def invalidate_bill_period_index(tables=None) -> None:
+    """Oznacza indeks jako nieaktualny (zostanie przebudowany przy następnym użyciu)."""
+    global _index, _index_generation
+    _index_generation += 1
+    _index = None
+
+
+def get_bill_period_index(db: Session) -> BillPeriodIndex:
+    """
+    Zwraca indeks okresów rachunków, budując go trzema zapytaniami GROUP BY, jeśli jest nieaktualny.
+
+    Args:
+        db: Sesja bazy danych
+
+    Returns:
+        Aktualny indeks okresów rachunków
+    """
+    global _index
+    index = _index
+    if index is not None:
+        return index
+
+    with _index_lock:
+        if _index is not None:
+            return _index
+        generation = _index_generation
+        index = BillPeriodIndex({
+            media: db.query(model.data, model.local).group_by(model.data, model.local).all()
+            for media, model in BILL_MODELS.items()
+        })
+        # Nie zapamiętuj indeksu, jeśli w trakcie budowy rachunki zostały zmienione
+        if generation == _index_generation:
+            _index = index
+        return index
+
+
+on_tables_changed(BILL_TABLES, invalidate_bill_period_index)
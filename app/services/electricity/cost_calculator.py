@@ -2,7 +2,7 @@
 Moduł obliczania kosztów 1 kWh dla faktur prądu.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Iterable
 from sqlalchemy.orm import Session
 from app.models.electricity_invoice import (
     ElectricityInvoiceSprzedazEnergii,
@@ -15,6 +15,23 @@ def calculate_kwh_cost(invoice_id: int, db: Session) -> Dict[str, Any]:
     Oblicza koszt 1 kWh dla faktury (bez uwzględniania fotowoltaiki).
     Zwraca koszt dla każdej strefy (dzienna, nocna, całodobowa).
     
+    Wynik pochodzi z modelu kosztów faktury (InvoiceCostModel) trzymanego w cache,
+    więc powtórne wywołania dla tej samej faktury nie wykonują zapytań.
+    """
+    from app.services.electricity.cost_model import get_invoice_cost_model
+    cost_model = get_invoice_cost_model(db, invoice_id)
+    if cost_model is None:
+        return {}
+    return cost_model.kwh_costs()
+
+
+def compute_kwh_cost(
+    sprzedaz: Iterable[ElectricityInvoiceSprzedazEnergii],
+    oplaty: Iterable[ElectricityInvoiceOplataDystrybucyjna]
+) -> Dict[str, Any]:
+    """
+    Oblicza koszt 1 kWh dla każdej strefy z wierszy sprzedaży energii i opłat dystrybucyjnych.
+    
     Koszt 1 kWh = suma:
     - Energia elektryczna czynna (cena_za_kwh z sprzedaz_energii)
     - Opłata jakościowa (cena z oplaty_dystrybucyjne gdzie typ_oplaty = "OPŁATA JAKOŚCIOWA")
@@ -22,16 +39,6 @@ def calculate_kwh_cost(invoice_id: int, db: Session) -> Dict[str, Any]:
     - Opłata OZE (cena z oplaty_dystrybucyjne gdzie typ_oplaty = "OPŁATA OZE")
     - Opłata kogeneracyjna (cena z oplaty_dystrybucyjne gdzie typ_oplaty = "OPŁATA KOGENERACYJNA")
     """
-    # Pobierz sprzedaż energii
-    sprzedaz = db.query(ElectricityInvoiceSprzedazEnergii).filter(
-        ElectricityInvoiceSprzedazEnergii.invoice_id == invoice_id
-    ).all()
-    
-    # Pobierz opłaty dystrybucyjne
-    oplaty = db.query(ElectricityInvoiceOplataDystrybucyjna).filter(
-        ElectricityInvoiceOplataDystrybucyjna.invoice_id == invoice_id
-    ).all()
-    
     # Inicjalizuj słowniki dla każdej strefy
     koszty = {
         "DZIENNA": {
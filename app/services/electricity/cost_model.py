@@ -0,0 +1,221 @@
+"""
+Niezmienny model kosztów faktury prądu (ceny stref, okresy dystrybucyjne, opłaty stałe).
+
+Model jest budowany raz na fakturę z wierszy podrzędnych wczytanych razem z fakturą
+(selectinload, zapisana oś taryfowa przez joinedload) i trzymany w cache LRU. Cache jest czyszczony po każdej zmianie
+w tabelach electricity_invoices i electricity_invoice_* (zdarzenia SQLAlchemy),
+więc kolejne rachunki, lokale i PDF-y tej samej faktury nie powtarzają zapytań.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from app.core.change_tracking import on_tables_changed
+from app.models.electricity_invoice import (
+    ElectricityInvoice,
+    ElectricityInvoiceSprzedazEnergii,
+    ElectricityInvoiceOplataDystrybucyjna
+)
+from app.services.electricity.cost_calculator import compute_kwh_cost
+from app.services.electricity.tariff_timeline import (
+    TariffTimeline,
+    build_tariff_timeline,
+    sorted_by_date
+)
+
+# Opłaty stałe (należność brutto za cały okres faktury) dzielone na 3 lokale
+FIXED_FEE_NAMES = (
+    'Opłata stała sieciowa - układ 3-fazowy',
+    'Opłata przejściowa > 1200 kWh',
+    'Opłata mocowa ( > 2800 kWh)',
+    'Opłata abonamentowa'
+)
+
+# Tabele, których zmiana unieważnia modele kosztów
+INVOICE_TABLES = (
+    "electricity_invoices",
+    "electricity_invoice_blankiety",
+    "electricity_invoice_odczyty",
+    "electricity_invoice_sprzedaz_energii",
+    "electricity_invoice_oplaty_dystrybucyjne",
+    "electricity_invoice_rozliczenie_okresy",
+    "electricity_invoice_tariff_timelines",
+)
+
+CACHE_MAX_SIZE = 128
+
+
+@dataclass(frozen=True)
+class InvoiceCostModel:
+    """
+    Koszty faktury prądu potrzebne do rozliczenia rachunków.
+
+    Attributes:
+        invoice_id: ID faktury
+        typ_taryfy: Typ taryfy faktury ('DWUTARYFOWA' / 'CAŁODOBOWA')
+        zone_costs: Koszt 1 kWh netto dla stref (jak w calculate_kwh_cost)
+        distribution_periods: Okresy z różnymi cenami (jak w get_distribution_periods)
+        fixed_fees_per_local: Opłaty stałe brutto przypadające na jeden lokal
+        distribution_kwh_dzienna: Suma cen opłat dystrybucyjnych za kWh w strefie dziennej
+        distribution_kwh_nocna: Suma cen opłat dystrybucyjnych za kWh w strefie nocnej
+        timeline: Oś taryfowa faktury (ceny, opłaty stałe i VAT w przedziałach dat)
+        vat_rate: Stawka VAT faktury (ułamek)
+    """
+    invoice_id: int
+    typ_taryfy: str
+    zone_costs: Mapping[str, Mapping[str, float]]
+    distribution_periods: Tuple[Mapping[str, Any], ...]
+    fixed_fees_per_local: float
+    distribution_kwh_dzienna: float
+    distribution_kwh_nocna: float
+    timeline: TariffTimeline
+    vat_rate: float
+
+    def kwh_costs(self) -> Dict[str, Dict[str, float]]:
+        """Zwraca kopię kosztów 1 kWh dla stref (słownik do modyfikacji/serializacji)."""
+        return {strefa: dict(dane) for strefa, dane in self.zone_costs.items()}
+
+    def distribution_periods_list(self) -> List[Dict[str, Any]]:
+        """Zwraca kopię okresów dystrybucyjnych jako listę słowników."""
+        return [dict(period) for period in self.distribution_periods]
+
+
+def calculate_fixed_fees(oplaty: Sequence[ElectricityInvoiceOplataDystrybucyjna]) -> float:
+    """
+    Oblicza sumę opłat stałych (stała sieciowa, przejściowa, abonamentowa, mocowa)
+    podzieloną na 3 lokale.
+
+    Opłaty stałe w fakturze są już za cały okres faktury, więc tylko dzielimy je na lokale.
+    """
+    total_fees = 0.0
+    for oplata in oplaty:
+        if oplata.typ_oplaty in FIXED_FEE_NAMES:
+            total_fees += float(oplata.naleznosc) if oplata.naleznosc else 0.0
+    return round(total_fees / 3.0, 4)
+
+
+def build_invoice_cost_model(invoice: ElectricityInvoice) -> InvoiceCostModel:
+    """
+    Buduje model kosztów z faktury i jej wczytanych wierszy podrzędnych.
+
+    Args:
+        invoice: Faktura z załadowanymi sprzedaz_energii, oplaty_dystrybucyjne i tariff_timeline
+
+    Returns:
+        Niezmienny model kosztów faktury
+    """
+    sprzedaz = sorted_by_date(invoice.sprzedaz_energii)
+    oplaty = sorted_by_date(invoice.oplaty_dystrybucyjne)
+
+    zone_costs = compute_kwh_cost(sprzedaz, oplaty)
+
+    # Zapisana oś taryfowa; gdy jej brak (np. przed migracją) - budowana w pamięci
+    if invoice.tariff_timeline is not None:
+        timeline = TariffTimeline.from_record(invoice.tariff_timeline)
+    else:
+        timeline = build_tariff_timeline(invoice, oplaty, sprzedaz)
+
+    dystrybucja_dzienna = 0.0
+    dystrybucja_nocna = 0.0
+    for op in oplaty:
+        if op.jednostka != "kWh":
+            continue
+        if op.strefa == "DZIENNA":
+            dystrybucja_dzienna += float(op.cena)
+        elif op.strefa == "NOCNA":
+            dystrybucja_nocna += float(op.cena)
+
+    return InvoiceCostModel(
+        invoice_id=invoice.id,
+        typ_taryfy=invoice.typ_taryfy,
+        zone_costs=MappingProxyType({
+            strefa: MappingProxyType(dane) for strefa, dane in zone_costs.items()
+        }),
+        distribution_periods=tuple(MappingProxyType(period) for period in timeline.periods()),
+        fixed_fees_per_local=calculate_fixed_fees(oplaty),
+        distribution_kwh_dzienna=dystrybucja_dzienna,
+        distribution_kwh_nocna=dystrybucja_nocna,
+        timeline=timeline,
+        vat_rate=timeline.vat_rate
+    )
+
+
+_cache: "OrderedDict[int, InvoiceCostModel]" = OrderedDict()
+_cache_generation = 0
+_cache_lock = threading.Lock()
+
+
+def invalidate_invoice_cost_models(tables=None) -> None:
+    """Usuwa wszystkie modele kosztów z cache."""
+    global _cache_generation
+    with _cache_lock:
+        _cache_generation += 1
+        _cache.clear()
+
+
+def get_invoice_cost_models(db: Session, invoice_ids: Iterable[int]) -> Dict[int, InvoiceCostModel]:
+    """
+    Zwraca modele kosztów dla wielu faktur naraz.
+
+    Brakujące w cache modele są budowane wspólnie - jedno zapytanie o faktury
+    i po jednym zapytaniu IN dla sprzedaży energii i opłat dystrybucyjnych,
+    niezależnie od liczby faktur.
+
+    Args:
+        db: Sesja bazy danych
+        invoice_ids: ID faktur (mogą się powtarzać)
+
+    Returns:
+        Słownik {invoice_id: model}; faktury nieistniejące są pominięte
+    """
+    models: Dict[int, InvoiceCostModel] = {}
+    missing = []
+    with _cache_lock:
+        for invoice_id in dict.fromkeys(invoice_ids):
+            model = _cache.get(invoice_id)
+            if model is not None:
+                _cache.move_to_end(invoice_id)
+                models[invoice_id] = model
+            elif invoice_id is not None:
+                missing.append(invoice_id)
+        generation = _cache_generation
+
+    if not missing:
+        return models
+
+    invoices = db.query(ElectricityInvoice).options(
+        selectinload(ElectricityInvoice.sprzedaz_energii),
+        selectinload(ElectricityInvoice.oplaty_dystrybucyjne),
+        joinedload(ElectricityInvoice.tariff_timeline)
+    ).filter(ElectricityInvoice.id.in_(missing)).all()
+    built = {invoice.id: build_invoice_cost_model(invoice) for invoice in invoices}
+    models.update(built)
+
+    with _cache_lock:
+        # Nie zapamiętuj modeli, jeśli w trakcie budowy faktury zostały zmienione
+        if generation == _cache_generation:
+            _cache.update(built)
+            while len(_cache) > CACHE_MAX_SIZE:
+                _cache.popitem(last=False)
+    return models
+
+
+def get_invoice_cost_model(db: Session, invoice_id: int) -> Optional[InvoiceCostModel]:
+    """
+    Zwraca model kosztów faktury z cache lub buduje go (3 zapytania: faktura z osią + 2 selectinload).
+
+    Args:
+        db: Sesja bazy danych
+        invoice_id: ID faktury
+
+    Returns:
+        Model kosztów lub None jeśli faktura nie istnieje
+    """
+    return get_invoice_cost_models(db, [invoice_id]).get(invoice_id)
+
+
+on_tables_changed(INVOICE_TABLES, invalidate_invoice_cost_models)
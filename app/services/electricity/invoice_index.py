@@ -0,0 +1,155 @@
+"""
+Indeks przedziałowy mapujący miesiące rozliczeniowe ('YYYY-MM') na faktury prądu.
+
+Faktura pokrywa miesiące od miesiąca data_poczatku_okresu do miesiąca
+data_konca_okresu włącznie. Indeks trzyma rozłączne przedziały miesięcy
+posortowane po początku, więc wyszukanie faktury to bisect - O(log n).
+Indeks jest budowany raz i przebudowywany dopiero po zapisie do electricity_invoices.
+"""
+
+import bisect
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from app.core.change_tracking import on_tables_changed
+from app.models.electricity_invoice import ElectricityInvoice
+
+
+def month_ordinal(value: date) -> int:
+    """Zamienia datę na numer miesiąca (rok * 12 + miesiąc - 1)."""
+    return value.year * 12 + value.month - 1
+
+
+def period_to_ordinal(period: str) -> Optional[int]:
+    """Zamienia okres 'YYYY-MM' na numer miesiąca lub None dla błędnego formatu."""
+    try:
+        year, month = map(int, period.split('-'))
+    except (ValueError, AttributeError):
+        return None
+    if not 1 <= month <= 12:
+        return None
+    return year * 12 + month - 1
+
+
+def ordinal_to_period(ordinal: int) -> str:
+    """Zamienia numer miesiąca na okres 'YYYY-MM'."""
+    return f"{ordinal // 12:04d}-{ordinal % 12 + 1:02d}"
+
+
+class InvoicePeriodIndex:
+    """Posortowany indeks przedziałów miesięcy pokrytych przez faktury prądu."""
+
+    def __init__(self, rows: Iterable[Tuple[int, date, date]]):
+        """
+        Buduje indeks z krotek (invoice_id, data_poczatku_okresu, data_konca_okresu).
+
+        Wiersze powinny być posortowane po ID - przy nakładających się fakturach
+        miesiąc przypada fakturze o najniższym ID (tak jak dotychczasowe
+        przeszukiwanie liniowe wyniku db.query(ElectricityInvoice).all()).
+        """
+        month_owner: Dict[int, int] = {}
+        invoice_count = 0
+        for invoice_id, start, end in rows:
+            invoice_count += 1
+            if start is None or end is None:
+                continue
+            for month in range(month_ordinal(start), month_ordinal(end) + 1):
+                month_owner.setdefault(month, invoice_id)
+
+        # Scal kolejne miesiące tej samej faktury w rozłączne przedziały
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._invoice_ids: List[int] = []
+        covered = sorted(month_owner)
+        for month in covered:
+            invoice_id = month_owner[month]
+            if self._invoice_ids and self._invoice_ids[-1] == invoice_id and self._ends[-1] == month - 1:
+                self._ends[-1] = month
+            else:
+                self._starts.append(month)
+                self._ends.append(month)
+                self._invoice_ids.append(invoice_id)
+
+        self._covered_ordinals = covered
+        self._covered_months = [ordinal_to_period(m) for m in covered]
+        self.invoice_count = invoice_count
+
+    def find_invoice_id(self, period: str) -> Optional[int]:
+        """
+        Zwraca ID faktury pokrywającej okres 'YYYY-MM' lub None.
+
+        Args:
+            period: Okres w formacie 'YYYY-MM'
+
+        Returns:
+            ID faktury lub None jeśli żadna faktura nie pokrywa okresu
+        """
+        month = period_to_ordinal(period)
+        if month is None:
+            return None
+        i = bisect.bisect_right(self._starts, month) - 1
+        if i >= 0 and month <= self._ends[i]:
+            return self._invoice_ids[i]
+        return None
+
+    def covered_months(self) -> List[str]:
+        """Zwraca posortowaną rosnąco listę miesięcy pokrytych przez faktury."""
+        return list(self._covered_months)
+
+    def covered_months_between(self, period_from: str, period_to: str) -> List[str]:
+        """Zwraca pokryte miesiące z zakresu [period_from, period_to] (włącznie)."""
+        start = period_to_ordinal(period_from)
+        end = period_to_ordinal(period_to)
+        if start is None or end is None:
+            return []
+        lo = bisect.bisect_left(self._covered_ordinals, start)
+        hi = bisect.bisect_right(self._covered_ordinals, end)
+        return self._covered_months[lo:hi]
+
+
+_index: Optional[InvoicePeriodIndex] = None
+_index_generation = 0
+_index_lock = threading.Lock()
+
+
+def invalidate_invoice_period_index(tables=None) -> None:
+    """Oznacza indeks jako nieaktualny (zostanie przebudowany przy następnym użyciu)."""
+    global _index, _index_generation
+    _index_generation += 1
+    _index = None
+
+
+def get_invoice_period_index(db: Session) -> InvoicePeriodIndex:
+    """
+    Zwraca indeks faktur, budując go jednym zapytaniem jeśli jest nieaktualny.
+
+    Args:
+        db: Sesja bazy danych
+
+    Returns:
+        Aktualny indeks przedziałowy faktur prądu
+    """
+    global _index
+    index = _index
+    if index is not None:
+        return index
+
+    with _index_lock:
+        if _index is not None:
+            return _index
+        generation = _index_generation
+        rows = db.query(
+            ElectricityInvoice.id,
+            ElectricityInvoice.data_poczatku_okresu,
+            ElectricityInvoice.data_konca_okresu
+        ).order_by(ElectricityInvoice.id).all()
+        index = InvoicePeriodIndex(rows)
+        # Nie zapamiętuj indeksu, jeśli w trakcie budowy faktury zostały zmienione
+        if generation == _index_generation:
+            _index = index
+        return index
+
+
+on_tables_changed(["electricity_invoices"], invalidate_invoice_period_index)
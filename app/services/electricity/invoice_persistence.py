@@ -0,0 +1,423 @@
+"""
+Zapis szczegółowych faktur prądu (blankiety, odczyty, sprzedaż energii,
+opłaty dystrybucyjne, rozliczenie okresów).
+
+Dane z dashboardu są normalizowane raz (liczby w formacie polskim, daty ISO lub DD/MM/YYYY,
+strefy) do słowników kolumn. Nowe wiersze trafiają do bazy zbiorczo (insert() + executemany),
+a przy aktualizacji faktury wiersze są porównywane po kluczu naturalnym - zmieniane są tylko
+te, które faktycznie się różnią.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.electricity_invoice import (
+    ElectricityInvoice,
+    ElectricityInvoiceBlankiet,
+    ElectricityInvoiceOdczyt,
+    ElectricityInvoiceSprzedazEnergii,
+    ElectricityInvoiceOplataDystrybucyjna,
+    ElectricityInvoiceRozliczenieOkres
+)
+
+# Tabele podrzędne faktury: klucz w danych -> (model, klucz naturalny wiersza)
+CHILD_TABLES = {
+    "blankiety": (ElectricityInvoiceBlankiet, ("numer_blankietu", "poczatek_podokresu", "koniec_podokresu")),
+    "odczyty": (ElectricityInvoiceOdczyt, ("typ_energii", "strefa", "data_odczytu")),
+    "sprzedaz_energii": (ElectricityInvoiceSprzedazEnergii, ("data", "strefa")),
+    "oplaty_dystrybucyjne": (ElectricityInvoiceOplataDystrybucyjna, ("typ_oplaty", "strefa", "jednostka", "data")),
+    "rozliczenie_okresy": (ElectricityInvoiceRozliczenieOkres, ("numer_okresu",)),
+}
+
+
+def parse_value(data_dict: Mapping[str, Any], key: str, default: Optional[float] = 0.0) -> Optional[float]:
+    """
+    Parsuje wartość numeryczną z formatu polskiego.
+    Dla małych wartości (< 10) bez kropek, przecinek jest separatorem dziesiętnym.
+    Dla większych wartości z kropkami, kropki są separatorami tysięcy.
+    Jeśli wartość jest już float, zwraca ją bez parsowania.
+    """
+    if key in data_dict and data_dict[key] is not None and data_dict[key] != '':
+        try:
+            # Jeśli wartość jest już float, zwróć ją bez parsowania
+            if isinstance(data_dict[key], (int, float)):
+                return float(data_dict[key])
+
+            value_str = str(data_dict[key]).strip()
+            # Jeśli wartość zawiera kropki, to są to separatory tysięcy
+            if '.' in value_str:
+                # Format: "1.234,56" -> usuń kropki -> "1234,56" -> zamień przecinek -> "1234.56"
+                return float(value_str.replace('.', '').replace(',', '.'))
+            else:
+                # Jeśli nie ma kropek, przecinek jest separatorem dziesiętnym
+                # Format: "0,3640" -> zamień przecinek -> "0.3640"
+                return float(value_str.replace(',', '.'))
+        except (ValueError, AttributeError, TypeError):
+            pass
+    return default
+
+
+def parse_int_value(data_dict: Mapping[str, Any], key: str, default: Optional[int] = 0) -> Optional[int]:
+    """Parsuje wartość całkowitą z formatu polskiego."""
+    if key in data_dict and data_dict[key] is not None and data_dict[key] != '':
+        try:
+            # Jeśli wartość jest już liczbą, zwróć ją jako int
+            if isinstance(data_dict[key], (int, float)):
+                return int(data_dict[key])
+
+            value_str = str(data_dict[key]).strip()
+
+            # Jeśli wartość zawiera kropki, sprawdź czy są to separatory tysięcy
+            if '.' in value_str:
+                # Jeśli jest też przecinek, to kropki są separatorami tysięcy
+                if ',' in value_str:
+                    # Format: "24.320,50" -> usuń kropki -> "24320,50" -> zamień przecinek -> "24320.50"
+                    value_str = value_str.replace('.', '').replace(',', '.')
+                else:
+                    # Tylko kropki - w formacie polskim każda grupa po separatorze tysięcy ma 3 cyfry
+                    # Format: "24.320" lub "1.234.567" -> wszystkie kropki to separatory tysięcy
+                    parts = value_str.split('.')
+                    if len(parts) > 1 and all(len(part) == 3 for part in parts[1:]):
+                        value_str = value_str.replace('.', '')
+                    # W przeciwnym razie kropka jest separatorem dziesiętnym (zostaw)
+            elif ',' in value_str:
+                # Tylko przecinek - zamień na kropkę (separator dziesiętny)
+                value_str = value_str.replace(',', '.')
+
+            return int(float(value_str))
+        except (ValueError, AttributeError, TypeError):
+            pass
+    return default
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """Parsuje datę w formacie ISO (YYYY-MM-DD) lub DD/MM/YYYY; None dla pustej lub błędnej."""
+    if not value:
+        return None
+    try:
+        if '/' in value:
+            return datetime.strptime(value, "%d/%m/%Y").date()
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        return None
+
+
+def _zone(item: Mapping[str, Any], typ_taryfy: str) -> Optional[str]:
+    """Strefa pozycji ('DZIENNA' / 'NOCNA'); dla taryfy całodobowej zawsze None."""
+    if typ_taryfy == "CAŁODOBOWA" or not item.get('strefa'):
+        return None
+    strefa = item['strefa'].upper()
+    return strefa if strefa in ('DZIENNA', 'NOCNA') else None
+
+
+def normalize_blankiety(items: Sequence[Mapping[str, Any]], typ_taryfy: str, data_konca_okresu: date) -> List[Dict[str, Any]]:
+    """Blankiety prognozowe (bez pozycji "Ogółem")."""
+    rows = []
+    for item in items:
+        if item.get('ogolem'):
+            continue
+
+        # Dla taryfy dwutaryfowej: ilosc_d i ilosc_c
+        ilosc_dzienna = parse_int_value(item, 'ilosc_d') if item.get('ilosc_d') else None
+        ilosc_nocna = parse_int_value(item, 'ilosc_c') if item.get('ilosc_c') else None
+        ilosc_calodobowa = None
+
+        # Dla taryfy całodobowej: ilosc_calodobowa (z parsera) lub ilosc_c (fallback)
+        if typ_taryfy == "CAŁODOBOWA":
+            if item.get('ilosc_calodobowa'):
+                ilosc_calodobowa = parse_int_value(item, 'ilosc_calodobowa')
+            elif item.get('ilosc_c'):
+                ilosc_calodobowa = parse_int_value(item, 'ilosc_c')
+            ilosc_dzienna = None
+            ilosc_nocna = None
+
+        rows.append({
+            "numer_blankietu": item.get('nr_blankietu', ''),
+            "poczatek_podokresu": parse_date(item.get('okres_od')),
+            "koniec_podokresu": parse_date(item.get('okres_do')),
+            "ilosc_dzienna_kwh": ilosc_dzienna,
+            "ilosc_nocna_kwh": ilosc_nocna,
+            "ilosc_calodobowa_kwh": ilosc_calodobowa,
+            "kwota_brutto": parse_value(item, 'kwota_brutto', 0.0),
+            "akcyza": parse_value(item, 'akcyza', 0.0),
+            "energia_do_akcyzy_kwh": parse_int_value(item, 'energia_do_akcyzy', 0),
+            "nadplata_niedoplata": parse_value(item, 'nadplata_niedoplata', 0.0),
+            "odsetki": parse_value(item, 'odsetki', 0.0),
+            "termin_platnosci": parse_date(item.get('termin_platnosci')) or data_konca_okresu,
+            "do_zaplaty": parse_value(item, 'do_zaplaty', 0.0),
+        })
+    return rows
+
+
+def normalize_odczyty(items: Sequence[Mapping[str, Any]], typ_taryfy: str) -> List[Dict[str, Any]]:
+    """Odczyty liczników (bez daty pomijane, duplikaty typ/strefa/data usuwane)."""
+    rows = []
+    seen = set()
+    for item in items:
+        data_odczytu = parse_date(item.get('data'))
+        if not data_odczytu:
+            continue
+
+        typ_energii = "POBRANA" if item.get('typ') == 'pobrana' else "ODDANA"
+        strefa = _zone(item, typ_taryfy)
+
+        # Wiele okresów dla tej samej strefy jest dozwolone - klucz zawiera datę
+        key = (typ_energii, strefa, data_odczytu)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        rows.append({
+            "typ_energii": typ_energii,
+            "strefa": strefa,
+            "data_odczytu": data_odczytu,
+            "biezacy_odczyt": parse_int_value(item, 'biezace', 0),
+            "poprzedni_odczyt": parse_int_value(item, 'poprzednie', 0),
+            "mnozna": parse_int_value(item, 'mnozna', 1),
+            "ilosc_kwh": parse_int_value(item, 'ilosc', 0),
+            "straty_kwh": parse_int_value(item, 'straty', 0),
+            "razem_kwh": parse_int_value(item, 'razem', 0),
+        })
+    return rows
+
+
+def normalize_sprzedaz_energii(items: Sequence[Mapping[str, Any]], typ_taryfy: str) -> List[Dict[str, Any]]:
+    """Pozycje sprzedaży energii (bez upustów)."""
+    rows = []
+    for item in items:
+        if item.get('typ') == 'upust':
+            continue
+
+        ilosc_kwh = 0
+        if 'ilosc_kwh' in item:
+            ilosc_kwh = parse_int_value(item, 'ilosc_kwh', 0)
+        elif 'ilosc' in item:
+            ilosc_kwh = parse_int_value(item, 'ilosc', 0)
+
+        rows.append({
+            "data": parse_date(item.get('data')),
+            "strefa": _zone(item, typ_taryfy),
+            "ilosc_kwh": ilosc_kwh,
+            "cena_za_kwh": parse_value(item, 'cena', 0.0),
+            "naleznosc": parse_value(item, 'naleznosc', 0.0),
+            "vat_procent": parse_value(item, 'vat', 23.0),
+        })
+    return rows
+
+
+def normalize_oplaty_dystrybucyjne(
+    items: Sequence[Mapping[str, Any]],
+    typ_taryfy: str,
+    data_poczatku_okresu: date
+) -> List[Dict[str, Any]]:
+    """Opłaty dystrybucyjne (bez daty - data początku okresu faktury)."""
+    rows = []
+    for item in items:
+        jednostka = item.get('jednostka', 'kWh')
+        ilosc_kwh = None
+        ilosc_miesiecy = None
+        wspolczynnik = None
+
+        if jednostka == 'kWh':
+            if 'ilosc_kwh' in item:
+                ilosc_kwh = parse_int_value(item, 'ilosc_kwh', 0)
+            elif 'ilosc' in item:
+                ilosc_kwh = parse_int_value(item, 'ilosc', 0)
+        elif jednostka == 'zł/mc':
+            # Float, bo może być np. 4,9333
+            if 'ilosc_miesiecy' in item:
+                ilosc_miesiecy = parse_value(item, 'ilosc_miesiecy', 0.0)
+            elif 'ilosc' in item:
+                ilosc_miesiecy = parse_value(item, 'ilosc', 0.0)
+
+        # Współczynnik (dla opłaty stałej sieciowej)
+        if 'wspolczynnik1' in item:
+            wspolczynnik = parse_value(item, 'wspolczynnik1', 0.0)
+        elif 'wspolczynnik' in item:
+            wspolczynnik = parse_value(item, 'wspolczynnik', 0.0)
+
+        rows.append({
+            "typ_oplaty": item.get('nazwa', ''),
+            "strefa": _zone(item, typ_taryfy),
+            "jednostka": jednostka,
+            "data": parse_date(item.get('data')) or data_poczatku_okresu,
+            "ilosc_kwh": ilosc_kwh,
+            "ilosc_miesiecy": ilosc_miesiecy,
+            "wspolczynnik": wspolczynnik,
+            "cena": parse_value(item, 'cena', 0.0),
+            "naleznosc": parse_value(item, 'naleznosc', 0.0),
+            "vat_procent": parse_value(item, 'vat', 23.0),
+        })
+    return rows
+
+
+def normalize_rozliczenie_okresy(
+    items: Optional[Sequence[Mapping[str, Any]]],
+    blankiety: Optional[Sequence[Mapping[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """Okresy rozliczenia; gdy ich brak - generowane z końców podokresów blankietów."""
+    rows = []
+    if items:
+        for item in items:
+            data_okresu = parse_date(item.get('data_okresu'))
+            if data_okresu:
+                rows.append({"data_okresu": data_okresu, "numer_okresu": item.get('numer_okresu', 1)})
+        return rows
+
+    numer_okresu = 1
+    for item in blankiety or ():
+        if item.get('ogolem'):
+            continue
+        data_okresu = parse_date(item.get('okres_do'))
+        if data_okresu:
+            rows.append({"data_okresu": data_okresu, "numer_okresu": numer_okresu})
+            numer_okresu += 1
+    return rows
+
+
+def normalize_invoice_children(
+    invoice_data: Mapping[str, Any],
+    typ_taryfy: str,
+    data_poczatku_okresu: date,
+    data_konca_okresu: date
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Normalizuje pozycje podrzędne faktury z danych dashboardu.
+
+    Zwraca tylko tabele obecne (i niepuste) w danych - tabele pominięte
+    nie są zmieniane przy aktualizacji faktury.
+
+    Args:
+        invoice_data: Dane faktury z dashboardu
+        typ_taryfy: Typ taryfy faktury
+        data_poczatku_okresu: Data początku okresu (domyślna data opłat)
+        data_konca_okresu: Data końca okresu (domyślny termin płatności blankietów)
+
+    Returns:
+        Słownik {klucz tabeli z CHILD_TABLES: lista słowników kolumn (bez invoice_id i rok)}
+    """
+    children: Dict[str, List[Dict[str, Any]]] = {}
+    blankiety = invoice_data.get('blankiety')
+    if blankiety:
+        children["blankiety"] = normalize_blankiety(blankiety, typ_taryfy, data_konca_okresu)
+    if invoice_data.get('odczyty'):
+        children["odczyty"] = normalize_odczyty(invoice_data['odczyty'], typ_taryfy)
+    if invoice_data.get('sprzedaz_energii'):
+        children["sprzedaz_energii"] = normalize_sprzedaz_energii(invoice_data['sprzedaz_energii'], typ_taryfy)
+    if invoice_data.get('oplaty_dystrybucyjne'):
+        children["oplaty_dystrybucyjne"] = normalize_oplaty_dystrybucyjne(
+            invoice_data['oplaty_dystrybucyjne'], typ_taryfy, data_poczatku_okresu
+        )
+    if invoice_data.get('rozliczenie_okresy') or blankiety:
+        children["rozliczenie_okresy"] = normalize_rozliczenie_okresy(invoice_data.get('rozliczenie_okresy'), blankiety)
+    return children
+
+
+def _with_invoice(invoice: ElectricityInvoice, rows: Sequence[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+    return [dict(row, invoice_id=invoice.id, rok=invoice.rok) for row in rows]
+
+
+def insert_invoice_children(
+    db: Session,
+    invoice: ElectricityInvoice,
+    children: Mapping[str, Sequence[Mapping[str, Any]]]
+) -> Dict[str, int]:
+    """
+    Zapisuje pozycje podrzędne nowej faktury - jedno zbiorcze INSERT na tabelę (bez commita).
+
+    Args:
+        db: Sesja bazy danych
+        invoice: Zapisana (flush) faktura
+        children: Wynik normalize_invoice_children
+
+    Returns:
+        Liczba wstawionych wierszy dla każdej tabeli
+    """
+    counts = {}
+    for name, rows in children.items():
+        model = CHILD_TABLES[name][0]
+        if rows:
+            # render_nulls - wiersze z pustymi polami nie rozbijają partii executemany
+            db.execute(insert(model).execution_options(render_nulls=True), _with_invoice(invoice, rows))
+        counts[name] = len(rows)
+    return counts
+
+
+def _keyed(rows: Sequence[Any], key_columns: Tuple[str, ...], get) -> Dict[tuple, Any]:
+    """Indeksuje wiersze kluczem naturalnym; powtórzenia klucza są numerowane kolejno."""
+    keyed = {}
+    occurrences: Dict[tuple, int] = {}
+    for row in rows:
+        key = tuple(get(row, column) for column in key_columns)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        keyed[key + (occurrence,)] = row
+    return keyed
+
+
+def _same(current: Any, new: Any) -> bool:
+    """Porównuje wartość z bazy (Numeric jako Decimal) z wartością znormalizowaną."""
+    if isinstance(current, Decimal) and new is not None:
+        return float(current) == float(new)
+    return current == new
+
+
+def sync_invoice_children(
+    db: Session,
+    invoice: ElectricityInvoice,
+    children: Mapping[str, Sequence[Mapping[str, Any]]]
+) -> Dict[str, Dict[str, int]]:
+    """
+    Aktualizuje pozycje podrzędne faktury, porównując je po kluczu naturalnym (bez commita).
+
+    Wiersze o tym samym kluczu są aktualizowane tylko w zmienionych kolumnach,
+    brakujące w nowych danych - usuwane, a nowe - wstawiane zbiorczo.
+
+    Args:
+        db: Sesja bazy danych
+        invoice: Aktualizowana faktura
+        children: Wynik normalize_invoice_children (tylko tabele do zastąpienia)
+
+    Returns:
+        Słownik {tabela: {'inserted': n, 'updated': n, 'deleted': n}}
+    """
+    stats = {}
+    inserts = []
+    for name, rows in children.items():
+        model, key_columns = CHILD_TABLES[name]
+        existing = _keyed(
+            db.query(model).filter(model.invoice_id == invoice.id).order_by(model.id).all(),
+            key_columns, getattr
+        )
+        new_rows = _keyed(_with_invoice(invoice, rows), key_columns, dict.get)
+
+        updated = 0
+        inserted = []
+        for key, row in new_rows.items():
+            obj = existing.pop(key, None)
+            if obj is None:
+                inserted.append(row)
+                continue
+            changed = False
+            for column, value in row.items():
+                if not _same(getattr(obj, column), value):
+                    setattr(obj, column, value)
+                    changed = True
+            updated += changed
+
+        # Pozostałe wiersze z bazy nie występują w nowych danych
+        for obj in existing.values():
+            db.delete(obj)
+
+        stats[name] = {"inserted": len(inserted), "updated": updated, "deleted": len(existing)}
+        inserts.append((model, inserted))
+
+    # Usunięcia i zmiany przed wstawieniem (unikalne klucze mogą się zwolnić)
+    db.flush()
+    for model, rows in inserts:
+        if rows:
+            db.execute(insert(model).execution_options(render_nulls=True), rows)
+    return stats
@@ -3,24 +3,76 @@ Moduł zarządzania odczytami i rozliczaniem rachunków za prąd.
 Oblicza koszty na podstawie faktur i dzieli proporcjonalnie między lokale.
 """
 
-from typing import Optional, Dict, Any, List
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterable, List, Tuple, Union
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from datetime import datetime, date, timedelta
+from sqlalchemy import desc, insert, update
+from datetime import datetime, date
 from app.models.electricity import ElectricityReading, ElectricityBill
 from app.models.electricity_invoice import (
     ElectricityInvoice, 
-    ElectricityInvoiceBlankiet, 
-    ElectricityInvoiceOplataDystrybucyjna,
-    ElectricityInvoiceSprzedazEnergii,
-    ElectricityInvoiceRozliczenieOkres
+    ElectricityInvoiceBlankiet
 )
 from app.models.water import Local
 from app.services.electricity.calculator import (
     calculate_all_usage,
     get_previous_reading
 )
-from app.services.electricity.cost_calculator import calculate_kwh_cost
+from app.services.electricity.cost_model import get_invoice_cost_model, get_invoice_cost_models
+from app.services.electricity.invoice_index import get_invoice_period_index
+from app.services.electricity.period_context import PeriodContext, compute_tenant_period_dates
+from app.services.electricity.tariff_timeline import DEFAULT_VAT_RATE, TariffTimeline
+
+
+def match_blankiet_for_period(
+    blankiety: List[ElectricityInvoiceBlankiet],
+    period: str  # 'YYYY-MM'
+) -> Optional[ElectricityInvoiceBlankiet]:
+    """
+    Wybiera z blankietów faktury ten, którego podokres zawiera dany okres.
+    
+    Args:
+        blankiety: Blankiety jednej faktury
+        period: Okres w formacie 'YYYY-MM'
+    
+    Returns:
+        Blankiet odpowiadający okresowi, pierwszy blankiet (fallback) lub None
+    """
+    # Parsuj okres na datę (pierwszy dzień miesiąca)
+    try:
+        period_date = datetime.strptime(period, '%Y-%m').date()
+    except ValueError:
+        return None
+    
+    # Znajdź blankiet, którego okres zawiera datę okresu
+    for blankiet in blankiety:
+        if blankiet.poczatek_podokresu and blankiet.koniec_podokresu:
+            # Sprawdź czy okres rachunku mieści się w podokresie blankietu
+            if blankiet.poczatek_podokresu <= period_date <= blankiet.koniec_podokresu:
+                return blankiet
+        elif blankiet.poczatek_podokresu:
+            # Jeśli brak końca, sprawdź tylko początek (miesiąc powinien być >= początek)
+            if period_date >= blankiet.poczatek_podokresu:
+                return blankiet
+    
+    # Jeśli nie znaleziono, zwróć pierwszy blankiet (jako fallback)
+    if blankiety:
+        return blankiety[0]
+    
+    return None
+
+
+# Kolumny aktualizowane przy ponownym generowaniu istniejącego rachunku
+BILL_UPDATE_COLUMNS = (
+    'invoice_id',
+    'usage_kwh',
+    'usage_kwh_dzienna',
+    'usage_kwh_nocna',
+    'energy_cost_gross',
+    'distribution_cost_gross',
+    'total_net_sum',
+    'total_gross_sum'
+)
 
 
 class ElectricityBillingManager:
@@ -100,31 +152,8 @@ class ElectricityBillingManager:
         Returns:
             Kwota opłat stałych przypadająca na jeden lokal (brutto)
         """
-        # Lista nazw opłat do zsumowania
-        target_fee_names = [
-            'Opłata stała sieciowa - układ 3-fazowy',
-            'Opłata przejściowa > 1200 kWh',
-            'Opłata mocowa ( > 2800 kWh)',
-            'Opłata abonamentowa'
-        ]
-        
-        # Pobierz wszystkie opłaty dystrybucyjne dla faktury
-        oplaty = db.query(ElectricityInvoiceOplataDystrybucyjna).filter(
-            ElectricityInvoiceOplataDystrybucyjna.invoice_id == invoice.id
-        ).all()
-        
-        # Sumuj należności dla opłat z listy
-        total_fees = 0.0
-        for oplata in oplaty:
-            if oplata.typ_oplaty in target_fee_names:
-                # Należność jest już w formacie brutto i za cały okres faktury
-                naleznosc = float(oplata.naleznosc) if oplata.naleznosc else 0.0
-                total_fees += naleznosc
-        
-        # Podziel na 3 lokale (opłaty są już za cały okres faktury, nie mnożymy przez liczbę miesięcy)
-        fee_per_local = total_fees / 3.0
-        
-        return round(fee_per_local, 4)
+        cost_model = get_invoice_cost_model(db, invoice.id)
+        return cost_model.fixed_fees_per_local if cost_model else 0.0
     
     def calculate_bill_costs(
         self,
@@ -132,7 +161,8 @@ class ElectricityBillingManager:
         usage_data: Dict[str, Any],
         local_name: str,
         db: Session,
-        data: str  # 'YYYY-MM' - okres rachunku
+        data: str,  # 'YYYY-MM' - okres rachunku
+        context: Optional[PeriodContext] = None
     ) -> Dict[str, float]:
         """
         Oblicza koszty dla pojedynczego rachunku prądu.
@@ -147,6 +177,8 @@ class ElectricityBillingManager:
             local_name: Nazwa lokalu ('gora', 'dol', 'gabinet')
             db: Sesja bazy danych
             data: Okres rachunku w formacie 'YYYY-MM'
+            context: Kontekst okresu (odczyty, daty najemcy, model kosztów) - jeśli podany,
+                obliczenia nie wykonują zapytań do bazy
         
         Returns:
             Słownik z obliczonymi kosztami dla lokalu
@@ -180,12 +212,22 @@ class ElectricityBillingManager:
                 'total_gross_sum': 0.0
             }
         
-        # NOWA LOGIKA: Sprawdź czy faktura ma okresy z różnymi cenami
-        distribution_periods = self.get_distribution_periods(db, invoice)
+        # Model kosztów faktury (z kontekstu okresu lub z cache - wspólny dla wszystkich lokali)
+        if context is not None:
+            cost_model = context.cost_model
+        else:
+            cost_model = get_invoice_cost_model(db, invoice.id)
+        
+        # Stawka VAT z pozycji faktury (domyślnie 23%)
+        vat_rate = cost_model.vat_rate if cost_model else DEFAULT_VAT_RATE
         
-        if distribution_periods and len(distribution_periods) > 1:
+        # NOWA LOGIKA: Sprawdź czy faktura ma okresy z różnymi cenami
+        if cost_model and cost_model.timeline.segment_count > 1:
             # Faktura ma wiele okresów - użyj nowej logiki z overlapping periods
-            tenant_period_dates = self.get_tenant_period_dates(db, data)
+            if context is not None:
+                tenant_period_dates = context.tenant_period
+            else:
+                tenant_period_dates = self.get_tenant_period_dates(db, data)
             
             if tenant_period_dates:
                 tenant_period_start, tenant_period_end = tenant_period_dates
@@ -193,11 +235,10 @@ class ElectricityBillingManager:
                 # Użyj usage_kwh_calodobowa dla gabinetu
                 usage_kwh_calodobowa = local_usage if local_name == 'gabinet' else None
                 
-                # Oblicz koszty z uwzględnieniem overlapping periods
-                result = self.calculate_bill_for_period_with_overlapping(
+                # Oblicz koszty proporcjonalnie do dni w okresach osi taryfowej
+                result = cost_model.timeline.prorate(
                     tenant_period_start,
                     tenant_period_end,
-                    distribution_periods,
                     local_usage_dzienna or 0.0,
                     local_usage_nocna or 0.0,
                     usage_kwh_calodobowa
@@ -216,9 +257,8 @@ class ElectricityBillingManager:
         # FALLBACK: Stara logika (gdy nie ma okresów lub jest tylko jeden okres)
         
         # Jeśli faktura jest dwutaryfowa, użyj średniej ważonej dla wszystkich lokali
-        if invoice.typ_taryfy == "DWUTARYFOWA":
-            from app.services.electricity.cost_calculator import calculate_kwh_cost
-            koszty_kwh = calculate_kwh_cost(invoice.id, db)
+        if invoice.typ_taryfy == "DWUTARYFOWA" and cost_model:
+            koszty_kwh = cost_model.zone_costs
             
             # Sprawdź czy faktura ma dwie taryfy (DZIENNA i NOCNA)
             if "DZIENNA" in koszty_kwh and "NOCNA" in koszty_kwh:
@@ -232,36 +272,22 @@ class ElectricityBillingManager:
                 energy_cost_net = round(koszt_sredni_wazony * local_usage, 4)
                 
                 # Dla dystrybucji również użyj średniej ważonej
-                # Pobierz opłaty dystrybucyjne z faktury
-                from app.models.electricity_invoice import ElectricityInvoiceOplataDystrybucyjna
-                oplaty = db.query(ElectricityInvoiceOplataDystrybucyjna).filter(
-                    ElectricityInvoiceOplataDystrybucyjna.invoice_id == invoice.id
-                ).all()
-                
-                # Oblicz średnią ważoną kosztu dystrybucji na kWh (netto)
-                dystrybucja_dzienna = 0.0
-                dystrybucja_nocna = 0.0
-                for op in oplaty:
-                    if op.jednostka != "kWh":
-                        continue
-                    if op.strefa == "DZIENNA":
-                        dystrybucja_dzienna += float(op.cena)
-                    elif op.strefa == "NOCNA":
-                        dystrybucja_nocna += float(op.cena)
+                # (sumy cen opłat dystrybucyjnych za kWh z modelu kosztów faktury)
+                dystrybucja_dzienna = cost_model.distribution_kwh_dzienna
+                dystrybucja_nocna = cost_model.distribution_kwh_nocna
                 
                 dystrybucja_srednia_wazona = round(dystrybucja_dzienna * 0.7 + dystrybucja_nocna * 0.3, 4)
                 
                 # Koszt dystrybucji netto = średnia ważona * zużycie
                 distribution_cost_net = round(dystrybucja_srednia_wazona * local_usage, 4)
                 
-                # Oblicz brutto (zakładając VAT 23%)
-                vat_rate = 0.23
+                # Oblicz brutto (stawka VAT z faktury)
                 energy_cost_gross = round(energy_cost_net * (1 + vat_rate), 4)
                 distribution_cost_gross = round(distribution_cost_net * (1 + vat_rate), 4)
                 
                 # Dodaj opłaty stałe (stała sieciowa, przejściowa, abonamentowa, mocowa)
                 # Podzielone na 3 lokale (opłaty są już za cały okres faktury)
-                fixed_fees_gross = self.calculate_fixed_fees_per_local(invoice, db)
+                fixed_fees_gross = cost_model.fixed_fees_per_local
                 fixed_fees_net = round(fixed_fees_gross / (1 + vat_rate), 4)
                 
                 total_net_sum = round(energy_cost_net + distribution_cost_net + fixed_fees_net, 4)
@@ -298,15 +324,13 @@ class ElectricityBillingManager:
         energy_cost_gross = float(invoice.ogolem_sprzedaz_energii) * usage_ratio
         distribution_cost_gross = float(invoice.ogolem_usluga_dystrybucji) * usage_ratio
         
-        # Oblicz netto (zakładając VAT 23% - standardowy VAT dla energii)
-        # Jeśli potrzebujemy dokładnego VAT, możemy obliczyć z naleznosc_za_okres
-        vat_rate = 0.23  # Domyślny VAT 23%
+        # Oblicz netto (stawka VAT z faktury)
         energy_cost_net = energy_cost_gross / (1 + vat_rate)
         distribution_cost_net = distribution_cost_gross / (1 + vat_rate)
         
         # Dodaj opłaty stałe (stała sieciowa, przejściowa, abonamentowa, mocowa)
         # Podzielone na 3 lokale (opłaty są już za cały okres faktury)
-        fixed_fees_gross = self.calculate_fixed_fees_per_local(invoice, db)
+        fixed_fees_gross = cost_model.fixed_fees_per_local if cost_model else 0.0
         fixed_fees_net = round(fixed_fees_gross / (1 + vat_rate), 4)
         
         total_net_sum = energy_cost_net + distribution_cost_net + fixed_fees_net
@@ -346,29 +370,7 @@ class ElectricityBillingManager:
             return None
         
         previous = get_previous_reading(db, data)
-        
-        # Okres najemcy kończy się w dacie odczytu obecnego
-        if current.data_odczytu_licznika:
-            end_date = current.data_odczytu_licznika
-        else:
-            # Fallback: parsujemy datę z formatu 'YYYY-MM'
-            year, month = map(int, data.split('-'))
-            # Zakładamy, że odczyty są około 10. dnia miesiąca
-            end_date = date(year, month, 10)
-        
-        # Okres najemcy zaczyna się dzień po dacie odczytu poprzedniego
-        if previous and previous.data_odczytu_licznika:
-            start_date = previous.data_odczytu_licznika + timedelta(days=1)
-        elif previous:
-            # Fallback: parsujemy datę z formatu 'YYYY-MM'
-            year, month = map(int, previous.data.split('-'))
-            start_date = date(year, month, 10) + timedelta(days=1)
-        else:
-            # Pierwszy odczyt - okres zaczyna się pierwszego dnia miesiąca
-            year, month = map(int, data.split('-'))
-            start_date = date(year, month, 1)
-        
-        return (start_date, end_date)
+        return compute_tenant_period_dates(data, current, previous)
     
     def get_distribution_periods(
         self,
@@ -378,10 +380,8 @@ class ElectricityBillingManager:
         """
         Wyłania okresy z faktury, gdzie mogą być różne ceny.
         
-        Pobiera dane z:
-        1. electricity_invoice_rozliczenie_okresy (jeśli są dostępne)
-        2. electricity_invoice_oplaty_dystrybucyjne (grupowane po data)
-        3. electricity_invoice_sprzedaz_energii (grupowane po kolejności)
+        Okresy pochodzą z modelu kosztów faktury (InvoiceCostModel), budowanego raz
+        z opłat dystrybucyjnych (grupowanych po data) i sprzedaży energii (po kolejności).
         
         Args:
             db: Sesja bazy danych
@@ -393,226 +393,28 @@ class ElectricityBillingManager:
             - cena_1kwh_dzienna, cena_1kwh_nocna, cena_1kwh_calodobowa: ceny netto za 1 kWh
             - suma_oplat_stalych: suma opłat stałych (netto)
         """
-        periods = []
-        
-        # Najpierw sprawdź czy są rozliczenie_okresy
-        rozliczenie_okresy = db.query(ElectricityInvoiceRozliczenieOkres).filter(
-            ElectricityInvoiceRozliczenieOkres.invoice_id == invoice.id
-        ).order_by(ElectricityInvoiceRozliczenieOkres.numer_okresu).all()
-        
-        if rozliczenie_okresy:
-            # Użyj rozliczenie_okresy do wyłaniania okresów
-            # Ale nadal musimy pobrać opłaty i sprzedaż dla każdego okresu
-            # Przejdź do logiki z opłatami dystrybucyjnymi, ale użyj dat z rozliczenie_okresy
-            # (pominięte - przejdź do dalszej logiki)
-            pass
-        
-        # Jeśli nie ma rozliczenie_okresy, użyj opłat dystrybucyjnych
-        oplaty = db.query(ElectricityInvoiceOplataDystrybucyjna).filter(
-            ElectricityInvoiceOplataDystrybucyjna.invoice_id == invoice.id
-        ).order_by(ElectricityInvoiceOplataDystrybucyjna.data).all()
-        
-        if not oplaty:
-            return periods
-        
-        # Pobierz sprzedaż energii
-        sprzedaz = db.query(ElectricityInvoiceSprzedazEnergii).filter(
-            ElectricityInvoiceSprzedazEnergii.invoice_id == invoice.id
-        ).order_by(ElectricityInvoiceSprzedazEnergii.data).all()
-        
-        # Okres rozliczeniowy faktury
-        period_start_year = invoice.data_poczatku_okresu.year
-        period_start = date(period_start_year, 11, 1)
-        period_end = date(period_start_year + 1, 10, 31)
-        
-        # Grupujemy opłaty po datach (okresach)
-        unique_dates = sorted(set(o.data for o in oplaty if o.data))
-        
-        if not unique_dates:
-            return periods
-        
-        # Grupujemy sprzedaż po kolejności
-        sprzedaz_grouped = []
-        if invoice.typ_taryfy == "DWUTARYFOWA":
-            i = 0
-            while i < len(sprzedaz):
-                dzienna = None
-                nocna = None
-                if i < len(sprzedaz) and sprzedaz[i].strefa == "DZIENNA":
-                    dzienna = sprzedaz[i]
-                    i += 1
-                if i < len(sprzedaz) and sprzedaz[i].strefa == "NOCNA":
-                    nocna = sprzedaz[i]
-                    i += 1
-                if dzienna or nocna:
-                    sprzedaz_grouped.append({"dzienna": dzienna, "nocna": nocna})
-        else:
-            for s in sprzedaz:
-                sprzedaz_grouped.append({"calodobowa": s})
-        
-        current_start = period_start
-        MAX_REASONABLE_PRICE_PER_KWH = 5.0
+        cost_model = get_invoice_cost_model(db, invoice.id)
+        if cost_model is None:
+            return []
+        return cost_model.distribution_periods_list()
+    
+    def get_tariff_timeline(
+        self,
+        db: Session,
+        invoice: ElectricityInvoice
+    ) -> Optional[TariffTimeline]:
+        """
+        Zwraca oś taryfową faktury z modelu kosztów (zapisaną lub zbudowaną raz i trzymaną w cache).
         
-        for i, dist_date in enumerate(unique_dates):
-            dist_period_end = dist_date
-            sprzedaz_period = sprzedaz_grouped[i] if i < len(sprzedaz_grouped) else {}
-            oplaty_period = [o for o in oplaty if o.data == dist_date]
-            
-            # Ceny z sprzedaży energii
-            cena_dzienna = None
-            cena_nocna = None
-            cena_calodobowa = None
-            
-            if sprzedaz_period.get("dzienna") and sprzedaz_period["dzienna"].ilosc_kwh > 0:
-                cena_raw = float(sprzedaz_period["dzienna"].cena_za_kwh)
-                if cena_raw > MAX_REASONABLE_PRICE_PER_KWH:
-                    naleznosc = float(sprzedaz_period["dzienna"].naleznosc)
-                    ilosc = float(sprzedaz_period["dzienna"].ilosc_kwh)
-                    if ilosc > 0:
-                        cena_z_naleznosci = naleznosc / ilosc
-                        cena_dzienna = cena_z_naleznosci if cena_z_naleznosci <= MAX_REASONABLE_PRICE_PER_KWH else cena_raw
-                    else:
-                        cena_dzienna = cena_raw
-                else:
-                    cena_dzienna = cena_raw
-            
-            if sprzedaz_period.get("nocna") and sprzedaz_period["nocna"].ilosc_kwh > 0:
-                cena_raw = float(sprzedaz_period["nocna"].cena_za_kwh)
-                if cena_raw > MAX_REASONABLE_PRICE_PER_KWH:
-                    naleznosc = float(sprzedaz_period["nocna"].naleznosc)
-                    ilosc = float(sprzedaz_period["nocna"].ilosc_kwh)
-                    if ilosc > 0:
-                        cena_z_naleznosci = naleznosc / ilosc
-                        cena_nocna = cena_z_naleznosci if cena_z_naleznosci <= MAX_REASONABLE_PRICE_PER_KWH else cena_raw
-                    else:
-                        cena_nocna = cena_raw
-                else:
-                    cena_nocna = cena_raw
-            
-            if sprzedaz_period.get("calodobowa") and sprzedaz_period["calodobowa"].ilosc_kwh > 0:
-                cena_raw = float(sprzedaz_period["calodobowa"].cena_za_kwh)
-                if cena_raw > MAX_REASONABLE_PRICE_PER_KWH:
-                    naleznosc = float(sprzedaz_period["calodobowa"].naleznosc)
-                    ilosc = float(sprzedaz_period["calodobowa"].ilosc_kwh)
-                    if ilosc > 0:
-                        cena_z_naleznosci = naleznosc / ilosc
-                        cena_calodobowa = cena_z_naleznosci if cena_z_naleznosci <= MAX_REASONABLE_PRICE_PER_KWH else cena_raw
-                    else:
-                        cena_calodobowa = cena_raw
-                else:
-                    cena_calodobowa = cena_raw
-            
-            # Opłaty dystrybucyjne zmienne (za kWh)
-            oplata_jakosciowa_dzienna = None
-            oplata_jakosciowa_nocna = None
-            oplata_zmienna_sieciowa_dzienna = None
-            oplata_zmienna_sieciowa_nocna = None
-            oplata_oze_dzienna = None
-            oplata_oze_nocna = None
-            oplata_kogeneracyjna_dzienna = None
-            oplata_kogeneracyjna_nocna = None
-            
-            # Opłaty stałe (za miesiąc)
-            oplata_stala_sieciowa = None
-            oplata_przejściowa = None
-            oplata_abonamentowa = None
-            oplata_mocowa = None
-            
-            for o in oplaty_period:
-                typ_oplaty_upper = o.typ_oplaty.upper()
-                if o.jednostka == "kWh":
-                    if "JAKOŚCIOWA" in typ_oplaty_upper or "JAKOSCIOWA" in typ_oplaty_upper:
-                        if o.strefa == "DZIENNA":
-                            oplata_jakosciowa_dzienna = float(o.cena)
-                        elif o.strefa == "NOCNA":
-                            oplata_jakosciowa_nocna = float(o.cena)
-                    elif "ZMIENNA SIECIOWA" in typ_oplaty_upper:
-                        if o.strefa == "DZIENNA":
-                            oplata_zmienna_sieciowa_dzienna = float(o.cena)
-                        elif o.strefa == "NOCNA":
-                            oplata_zmienna_sieciowa_nocna = float(o.cena)
-                    elif "OZE" in typ_oplaty_upper:
-                        if o.strefa == "DZIENNA":
-                            oplata_oze_dzienna = float(o.cena)
-                        elif o.strefa == "NOCNA":
-                            oplata_oze_nocna = float(o.cena)
-                    elif "KOGENERACYJNA" in typ_oplaty_upper:
-                        if o.strefa == "DZIENNA":
-                            oplata_kogeneracyjna_dzienna = float(o.cena)
-                        elif o.strefa == "NOCNA":
-                            oplata_kogeneracyjna_nocna = float(o.cena)
-                elif o.jednostka == "zł/mc":
-                    if "STAŁA SIECIOWA" in typ_oplaty_upper or "STALA SIECIOWA" in typ_oplaty_upper:
-                        oplata_stala_sieciowa = float(o.cena)
-                    elif "PRZEJŚCIOWA" in typ_oplaty_upper or "PRZEJSCIOWA" in typ_oplaty_upper:
-                        oplata_przejściowa = float(o.cena)
-                    elif "ABONAMENTOWA" in typ_oplaty_upper:
-                        oplata_abonamentowa = float(o.cena)
-                    elif "MOCOWA" in typ_oplaty_upper:
-                        oplata_mocowa = float(o.cena)
-            
-            # Obliczamy cenę za 1kWh dla okresu (netto)
-            cena_1kwh_dzienna = None
-            cena_1kwh_nocna = None
-            cena_1kwh_calodobowa = None
-            
-            if cena_dzienna is not None:
-                cena_1kwh_dzienna = cena_dzienna
-                if oplata_jakosciowa_dzienna is not None:
-                    cena_1kwh_dzienna += oplata_jakosciowa_dzienna
-                if oplata_zmienna_sieciowa_dzienna is not None:
-                    cena_1kwh_dzienna += oplata_zmienna_sieciowa_dzienna
-                if oplata_oze_dzienna is not None:
-                    cena_1kwh_dzienna += oplata_oze_dzienna
-                if oplata_kogeneracyjna_dzienna is not None:
-                    cena_1kwh_dzienna += oplata_kogeneracyjna_dzienna
-                cena_1kwh_dzienna = round(cena_1kwh_dzienna, 4)
-            
-            if cena_nocna is not None:
-                cena_1kwh_nocna = cena_nocna
-                if oplata_jakosciowa_nocna is not None:
-                    cena_1kwh_nocna += oplata_jakosciowa_nocna
-                if oplata_zmienna_sieciowa_nocna is not None:
-                    cena_1kwh_nocna += oplata_zmienna_sieciowa_nocna
-                if oplata_oze_nocna is not None:
-                    cena_1kwh_nocna += oplata_oze_nocna
-                if oplata_kogeneracyjna_nocna is not None:
-                    cena_1kwh_nocna += oplata_kogeneracyjna_nocna
-                cena_1kwh_nocna = round(cena_1kwh_nocna, 4)
-            
-            if cena_calodobowa is not None:
-                cena_1kwh_calodobowa = cena_calodobowa
-                for o in oplaty_period:
-                    if o.jednostka == "kWh" and (o.strefa is None or o.strefa == "CAŁODOBOWA"):
-                        if "JAKOŚCIOWA" in o.typ_oplaty.upper() or "ZMIENNA SIECIOWA" in o.typ_oplaty.upper() or \
-                           "OZE" in o.typ_oplaty.upper() or "KOGENERACYJNA" in o.typ_oplaty.upper():
-                            cena_1kwh_calodobowa += float(o.cena)
-                cena_1kwh_calodobowa = round(cena_1kwh_calodobowa, 4)
-            
-            # Suma opłat stałych (netto)
-            suma_oplat_stalych = 0
-            if oplata_stala_sieciowa is not None:
-                suma_oplat_stalych += oplata_stala_sieciowa
-            if oplata_przejściowa is not None:
-                suma_oplat_stalych += oplata_przejściowa
-            if oplata_abonamentowa is not None:
-                suma_oplat_stalych += oplata_abonamentowa
-            if oplata_mocowa is not None:
-                suma_oplat_stalych += oplata_mocowa
-            
-            periods.append({
-                "okres": f"OKRES_DYSTRYBUCYJNY_{i+1}",
-                "od": current_start,
-                "do": dist_period_end,
-                "cena_1kwh_dzienna": cena_1kwh_dzienna,
-                "cena_1kwh_nocna": cena_1kwh_nocna,
-                "cena_1kwh_calodobowa": cena_1kwh_calodobowa,
-                "suma_oplat_stalych": round(suma_oplat_stalych, 4)
-            })
-            
-            current_start = dist_period_end + timedelta(days=1)
+        Args:
+            db: Sesja bazy danych
+            invoice: Faktura prądu
         
-        return periods
+        Returns:
+            Oś taryfowa faktury lub None, jeśli faktury nie ma
+        """
+        cost_model = get_invoice_cost_model(db, invoice.id)
+        return cost_model.timeline if cost_model is not None else None
     
     def calculate_days_between(self, start_date: date, end_date: date) -> int:
         """Oblicza liczbę dni między datami (włącznie z końcową)."""
@@ -622,7 +424,7 @@ class ElectricityBillingManager:
         self,
         tenant_period_start: date,
         tenant_period_end: date,
-        distribution_periods: List[Dict[str, Any]],
+        distribution_periods: Union[List[Dict[str, Any]], TariffTimeline],
         usage_kwh_dzienna: float,
         usage_kwh_nocna: float,
         usage_kwh_calodobowa: Optional[float] = None
@@ -633,7 +435,8 @@ class ElectricityBillingManager:
         Args:
             tenant_period_start: Data początku okresu najemcy
             tenant_period_end: Data końca okresu najemcy
-            distribution_periods: Lista okresów z faktury z różnymi cenami
+            distribution_periods: Oś taryfowa faktury (get_tariff_timeline - bez ponownego budowania)
+                albo lista okresów z różnymi cenami (opcjonalnie z vat_rate)
             usage_kwh_dzienna: Zużycie dzienne (kWh)
             usage_kwh_nocna: Zużycie nocne (kWh)
             usage_kwh_calodobowa: Zużycie całodobowe (kWh) - opcjonalne
@@ -641,103 +444,19 @@ class ElectricityBillingManager:
         Returns:
             Słownik z obliczonymi kosztami (netto i brutto)
         """
-        # Znajdujemy, które okresy dystrybucyjne pokrywają się z okresem najemcy
-        overlapping_periods = []
-        
-        for dist_period in distribution_periods:
-            # Sprawdzamy przecięcie okresów
-            period_start = max(tenant_period_start, dist_period["od"])
-            period_end = min(tenant_period_end, dist_period["do"])
-            
-            if period_start <= period_end:
-                days = self.calculate_days_between(period_start, period_end)
-                overlapping_periods.append({
-                    "period": dist_period,
-                    "days": days,
-                    "start": period_start,
-                    "end": period_end
-                })
-        
-        if not overlapping_periods:
-            return {
-                "energy_cost_net": 0.0,
-                "energy_cost_gross": 0.0,
-                "distribution_cost_net": 0.0,
-                "distribution_cost_gross": 0.0,
-                "fixed_fees_net": 0.0,
-                "fixed_fees_gross": 0.0,
-                "total_net_sum": 0.0,
-                "total_gross_sum": 0.0,
-                "details": []
-            }
-        
-        total_days = sum(op["days"] for op in overlapping_periods)
-        
-        total_energy_cost_net = 0.0
-        total_fixed_fees_net = 0.0
-        details = []
-        vat_rate = 0.23  # VAT 23%
-        
-        for op in overlapping_periods:
-            period = op["period"]
-            days = op["days"]
-            proportion = days / total_days if total_days > 0 else 0
-            
-            # Obliczamy zużycie dla tej części okresu
-            if usage_kwh_calodobowa is not None:
-                # Taryfa całodobowa
-                usage_part = usage_kwh_calodobowa * proportion
-                cena_1kwh = period.get("cena_1kwh_calodobowa", 0) or 0
-                energy_cost_net = usage_part * cena_1kwh
-            else:
-                # Taryfa dwutaryfowa
-                usage_dzienna_part = usage_kwh_dzienna * proportion
-                usage_nocna_part = usage_kwh_nocna * proportion
-                
-                cena_dzienna = period.get("cena_1kwh_dzienna", 0) or 0
-                cena_nocna = period.get("cena_1kwh_nocna", 0) or 0
-                
-                energy_cost_net = (usage_dzienna_part * cena_dzienna) + (usage_nocna_part * cena_nocna)
-            
-            # Opłaty stałe proporcjonalnie (netto)
-            suma_oplat_stalych = period.get("suma_oplat_stalych", 0) or 0
-            fixed_cost_net = suma_oplat_stalych * proportion
-            
-            total_energy_cost_net += energy_cost_net
-            total_fixed_fees_net += fixed_cost_net
-            
-            details.append({
-                "period": period["okres"],
-                "days": days,
-                "proportion": proportion,
-                "energy_cost_net": round(energy_cost_net, 4),
-                "fixed_cost_net": round(fixed_cost_net, 4)
-            })
-        
-        # Oblicz brutto
-        total_energy_cost_gross = round(total_energy_cost_net * (1 + vat_rate), 4)
-        total_fixed_fees_gross = round(total_fixed_fees_net * (1 + vat_rate), 4)
-        
-        # Dla dystrybucji: w obecnej implementacji dystrybucja jest już wliczona w cenę za kWh
-        # (cena_1kwh_dzienna/nocna zawiera już opłaty dystrybucyjne zmienne)
-        # Więc distribution_cost = 0 (już wliczone w energy_cost)
-        distribution_cost_net = 0.0
-        distribution_cost_gross = 0.0
-        
-        total_net_sum = round(total_energy_cost_net + distribution_cost_net + total_fixed_fees_net, 4)
-        total_gross_sum = round(total_energy_cost_gross + distribution_cost_gross + total_fixed_fees_gross, 4)
-        
-        return {
-            "energy_cost_net": round(total_energy_cost_net, 4),
-            "energy_cost_gross": total_energy_cost_gross,
-            "distribution_cost_net": distribution_cost_net,
-            "distribution_cost_gross": distribution_cost_gross,
-            "fixed_fees_net": round(total_fixed_fees_net, 4),
-            "fixed_fees_gross": total_fixed_fees_gross,
-            "total_net_sum": total_net_sum,
-            "total_gross_sum": total_gross_sum,
-            "details": details
-        }
+        # Koszt liczony z sum skumulowanych osi; lista okresów jest układana na osi tylko wtedy,
+        # gdy nie przekazano gotowej osi
+        if isinstance(distribution_periods, TariffTimeline):
+            timeline = distribution_periods
+        else:
+            timeline = TariffTimeline.from_periods(distribution_periods)
+        return timeline.prorate(
+            tenant_period_start,
+            tenant_period_end,
+            usage_kwh_dzienna,
+            usage_kwh_nocna,
+            usage_kwh_calodobowa
+        )
     
     def find_blankiet_for_period(
         self,
@@ -756,128 +475,119 @@ class ElectricityBillingManager:
         Returns:
             Blankiet odpowiadający okresowi lub None
         """
-        # Parsuj okres na datę (pierwszy dzień miesiąca)
-        try:
-            period_date = datetime.strptime(period, '%Y-%m').date()
-        except ValueError:
-            return None
-        
         # Pobierz wszystkie blankiety dla faktury
         blankiety = db.query(ElectricityInvoiceBlankiet).filter(
             ElectricityInvoiceBlankiet.invoice_id == invoice_id
         ).all()
         
-        # Znajdź blankiet, którego okres zawiera datę okresu
-        for blankiet in blankiety:
-            if blankiet.poczatek_podokresu and blankiet.koniec_podokresu:
-                # Sprawdź czy okres rachunku mieści się w podokresie blankietu
-                if blankiet.poczatek_podokresu <= period_date <= blankiet.koniec_podokresu:
-                    return blankiet
-            elif blankiet.poczatek_podokresu:
-                # Jeśli brak końca, sprawdź tylko początek (miesiąc powinien być >= początek)
-                if period_date >= blankiet.poczatek_podokresu:
-                    return blankiet
-        
-        # Jeśli nie znaleziono, zwróć pierwszy blankiet (jako fallback)
-        if blankiety:
-            return blankiety[0]
+        return match_blankiet_for_period(blankiety, period)
+    
+    def find_invoice_for_period(
+        self,
+        db: Session,
+        data: str  # 'YYYY-MM'
+    ) -> Optional[ElectricityInvoice]:
+        """
+        Znajduje fakturę, której okres rozliczeniowy zawiera dany miesiąc.
         
-        return None
+        Okres rozliczeniowy dwumiesięczny zaczyna się początkiem okresu (pierwszy dzień miesiąca),
+        więc miesiąc jest pokryty, jeśli mieści się między miesiącem początku a datą końca faktury.
+        Wyszukiwanie korzysta z indeksu przedziałowego (O(log n)) zamiast skanować wszystkie faktury.
+        
+        Args:
+            db: Sesja bazy danych
+            data: Okres w formacie 'YYYY-MM'
+        
+        Returns:
+            Faktura pokrywająca okres lub None
+        """
+        invoice_id = get_invoice_period_index(db).find_invoice_id(data)
+        if invoice_id is None:
+            return None
+        return db.query(ElectricityInvoice).filter(ElectricityInvoice.id == invoice_id).first()
     
-    def generate_bills_for_period(
+    def build_period_context(
         self,
         db: Session,
         data: str
-    ) -> list[ElectricityBill]:
+    ) -> PeriodContext:
         """
-        Generuje rachunki dla wszystkich lokali w danym okresie.
+        Buduje kontekst okresu: fakturę, model kosztów, odczyty, zużycie,
+        daty okresu najemcy, blankiet i lokale - każde pobierane tylko raz.
         
         Args:
             db: Sesja bazy danych
             data: Data w formacie 'YYYY-MM'
         
         Returns:
-            Lista wygenerowanych rachunków
+            Kontekst okresu
+        
+        Raises:
+            ValueError: Błędny format okresu, brak faktury lub odczytów
         """
-        # Parsuj okres na datę (pierwszy dzień miesiąca)
+        # Sprawdź format okresu
         try:
-            period_date = datetime.strptime(data, '%Y-%m').date()
+            datetime.strptime(data, '%Y-%m')
         except ValueError:
             raise ValueError(f"Nieprawidłowy format okresu: {data}. Oczekiwany format: YYYY-MM")
         
         # Znajdź fakturę, której okres zawiera datę
-        # Okres rozliczeniowy dwumiesięczny zaczyna się początkiem okresu (pierwszy dzień miesiąca)
-        # Więc sprawdzamy czy okres rachunku (pierwszy dzień miesiąca) jest w zakresie faktury
-        invoices = db.query(ElectricityInvoice).all()
-        invoice = None
-        
-        for inv in invoices:
-            # Pobierz pierwszy dzień miesiąca z początku okresu faktury
-            invoice_start_month = inv.data_poczatku_okresu.replace(day=1)
-            
-            # Sprawdź czy okres rachunku (pierwszy dzień miesiąca) jest w zakresie faktury
-            # period_date to już pierwszy dzień miesiąca (z parsowania 'YYYY-MM')
-            if invoice_start_month <= period_date <= inv.data_konca_okresu:
-                invoice = inv
-                break
-        
+        invoice = self.find_invoice_for_period(db, data)
         if not invoice:
             raise ValueError(f"Brak faktury dla okresu {data}")
         
-        # Znajdź blankiet dla okresu
-        blankiet = self.find_blankiet_for_period(db, invoice.id, data)
+        # Pobierz odczyty i oblicz zużycie
+        current = db.query(ElectricityReading).filter(
+            ElectricityReading.data == data
+        ).first()
+        if not current:
+            raise ValueError(f"Brak odczytów dla okresu {data}")
+        previous = get_previous_reading(db, data)
         
-        # Oblicz koszt 1 kWh dla faktury
-        koszty_kwh = calculate_kwh_cost(invoice.id, db)
+        return PeriodContext(
+            data=data,
+            invoice=invoice,
+            cost_model=get_invoice_cost_model(db, invoice.id),
+            current_reading=current,
+            previous_reading=previous,
+            usage_data=calculate_all_usage(current, previous),
+            tenant_period=compute_tenant_period_dates(data, current, previous),
+            blankiet=self.find_blankiet_for_period(db, invoice.id, data),
+            locals=db.query(Local).all()
+        )
+    
+    def compute_period_bills(self, context: PeriodContext) -> List[Dict[str, Any]]:
+        """
+        Oblicza rachunki okresu (lokale i DOM) bez zapytań do bazy.
         
-        # Pobierz dane zużycia
-        usage_data = self.get_usage_for_period(db, data)
-        if not usage_data:
-            raise ValueError(f"Brak odczytów dla okresu {data}")
+        Args:
+            context: Kontekst okresu
         
-        # Pobierz lokale
-        locals = db.query(Local).all()
-        bills = []
+        Returns:
+            Lista słowników z kolumnami ElectricityBill (bez id i pdf_path)
+        """
+        invoice = context.invoice
+        cost_model = context.cost_model
+        usage_data = context.usage_data
+        rows = []
         
-        for local in locals:
+        for local in context.locals:
             # Oblicz koszty
-            costs = self.calculate_bill_costs(invoice, usage_data, local.local, db, data)
-            
-            # Sprawdź czy rachunek już istnieje
-            existing_bill = db.query(ElectricityBill).filter(
-                ElectricityBill.data == data,
-                ElectricityBill.local == local.local
-            ).first()
-            
-            if existing_bill:
-                # Aktualizuj istniejący (w tym invoice_id, bo mogło się zmienić po poprawce logiki)
-                existing_bill.invoice_id = invoice.id
-                existing_bill.usage_kwh = costs['usage_kwh']
-                existing_bill.usage_kwh_dzienna = costs.get('usage_kwh_dzienna')
-                existing_bill.usage_kwh_nocna = costs.get('usage_kwh_nocna')
-                existing_bill.energy_cost_gross = costs['energy_cost_gross']
-                existing_bill.distribution_cost_gross = costs['distribution_cost_gross']
-                existing_bill.total_net_sum = costs['total_net_sum']
-                existing_bill.total_gross_sum = costs['total_gross_sum']
-                bills.append(existing_bill)
-            else:
-                # Utwórz nowy
-                bill = ElectricityBill(
-                    data=data,
-                    local=local.local,
-                    reading_id=None,  # TODO: powiązać z odczytem
-                    invoice_id=invoice.id,
-                    local_id=local.id,
-                    usage_kwh=costs['usage_kwh'],
-                    usage_kwh_dzienna=costs.get('usage_kwh_dzienna'),
-                    usage_kwh_nocna=costs.get('usage_kwh_nocna'),
-                    energy_cost_gross=costs['energy_cost_gross'],
-                    distribution_cost_gross=costs['distribution_cost_gross'],
-                    total_net_sum=costs['total_net_sum'],
-                    total_gross_sum=costs['total_gross_sum']
-                )
-                db.add(bill)
-                bills.append(bill)
+            costs = self.calculate_bill_costs(invoice, usage_data, local.local, None, context.data, context)
+            rows.append({
+                'data': context.data,
+                'local': local.local,
+                'reading_id': None,  # TODO: powiązać z odczytem
+                'invoice_id': invoice.id,
+                'local_id': local.id,
+                'usage_kwh': costs['usage_kwh'],
+                'usage_kwh_dzienna': costs.get('usage_kwh_dzienna'),
+                'usage_kwh_nocna': costs.get('usage_kwh_nocna'),
+                'energy_cost_gross': costs['energy_cost_gross'],
+                'distribution_cost_gross': costs['distribution_cost_gross'],
+                'total_net_sum': costs['total_net_sum'],
+                'total_gross_sum': costs['total_gross_sum']
+            })
         
         # Dodaj rachunek dla całego domu (DOM) - suma wszystkich lokali
         dom_usage = usage_data['dom']['zuzycie_dom_lacznie']
@@ -889,62 +599,285 @@ class ElectricityBillingManager:
             dom_energy_cost_gross = float(invoice.ogolem_sprzedaz_energii)
             dom_distribution_cost_gross = float(invoice.ogolem_usluga_dystrybucji)
             
-            # Oblicz netto (zakładając VAT 23%) - zaokrąglone do 4 miejsc
-            vat_rate = 0.23
+            # Oblicz netto (stawka VAT z faktury) - zaokrąglone do 4 miejsc
+            vat_rate = cost_model.vat_rate
             dom_energy_cost_net = round(dom_energy_cost_gross / (1 + vat_rate), 4)
             dom_distribution_cost_net = round(dom_distribution_cost_gross / (1 + vat_rate), 4)
             
             # Dodaj opłaty stałe dla całego domu (suma dla wszystkich 3 lokali)
             # Opłaty stałe dla DOM = opłaty dla jednego lokalu * 3
-            fixed_fees_dom_gross = self.calculate_fixed_fees_per_local(invoice, db) * 3.0
+            fixed_fees_dom_gross = cost_model.fixed_fees_per_local * 3.0
             fixed_fees_dom_net = round(fixed_fees_dom_gross / (1 + vat_rate), 4)
             
             dom_total_net_sum = round(dom_energy_cost_net + dom_distribution_cost_net + fixed_fees_dom_net, 4)
             dom_total_gross_sum = round(dom_energy_cost_gross + dom_distribution_cost_gross + fixed_fees_dom_gross, 4)
             
             # Zaokrąglij również zużycie i koszty brutto do 4 miejsc
-            dom_usage = round(dom_usage, 4) if dom_usage else 0.0
-            dom_usage_dzienna = round(dom_usage_dzienna, 4) if dom_usage_dzienna is not None else None
-            dom_usage_nocna = round(dom_usage_nocna, 4) if dom_usage_nocna is not None else None
-            dom_energy_cost_gross = round(dom_energy_cost_gross, 4)
-            dom_distribution_cost_gross = round(dom_distribution_cost_gross, 4)
-            
-            # Sprawdź czy rachunek DOM już istnieje
-            existing_dom_bill = db.query(ElectricityBill).filter(
-                ElectricityBill.data == data,
-                ElectricityBill.local == 'dom'
-            ).first()
-            
-            if existing_dom_bill:
+            rows.append({
+                'data': context.data,
+                'local': 'dom',
+                'reading_id': None,
+                'invoice_id': invoice.id,
+                'local_id': None,  # DOM nie ma przypisanego lokalu w tabeli locals
+                'usage_kwh': round(dom_usage, 4),
+                'usage_kwh_dzienna': round(dom_usage_dzienna, 4) if dom_usage_dzienna is not None else None,
+                'usage_kwh_nocna': round(dom_usage_nocna, 4) if dom_usage_nocna is not None else None,
+                'energy_cost_gross': round(dom_energy_cost_gross, 4),
+                'distribution_cost_gross': round(dom_distribution_cost_gross, 4),
+                'total_net_sum': dom_total_net_sum,
+                'total_gross_sum': dom_total_gross_sum
+            })
+        
+        return rows
+    
+    def generate_bills_for_period(
+        self,
+        db: Session,
+        data: str
+    ) -> list[ElectricityBill]:
+        """
+        Generuje rachunki dla wszystkich lokali w danym okresie.
+        
+        Args:
+            db: Sesja bazy danych
+            data: Data w formacie 'YYYY-MM'
+        
+        Returns:
+            Lista wygenerowanych rachunków
+        """
+        # Kontekst okresu (faktura, model kosztów, odczyty, zużycie, lokale) - budowany raz
+        context = self.build_period_context(db, data)
+        
+        # Istniejące rachunki okresu (w tym DOM) - jedno zapytanie zamiast jednego na lokal
+        existing_bills: Dict[str, ElectricityBill] = {}
+        for bill in db.query(ElectricityBill).filter(
+            ElectricityBill.data == data
+        ).order_by(ElectricityBill.id).all():
+            existing_bills.setdefault(bill.local, bill)
+        bills = []
+        
+        for row in self.compute_period_bills(context):
+            existing_bill = existing_bills.get(row['local'])
+            if existing_bill:
                 # Aktualizuj istniejący (w tym invoice_id, bo mogło się zmienić po poprawce logiki)
-                existing_dom_bill.invoice_id = invoice.id
-                existing_dom_bill.usage_kwh = dom_usage
-                existing_dom_bill.usage_kwh_dzienna = dom_usage_dzienna
-                existing_dom_bill.usage_kwh_nocna = dom_usage_nocna
-                existing_dom_bill.energy_cost_gross = dom_energy_cost_gross
-                existing_dom_bill.distribution_cost_gross = dom_distribution_cost_gross
-                existing_dom_bill.total_net_sum = dom_total_net_sum
-                existing_dom_bill.total_gross_sum = dom_total_gross_sum
-                bills.append(existing_dom_bill)
+                for column in BILL_UPDATE_COLUMNS:
+                    setattr(existing_bill, column, row[column])
+                bills.append(existing_bill)
             else:
-                # Utwórz nowy rachunek dla DOM
-                dom_bill = ElectricityBill(
-                    data=data,
-                    local='dom',
-                    reading_id=None,
-                    invoice_id=invoice.id,
-                    local_id=None,  # DOM nie ma przypisanego lokalu w tabeli locals
-                    usage_kwh=dom_usage,
-                    usage_kwh_dzienna=dom_usage_dzienna,
-                    usage_kwh_nocna=dom_usage_nocna,
-                    energy_cost_gross=dom_energy_cost_gross,
-                    distribution_cost_gross=dom_distribution_cost_gross,
-                    total_net_sum=dom_total_net_sum,
-                    total_gross_sum=dom_total_gross_sum
-                )
-                db.add(dom_bill)
-                bills.append(dom_bill)
+                # Utwórz nowy
+                bill = ElectricityBill(**row)
+                db.add(bill)
+                bills.append(bill)
         
         db.commit()
         return bills
-
+    
+    def build_period_contexts(
+        self,
+        db: Session,
+        periods: Optional[Iterable[str]] = None
+    ) -> Tuple[List[PeriodContext], Dict[str, str]]:
+        """
+        Buduje konteksty wielu okresów naraz.
+        
+        Odczyty są wczytywane raz i sortowane, więc poprzedni odczyt to sąsiad na liście;
+        faktury, modele kosztów, blankiety i lokale - po jednym zapytaniu dla wszystkich okresów.
+        
+        Args:
+            db: Sesja bazy danych
+            periods: Okresy 'YYYY-MM' do rozliczenia lub None dla wszystkich okresów z odczytami
+        
+        Returns:
+            Tuple (konteksty w kolejności okresów, {okres: komunikat błędu} dla pominiętych)
+        """
+        readings = db.query(ElectricityReading).order_by(ElectricityReading.data).all()
+        wanted = None if periods is None else set(periods)
+        index = get_invoice_period_index(db)
+        errors: Dict[str, str] = {}
+        
+        selected = []
+        for position, current in enumerate(readings):
+            if wanted is not None and current.data not in wanted:
+                continue
+            invoice_id = index.find_invoice_id(current.data)
+            if invoice_id is None:
+                errors[current.data] = f"Brak faktury dla okresu {current.data}"
+                continue
+            previous = readings[position - 1] if position > 0 else None
+            selected.append((current, previous, invoice_id))
+        
+        if wanted is not None:
+            for data in sorted(wanted - {reading.data for reading in readings}):
+                errors[data] = f"Brak odczytów dla okresu {data}"
+        
+        invoice_ids = {invoice_id for _, _, invoice_id in selected}
+        invoices = {
+            invoice.id: invoice
+            for invoice in db.query(ElectricityInvoice).filter(ElectricityInvoice.id.in_(invoice_ids)).all()
+        } if invoice_ids else {}
+        cost_models = get_invoice_cost_models(db, invoice_ids)
+        blankiety_by_invoice: Dict[int, List[ElectricityInvoiceBlankiet]] = {}
+        if invoice_ids:
+            for blankiet in db.query(ElectricityInvoiceBlankiet).filter(
+                ElectricityInvoiceBlankiet.invoice_id.in_(invoice_ids)
+            ).order_by(ElectricityInvoiceBlankiet.id).all():
+                blankiety_by_invoice.setdefault(blankiet.invoice_id, []).append(blankiet)
+        locals_list = db.query(Local).all()
+        
+        contexts = [
+            PeriodContext(
+                data=current.data,
+                invoice=invoices[invoice_id],
+                cost_model=cost_models[invoice_id],
+                current_reading=current,
+                previous_reading=previous,
+                usage_data=calculate_all_usage(current, previous),
+                tenant_period=compute_tenant_period_dates(current.data, current, previous),
+                blankiet=match_blankiet_for_period(blankiety_by_invoice.get(invoice_id, []), current.data),
+                locals=locals_list
+            )
+            for current, previous, invoice_id in selected
+        ]
+        return contexts, errors
+    
+    def upsert_bills(
+        self,
+        db: Session,
+        rows: List[Dict[str, Any]],
+        reset_pdf: bool = False
+    ) -> Dict[str, int]:
+        """
+        Zapisuje rachunki zbiorczo: jedno UPDATE (executemany po ID) dla istniejących
+        rachunków (okres, lokal) i jedno INSERT dla nowych. Bez commita.
+        
+        Args:
+            db: Sesja bazy danych
+            rows: Wiersze z compute_period_bills
+            reset_pdf: Czy wyczyścić pdf_path aktualizowanych rachunków (PDF jest nieaktualny)
+        
+        Returns:
+            Słownik {'inserted': n, 'updated': n}
+        """
+        periods = {row['data'] for row in rows}
+        existing_ids: Dict[Tuple[str, str], int] = {}
+        if periods:
+            for bill_id, data, local in db.query(
+                ElectricityBill.id, ElectricityBill.data, ElectricityBill.local
+            ).filter(ElectricityBill.data.in_(periods)).order_by(ElectricityBill.id).all():
+                existing_ids.setdefault((data, local), bill_id)
+        
+        updates = []
+        inserts = []
+        for row in rows:
+            bill_id = existing_ids.get((row['data'], row['local']))
+            if bill_id is None:
+                inserts.append(row)
+                continue
+            values = {column: row[column] for column in BILL_UPDATE_COLUMNS}
+            values['id'] = bill_id
+            if reset_pdf:
+                values['pdf_path'] = None
+            updates.append(values)
+        
+        if updates:
+            db.execute(update(ElectricityBill), updates)
+        if inserts:
+            # render_nulls - wiersze z None (np. DOM bez local_id) w tej samej partii executemany
+            db.execute(insert(ElectricityBill).execution_options(render_nulls=True), inserts)
+        return {'inserted': len(inserts), 'updated': len(updates)}
+    
+    def generate_all_bills(
+        self,
+        db: Session,
+        periods: Optional[Iterable[str]] = None,
+        reset_pdf: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Generuje rachunki dla wielu okresów naraz.
+        
+        Konteksty okresów są budowane wspólnie (build_period_contexts), obliczenia
+        okresów wykonywane bez zapytań do bazy, a wszystkie rachunki (w tym DOM)
+        zapisywane zbiorczo w jednej transakcji. Obliczenia idą w bieżącym wątku:
+        są krótkie wobec wczytania danych, a konteksty trzymają obiekty ORM sesji,
+        której nie można używać z wielu wątków.
+        
+        Args:
+            db: Sesja bazy danych
+            periods: Okresy 'YYYY-MM' lub None dla wszystkich okresów z odczytami
+            reset_pdf: Czy wyczyścić pdf_path aktualizowanych rachunków
+        
+        Returns:
+            Słownik ze statystykami generowania
+        """
+        contexts, errors = self.build_period_contexts(db, periods)
+        
+        rows = [row for context in contexts for row in self.compute_period_bills(context)]
+        counts = self.upsert_bills(db, rows, reset_pdf=reset_pdf)
+        db.commit()
+        
+        return {
+            "periods_processed": [context.data for context in contexts],
+            "bills_count": len(rows),
+            "bills_inserted": counts['inserted'],
+            "bills_updated": counts['updated'],
+            "errors": [errors[data] for data in sorted(errors)]
+        }
+    
+    def regenerate_bills_range(
+        self,
+        db: Session,
+        start: str,
+        end: str
+    ) -> Dict[str, Any]:
+        """
+        Przelicza rachunki dla okresów od start do end (włącznie).
+        
+        Rachunki są aktualizowane w miejscu, a ich pliki PDF usuwane (są nieaktualne) -
+        dopiero po zatwierdzeniu przeliczenia, więc błąd obliczeń nie zostawia rachunków bez PDF.
+        
+        Args:
+            db: Sesja bazy danych
+            start: Pierwszy okres 'YYYY-MM'
+            end: Ostatni okres 'YYYY-MM'
+        
+        Returns:
+            Słownik ze statystykami generowania
+        
+        Raises:
+            ValueError: Błędny format lub kolejność okresów
+        """
+        for period in (start, end):
+            try:
+                datetime.strptime(period, '%Y-%m')
+            except ValueError:
+                raise ValueError(f"Nieprawidłowy format okresu: {period}. Oczekiwany format: YYYY-MM")
+        if start > end:
+            raise ValueError(f"Początek zakresu {start} jest po jego końcu {end}")
+        
+        periods = [
+            data for (data,) in db.query(ElectricityReading.data).filter(
+                ElectricityReading.data >= start,
+                ElectricityReading.data <= end
+            ).all()
+        ]
+        
+        # Pliki PDF przeliczanych rachunków (pdf_path jest czyszczony w tej samej transakcji)
+        pdf_paths = db.query(ElectricityBill.data, ElectricityBill.pdf_path).filter(
+            ElectricityBill.data.in_(periods),
+            ElectricityBill.pdf_path.isnot(None)
+        ).all() if periods else []
+        
+        result = self.generate_all_bills(db, periods, reset_pdf=True)
+        
+        # Usuń nieaktualne pliki PDF przeliczonych okresów - po commicie, gdy rachunki już na nie nie wskazują
+        processed = set(result["periods_processed"])
+        for data, pdf_path in pdf_paths:
+            if data not in processed:
+                continue
+            if Path(pdf_path).exists():
+                try:
+                    Path(pdf_path).unlink()
+                except Exception:
+                    pass  # Ignoruj błędy usuwania plików
+        
+        return result
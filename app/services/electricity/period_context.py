@@ -0,0 +1,83 @@
+"""
+Kontekst rozliczenia okresu prądu.
+
+Zbiera raz na okres wszystko, czego potrzebują obliczenia rachunków lokali
+(odczyty, zużycie, daty okresu najemcy, model kosztów faktury, blankiet, lokale),
+dzięki czemu liczba zapytań na okres nie zależy od liczby lokali.
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.electricity import ElectricityReading
+from app.models.electricity_invoice import ElectricityInvoice, ElectricityInvoiceBlankiet
+from app.models.water import Local
+from app.services.electricity.cost_model import InvoiceCostModel
+
+
+@dataclass(frozen=True)
+class PeriodContext:
+    """
+    Dane okresu rozliczeniowego wspólne dla wszystkich lokali.
+
+    Attributes:
+        data: Okres w formacie 'YYYY-MM'
+        invoice: Faktura pokrywająca okres
+        cost_model: Model kosztów faktury
+        current_reading: Odczyt z okresu
+        previous_reading: Poprzedni odczyt (lub None dla pierwszego odczytu)
+        usage_data: Zużycie lokali (wynik calculate_all_usage)
+        tenant_period: Daty (początek, koniec) okresu najemcy
+        blankiet: Blankiet faktury dla okresu (lub None)
+        locals: Lokale do rozliczenia
+    """
+    data: str
+    invoice: ElectricityInvoice
+    cost_model: InvoiceCostModel
+    current_reading: ElectricityReading
+    previous_reading: Optional[ElectricityReading]
+    usage_data: Dict[str, Any]
+    tenant_period: Tuple[date, date]
+    blankiet: Optional[ElectricityInvoiceBlankiet]
+    locals: List[Local]
+
+
+def compute_tenant_period_dates(
+    data: str,
+    current: ElectricityReading,
+    previous: Optional[ElectricityReading]
+) -> Tuple[date, date]:
+    """
+    Określa daty początku i końca okresu najemcy na podstawie odczytów.
+
+    Args:
+        data: Okres w formacie 'YYYY-MM'
+        current: Odczyt z okresu
+        previous: Poprzedni odczyt lub None
+
+    Returns:
+        Tuple (start_date, end_date)
+    """
+    # Okres najemcy kończy się w dacie odczytu obecnego
+    if current.data_odczytu_licznika:
+        end_date = current.data_odczytu_licznika
+    else:
+        # Fallback: parsujemy datę z formatu 'YYYY-MM'
+        year, month = map(int, data.split('-'))
+        # Zakładamy, że odczyty są około 10. dnia miesiąca
+        end_date = date(year, month, 10)
+
+    # Okres najemcy zaczyna się dzień po dacie odczytu poprzedniego
+    if previous and previous.data_odczytu_licznika:
+        start_date = previous.data_odczytu_licznika + timedelta(days=1)
+    elif previous:
+        # Fallback: parsujemy datę z formatu 'YYYY-MM'
+        year, month = map(int, previous.data.split('-'))
+        start_date = date(year, month, 10) + timedelta(days=1)
+    else:
+        # Pierwszy odczyt - okres zaczyna się pierwszego dnia miesiąca
+        year, month = map(int, data.split('-'))
+        start_date = date(year, month, 1)
+
+    return (start_date, end_date)
@@ -0,0 +1,714 @@
+"""
+Oś taryfowa faktury prądu - ciągłe przedziały dat z cenami netto 1 kWh dla stref,
+opłatami stałymi i stawką VAT.
+
+Oś jest trzymana jako zwarte tablice (array) z sumami skumulowanymi po dniach,
+więc koszt dowolnego okresu najemcy liczy się kilkoma wyszukiwaniami bisect - O(log n),
+niezależnie od liczby przedziałów. Oś jest zapisywana w tabeli
+electricity_invoice_tariff_timelines i przebudowywana przy commicie,
+jeśli zmieniła się faktura, jej sprzedaż energii lub opłaty dystrybucyjne.
+"""
+
+import bisect
+import math
+from array import array
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+from sqlalchemy.orm import Session
+
+from app.core.change_tracking import on_before_commit, pending_changes
+from app.models.electricity_invoice import (
+    ElectricityInvoice,
+    ElectricityInvoiceSprzedazEnergii,
+    ElectricityInvoiceOplataDystrybucyjna,
+    ElectricityInvoiceTariffTimeline
+)
+
+# Stawka VAT, gdy pozycje faktury jej nie podają
+DEFAULT_VAT_RATE = 0.23
+
+# Klucz w session.info ze zbiorem ID faktur, których oś trzeba przebudować
+_PENDING_KEY = "tariff_timeline_invoices"
+# Znacznik "przebuduj wszystkie" (masowe zapisy bez znanych ID faktur)
+_ALL = "*"
+
+_SOURCE_TABLES = (
+    "electricity_invoice_sprzedaz_energii",
+    "electricity_invoice_oplaty_dystrybucyjne",
+)
+
+_KEYS = ("dzienna", "nocna", "calodobowa", "fixed")
+
+
+def _vat_rate(*row_groups: Iterable[Any]) -> float:
+    """Zwraca stawkę VAT (ułamek) z pierwszej pozycji faktury, która ją podaje."""
+    for rows in row_groups:
+        for row in rows:
+            if row.vat_procent is not None:
+                return float(row.vat_procent) / 100.0
+    return DEFAULT_VAT_RATE
+
+
+def _to_price(value: Optional[float]) -> float:
+    """None (brak ceny dla strefy) jest zapisywane jako NaN."""
+    return math.nan if value is None else float(value)
+
+
+def _from_price(value: float) -> Optional[float]:
+    """NaN z tablicy cen zamienia z powrotem na None."""
+    return None if math.isnan(value) else value
+
+
+def _cumulative(days: Sequence[int], values: Sequence[float]) -> array:
+    """Sumy skumulowane days[i] * values[i] (NaN liczone jako 0), długość n + 1."""
+    result = array('d', [0.0])
+    total = 0.0
+    for d, v in zip(days, values):
+        if not math.isnan(v):
+            total += d * v
+        result.append(total)
+    return result
+
+
+def _unpack(typecode: str, data: bytes) -> array:
+    """Odtwarza tablicę zapisaną przez array.tobytes()."""
+    values = array(typecode)
+    values.frombytes(data)
+    return values
+
+
+class TariffTimeline:
+    """
+    Ciągła oś przedziałów cenowych faktury.
+
+    Przedział i obejmuje dni od starts[i] do starts[i + 1] - 1 (ostatni do end).
+    Przedziały z wagą 0 to luki (dni bez cen) - nie liczą się do proporcji,
+    tak jak dni poza okresami faktury w dotychczasowym liczeniu.
+    """
+
+    def __init__(
+        self,
+        starts: Sequence[int],
+        end: int,
+        prices_dzienna: Sequence[float],
+        prices_nocna: Sequence[float],
+        prices_calodobowa: Sequence[float],
+        fixed_fees: Sequence[float],
+        vat_rates: Sequence[float],
+        weights: Optional[Sequence[int]] = None
+    ):
+        """
+        Args:
+            starts: Początki przedziałów (date.toordinal()), rosnąco
+            end: Ostatni dzień osi (date.toordinal(), włącznie)
+            prices_dzienna, prices_nocna, prices_calodobowa: Ceny 1 kWh netto (NaN = brak)
+            fixed_fees: Suma opłat stałych netto przedziału (zł/mc)
+            vat_rates: Stawka VAT przedziału (ułamek)
+            weights: 1 dla przedziału z ceną z faktury, 0 dla luki (domyślnie same 1)
+        """
+        self.starts = array('i', starts)
+        self.end = end
+        self.vat_rates = array('d', vat_rates)
+        self.weights = array('b', weights if weights is not None else [1] * len(self.starts))
+        self._values = {
+            "dzienna": array('d', prices_dzienna),
+            "nocna": array('d', prices_nocna),
+            "calodobowa": array('d', prices_calodobowa),
+            "fixed": array('d', fixed_fees),
+        }
+        self._gross_values = {
+            key: array('d', [v * (1 + vat) for v, vat in zip(values, self.vat_rates)])
+            for key, values in self._values.items()
+        }
+
+        n = len(self.starts)
+        self._days = [
+            ((self.starts[i + 1] if i + 1 < n else end + 1) - self.starts[i]) * self.weights[i]
+            for i in range(n)
+        ]
+        self._ones = array('d', [1.0] * n)
+        self._cum_days = _cumulative(self._days, self._ones)
+        self._cum_net = {key: _cumulative(self._days, self._values[key]) for key in _KEYS}
+        self._cum_gross = {key: _cumulative(self._days, self._gross_values[key]) for key in _KEYS}
+
+        # Etykiety przedziałów z cenami (luki nie mają etykiety)
+        self._labels: List[Optional[str]] = []
+        count = 0
+        for weight in self.weights:
+            if weight:
+                count += 1
+                self._labels.append(f"OKRES_DYSTRYBUCYJNY_{count}")
+            else:
+                self._labels.append(None)
+
+        real_rates = {rate for rate, weight in zip(self.vat_rates, self.weights) if weight}
+        # Jedna stawka na całej osi - brutto liczone jak dotąd: netto * (1 + VAT)
+        self.uniform_vat_rate: Optional[float] = real_rates.pop() if len(real_rates) == 1 else None
+
+    @property
+    def segment_count(self) -> int:
+        """Liczba przedziałów z cenami (bez luk)."""
+        return sum(self.weights)
+
+    @property
+    def vat_rate(self) -> float:
+        """Stawka VAT osi (jedna stawka lub średnia ważona dniami; domyślnie 23%)."""
+        if self.uniform_vat_rate is not None:
+            return self.uniform_vat_rate
+        total_days = self._cum_days[-1]
+        if not total_days:
+            return DEFAULT_VAT_RATE
+        return sum(d * rate for d, rate in zip(self._days, self.vat_rates)) / total_days
+
+    @classmethod
+    def from_periods(
+        cls,
+        periods: Iterable[Mapping[str, Any]],
+        default_vat_rate: float = DEFAULT_VAT_RATE
+    ) -> "TariffTimeline":
+        """
+        Buduje oś z listy okresów (format get_distribution_periods).
+
+        Okresy są sortowane po dacie początku; dni między okresami stają się lukami,
+        a okresy puste (od > do) są pomijane.
+        """
+        starts: List[int] = []
+        rows: List[Tuple[float, float, float, float, float]] = []
+        weights: List[int] = []
+        end: Optional[int] = None
+        for period in sorted(periods, key=lambda p: p["od"]):
+            start = period["od"].toordinal()
+            stop = period["do"].toordinal()
+            if end is not None:
+                if start > end + 1:
+                    starts.append(end + 1)
+                    rows.append((math.nan, math.nan, math.nan, math.nan, default_vat_rate))
+                    weights.append(0)
+                start = max(start, end + 1)
+            if start > stop:
+                continue
+            starts.append(start)
+            rows.append((
+                _to_price(period.get("cena_1kwh_dzienna")),
+                _to_price(period.get("cena_1kwh_nocna")),
+                _to_price(period.get("cena_1kwh_calodobowa")),
+                float(period.get("suma_oplat_stalych") or 0.0),
+                float(period.get("vat_rate", default_vat_rate)),
+            ))
+            weights.append(1)
+            end = stop
+        columns = list(zip(*rows)) if rows else [(), (), (), (), ()]
+        return cls(starts, end if end is not None else 0, *columns, weights=weights)
+
+    @classmethod
+    def from_record(cls, record: ElectricityInvoiceTariffTimeline) -> "TariffTimeline":
+        """Odczytuje oś zapisaną w tabeli electricity_invoice_tariff_timelines."""
+        fixed_fees = _unpack('d', record.fixed_fees)
+        return cls(
+            _unpack('i', record.segment_starts),
+            record.end_date.toordinal(),
+            _unpack('d', record.prices_dzienna),
+            _unpack('d', record.prices_nocna),
+            _unpack('d', record.prices_calodobowa),
+            fixed_fees,
+            _unpack('d', record.vat_rates),
+            # Luki mają opłatę stałą NaN (przedziały z faktury zawsze mają liczbę)
+            weights=[0 if math.isnan(fee) else 1 for fee in fixed_fees]
+        )
+
+    def to_record_values(self) -> Dict[str, Any]:
+        """Zwraca wartości kolumn rekordu osi (tablice zapisane jako bajty)."""
+        return {
+            "end_date": date.fromordinal(self.end) if self.end else date.min,
+            "segment_starts": self.starts.tobytes(),
+            "prices_dzienna": self._values["dzienna"].tobytes(),
+            "prices_nocna": self._values["nocna"].tobytes(),
+            "prices_calodobowa": self._values["calodobowa"].tobytes(),
+            "fixed_fees": self._values["fixed"].tobytes(),
+            "vat_rates": self.vat_rates.tobytes(),
+        }
+
+    def _stop(self, i: int) -> int:
+        """Ostatni dzień przedziału i."""
+        return self.starts[i + 1] - 1 if i + 1 < len(self.starts) else self.end
+
+    def periods(self) -> List[Dict[str, Any]]:
+        """Zwraca przedziały z cenami w formacie get_distribution_periods (z kluczem vat_rate)."""
+        return [
+            {
+                "okres": self._labels[i],
+                "od": date.fromordinal(self.starts[i]),
+                "do": date.fromordinal(self._stop(i)),
+                "cena_1kwh_dzienna": _from_price(self._values["dzienna"][i]),
+                "cena_1kwh_nocna": _from_price(self._values["nocna"][i]),
+                "cena_1kwh_calodobowa": _from_price(self._values["calodobowa"][i]),
+                "suma_oplat_stalych": self._values["fixed"][i],
+                "vat_rate": self.vat_rates[i],
+            }
+            for i in range(len(self.starts))
+            if self.weights[i]
+        ]
+
+    def _integral(self, cumulative: array, values: Sequence[float], day: int) -> float:
+        """Suma (dni * wartość) od początku osi do dnia day (wyłącznie) - bisect."""
+        i = bisect.bisect_right(self.starts, day) - 1
+        if i < 0:
+            return 0.0
+        value = values[i]
+        if not self.weights[i] or math.isnan(value):
+            return cumulative[i]
+        return cumulative[i] + (day - self.starts[i]) * value
+
+    def _window(self, start: date, end: date) -> Optional[Tuple[int, int]]:
+        """Przycina okres do osi; zwraca (pierwszy dzień, dzień po ostatnim) lub None."""
+        if not len(self.starts):
+            return None
+        lo = max(start.toordinal(), self.starts[0])
+        hi = min(end.toordinal(), self.end) + 1
+        return (lo, hi) if lo < hi else None
+
+    def _sum(self, key: str, lo: int, hi: int, gross: bool = False) -> float:
+        """Suma (dni * wartość) w przedziale dni [lo, hi)."""
+        cumulative = (self._cum_gross if gross else self._cum_net)[key]
+        values = (self._gross_values if gross else self._values)[key]
+        return self._integral(cumulative, values, hi) - self._integral(cumulative, values, lo)
+
+    def _covered_days(self, lo: int, hi: int) -> float:
+        """Liczba dni z cenami w przedziale dni [lo, hi)."""
+        return self._integral(self._cum_days, self._ones, hi) - self._integral(self._cum_days, self._ones, lo)
+
+    def average_prices(self, start: date, end: date) -> Dict[str, Optional[float]]:
+        """
+        Zwraca średnie (ważone dniami) ceny 1 kWh netto i opłaty stałe dla okresu.
+
+        Args:
+            start: Pierwszy dzień okresu
+            end: Ostatni dzień okresu (włącznie)
+
+        Returns:
+            Słownik {'dzienna', 'nocna', 'calodobowa', 'fixed', 'days'}; None gdy okres poza osią
+        """
+        window = self._window(start, end)
+        days = self._covered_days(*window) if window else 0
+        if not days:
+            return {key: None for key in _KEYS} | {"days": 0}
+        lo, hi = window
+        return {key: round(self._sum(key, lo, hi) / days, 4) for key in _KEYS} | {"days": int(days)}
+
+    def prorate(
+        self,
+        tenant_period_start: date,
+        tenant_period_end: date,
+        usage_kwh_dzienna: float,
+        usage_kwh_nocna: float,
+        usage_kwh_calodobowa: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Oblicza koszty okresu najemcy proporcjonalnie do dni w przedziałach osi.
+
+        Zużycie jest dzielone proporcjonalnie do liczby dni pokrytych przez każdy przedział,
+        a opłaty stałe liczone jako średnia ważona dniami (jak w
+        calculate_bill_for_period_with_overlapping). Sumy pochodzą z tablic skumulowanych.
+
+        Returns:
+            Słownik z kosztami netto i brutto oraz szczegółami dla przedziałów
+        """
+        window = self._window(tenant_period_start, tenant_period_end)
+        total_days = self._covered_days(*window) if window else 0
+        if not total_days:
+            return {
+                "energy_cost_net": 0.0,
+                "energy_cost_gross": 0.0,
+                "distribution_cost_net": 0.0,
+                "distribution_cost_gross": 0.0,
+                "fixed_fees_net": 0.0,
+                "fixed_fees_gross": 0.0,
+                "total_net_sum": 0.0,
+                "total_gross_sum": 0.0,
+                "details": []
+            }
+        lo, hi = window
+
+        def energy(gross: bool) -> float:
+            if usage_kwh_calodobowa is not None:
+                return usage_kwh_calodobowa * self._sum("calodobowa", lo, hi, gross) / total_days
+            return (
+                usage_kwh_dzienna * self._sum("dzienna", lo, hi, gross)
+                + usage_kwh_nocna * self._sum("nocna", lo, hi, gross)
+            ) / total_days
+
+        energy_cost_net = energy(gross=False)
+        fixed_fees_net = self._sum("fixed", lo, hi) / total_days
+        if self.uniform_vat_rate is not None:
+            energy_cost_gross = round(energy_cost_net * (1 + self.uniform_vat_rate), 4)
+            fixed_fees_gross = round(fixed_fees_net * (1 + self.uniform_vat_rate), 4)
+        else:
+            energy_cost_gross = round(energy(gross=True), 4)
+            fixed_fees_gross = round(self._sum("fixed", lo, hi, gross=True) / total_days, 4)
+
+        # Szczegóły dla przedziałów pokrywających się z okresem najemcy
+        details = []
+        first = bisect.bisect_right(self.starts, lo) - 1
+        last = bisect.bisect_right(self.starts, hi - 1) - 1
+        for i in range(first, last + 1):
+            if not self.weights[i]:
+                continue
+            days = min(self._stop(i), hi - 1) - max(self.starts[i], lo) + 1
+            proportion = days / total_days
+            if usage_kwh_calodobowa is not None:
+                cena = _from_price(self._values["calodobowa"][i]) or 0
+                period_energy = usage_kwh_calodobowa * proportion * cena
+            else:
+                cena_dzienna = _from_price(self._values["dzienna"][i]) or 0
+                cena_nocna = _from_price(self._values["nocna"][i]) or 0
+                period_energy = (usage_kwh_dzienna * proportion * cena_dzienna) + (usage_kwh_nocna * proportion * cena_nocna)
+            details.append({
+                "period": self._labels[i],
+                "days": days,
+                "proportion": proportion,
+                "energy_cost_net": round(period_energy, 4),
+                "fixed_cost_net": round(self._values["fixed"][i] * proportion, 4)
+            })
+
+        # Dystrybucja jest wliczona w cenę za kWh (cena_1kwh_* zawiera opłaty zmienne)
+        return {
+            "energy_cost_net": round(energy_cost_net, 4),
+            "energy_cost_gross": energy_cost_gross,
+            "distribution_cost_net": 0.0,
+            "distribution_cost_gross": 0.0,
+            "fixed_fees_net": round(fixed_fees_net, 4),
+            "fixed_fees_gross": fixed_fees_gross,
+            "total_net_sum": round(energy_cost_net + fixed_fees_net, 4),
+            "total_gross_sum": round(energy_cost_gross + fixed_fees_gross, 4),
+            "details": details
+        }
+
+
+# Maksymalna rozsądna cena 1 kWh (zł); wyższa to zwykle należność wpisana zamiast ceny
+MAX_REASONABLE_PRICE_PER_KWH = 5.0
+
+
+def group_energy_sales(
+    typ_taryfy: str,
+    sprzedaz: Sequence[ElectricityInvoiceSprzedazEnergii]
+) -> List[Dict[str, ElectricityInvoiceSprzedazEnergii]]:
+    """
+    Grupuje pozycje sprzedaży energii po kolejności w okresy dystrybucyjne.
+
+    Dla taryfy dwustrefowej okres to para {"dzienna", "nocna"}, dla pozostałych
+    pojedyncza pozycja {"calodobowa"}.
+    """
+    if typ_taryfy != "DWUTARYFOWA":
+        return [{"calodobowa": s} for s in sprzedaz]
+    grouped = []
+    i = 0
+    while i < len(sprzedaz):
+        dzienna = None
+        nocna = None
+        if i < len(sprzedaz) and sprzedaz[i].strefa == "DZIENNA":
+            dzienna = sprzedaz[i]
+            i += 1
+        if i < len(sprzedaz) and sprzedaz[i].strefa == "NOCNA":
+            nocna = sprzedaz[i]
+            i += 1
+        if dzienna or nocna:
+            grouped.append({"dzienna": dzienna, "nocna": nocna})
+        else:
+            # Pozycja bez strefy dziennej/nocnej - pomijana
+            i += 1
+    return grouped
+
+
+def _energy_price(pozycja: Optional[ElectricityInvoiceSprzedazEnergii]) -> Optional[float]:
+    """Cena 1 kWh netto pozycji sprzedaży (z należności, gdy cena jest nierealnie wysoka)."""
+    if not pozycja or not pozycja.ilosc_kwh > 0:
+        return None
+    cena_raw = float(pozycja.cena_za_kwh)
+    if cena_raw <= MAX_REASONABLE_PRICE_PER_KWH:
+        return cena_raw
+    cena_z_naleznosci = float(pozycja.naleznosc) / float(pozycja.ilosc_kwh)
+    return cena_z_naleznosci if cena_z_naleznosci <= MAX_REASONABLE_PRICE_PER_KWH else cena_raw
+
+
+def build_distribution_periods(
+    data_poczatku_okresu: date,
+    typ_taryfy: str,
+    oplaty: Sequence[ElectricityInvoiceOplataDystrybucyjna],
+    sprzedaz: Sequence[ElectricityInvoiceSprzedazEnergii]
+) -> List[Dict[str, Any]]:
+    """
+    Wyłania okresy z faktury, gdzie mogą być różne ceny.
+
+    Jedyne miejsce wyznaczania okresów: oś taryfowa (a przez nią model kosztów
+    i ElectricityBillingManager.get_distribution_periods) powstaje z tej listy.
+
+    Args:
+        data_poczatku_okresu: Data początku okresu faktury
+        typ_taryfy: Typ taryfy faktury
+        oplaty: Opłaty dystrybucyjne posortowane po dacie
+        sprzedaz: Sprzedaż energii posortowana po dacie
+
+    Returns:
+        Lista słowników z okresami (od, do, ceny 1 kWh netto, suma opłat stałych netto,
+        stawka VAT z pozycji faktury)
+    """
+    periods = []
+    if not oplaty:
+        return periods
+
+    # Grupujemy opłaty po datach (okresach)
+    unique_dates = sorted(set(o.data for o in oplaty if o.data))
+
+    if not unique_dates:
+        return periods
+
+    sprzedaz_grouped = group_energy_sales(typ_taryfy, sprzedaz)
+
+    # Pierwszy okres zaczyna się w dniu początku okresu rozliczeniowego faktury
+    current_start = data_poczatku_okresu
+
+    for i, dist_date in enumerate(unique_dates):
+        dist_period_end = dist_date
+        sprzedaz_period = sprzedaz_grouped[i] if i < len(sprzedaz_grouped) else {}
+        oplaty_period = [o for o in oplaty if o.data == dist_date]
+
+        # Ceny z sprzedaży energii
+        cena_dzienna = _energy_price(sprzedaz_period.get("dzienna"))
+        cena_nocna = _energy_price(sprzedaz_period.get("nocna"))
+        cena_calodobowa = _energy_price(sprzedaz_period.get("calodobowa"))
+
+        # Opłaty dystrybucyjne zmienne (za kWh)
+        oplata_jakosciowa_dzienna = None
+        oplata_jakosciowa_nocna = None
+        oplata_zmienna_sieciowa_dzienna = None
+        oplata_zmienna_sieciowa_nocna = None
+        oplata_oze_dzienna = None
+        oplata_oze_nocna = None
+        oplata_kogeneracyjna_dzienna = None
+        oplata_kogeneracyjna_nocna = None
+
+        # Opłaty stałe (za miesiąc)
+        oplata_stala_sieciowa = None
+        oplata_przejściowa = None
+        oplata_abonamentowa = None
+        oplata_mocowa = None
+
+        for o in oplaty_period:
+            typ_oplaty_upper = o.typ_oplaty.upper()
+            if o.jednostka == "kWh":
+                if "JAKOŚCIOWA" in typ_oplaty_upper or "JAKOSCIOWA" in typ_oplaty_upper:
+                    if o.strefa == "DZIENNA":
+                        oplata_jakosciowa_dzienna = float(o.cena)
+                    elif o.strefa == "NOCNA":
+                        oplata_jakosciowa_nocna = float(o.cena)
+                elif "ZMIENNA SIECIOWA" in typ_oplaty_upper:
+                    if o.strefa == "DZIENNA":
+                        oplata_zmienna_sieciowa_dzienna = float(o.cena)
+                    elif o.strefa == "NOCNA":
+                        oplata_zmienna_sieciowa_nocna = float(o.cena)
+                elif "OZE" in typ_oplaty_upper:
+                    if o.strefa == "DZIENNA":
+                        oplata_oze_dzienna = float(o.cena)
+                    elif o.strefa == "NOCNA":
+                        oplata_oze_nocna = float(o.cena)
+                elif "KOGENERACYJNA" in typ_oplaty_upper:
+                    if o.strefa == "DZIENNA":
+                        oplata_kogeneracyjna_dzienna = float(o.cena)
+                    elif o.strefa == "NOCNA":
+                        oplata_kogeneracyjna_nocna = float(o.cena)
+            elif o.jednostka == "zł/mc":
+                if "STAŁA SIECIOWA" in typ_oplaty_upper or "STALA SIECIOWA" in typ_oplaty_upper:
+                    oplata_stala_sieciowa = float(o.cena)
+                elif "PRZEJŚCIOWA" in typ_oplaty_upper or "PRZEJSCIOWA" in typ_oplaty_upper:
+                    oplata_przejściowa = float(o.cena)
+                elif "ABONAMENTOWA" in typ_oplaty_upper:
+                    oplata_abonamentowa = float(o.cena)
+                elif "MOCOWA" in typ_oplaty_upper:
+                    oplata_mocowa = float(o.cena)
+
+        # Obliczamy cenę za 1kWh dla okresu (netto)
+        cena_1kwh_dzienna = None
+        cena_1kwh_nocna = None
+        cena_1kwh_calodobowa = None
+
+        if cena_dzienna is not None:
+            cena_1kwh_dzienna = cena_dzienna
+            if oplata_jakosciowa_dzienna is not None:
+                cena_1kwh_dzienna += oplata_jakosciowa_dzienna
+            if oplata_zmienna_sieciowa_dzienna is not None:
+                cena_1kwh_dzienna += oplata_zmienna_sieciowa_dzienna
+            if oplata_oze_dzienna is not None:
+                cena_1kwh_dzienna += oplata_oze_dzienna
+            if oplata_kogeneracyjna_dzienna is not None:
+                cena_1kwh_dzienna += oplata_kogeneracyjna_dzienna
+            cena_1kwh_dzienna = round(cena_1kwh_dzienna, 4)
+
+        if cena_nocna is not None:
+            cena_1kwh_nocna = cena_nocna
+            if oplata_jakosciowa_nocna is not None:
+                cena_1kwh_nocna += oplata_jakosciowa_nocna
+            if oplata_zmienna_sieciowa_nocna is not None:
+                cena_1kwh_nocna += oplata_zmienna_sieciowa_nocna
+            if oplata_oze_nocna is not None:
+                cena_1kwh_nocna += oplata_oze_nocna
+            if oplata_kogeneracyjna_nocna is not None:
+                cena_1kwh_nocna += oplata_kogeneracyjna_nocna
+            cena_1kwh_nocna = round(cena_1kwh_nocna, 4)
+
+        if cena_calodobowa is not None:
+            cena_1kwh_calodobowa = cena_calodobowa
+            for o in oplaty_period:
+                if o.jednostka == "kWh" and (o.strefa is None or o.strefa == "CAŁODOBOWA"):
+                    if "JAKOŚCIOWA" in o.typ_oplaty.upper() or "ZMIENNA SIECIOWA" in o.typ_oplaty.upper() or \
+                       "OZE" in o.typ_oplaty.upper() or "KOGENERACYJNA" in o.typ_oplaty.upper():
+                        cena_1kwh_calodobowa += float(o.cena)
+            cena_1kwh_calodobowa = round(cena_1kwh_calodobowa, 4)
+
+        # Suma opłat stałych (netto)
+        suma_oplat_stalych = 0
+        if oplata_stala_sieciowa is not None:
+            suma_oplat_stalych += oplata_stala_sieciowa
+        if oplata_przejściowa is not None:
+            suma_oplat_stalych += oplata_przejściowa
+        if oplata_abonamentowa is not None:
+            suma_oplat_stalych += oplata_abonamentowa
+        if oplata_mocowa is not None:
+            suma_oplat_stalych += oplata_mocowa
+
+        periods.append({
+            "okres": f"OKRES_DYSTRYBUCYJNY_{i+1}",
+            "od": current_start,
+            "do": dist_period_end,
+            "cena_1kwh_dzienna": cena_1kwh_dzienna,
+            "cena_1kwh_nocna": cena_1kwh_nocna,
+            "cena_1kwh_calodobowa": cena_1kwh_calodobowa,
+            "suma_oplat_stalych": round(suma_oplat_stalych, 4),
+            "vat_rate": _vat_rate(oplaty_period, [s for s in sprzedaz_period.values() if s is not None])
+        })
+
+        current_start = dist_period_end + timedelta(days=1)
+
+    return periods
+
+
+def build_tariff_timeline(
+    invoice: ElectricityInvoice,
+    oplaty: Sequence[ElectricityInvoiceOplataDystrybucyjna],
+    sprzedaz: Sequence[ElectricityInvoiceSprzedazEnergii]
+) -> TariffTimeline:
+    """
+    Buduje oś taryfową faktury z jej opłat dystrybucyjnych i sprzedaży energii.
+
+    Args:
+        invoice: Faktura prądu
+        oplaty: Opłaty dystrybucyjne posortowane po dacie
+        sprzedaz: Sprzedaż energii posortowana po dacie
+
+    Returns:
+        Oś taryfowa (pusta, jeśli faktura nie ma opłat z datami)
+    """
+    periods = []
+    if invoice.data_poczatku_okresu is not None:
+        periods = build_distribution_periods(invoice.data_poczatku_okresu, invoice.typ_taryfy, oplaty, sprzedaz)
+    return TariffTimeline.from_periods(periods)
+
+
+def sorted_by_date(rows):
+    """Sortuje wiersze jak ORDER BY data w SQLite (NULL na początku, remisy po ID)."""
+    return sorted(rows, key=lambda r: (r.data is not None, r.data or date.min, r.id))
+
+
+def rebuild_tariff_timelines(db: Session, invoice_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Przebudowuje i zapisuje osie taryfowe faktur (bez commita).
+
+    Wiersze są ładowane zbiorczo: faktury, sprzedaż energii, opłaty i istniejące osie -
+    po jednym zapytaniu niezależnie od liczby faktur.
+
+    Args:
+        db: Sesja bazy danych
+        invoice_ids: ID faktur do przebudowy lub None dla wszystkich faktur
+
+    Returns:
+        Liczba zapisanych osi
+    """
+    invoice_query = db.query(ElectricityInvoice)
+    sprzedaz_query = db.query(ElectricityInvoiceSprzedazEnergii)
+    oplaty_query = db.query(ElectricityInvoiceOplataDystrybucyjna)
+    timeline_query = db.query(ElectricityInvoiceTariffTimeline)
+    if invoice_ids is not None:
+        ids = {invoice_id for invoice_id in invoice_ids if invoice_id is not None}
+        if not ids:
+            return 0
+        invoice_query = invoice_query.filter(ElectricityInvoice.id.in_(ids))
+        sprzedaz_query = sprzedaz_query.filter(ElectricityInvoiceSprzedazEnergii.invoice_id.in_(ids))
+        oplaty_query = oplaty_query.filter(ElectricityInvoiceOplataDystrybucyjna.invoice_id.in_(ids))
+        timeline_query = timeline_query.filter(ElectricityInvoiceTariffTimeline.invoice_id.in_(ids))
+
+    invoices = {invoice.id: invoice for invoice in invoice_query.all()}
+    sprzedaz_by_invoice: Dict[int, list] = {}
+    for row in sprzedaz_query.all():
+        sprzedaz_by_invoice.setdefault(row.invoice_id, []).append(row)
+    oplaty_by_invoice: Dict[int, list] = {}
+    for row in oplaty_query.all():
+        oplaty_by_invoice.setdefault(row.invoice_id, []).append(row)
+    records = {record.invoice_id: record for record in timeline_query.all()}
+
+    # Osie usuniętych faktur (np. po masowym DELETE) nie są już potrzebne
+    for invoice_id, record in records.items():
+        if invoice_id not in invoices:
+            db.delete(record)
+
+    for invoice_id, invoice in invoices.items():
+        timeline = build_tariff_timeline(
+            invoice,
+            sorted_by_date(oplaty_by_invoice.get(invoice_id, [])),
+            sorted_by_date(sprzedaz_by_invoice.get(invoice_id, []))
+        )
+        values = timeline.to_record_values()
+        record = records.get(invoice_id)
+        if record is None:
+            db.add(ElectricityInvoiceTariffTimeline(invoice_id=invoice_id, **values))
+        else:
+            for column, value in values.items():
+                setattr(record, column, value)
+    return len(invoices)
+
+
+def _collect_changed_invoices(session: Session) -> None:
+    """Zapamiętuje faktury, których sprzedaż energii lub opłaty zmieniono we flushu."""
+    changed = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (ElectricityInvoiceSprzedazEnergii, ElectricityInvoiceOplataDystrybucyjna)):
+            changed.add(obj.invoice_id)
+        elif isinstance(obj, ElectricityInvoice):
+            changed.add(obj.id)
+    if changed:
+        pending_changes(session, _PENDING_KEY).update(changed)
+
+
+def _collect_bulk_changes(orm_execute_state) -> None:
+    """
+    Masowe zapisy sprzedaży/opłat (query.delete(), insert()).
+
+    Gdy wszystkie wiersze zapisu podają invoice_id (np. zbiorczy INSERT), przebudowywane są
+    tylko te faktury; w przeciwnym razie - wszystkie osie.
+    """
+    table = getattr(orm_execute_state.statement, "table", None)
+    if getattr(table, "name", None) not in _SOURCE_TABLES:
+        return
+    params = orm_execute_state.parameters
+    rows = params if isinstance(params, (list, tuple)) else [params] if params else []
+    pending = pending_changes(orm_execute_state.session, _PENDING_KEY)
+    if rows and all("invoice_id" in row for row in rows):
+        pending.update(row["invoice_id"] for row in rows)
+    else:
+        pending.add(_ALL)
+
+
+def _rebuild_changed(session: Session, pending: Set[Any]) -> None:
+    """Przebudowuje osie zmienionych faktur w tej samej transakcji."""
+    rebuild_tariff_timelines(session, None if _ALL in pending else pending)
+
+
+on_before_commit(_PENDING_KEY, _rebuild_changed, _collect_changed_invoices, _collect_bulk_changes)
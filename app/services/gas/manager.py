@@ -1,176 +1,356 @@
 """
 Moduł zarządzania licznikami i rozliczaniem rachunków za gaz.
-Oblicza koszty na podstawie faktur i dzieli proporcjonalnie między lokale.
+Oblicza koszty na podstawie faktur i dzieli proporcjonalnie między lokale
+według reguł podziału (gas_allocation_rules) obowiązujących dla faktury.
 """
 
-from typing import Optional
+import bisect
+from dataclasses import dataclass
+from datetime import date
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app.models.gas import GasInvoice, GasBill
+from sqlalchemy import insert
+from app.models.gas import GasInvoice, GasBill, GasAllocationRule
 from app.models.water import Local
 
+# Domyślny podział kosztów (lokal, udział, czy płaci odsetki) - gdy tabela reguł jest pusta
+DEFAULT_ALLOCATION_RULES = (
+    ('gora', 0.58, True),
+    ('dol', 0.25, False),
+    ('gabinet', 0.17, False),
+)
+
+# Dopuszczalna odchyłka sumy udziałów od 1
+SHARE_TOLERANCE = 1e-6
+
+
+@dataclass(frozen=True)
+class AllocationVersion:
+    """Wersja podziału kosztów - wektor udziałów lokali w przedziale dat."""
+    valid_from: Optional[date]
+    valid_to: Optional[date]
+    locals: Tuple[str, ...]
+    shares: Tuple[float, ...]
+    interest_local: Optional[str]
+
+    def share(self, local_name: str) -> float:
+        """Udział lokalu (ValueError dla lokalu spoza wersji)."""
+        try:
+            return self.shares[self.locals.index(local_name)]
+        except ValueError:
+            raise ValueError(f"Nieznany lokal: {local_name}")
+
+    def covers(self, day: date) -> bool:
+        """Czy wersja obowiązuje w danym dniu."""
+        return (self.valid_from is None or self.valid_from <= day) and (self.valid_to is None or day <= self.valid_to)
+
+
+class AllocationSchedule:
+    """Wersje podziału kosztów posortowane po początku obowiązywania (wyszukiwanie - bisect)."""
+
+    def __init__(self, versions: Iterable[AllocationVersion]):
+        self.versions = sorted(versions, key=lambda v: v.valid_from or date.min)
+        self._starts = [v.valid_from or date.min for v in self.versions]
+
+    @classmethod
+    def from_rules(cls, rules: Iterable[Any]) -> "AllocationSchedule":
+        """
+        Kompiluje reguły (obiekty z polami local, share, bears_interest, valid_from, valid_to)
+        w wersje - reguły o tym samym przedziale dat tworzą jedną wersję.
+
+        Raises:
+            ValueError: Udziały wersji nie sumują się do 1 lub odsetki płaci więcej niż jeden lokal
+        """
+        def validity(rule):
+            return (rule.valid_from or date.min, rule.valid_to or date.max)
+
+        versions = []
+        for (valid_from, valid_to), group in groupby(sorted(rules, key=validity), key=validity):
+            group = list(group)
+            total = sum(rule.share for rule in group)
+            if abs(total - 1.0) > SHARE_TOLERANCE:
+                raise ValueError(f"Udziały reguł podziału od {valid_from} sumują się do {total}, a nie do 1")
+            interest = [rule.local for rule in group if rule.bears_interest]
+            if len(interest) > 1:
+                raise ValueError(f"Odsetki może płacić tylko jeden lokal (reguły od {valid_from}: {', '.join(interest)})")
+            versions.append(AllocationVersion(
+                valid_from=None if valid_from == date.min else valid_from,
+                valid_to=None if valid_to == date.max else valid_to,
+                locals=tuple(rule.local for rule in group),
+                shares=tuple(rule.share for rule in group),
+                interest_local=interest[0] if interest else None
+            ))
+        return cls(versions)
+
+    @classmethod
+    def default(cls) -> "AllocationSchedule":
+        """Harmonogram z domyślnym podziałem 58/25/17 (odsetki - gora)."""
+        return cls.from_rules(
+            GasAllocationRule(local=local, share=share, bears_interest=interest, valid_from=None, valid_to=None)
+            for local, share, interest in DEFAULT_ALLOCATION_RULES
+        )
+
+    def version_for(self, day: date) -> AllocationVersion:
+        """
+        Wersja obowiązująca w danym dniu (przy nakładaniu - rozpoczęta najpóźniej).
+
+        Raises:
+            ValueError: Żadna wersja nie obowiązuje w tym dniu
+        """
+        i = bisect.bisect_right(self._starts, day) - 1
+        while i >= 0:
+            if self.versions[i].covers(day):
+                return self.versions[i]
+            i -= 1
+        raise ValueError(f"Brak reguł podziału kosztów gazu obowiązujących w dniu {day}")
+
+
+def load_allocation_schedule(db: Session) -> AllocationSchedule:
+    """Wczytuje reguły podziału jednym zapytaniem (pusta tabela - podział domyślny)."""
+    rules = db.query(GasAllocationRule).order_by(GasAllocationRule.id).all()
+    return AllocationSchedule.from_rules(rules) if rules else AllocationSchedule.default()
+
+
+def _has_detailed_values(invoice: GasInvoice) -> bool:
+    """Czy faktura ma wartości szczegółowe (paliwo, abonament, dystrybucja) różne od 0."""
+    return (invoice.fuel_value_gross > 0 or invoice.subscription_value_gross > 0 or
+            invoice.distribution_fixed_value_gross > 0 or invoice.distribution_variable_value_gross > 0)
+
 
 class GasBillingManager:
     """Zarządzanie licznikami i rozliczaniem rachunków za gaz."""
-    
+
     def calculate_bill_costs(
         self,
         invoice: GasInvoice,
-        local_name: str
+        local_name: str,
+        version: Optional[AllocationVersion] = None
     ) -> dict:
         """
         Oblicza koszty dla pojedynczego rachunku gazu.
-        
+
         Algorytm (tak jak w generatorze PDF):
         1. Używamy total_gross_sum z faktury (bez odsetek) jako podstawy
         2. Dzielimy proporcjonalnie według udziału lokalu
         3. Obliczamy wartości szczegółowe proporcjonalnie z faktury (jeśli są dostępne)
            lub używamy tylko total_gross_sum
-        
+
         Args:
             invoice: Faktura gazu
             local_name: Nazwa lokalu ('gora', 'dol', 'gabinet')
-        
+            version: Wersja podziału kosztów (domyślnie podział 58/25/17)
+
         Returns:
             Słownik z obliczonymi kosztami dla lokalu
         """
-        # Proporcje dla lokali
-        if local_name == 'gora':
-            share = 0.58  # 58%
-        elif local_name == 'dol':
-            share = 0.25  # 25%
-        elif local_name == 'gabinet':
-            share = 0.17  # 17%
-        else:
-            raise ValueError(f"Nieznany lokal: {local_name}")
-        
+        if version is None:
+            version = AllocationSchedule.default().versions[0]
+        share = version.share(local_name)
+
         # Oblicz kwotę brutto bez odsetek (tak jak w generatorze PDF)
         house_gross_without_interest = invoice.total_gross_sum - invoice.late_payment_interest
         local_gross_base = house_gross_without_interest * share
-        
-        # Jeśli wartości szczegółowe w fakturze są dostępne (nie są 0), użyj ich
-        # W przeciwnym razie rozdziel proporcjonalnie z total_gross_sum
-        if (invoice.fuel_value_gross > 0 or invoice.subscription_value_gross > 0 or 
-            invoice.distribution_fixed_value_gross > 0 or invoice.distribution_variable_value_gross > 0):
-            # Użyj wartości szczegółowych z faktury
-            fuel_cost_gross = invoice.fuel_value_gross * share
-            subscription_cost_gross = invoice.subscription_value_gross * share
-            distribution_fixed_cost_gross = invoice.distribution_fixed_value_gross * share
-            distribution_variable_cost_gross = invoice.distribution_variable_value_gross * share
-        else:
-            # Jeśli wartości szczegółowe są 0, rozdziel total_gross_sum proporcjonalnie
-            # Używamy proporcji z całkowitej kwoty brutto (bez odsetek)
-            # Dla uproszczenia dzielimy równo między wszystkie kategorie
-            fuel_cost_gross = local_gross_base * 0.25  # 25% dla paliwa
-            subscription_cost_gross = local_gross_base * 0.25  # 25% dla abonamentu
-            distribution_fixed_cost_gross = local_gross_base * 0.25  # 25% dla dystrybucji stałej
-            distribution_variable_cost_gross = local_gross_base * 0.25  # 25% dla dystrybucji zmiennej
-        
-        # Suma brutto dla lokalu (powinna być równa local_gross_base)
-        total_gross = local_gross_base
-        
+
+        fuel, subscription, distribution_fixed, distribution_variable = self._local_components(invoice, share)
+
         # Suma netto (używamy VAT rate z faktury)
-        total_net = total_gross / (1 + invoice.vat_rate)
-        
+        total_net = local_gross_base / (1 + invoice.vat_rate)
+
         return {
             'cost_share': share,
-            'fuel_cost_gross': fuel_cost_gross,
-            'subscription_cost_gross': subscription_cost_gross,
-            'distribution_fixed_cost_gross': distribution_fixed_cost_gross,
-            'distribution_variable_cost_gross': distribution_variable_cost_gross,
+            'fuel_cost_gross': fuel,
+            'subscription_cost_gross': subscription,
+            'distribution_fixed_cost_gross': distribution_fixed,
+            'distribution_variable_cost_gross': distribution_variable,
             'total_net_sum': total_net,
-            'total_gross_sum': total_gross
+            'total_gross_sum': local_gross_base
         }
-    
+
+    def _local_components(self, invoice: GasInvoice, share: float) -> Tuple[float, float, float, float]:
+        """
+        Składniki kosztów faktury przypadające na lokal o danym udziale:
+        (paliwo, abonament, dystrybucja stała, dystrybucja zmienna) - brutto.
+        """
+        if _has_detailed_values(invoice):
+            # Użyj wartości szczegółowych z faktury
+            return (
+                invoice.fuel_value_gross * share,
+                invoice.subscription_value_gross * share,
+                invoice.distribution_fixed_value_gross * share,
+                invoice.distribution_variable_value_gross * share
+            )
+        # Wartości szczegółowe są 0 - rozdziel total_gross_sum (bez odsetek) równo między kategorie
+        local_gross_base = (invoice.total_gross_sum - invoice.late_payment_interest) * share
+        return (local_gross_base * 0.25,) * 4
+
+    def allocate_period(
+        self,
+        period: str,
+        invoices: List[GasInvoice],
+        schedule: AllocationSchedule,
+        local_ids: Dict[str, int]
+    ) -> List[Dict[str, Any]]:
+        """
+        Dzieli koszty faktur okresu między lokale - bez zapytań do bazy.
+
+        Każda faktura jest dzielona wektorem udziałów swojej wersji reguł
+        (według period_start); koszty wielu faktur okresu są sumowane.
+        Rachunek dostaje każdy lokal występujący w którejkolwiek z tych wersji.
+        Stawka VAT i odsetki pochodzą z pierwszej faktury okresu.
+
+        Args:
+            period: Okres rozliczeniowy 'YYYY-MM'
+            invoices: Faktury okresu (posortowane po ID)
+            schedule: Harmonogram reguł podziału
+            local_ids: Mapowanie nazwa lokalu -> ID
+
+        Returns:
+            Lista słowników z kolumnami GasBill
+
+        Raises:
+            ValueError: Brak reguł dla faktury lub lokalu w bazie
+        """
+        versions = [schedule.version_for(invoice.period_start) for invoice in invoices]
+        first_invoice, first_version = invoices[0], versions[0]
+        vat_rate = first_invoice.vat_rate
+        rows = []
+
+        # Lokale wszystkich wersji okresu (w kolejności pierwszego wystąpienia)
+        period_locals = list(dict.fromkeys(name for version in versions for name in version.locals))
+
+        for local_name in period_locals:
+            if local_name not in local_ids:
+                raise ValueError(f"Brak lokalizacji '{local_name}' w bazie")
+
+            # Sumuj koszty ze wszystkich faktur dla tego lokalu
+            totals = [0, 0, 0, 0]
+            for invoice, version in zip(invoices, versions):
+                share = version.shares[version.locals.index(local_name)] if local_name in version.locals else 0.0
+                for i, value in enumerate(self._local_components(invoice, share)):
+                    totals[i] += value
+
+            # Suma brutto bazowa (bez odsetek) - tak jak w generatorze PDF
+            local_gross_sum = totals[0] + totals[1] + totals[2] + totals[3]
+            local_net_sum = local_gross_sum / (1 + vat_rate)
+
+            # Lokal wskazany w regułach płaci odsetki za spóźnienie
+            if local_name == first_version.interest_local and first_invoice.late_payment_interest > 0:
+                local_net_sum += first_invoice.late_payment_interest / (1 + vat_rate)
+                local_gross_sum = local_net_sum + local_net_sum * vat_rate
+
+            rows.append({
+                'data': period,
+                'local': local_name,
+                'invoice_id': first_invoice.id,  # Pierwsza faktura
+                'local_id': local_ids[local_name],
+                # Udział z pierwszej wersji okresu, w której występuje lokal
+                'cost_share': next(
+                    version.shares[version.locals.index(local_name)]
+                    for version in versions if local_name in version.locals
+                ),
+                'fuel_cost_gross': round(totals[0], 2),
+                'subscription_cost_gross': round(totals[1], 2),
+                'distribution_fixed_cost_gross': round(totals[2], 2),
+                'distribution_variable_cost_gross': round(totals[3], 2),
+                'total_net_sum': round(local_net_sum, 2),  # Z uwzględnieniem odsetek
+                'total_gross_sum': round(local_gross_sum, 2)  # Ostateczna kwota brutto do zapłaty
+            })
+
+        return rows
+
+    def _local_ids(self, db: Session) -> Dict[str, int]:
+        """Mapowanie nazwa lokalu -> ID (jedno zapytanie)."""
+        local_ids = {}
+        for local_id, name in db.query(Local.id, Local.local).order_by(Local.id).all():
+            local_ids.setdefault(name, local_id)
+        return local_ids
+
     def generate_bills_for_period(self, db: Session, period: str) -> list[GasBill]:
         """
         Generuje rachunki gazu dla wszystkich lokali na dany okres.
-        
+
         Algorytm:
         1. Pobierz WSZYSTKIE faktury dla okresu (może być wiele)
-        2. Dla każdej faktury i każdego lokalu:
-           - Oblicz proporcjonalne koszty (58%/25%/17%)
-           - Utwórz rachunek
-        3. Jeśli jest wiele faktur, sumuj koszty dla każdego lokalu
-        
+        2. Podziel koszty każdej faktury według reguł podziału i zsumuj je dla lokali
+        3. Zapisz rachunki jednym INSERT
+
         UWAGA: Wszystkie dane są w fakturze - nie ma osobnych odczytów.
         Używamy bezpośrednio kosztów brutto z faktury.
-        
+
         Args:
             db: Sesja bazy danych
             period: Okres rozliczeniowy w formacie 'YYYY-MM'
-        
+
         Returns:
             Lista wygenerowanych rachunków
         """
-        # 1. Pobierz wszystkie faktury dla okresu
-        invoices = db.query(GasInvoice).filter(GasInvoice.data == period).all()
+        invoices = db.query(GasInvoice).filter(GasInvoice.data == period).order_by(GasInvoice.id).all()
         if not invoices:
             raise ValueError(f"Brak faktur dla okresu {period}")
-        
-        # 3. Dla każdego lokalu i każdej faktury oblicz koszty
-        locals_list = ['gora', 'dol', 'gabinet']
-        bills = []
-        
-        for local_name in locals_list:
-            # Sumuj koszty ze wszystkich faktur dla tego lokalu
-            total_fuel_gross = 0
-            total_subscription_gross = 0
-            total_dist_fixed_gross = 0
-            total_dist_variable_gross = 0
-            
-            for invoice in invoices:
-                costs = self.calculate_bill_costs(invoice, local_name)
-                total_fuel_gross += costs['fuel_cost_gross']
-                total_subscription_gross += costs['subscription_cost_gross']
-                total_dist_fixed_gross += costs['distribution_fixed_cost_gross']
-                total_dist_variable_gross += costs['distribution_variable_cost_gross']
-            
-            # Suma brutto bazowa (bez odsetek) - tak jak w generatorze PDF
-            total_gross_base = (total_fuel_gross + total_subscription_gross + 
-                              total_dist_fixed_gross + total_dist_variable_gross)
-            
-            # Suma netto bazowa
-            # Musimy użyć VAT rate z faktury, nie hardkodowanego 1.23
-            invoice_vat_rate = invoices[0].vat_rate if invoices else 0.23
-            total_net_base = total_gross_base / (1 + invoice_vat_rate)
-            
-            # Oblicz ostateczną kwotę brutto (z uwzględnieniem odsetek dla "gora")
-            # Tak samo jak w generatorze PDF
-            local_gross_sum = total_gross_base
-            local_net_sum = total_net_base
-            local_vat = local_net_sum * invoice_vat_rate
-            
-            # Dla lokalu "gora" dodajemy odsetki za spóźnienie
-            if local_name == 'gora' and invoices[0].late_payment_interest > 0:
-                interest_net = invoices[0].late_payment_interest / (1 + invoice_vat_rate)
-                local_net_sum += interest_net
-                local_vat = local_net_sum * invoice_vat_rate
-                local_gross_sum = local_net_sum + local_vat
-            
-            # Utwórz rachunek
-            local_obj = db.query(Local).filter(Local.local == local_name).first()
-            if not local_obj:
-                raise ValueError(f"Brak lokalizacji '{local_name}' w bazie")
-            
-            bill = GasBill(
-                data=period,
-                local=local_name,
-                invoice_id=invoices[0].id,  # Pierwsza faktura
-                local_id=local_obj.id,
-                cost_share=0.58 if local_name == 'gora' else (0.25 if local_name == 'dol' else 0.17),
-                fuel_cost_gross=round(total_fuel_gross, 2),
-                subscription_cost_gross=round(total_subscription_gross, 2),
-                distribution_fixed_cost_gross=round(total_dist_fixed_gross, 2),
-                distribution_variable_cost_gross=round(total_dist_variable_gross, 2),
-                total_net_sum=round(local_net_sum, 2),  # Z uwzględnieniem odsetek dla gora
-                total_gross_sum=round(local_gross_sum, 2)  # Ostateczna kwota brutto do zapłaty
-            )
-            
-            db.add(bill)
-            bills.append(bill)
-        
+
+        rows = self.allocate_period(period, invoices, load_allocation_schedule(db), self._local_ids(db))
+        bills = list(db.scalars(insert(GasBill).returning(GasBill), rows))
         db.commit()
-        
+
         return bills
 
+    def generate_all_bills(
+        self,
+        db: Session,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        skip_existing: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Generuje rachunki gazu dla wszystkich okresów z fakturami (opcjonalnie w zakresie).
+
+        Faktury, reguły podziału i lokale są wczytywane raz, koszty dzielone w jednym
+        przebiegu, a rachunki zapisywane jednym zbiorczym INSERT.
+
+        Args:
+            db: Sesja bazy danych
+            start: Pierwszy okres 'YYYY-MM' (opcjonalnie)
+            end: Ostatni okres 'YYYY-MM' (opcjonalnie)
+            skip_existing: Pomija okresy, które mają już rachunki
+
+        Returns:
+            Słownik ze statystykami generowania
+        """
+        query = db.query(GasInvoice)
+        if start:
+            query = query.filter(GasInvoice.data >= start)
+        if end:
+            query = query.filter(GasInvoice.data <= end)
+        invoices = query.order_by(GasInvoice.data, GasInvoice.id).all()
+
+        existing = set()
+        if skip_existing and invoices:
+            periods = {invoice.data for invoice in invoices}
+            existing = {data for (data,) in db.query(GasBill.data).filter(GasBill.data.in_(periods)).distinct()}
+
+        schedule = load_allocation_schedule(db)
+        local_ids = self._local_ids(db)
+        rows = []
+        processed = []
+        errors = []
+
+        for period, group in groupby(invoices, key=lambda invoice: invoice.data):
+            if period in existing:
+                continue
+            try:
+                rows.extend(self.allocate_period(period, list(group), schedule, local_ids))
+                processed.append(period)
+            except ValueError as e:
+                errors.append(f"{period}: {e}")
+
+        if rows:
+            db.execute(insert(GasBill), rows)
+        db.commit()
+
+        return {
+            "periods_processed": processed,
+            "periods_skipped": sorted(existing),
+            "bills_generated": len(rows),
+            "errors": errors
+        }
@@ -6,15 +6,11 @@ Creates PDF files with bills in bills/ folder.
 
 import os
 from pathlib import Path
-from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
 from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-from reportlab.pdfbase import pdfmetrics
+from sqlalchemy import func
 from sqlalchemy.orm import Session
+from app.core.pdf_pipeline import render_and_save, write_pdf_cached
+from app.core.pdf_toolkit import info_table_commands, summary_table_commands
 from app.models.water import Bill, Local
 
 
@@ -28,201 +24,15 @@ def format_usage(value: float) -> str:
     return f"{value:.2f} m³"
 
 
-def generate_bill_pdf(db: Session, bill: Bill) -> str:
-    """
-    Generates PDF file with bill.
-    
-    Args:
-        db: Database session
-        bill: Bill to generate
-    
-    Returns:
-        Path to generated PDF file
-    """
-    # Determine file path
-    bills_folder = Path("bills/woda")
-    bills_folder.mkdir(parents=True, exist_ok=True)
-    
-    # Filename: bill_2025_02_local_gora.pdf
-    filename = f"bill_{bill.data}_local_{bill.local}.pdf"
-    filepath = bills_folder / filename
-    
-    # Check if Arial font is available (for Polish characters)
-    try:
-        from reportlab.pdfbase.ttfonts import TTFont  # type: ignore
-        import platform
-        
-        font_registered = False
-        if platform.system() == 'Windows':
-            # On Windows, check standard Arial locations
-            font_paths = [
-                'C:/Windows/Fonts/arial.ttf',
-                'C:/Windows/Fonts/Arial.ttf',
-                Path('C:/Windows/Fonts/arial.ttf'),  # Try also as Path
-            ]
-        else:
-            # On other systems try standard locations
-            font_paths = [
-                '/usr/share/fonts/truetype/msttcorefonts/arial.ttf',
-                '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
-            ]
-        
-        for font_path in font_paths:
-            try:
-                font_path_str = str(font_path)
-                if Path(font_path_str).exists():
-                    pdfmetrics.registerFont(TTFont('Arial', font_path_str))
-                    # Check if font was registered
-                    if 'Arial' in pdfmetrics.getRegisteredFontNames():
-                        font_registered = True
-                        print(f"[OK] Registered Arial font from: {font_path_str}")
-                        break
-            except Exception as e:
-                print(f"[DEBUG] Failed to register font from {font_path}: {e}")
-                continue
-        
-        if not font_registered:
-            print("[WARNING] Arial font not found, using Helvetica (may lack Polish characters)")
-        default_font = 'Arial' if font_registered else 'Helvetica'
-    except Exception as e:
-        # If font is not available, use default Helvetica
-        print(f"[WARNING] Font registration error: {e}, using Helvetica")
-        default_font = 'Helvetica'
-    
-    # Funkcja do tworzenia CustomDocTemplate z nagłówkiem
-    class CustomDocTemplate(SimpleDocTemplate):
-        def __init__(self, font_name, *args, **kwargs):
-            SimpleDocTemplate.__init__(self, *args, **kwargs)
-            self.font_name = font_name
-            self.page_width = A4[0]
-            self.page_height = A4[1]
-        
-        def build(self, flowables, onFirstPage=None, onLaterPages=None):
-            now = datetime.now()
-            generated_text = f"Wygenerowano: {now.strftime('%d.%m.%Y %H:%M')}"
-            font_name = self.font_name
-            page_width = self.page_width
-            page_height = self.page_height
-            
-            def add_header(canvas, doc):
-                canvas.saveState()
-                canvas.setFont(font_name, 9)
-                # Oblicz pozycję uwzględniając marginesy
-                right_margin = 15*mm  # Zgodnie z rightMargin w CustomDocTemplate
-                text_width = canvas.stringWidth(generated_text, font_name, 9)
-                x = page_width - right_margin - text_width
-                y = page_height - 15*mm
-                canvas.drawString(x, y, generated_text)
-                canvas.restoreState()
-            
-            return SimpleDocTemplate.build(self, flowables, onFirstPage=add_header, onLaterPages=add_header)
-    
-    # Stwórz dokument
-    doc = CustomDocTemplate(default_font, str(filepath), pagesize=A4,
-                           leftMargin=15*mm, rightMargin=15*mm,
-                           topMargin=25*mm, bottomMargin=15*mm)
-    
-    # Style
-    styles = getSampleStyleSheet()
-    
-    # Użyj fontu z polskimi znakami jeśli dostępny
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading5'],
-        fontSize=12,
-        textColor=colors.HexColor('#2c5aa0'),
-        spaceAfter=1*mm,
-        alignment=TA_LEFT,
-        fontName=default_font
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading3'],
-        fontSize=11,
-        textColor=colors.HexColor('#2c5aa0'),
-        spaceBefore=2*mm,
-        spaceAfter=1*mm,
-        fontName=default_font
-    )
-    
-    story = []
-    
-    # Tytuł (bez polskich liter)
-    story.append(Paragraph("RACHUNEK ZA WODE I SCIEKI", title_style))
-    story.append(Paragraph("NA PODSTAWIE FAKTUR (W ZAŁĄCZNIKU)", heading_style))
-    # Dane lokalu
-    local_obj = db.query(Local).filter(Local.local == bill.local).first()
-    
-    # Okres rozliczeniowy - pobierz z faktury
-    period_text = bill.data
-    if bill.invoice and bill.invoice.period_start and bill.invoice.period_stop:
-        period_start = bill.invoice.period_start.strftime('%d.%m.%Y')
-        period_stop = bill.invoice.period_stop.strftime('%d.%m.%Y')
-        period_text = f"{period_start} - {period_stop}"
-    
-    # Oblicz całkowite zużycie dla domu (suma wszystkich lokali w tym okresie)
-    all_bills_for_period = db.query(Bill).filter(Bill.data == bill.data).all()
-    total_house_usage = sum(b.usage_m3 for b in all_bills_for_period)
-    
-    data = [
-        ['Okres rozliczeniowy:', period_text],
-        ['Zuzycie dom:', f"{total_house_usage:.2f} m3"],
-        ['Lokal:', bill.local],
-        ['Najemca:', local_obj.tenant if local_obj else '-'],
-    ]
-    
-    table = Table(data, colWidths=[50*mm, 125*mm])
-    table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, -1), default_font),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ('TOPPADDING', (0, 0), (-1, -1), 0),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-    ]))
-    
-    story.append(table)
-    story.append(Spacer(1, 3*mm))
-    
-    # Koszty - przestrukturyzowana tabela
-    story.append(Paragraph("ROZLICZENIE KOSZTOW", heading_style))
-    
-    if bill.invoice:
-        invoice = bill.invoice
-        # Oblicz całkowitą kwotę abonamentu (łącznie dla wszystkich lokali)
-        # IMPORTANT: water_subscr_cost and sewage_subscr_cost are already TOTAL sums from all positions
-        # (each position: quantity × price, then all positions are summed)
-        # We do NOT multiply by nr_of_subscription - it's already the total sum!
-        total_abonament_water = invoice.water_subscr_cost
-        total_abonament_sewage = invoice.sewage_subscr_cost
-        
-        costs_data = [
-            ['', 'Zuzycie', 'Cena jednostkowa', 'Laczny koszt'],
-            ['Woda:', format_usage(bill.usage_m3), format_money(invoice.water_cost_m3), format_money(bill.cost_water)],
-            ['Scieki:', format_usage(bill.usage_m3), format_money(invoice.sewage_cost_m3), format_money(bill.cost_sewage)],
-            ['Koszt zuzycia woda/scieki lacznie', '', '', format_money(bill.cost_usage_total)],
-            ['Woda abonament', '1/3', format_money(total_abonament_water), format_money(bill.abonament_water_share)],
-            ['Scieki abonament', '1/3', format_money(total_abonament_sewage), format_money(bill.abonament_sewage_share)],
-            ['Abonament lacznie', '', '', format_money(bill.abonament_total)],
-        ]
-    else:
-        costs_data = [
-            ['', 'Zużycie', 'Cena jednostkowa', 'Łączny koszt'],
-            ['Woda:', format_usage(bill.usage_m3), '', format_money(bill.cost_water)],
-            ['Scieki:', format_usage(bill.usage_m3), '', format_money(bill.cost_sewage)],
-            ['Koszt zuzycia woda/scieki lacznie', '', '', format_money(bill.cost_usage_total)],
-            ['Abonament', '', '', format_money(bill.abonament_total)],
-        ]
-    
-    costs_table = Table(costs_data, colWidths=[60*mm, 30*mm, 40*mm, 30*mm])
-    costs_table.setStyle(TableStyle([
+def costs_table_commands(font_name: str) -> list:
+    """Cost table style (header row and subtotal rows highlighted)."""
+    return [
         # Nagłówek
         ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
         ('ALIGN', (2, 1), (3, -1), 'RIGHT'),  # Cena i koszt wyrównane do prawej
-        ('FONTNAME', (0, 0), (-1, -1), default_font),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
         ('FONTSIZE', (0, 0), (-1, -1), 9),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
         ('TOPPADDING', (0, 0), (-1, -1), 6),
@@ -230,39 +40,124 @@ def generate_bill_pdf(db: Session, bill: Bill) -> str:
         # Wiersze sum
         ('ROWBACKGROUNDS', (0, 3), (-1, 3), [colors.lightgrey]),
         ('ROWBACKGROUNDS', (0, 6), (-1, 6), [colors.lightgrey]),
-    ]))
-    
-    story.append(costs_table)
-    story.append(Spacer(1, 5*mm))
+    ]
+
+
+def bill_pdf_path(bill: Bill) -> Path:
+    """PDF path of the bill, e.g. bills/woda/bill_2025-02_local_gora.pdf."""
+    return Path("bills/woda") / f"bill_{bill.data}_local_{bill.local}.pdf"
+
+
+def build_bill_views(db: Session, bills: list[Bill]) -> list[dict]:
+    """
+    Builds plain-data view models of bills (see app.core.pdf_toolkit.render_view).
+    Tenants and house usage of all periods are loaded with two queries.
     
-    # Podsumowanie (zamiast SUMA KOŃCOWA)
-    story.append(Paragraph("PODSUMOWANIE", heading_style))
+    Args:
+        db: Database session
+        bills: Bills to render
     
-    total_data = [
-        ['Netto Lacznie:', format_money(bill.net_sum)],
-        ['VAT:', '8%'],
-        ['Calosc brutto:', format_money(bill.gross_sum)],
-    ]
+    Returns:
+        View models in the order of bills
+    """
+    if not bills:
+        return []
+    periods = {bill.data for bill in bills}
+    tenants = {
+        local.local: local.tenant
+        for local in db.query(Local).filter(Local.local.in_({bill.local for bill in bills}))
+    }
+    house_usage = dict(
+        db.query(Bill.data, func.sum(Bill.usage_m3)).filter(Bill.data.in_(periods)).group_by(Bill.data).all()
+    )
     
-    total_table = Table(total_data, colWidths=[60*mm, 100*mm])
-    total_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, 2), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), default_font),
-        ('FONTSIZE', (0, 2), (-1, 2), 11),
-        ('FONTSIZE', (0, 0), (-1, 1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BACKGROUND', (0, 2), (-1, 2), colors.lightgrey),
-    ]))
+    views = []
+    for bill in bills:
+        # Okres rozliczeniowy - pobierz z faktury
+        period_text = bill.data
+        if bill.invoice and bill.invoice.period_start and bill.invoice.period_stop:
+            period_start = bill.invoice.period_start.strftime('%d.%m.%Y')
+            period_stop = bill.invoice.period_stop.strftime('%d.%m.%Y')
+            period_text = f"{period_start} - {period_stop}"
+        
+        info_rows = [
+            ['Okres rozliczeniowy:', period_text],
+            ['Zuzycie dom:', f"{house_usage.get(bill.data) or 0:.2f} m3"],
+            ['Lokal:', bill.local],
+            ['Najemca:', tenants.get(bill.local, '-')],
+        ]
+        
+        if bill.invoice:
+            invoice = bill.invoice
+            # IMPORTANT: water_subscr_cost and sewage_subscr_cost are already TOTAL sums from all positions
+            # (each position: quantity × price, then all positions are summed)
+            # We do NOT multiply by nr_of_subscription - it's already the total sum!
+            costs_rows = [
+                ['', 'Zuzycie', 'Cena jednostkowa', 'Laczny koszt'],
+                ['Woda:', format_usage(bill.usage_m3), format_money(invoice.water_cost_m3), format_money(bill.cost_water)],
+                ['Scieki:', format_usage(bill.usage_m3), format_money(invoice.sewage_cost_m3), format_money(bill.cost_sewage)],
+                ['Koszt zuzycia woda/scieki lacznie', '', '', format_money(bill.cost_usage_total)],
+                ['Woda abonament', '1/3', format_money(invoice.water_subscr_cost), format_money(bill.abonament_water_share)],
+                ['Scieki abonament', '1/3', format_money(invoice.sewage_subscr_cost), format_money(bill.abonament_sewage_share)],
+                ['Abonament lacznie', '', '', format_money(bill.abonament_total)],
+            ]
+        else:
+            costs_rows = [
+                ['', 'Zużycie', 'Cena jednostkowa', 'Łączny koszt'],
+                ['Woda:', format_usage(bill.usage_m3), '', format_money(bill.cost_water)],
+                ['Scieki:', format_usage(bill.usage_m3), '', format_money(bill.cost_sewage)],
+                ['Koszt zuzycia woda/scieki lacznie', '', '', format_money(bill.cost_usage_total)],
+                ['Abonament', '', '', format_money(bill.abonament_total)],
+            ]
+        
+        total_rows = [
+            ['Netto Lacznie:', format_money(bill.net_sum)],
+            ['VAT:', '8%'],
+            ['Calosc brutto:', format_money(bill.gross_sum)],
+        ]
+        
+        views.append({
+            'bill_id': bill.id,
+            'path': str(bill_pdf_path(bill)),
+            'blocks': [
+                ('paragraph', 'title', "RACHUNEK ZA WODE I SCIEKI"),
+                ('paragraph', 'heading', "NA PODSTAWIE FAKTUR (W ZAŁĄCZNIKU)"),
+                ('table', info_rows, [50, 125], info_table_commands),
+                ('spacer', 3),
+                ('paragraph', 'heading', "ROZLICZENIE KOSZTOW"),
+                ('table', costs_rows, [60, 30, 40, 30], costs_table_commands),
+                ('spacer', 5),
+                ('paragraph', 'heading', "PODSUMOWANIE"),
+                ('table', total_rows, [60, 100], summary_table_commands),
+            ],
+        })
+    return views
+
+
+def generate_bill_pdf(db: Session, bill: Bill) -> str:
+    """
+    Generates PDF file with bill.
     
-    story.append(total_table)
+    Args:
+        db: Database session
+        bill: Bill to generate
     
-    # Generuj PDF - "Wygenerowano" jest dodawane w CustomDocTemplate
-    doc.build(story)
+    Returns:
+        Path to generated PDF file (not re-rendered if bill.pdf_hash matches)
+    """
+    view = build_bill_views(db, [bill])[0]
+    return write_pdf_cached(bill, view)
+
+
+def generate_bill_pdfs(db: Session, bills: list[Bill], max_workers: int | None = None) -> tuple[dict, dict, dict]:
+    """
+    Renders PDFs of changed bills in parallel and saves pdf_path and pdf_hash
+    with one bulk update (without commit).
     
-    return str(filepath)
+    Returns:
+        Tuple ({bill_id: path} rendered, {bill_id: path} unchanged, {bill_id: error})
+    """
+    return render_and_save(db, Bill, build_bill_views(db, bills), max_workers)
 
 
 def generate_all_bills_for_period(db: Session, period: str) -> list[str]:
@@ -282,26 +177,17 @@ def generate_all_bills_for_period(db: Session, period: str) -> list[str]:
         print(f"Brak rachunków dla okresu {period}")
         return []
     
-    generated_files = []
+    generated_files = [str(bill_pdf_path(bill)) for bill in bills]
     
-    for bill in bills:
-        # Sprawdź czy plik już istnieje
-        bills_folder = Path("bills/woda")
-        filename = f"bill_{bill.data}_local_{bill.local}.pdf"
-        filepath = bills_folder / filename
-        
-        if filepath.exists():
-            print(f"Rachunek już istnieje: {filename}")
-        else:
-            pdf_path = generate_bill_pdf(db, bill)
-            
-            # Zaktualizuj ścieżkę w bazie
-            bill.pdf_path = pdf_path
-            db.commit()
-            
-            print(f"[OK] Wygenerowano: {filename}")
-        
-        generated_files.append(str(filepath))
+    # Renderowane są tylko rachunki, których dane zmieniły się od ostatniego PDF (pdf_hash)
+    rendered, unchanged, errors = generate_bill_pdfs(db, bills)
+    db.commit()
+    for path in unchanged.values():
+        print(f"Rachunek aktualny: {Path(path).name}")
+    for path in rendered.values():
+        print(f"[OK] Wygenerowano: {Path(path).name}")
+    for bill_id, error in errors.items():
+        print(f"[ERROR] Błąd generowania PDF dla rachunku {bill_id}: {error}")
     
     return generated_files
 
@@ -369,25 +255,23 @@ def generate_all_possible_bills(db: Session) -> dict:
             print(f"[ERROR] {error_msg}")
             continue
     
-    # Teraz wygeneruj PDF dla wszystkich rachunków bez PDF
+    # Teraz wygeneruj PDF dla rachunków bez aktualnego PDF (równolegle, jeden UPDATE ścieżek)
     all_bills = db.query(Bill).all()
-    for bill in all_bills:
-        if not bill.pdf_path:
-            try:
-                bills_folder = Path("bills")
-                filename = f"bill_{bill.data}_local_{bill.local}.pdf"
-                filepath = bills_folder / filename
-                
-                if not filepath.exists():
-                    pdf_path = generate_bill_pdf(db, bill)
-                    bill.pdf_path = pdf_path
-                    db.commit()
-                    pdfs_generated_count += 1
-                    print(f"[OK] Wygenerowano PDF: {filename}")
-            except Exception as e:
-                error_msg = f"Błąd generowania PDF dla rachunku {bill.id} ({bill.data}, {bill.local}): {str(e)}"
-                errors.append(error_msg)
-                print(f"[ERROR] {error_msg}")
+    bills_by_id = {bill.id: bill for bill in all_bills}
+    try:
+        paths, _, pdf_errors = generate_bill_pdfs(db, all_bills)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        paths, pdf_errors = {}, {bill.id: str(e) for bill in all_bills}
+    pdfs_generated_count = len(paths)
+    for path in paths.values():
+        print(f"[OK] Wygenerowano PDF: {Path(path).name}")
+    for bill_id, error in pdf_errors.items():
+        bill = bills_by_id[bill_id]
+        error_msg = f"Błąd generowania PDF dla rachunku {bill.id} ({bill.data}, {bill.local}): {error}"
+        errors.append(error_msg)
+        print(f"[ERROR] {error_msg}")
     
     return {
         "message": "Zakończono generowanie wszystkich możliwych rachunków",
@@ -4,14 +4,16 @@ Zawiera endpointy do zarządzania danymi i generowania rachunków.
 """
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends
-from fastapi.responses import HTMLResponse, Response
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 from sqlalchemy.orm import Session
 
+from app.core.compression import TextGZipMiddleware
 from app.core.database import init_db, get_db
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.static_assets import PrecompressedStaticFiles, build_static_assets, page_response
 from app.models.water import Local
 from app.config import settings
 from app.api.routes.gas import router as gas_router
@@ -20,6 +22,8 @@ from app.api.routes.water import router as water_router
 from app.api.routes.auth import router as auth_router
 from app.api.routes.backup import router as backup_router
 from app.api.routes.combined import router as combined_router
+from app.api.routes.bills import router as bills_router
+from app.api.routes.dashboard import router as dashboard_router
 
 
 def init_admin_user(db: Session):
@@ -59,6 +63,13 @@ async def lifespan(app: FastAPI):
     finally:
         db.close()
     
+    # Zbudowanie zasobów statycznych stron (tylko po zmianie źródeł)
+    try:
+        for page, files in build_static_assets(Path(settings.static_dir)).items():
+            print(f"[OK] Zbudowano {page} ({len(files)} plików)")
+    except OSError as e:
+        print(f"[WARNING] Nie udało się zbudować zasobów statycznych - strony serwowane ze źródeł: {e}")
+    
     yield
     # Shutdown - tutaj można dodać czyszczenie zasobów jeśli potrzeba
 
@@ -67,7 +78,9 @@ app = FastAPI(
     title=settings.api_title,
     description=settings.api_description,
     version=settings.api_version,
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Odpowiedzi JSON serializowane przez orjson (daty, liczby i słowniki w C)
+    default_response_class=ORJSONResponse
 )
 
 # CORS dla frontendu
@@ -77,12 +90,15 @@ app.add_middleware(
     allow_credentials=settings.cors_allow_credentials,
     allow_methods=settings.cors_allow_methods,
     allow_headers=settings.cors_allow_headers,
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+# Kompresja odpowiedzi JSON i HTML (PDF, ZIP i prekompresowane pliki statyczne bez zmian)
+app.add_middleware(TextGZipMiddleware, minimum_size=1000)
 
 # Serwowanie plików statycznych
 static_dir = Path(settings.static_dir)
 static_dir.mkdir(exist_ok=True, parents=True)
-app.mount("/static", StaticFiles(directory=settings.static_dir), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=settings.static_dir), name="static")
 
 # Rejestracja routerów dla mediów
 app.include_router(water_router)  # /api/water/*
@@ -91,6 +107,8 @@ app.include_router(electricity_router)  # /api/electricity/*
 app.include_router(auth_router)  # /api/auth/*
 app.include_router(backup_router)  # /api/backup/*
 app.include_router(combined_router)  # /api/combined/*
+app.include_router(bills_router)  # /api/bills/*
+app.include_router(dashboard_router)  # /api/dashboard/*
 
 
 # ========== ENDPOINTY POMOCNICZE ==========
@@ -102,11 +120,11 @@ def favicon():
 
 
 @app.get("/", response_class=HTMLResponse)
-def root():
+def root(request: Request):
     """Strona główna - przekierowanie do logowania."""
-    login_path = static_dir / "login.html"
-    if login_path.exists():
-        return login_path.read_text(encoding="utf-8")
+    response = page_response(request, static_dir, "login.html")
+    if response is not None:
+        return response
     return """
     <!DOCTYPE html>
     <html>
@@ -124,29 +142,29 @@ def root():
 
 
 @app.get("/login", response_class=HTMLResponse)
-def login_page():
+def login_page(request: Request):
     """Strona logowania."""
-    login_path = static_dir / "login.html"
-    if login_path.exists():
-        return login_path.read_text(encoding="utf-8")
+    response = page_response(request, static_dir, "login.html")
+    if response is not None:
+        return response
     return "<h1>Strona logowania nie znaleziona</h1>"
 
 
 @app.get("/dashboard", response_class=HTMLResponse)
-def dashboard():
+def dashboard(request: Request):
     """Dashboard aplikacji."""
-    dashboard_path = static_dir / "dashboard.html"
-    if dashboard_path.exists():
-        return dashboard_path.read_text(encoding="utf-8")
+    response = page_response(request, static_dir, "dashboard.html")
+    if response is not None:
+        return response
     return "<h1>Dashboard nie znaleziony. Sprawdź folder static/</h1>"
 
 
 @app.get("/dashboard-alt", response_class=HTMLResponse)
-def dashboard_alt():
+def dashboard_alt(request: Request):
     """Alternatywny dashboard aplikacji."""
-    dashboard_path = static_dir / "dashboard_alt.html"
-    if dashboard_path.exists():
-        return dashboard_path.read_text(encoding="utf-8")
+    response = page_response(request, static_dir, "dashboard_alt.html")
+    if response is not None:
+        return response
     return "<h1>Alternatywny dashboard nie znaleziony. Sprawdź folder static/</h1>"
 
 
@@ -0,0 +1,51 @@
+"""
+Migracja: Dodanie tabeli osi taryfowych faktur prądu.
+Tworzy tabelę electricity_invoice_tariff_timelines (przedziały dat z cenami netto stref,
+opłatami stałymi i stawką VAT zapisanymi jako tablice) i wypełnia ją dla istniejących faktur.
+"""
+
+from sqlalchemy import text
+from app.core.database import engine, SessionLocal
+
+
+def upgrade():
+    """Tworzy tabelę osi taryfowych i buduje osie dla istniejących faktur."""
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS electricity_invoice_tariff_timelines (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                invoice_id INTEGER NOT NULL UNIQUE,
+                end_date DATE NOT NULL,
+                segment_starts BLOB NOT NULL,
+                prices_dzienna BLOB NOT NULL,
+                prices_nocna BLOB NOT NULL,
+                prices_calodobowa BLOB NOT NULL,
+                fixed_fees BLOB NOT NULL,
+                vat_rates BLOB NOT NULL,
+                FOREIGN KEY (invoice_id) REFERENCES electricity_invoices(id) ON DELETE CASCADE
+            )
+        """))
+
+    # Osie dla istniejących faktur
+    from app.services.electricity.tariff_timeline import rebuild_tariff_timelines
+    db = SessionLocal()
+    try:
+        count = rebuild_tariff_timelines(db)
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"[OK] Tabela electricity_invoice_tariff_timelines utworzona, zbudowano osie dla {count} faktur")
+
+
+def downgrade():
+    """Usuwa tabelę osi taryfowych."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS electricity_invoice_tariff_timelines"))
+
+    print("[OK] Tabela electricity_invoice_tariff_timelines usunięta")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,50 @@
+"""
+Migracja: Dodanie tabeli kolejki wiadomości email (email_outbox).
+Rachunki łączone i backupy są zapisywane w kolejce, a worker wysyła je
+przez współdzielone połączenia SMTP i zapisuje status dostarczenia.
+"""
+
+from sqlalchemy import text
+from app.core.database import engine
+
+
+def upgrade():
+    """Tworzy tabelę email_outbox."""
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind VARCHAR(20) NOT NULL,
+                recipient VARCHAR(200) NOT NULL,
+                subject VARCHAR(300) NOT NULL,
+                body TEXT NOT NULL,
+                attachment_path VARCHAR(500),
+                attachment_name VARCHAR(200),
+                encrypt_attachment BOOLEAN NOT NULL DEFAULT 0,
+                combined_bill_id INTEGER REFERENCES combined_bills (id),
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                claimed_at DATETIME,
+                last_error VARCHAR(500),
+                created_at DATETIME NOT NULL,
+                sent_at DATETIME
+            )
+        """))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_email_outbox_status ON email_outbox (status)"
+        ))
+
+    print("[OK] Tabela email_outbox utworzona")
+
+
+def downgrade():
+    """Usuwa tabelę email_outbox."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS email_outbox"))
+
+    print("[OK] Tabela email_outbox usunięta")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,36 @@
+"""
+Migracja: Dodanie kolumny claimed_at do tabeli email_outbox.
+Czas pobrania wiadomości do wysyłki pozwala workerowi ponownie przejąć wiadomości,
+których wysyłka została przerwana (status 'sending' dłużej niż SENDING_TIMEOUT).
+Wiadomości 'sending' bez claimed_at są przejmowane przy najbliższej wysyłce.
+"""
+
+from sqlalchemy import inspect, text
+from app.core.database import engine
+
+
+def upgrade():
+    """Dodaje kolumnę claimed_at do tabeli email_outbox."""
+    inspector = inspect(engine)
+    if not inspector.has_table('email_outbox'):
+        print("[INFO] Tabela email_outbox nie istnieje - uruchom migrate_add_email_outbox.py")
+        return
+    if 'claimed_at' in [column['name'] for column in inspector.get_columns('email_outbox')]:
+        print("[INFO] Kolumna claimed_at już istnieje w tabeli email_outbox - pomijam")
+        return
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE email_outbox ADD COLUMN claimed_at DATETIME"))
+    print("[OK] Kolumna claimed_at dodana do tabeli email_outbox")
+
+
+def downgrade():
+    """Usuwa kolumnę claimed_at z tabeli email_outbox (SQLite >= 3.35)."""
+    inspector = inspect(engine)
+    if inspector.has_table('email_outbox') and 'claimed_at' in [c['name'] for c in inspector.get_columns('email_outbox')]:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE email_outbox DROP COLUMN claimed_at"))
+        print("[OK] Kolumna claimed_at usunięta z tabeli email_outbox")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,49 @@
+"""
+Migracja: Dodanie tabeli reguł podziału kosztów gazu.
+Tworzy tabelę gas_allocation_rules i wypełnia ją dotychczasowym podziałem
+(gora 58% - płaci odsetki, dol 25%, gabinet 17%) obowiązującym bezterminowo.
+"""
+
+from sqlalchemy import text
+from app.core.database import engine
+
+
+def upgrade():
+    """Tworzy tabelę reguł podziału i dodaje reguły domyślne."""
+    from app.services.gas.manager import DEFAULT_ALLOCATION_RULES
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS gas_allocation_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                local VARCHAR(50) NOT NULL,
+                share FLOAT NOT NULL,
+                bears_interest BOOLEAN NOT NULL DEFAULT 0,
+                valid_from DATE,
+                valid_to DATE
+            )
+        """))
+
+        count = conn.execute(text("SELECT COUNT(*) FROM gas_allocation_rules")).scalar()
+        if count == 0:
+            conn.execute(
+                text("INSERT INTO gas_allocation_rules (local, share, bears_interest) VALUES (:local, :share, :bears_interest)"),
+                [
+                    {"local": local, "share": share, "bears_interest": bears_interest}
+                    for local, share, bears_interest in DEFAULT_ALLOCATION_RULES
+                ]
+            )
+
+    print("[OK] Tabela gas_allocation_rules utworzona")
+
+
+def downgrade():
+    """Usuwa tabelę reguł podziału."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS gas_allocation_rules"))
+
+    print("[OK] Tabela gas_allocation_rules usunięta")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,41 @@
+"""
+Migracja: Indeksy (data, id) dla stronicowania kursorowego list.
+Endpointy list zwracają strony posortowane malejąco po (data, id) - indeks
+pozwala pobrać każdą stronę bez sortowania i pomijania wcześniejszych wierszy.
+"""
+
+from sqlalchemy import text
+from app.core.database import engine
+
+# (nazwa indeksu, tabela, kolumny)
+INDEXES = [
+    ("idx_bills_data_id", "bills", "data, id"),
+    ("idx_invoices_data_id", "invoices", "data, id"),
+    ("idx_gas_bills_data_id", "gas_bills", "data, id"),
+    ("idx_gas_invoices_data_id", "gas_invoices", "data, id"),
+    ("idx_electricity_bills_data_id", "electricity_bills", "data, id"),
+    ("idx_electricity_invoices_period_id", "electricity_invoices", "data_poczatku_okresu, id"),
+]
+
+
+def upgrade():
+    """Tworzy indeksy (data, id)."""
+
+    with engine.begin() as conn:
+        for name, table, columns in INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+    print(f"[OK] Utworzono indeksy stronicowania ({len(INDEXES)})")
+
+
+def downgrade():
+    """Usuwa indeksy (data, id)."""
+    with engine.begin() as conn:
+        for name, _, _ in INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    print("[OK] Indeksy stronicowania usunięte")
+
+
+if __name__ == "__main__":
+    upgrade()
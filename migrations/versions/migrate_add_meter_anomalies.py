@@ -0,0 +1,77 @@
+"""
+Migracja: Dodanie tabel wykrywania anomalii odczytów liczników.
+Tworzy tabele meter_stream_states (ostatni przetworzony odczyt licznika),
+meter_statistics (okna zużyć z medianą i MAD per miesiąc kalendarzowy)
+i meter_anomalies (wykryte anomalie) oraz przetwarza istniejącą historię odczytów.
+Później odczyty są przetwarzane przy zapisie (oraz przez
+POST /api/combined/meter-anomalies/refresh).
+"""
+
+from sqlalchemy import text
+from app.core.database import engine, SessionLocal
+
+
+def upgrade():
+    """Tworzy tabele anomalii odczytów."""
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS meter_stream_states (
+                meter VARCHAR(50) PRIMARY KEY,
+                last_data VARCHAR(7) NOT NULL,
+                last_value FLOAT
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS meter_statistics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                meter VARCHAR(50) NOT NULL,
+                month INTEGER NOT NULL,
+                deltas TEXT NOT NULL,
+                median FLOAT NOT NULL,
+                mad FLOAT NOT NULL,
+                CONSTRAINT uq_meter_statistics_meter_month UNIQUE (meter, month)
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS meter_anomalies (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                media VARCHAR(20) NOT NULL,
+                meter VARCHAR(50) NOT NULL,
+                data VARCHAR(7) NOT NULL,
+                kind VARCHAR(30) NOT NULL,
+                value FLOAT NOT NULL,
+                previous_value FLOAT NOT NULL,
+                delta FLOAT NOT NULL,
+                median FLOAT,
+                mad FLOAT,
+                score FLOAT
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_meter_anomalies_meter ON meter_anomalies (meter)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_meter_anomalies_data ON meter_anomalies (data)"))
+
+    # Istniejąca historia odczytów
+    from app.services.combined.meter_anomalies import update_meter_anomalies
+    db = SessionLocal()
+    try:
+        stats = update_meter_anomalies(db)
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"[OK] Tabele meter_stream_states, meter_statistics i meter_anomalies utworzone, "
+          f"przetworzono {stats['readings_processed']} odczytów ({stats['anomalies_found']} anomalii)")
+
+
+def downgrade():
+    """Usuwa tabele anomalii odczytów."""
+    with engine.begin() as conn:
+        for table in ("meter_anomalies", "meter_statistics", "meter_stream_states"):
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+    print("[OK] Tabele anomalii odczytów usunięte")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,40 @@
+"""
+Migracja: Dodanie kolumny pdf_hash do tabel rachunków (woda, gaz, prąd, łączone).
+Skrót danych wejściowych PDF pozwala pominąć ponowne renderowanie niezmienionych
+rachunków. Puste pdf_hash oznacza, że PDF zostanie wygenerowany przy najbliższej okazji.
+"""
+
+from sqlalchemy import inspect, text
+from app.core.database import engine
+
+BILL_TABLES = ('bills', 'gas_bills', 'electricity_bills', 'combined_bills')
+
+
+def upgrade():
+    """Dodaje kolumnę pdf_hash do istniejących tabel rachunków."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in BILL_TABLES:
+            if not inspector.has_table(table):
+                print(f"[INFO] Tabela {table} nie istnieje - zostanie utworzona automatycznie")
+                continue
+            columns = [column['name'] for column in inspector.get_columns(table)]
+            if 'pdf_hash' in columns:
+                print(f"[INFO] Kolumna pdf_hash już istnieje w tabeli {table} - pomijam")
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN pdf_hash VARCHAR(64)"))
+            print(f"[OK] Kolumna pdf_hash dodana do tabeli {table}")
+
+
+def downgrade():
+    """Usuwa kolumnę pdf_hash z tabel rachunków (SQLite >= 3.35)."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in BILL_TABLES:
+            if inspector.has_table(table) and 'pdf_hash' in [c['name'] for c in inspector.get_columns(table)]:
+                conn.execute(text(f"ALTER TABLE {table} DROP COLUMN pdf_hash"))
+                print(f"[OK] Kolumna pdf_hash usunięta z tabeli {table}")
+
+
+if __name__ == "__main__":
+    upgrade()
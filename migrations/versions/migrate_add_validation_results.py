@@ -0,0 +1,56 @@
+"""
+Migracja: Dodanie tabeli wyników walidacji faktur.
+Tworzy tabelę validation_results (wynik reguły per faktura) i waliduje istniejące
+faktury. Później faktury są walidowane przy zapisie (oraz przez
+POST /api/combined/invoice-validation/refresh).
+"""
+
+from sqlalchemy import text
+from app.core.database import engine, SessionLocal
+
+
+def upgrade():
+    """Tworzy tabelę validation_results i waliduje istniejące faktury."""
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS validation_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                media VARCHAR(20) NOT NULL,
+                invoice_id INTEGER NOT NULL,
+                rule VARCHAR(60) NOT NULL,
+                status VARCHAR(10) NOT NULL,
+                severity VARCHAR(10) NOT NULL,
+                expected FLOAT,
+                actual FLOAT,
+                message VARCHAR(300),
+                CONSTRAINT uq_validation_results_invoice_rule UNIQUE (media, invoice_id, rule)
+            )
+        """))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_validation_results_status ON validation_results (media, status)"
+        ))
+
+    # Wyniki dla istniejących faktur
+    from app.services.combined.invoice_validation import validate_invoices
+    db = SessionLocal()
+    try:
+        stats = validate_invoices(db)
+        db.commit()
+    finally:
+        db.close()
+
+    count = sum(media_stats['validated'] for media_stats in stats.values())
+    print(f"[OK] Tabela validation_results utworzona, zwalidowano {count} faktur")
+
+
+def downgrade():
+    """Usuwa tabelę validation_results."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS validation_results"))
+
+    print("[OK] Tabela validation_results usunięta")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,390 @@
+"""
+Wspólne fixtures dla testów - baza SQLite w pamięci ze wszystkimi tabelami,
+zestawy rachunków wszystkich mediów oraz funkcje budujące dane testowe
+(importowane w testach z tests.conftest).
+"""
+
+import asyncio
+import copy
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+
+import app.models  # noqa: F401 - rejestruje wszystkie modele w Base.metadata
+from app.api.routes.electricity import verify_and_save_invoice_detailed
+from app.core.database import Base
+from app.models.combined import CombinedBill
+from app.models.electricity import ElectricityBill, ElectricityReading
+from app.models.electricity_invoice import (
+    ElectricityInvoice,
+    ElectricityInvoiceBlankiet,
+    ElectricityInvoiceOplataDystrybucyjna,
+    ElectricityInvoiceSprzedazEnergii,
+)
+from app.models.gas import GasBill, GasInvoice
+from app.models.water import Bill, Invoice, Local, Reading
+
+
+@pytest.fixture
+def db_engine():
+    """Silnik SQLite w pamięci z utworzonym schematem."""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    # Nazwy indeksów (idx_rok, idx_invoice_id) powtarzają się między tabelami,
+    # więc - jak w init_db - ignorujemy błędy już istniejących indeksów
+    for table in Base.metadata.sorted_tables:
+        try:
+            table.create(bind=engine, checkfirst=True)
+        except OperationalError as e:
+            if "already exists" not in str(e):
+                raise
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(db_engine):
+    """Sesja bazy danych w pamięci."""
+    session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def count_queries(db_engine):
+    """
+    Zapisywanie zapytań SQL wykonanych na silniku testowym.
+
+    count_queries() zwraca listę, do której trafiają kolejne zapytania;
+    count_queries(call) wykonuje call i zwraca listę jego zapytań
+    (selects=True - tylko SELECT). Listenery są usuwane po teście.
+    """
+    listeners = []
+
+    def record(call=None, selects=False):
+        statements = []
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db_engine, "before_cursor_execute", listener)
+        listeners.append(listener)
+        if call is None:
+            return statements
+        try:
+            call()
+        finally:
+            event.remove(db_engine, "before_cursor_execute", listener)
+            listeners.remove(listener)
+        if selects:
+            return [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+        return statements
+
+    yield record
+    for listener in listeners:
+        event.remove(db_engine, "before_cursor_execute", listener)
+
+
+# ========== ODCZYTY I FAKTURY PRĄDU ==========
+
+def create_reading(
+    data: str,
+    dom_single: bool = True,
+    dom_reading: float = None,
+    dom_I: float = None,
+    dom_II: float = None,
+    dol_single: bool = True,
+    dol_reading: float = None,
+    dol_I: float = None,
+    dol_II: float = None,
+    gabinet: float = 0.0
+) -> ElectricityReading:
+    """Pomocnicza funkcja do tworzenia odczytów testowych."""
+    reading = ElectricityReading()
+    reading.data = data
+    reading.licznik_dom_jednotaryfowy = dom_single
+    reading.odczyt_dom = dom_reading
+    reading.odczyt_dom_I = dom_I
+    reading.odczyt_dom_II = dom_II
+    reading.licznik_dol_jednotaryfowy = dol_single
+    reading.odczyt_dol = dol_reading
+    reading.odczyt_dol_I = dol_I
+    reading.odczyt_dol_II = dol_II
+    reading.odczyt_gabinet = gabinet
+    return reading
+
+
+def create_invoice(numer: str, start: date, end: date) -> ElectricityInvoice:
+    """Pomocnicza funkcja do tworzenia faktur testowych (tylko pola wymagane)."""
+    return ElectricityInvoice(
+        rok=start.year, numer_faktury=numer, data_wystawienia=end,
+        data_poczatku_okresu=start, data_konca_okresu=end,
+        naleznosc_za_okres=0, wartosc_prognozy=0, faktury_korygujace=0, odsetki=0,
+        wynik_rozliczenia=0, kwota_nadplacona=0, saldo_z_rozliczenia=0, niedoplata_nadplata=0,
+        energia_do_akcyzy_kwh=0, akcyza=0, do_zaplaty=0, zuzycie_kwh=0,
+        ogolem_sprzedaz_energii=0, ogolem_usluga_dystrybucji=0,
+        grupa_taryfowa="G12", typ_taryfy="DWUTARYFOWA", energia_lacznie_zuzyta_w_roku_kwh=0
+    )
+
+
+def create_invoice_with_prices(db_session):
+    """Faktura dwutaryfowa z dwoma okresami cenowymi (zmiana cen 31.03.2022)."""
+    invoice = create_invoice("F/1", date(2021, 11, 1), date(2022, 10, 31))
+    db_session.add(invoice)
+    db_session.flush()
+
+    def sprzedaz(data, strefa, ilosc, cena):
+        return ElectricityInvoiceSprzedazEnergii(
+            invoice_id=invoice.id, rok=2022, data=data, strefa=strefa, ilosc_kwh=ilosc,
+            cena_za_kwh=cena, naleznosc=round(ilosc * cena * 1.23, 2), vat_procent=23
+        )
+
+    def oplata(data, typ, strefa, jednostka, cena, naleznosc=0):
+        return ElectricityInvoiceOplataDystrybucyjna(
+            invoice_id=invoice.id, rok=2022, typ_oplaty=typ, strefa=strefa, jednostka=jednostka,
+            data=data, cena=cena, naleznosc=naleznosc, vat_procent=23
+        )
+
+    first, second = date(2022, 3, 31), date(2022, 10, 31)
+    db_session.add_all([
+        sprzedaz(first, "DZIENNA", 1000, 0.5),
+        sprzedaz(first, "NOCNA", 500, 0.3),
+        sprzedaz(second, "DZIENNA", 1000, 0.7),
+        sprzedaz(second, "NOCNA", 500, 0.4),
+        oplata(first, "OPŁATA OZE", "DZIENNA", "kWh", 0.01),
+        oplata(first, "OPŁATA OZE", "NOCNA", "kWh", 0.01),
+        oplata(second, "OPŁATA OZE", "DZIENNA", "kWh", 0.02),
+        oplata(second, "OPŁATA OZE", "NOCNA", "kWh", 0.02),
+        oplata(first, "Opłata abonamentowa", None, "zł/mc", 1.0, naleznosc=30.0),
+        oplata(second, "Opłata abonamentowa", None, "zł/mc", 2.0, naleznosc=60.0),
+    ])
+    db_session.commit()
+    return invoice
+
+
+def create_period_data(db_session, local_names):
+    """Faktura z dwoma okresami cenowymi, dwa odczyty dwutaryfowe i lokale."""
+    create_invoice_with_prices(db_session)
+    previous = create_reading("2022-03", dom_single=False, dom_I=1000.0, dom_II=500.0,
+                              dol_single=False, dol_I=400.0, dol_II=200.0, gabinet=100.0)
+    previous.data_odczytu_licznika = date(2022, 3, 10)
+    current = create_reading("2022-05", dom_single=False, dom_I=1300.0, dom_II=600.0,
+                             dol_single=False, dol_I=500.0, dol_II=250.0, gabinet=150.0)
+    current.data_odczytu_licznika = date(2022, 5, 10)
+    db_session.add_all([previous, current])
+    db_session.add_all([Local(local=name) for name in local_names])
+    db_session.commit()
+
+
+def invoice_payload():
+    """Dane faktury dwutaryfowej w formacie dashboardu."""
+    payload = {field: 0 for field in (
+        'naleznosc_za_okres', 'wartosc_prognozy', 'faktury_korygujace', 'odsetki',
+        'wynik_rozliczenia', 'kwota_nadplacona', 'saldo_z_rozliczenia', 'niedoplata_nadplata',
+        'energia_do_akcyzy_kwh', 'akcyza', 'do_zaplaty', 'zuzycie_kwh',
+        'ogolem_sprzedaz_energii', 'ogolem_usluga_dystrybucji', 'energia_lacznie_zuzyta_w_roku_kwh'
+    )}
+    payload.update({
+        'rok': 2022, 'numer_faktury': 'P/1', 'data_wystawienia': '2022-11-15',
+        'data_poczatku_okresu': '2021-11-01', 'data_konca_okresu': '2022-10-31',
+        'grupa_taryfowa': 'G12', 'typ_taryfy': 'DWUTARYFOWA',
+        'blankiety': [
+            {'nr_blankietu': 'B/1', 'okres_od': '01/11/2021', 'okres_do': '31/03/2022', 'kwota_brutto': '1.234,56'},
+            {'nr_blankietu': 'B/2', 'okres_od': '01/04/2022', 'okres_do': '31/10/2022', 'kwota_brutto': '100,00'},
+            {'ogolem': True},
+        ],
+        'odczyty': [
+            {'typ': 'pobrana', 'strefa': 'dzienna', 'data': '31/10/2022', 'biezace': '24.320', 'ilosc': '1.000'},
+            {'typ': 'pobrana', 'strefa': 'dzienna', 'data': '31/10/2022', 'biezace': '24.320'},
+            {'typ': 'pobrana', 'strefa': 'nocna', 'data': '31/10/2022', 'biezace': '8.100'},
+        ],
+        'sprzedaz_energii': [
+            {'data': '31/03/2022', 'strefa': 'DZIENNA', 'ilosc': '1.000', 'cena': '0,5000', 'naleznosc': '615,00'},
+            {'data': '31/03/2022', 'strefa': 'NOCNA', 'ilosc': '500', 'cena': '0,3000', 'naleznosc': '184,50'},
+            {'typ': 'upust', 'naleznosc': '-10,00'},
+        ],
+        'oplaty_dystrybucyjne': [
+            {'nazwa': 'Opłata abonamentowa', 'jednostka': 'zł/mc', 'data': '31/03/2022', 'ilosc': '5', 'cena': '1,00', 'naleznosc': '6,15'},
+        ],
+    })
+    return payload
+
+
+def save_invoices(db_session, count: int, first_year: int = 2010):
+    """Zapisuje faktury z pełnymi pozycjami podrzędnymi (różne lata)."""
+    ids = []
+    for i in range(count):
+        payload = copy.deepcopy(invoice_payload())
+        payload['rok'] = first_year + i
+        payload['numer_faktury'] = f"P/{first_year + i}"
+        ids.append(verify_and_save_invoice_detailed(invoice_data=payload, db=db_session)["invoice_id"])
+    return ids
+
+
+def create_bills(db_session, invoice_count: int, bills_per_invoice: int, first_year: int = 2010):
+    """Tworzy faktury (po jednym blankiecie) i rachunki przypisane do nich."""
+    for i in range(invoice_count):
+        year = first_year + i
+        invoice = create_invoice(f"F/{i}", date(year, 1, 1), date(year, 12, 31))
+        db_session.add(invoice)
+        db_session.flush()
+        db_session.add(ElectricityInvoiceBlankiet(
+            invoice_id=invoice.id, rok=year, numer_blankietu=f"B/{i}",
+            poczatek_podokresu=date(year, 1, 1), koniec_podokresu=date(year, 12, 31),
+            kwota_brutto=0, akcyza=0, energia_do_akcyzy_kwh=0, nadplata_niedoplata=0,
+            odsetki=0, termin_platnosci=date(year, 12, 31), do_zaplaty=0
+        ))
+        for j in range(bills_per_invoice):
+            db_session.add(ElectricityBill(
+                data=f"{year}-{j % 12 + 1:02d}", local="gora", invoice_id=invoice.id,
+                usage_kwh=10.0, energy_cost_gross=1.0, distribution_cost_gross=1.0,
+                total_net_sum=1.0, total_gross_sum=2.0
+            ))
+    db_session.commit()
+
+
+# ========== FAKTURY GAZU ==========
+
+def create_gas_invoice(db_session, data, interest=0.0, detailed=True):
+    """Faktura gazu z wartościami szczegółowymi (lub tylko sumą brutto)."""
+    value = 100.0 if detailed else 0.0
+    year, month = map(int, data.split('-'))
+    invoice = GasInvoice(
+        data=data, period_start=date(year, month, 1), period_stop=date(year, month, 28),
+        previous_reading=0, current_reading=100, fuel_usage_m3=100, fuel_price_net=1, fuel_value_net=value,
+        fuel_vat_amount=0, fuel_value_gross=value * 2, subscription_quantity=2, subscription_price_net=1,
+        subscription_value_net=value, subscription_vat_amount=0, subscription_value_gross=value,
+        distribution_fixed_quantity=2, distribution_fixed_price_net=1, distribution_fixed_vat_amount=0,
+        distribution_fixed_value_gross=value, distribution_fixed_value_net=value,
+        distribution_variable_usage_m3=100, distribution_variable_conversion_factor=11,
+        distribution_variable_usage_kwh=1100, distribution_variable_price_net=0.1,
+        distribution_variable_value_net=value, distribution_variable_vat_amount=0,
+        distribution_variable_value_gross=value, fuel_conversion_factor=11, fuel_usage_kwh=1100,
+        vat_rate=0.23, vat_amount=0, total_net_sum=400, total_gross_sum=492.0 + interest,
+        late_payment_interest=interest, amount_to_pay=492.0 + interest, payment_due_date=date(year, month, 28),
+        invoice_number=f"P/{data}"
+    )
+    db_session.add(invoice)
+    db_session.commit()
+    return invoice
+
+
+# ========== RACHUNKI WSZYSTKICH MEDIÓW ==========
+
+@pytest.fixture
+def bills(db_session):
+    """Rachunki wody, gazu, prądu i rachunek łączony lokalu 'gora' za 2024-01/2024-02."""
+    local = Local(local="gora", tenant="Jan Testowy")
+    db_session.add(local)
+    db_session.add_all([
+        Reading(data=period, water_meter_main=value, water_meter_5=value // 2, water_meter_5a=1, water_meter_5b=0)
+        for period, value in (("2024-01", 100), ("2024-02", 130))
+    ])
+    water_invoice = Invoice(
+        data="2024-02", usage=30, water_cost_m3=5, sewage_cost_m3=6, nr_of_subscription=2,
+        water_subscr_cost=10, sewage_subscr_cost=12, vat=0.08, period_start=date(2024, 1, 1),
+        period_stop=date(2024, 2, 29), invoice_number="W/1", gross_sum=380
+    )
+    db_session.add(water_invoice)
+    db_session.flush()
+    water = Bill(
+        data="2024-02", local="gora", reading_id="2024-02", invoice_id=water_invoice.id, local_id=local.id,
+        reading_value=65, usage_m3=15, cost_water=75, cost_sewage=90, cost_usage_total=165,
+        abonament_water_share=3.33, abonament_sewage_share=4, abonament_total=7.33, net_sum=172.33, gross_sum=186.12
+    )
+    gas_invoice = create_gas_invoice(db_session, "2024-01")
+    gas = GasBill(
+        data="2024-01", local="gora", invoice_id=gas_invoice.id, local_id=local.id, cost_share=0.58,
+        fuel_cost_gross=116, subscription_cost_gross=58, distribution_fixed_cost_gross=58,
+        distribution_variable_cost_gross=58, total_net_sum=232, total_gross_sum=285.36
+    )
+    electricity_invoice = create_invoice("P/1", date(2024, 1, 1), date(2024, 12, 31))
+    db_session.add(electricity_invoice)
+    db_session.flush()
+    electricity = ElectricityBill(
+        data="2024-02", local="gora", invoice_id=electricity_invoice.id, local_id=local.id,
+        usage_kwh=200, usage_kwh_dzienna=140, usage_kwh_nocna=60, energy_cost_gross=100,
+        distribution_cost_gross=50, total_net_sum=130, total_gross_sum=160
+    )
+    db_session.add_all([water, gas, electricity])
+    db_session.flush()
+    combined = CombinedBill(
+        period_start="2024-01", period_end="2024-02", local="gora", local_id=local.id,
+        water_bill_id=water.id, gas_bill_id=gas.id, electricity_bill_id=electricity.id,
+        total_net_sum=534.33, total_gross_sum=631.48, generated_date=date(2024, 3, 1)
+    )
+    db_session.add(combined)
+    db_session.commit()
+    return {'water': water, 'gas': gas, 'electricity': electricity, 'combined': combined}
+
+
+@pytest.fixture
+def combined_bills(db_session, bills):
+    """Rachunki łączone lokali 'gora', 'dol' i 'gabinet' z odczytami prądu (także poprzednim)."""
+    readings = [
+        ElectricityReading(
+            data=period, data_odczytu_licznika=reading_date, odczyt_dom_I=value, odczyt_dom_II=value / 2,
+            licznik_dol_jednotaryfowy=True, odczyt_dol=value / 4, odczyt_gabinet=value / 10
+        )
+        for period, reading_date, value in (
+            ("2023-12", date(2023, 12, 9), 1000), ("2024-01", date(2024, 1, 10), 1400),
+            ("2024-02", date(2024, 2, 11), 1800)
+        )
+    ]
+    db_session.add_all(readings)
+    db_session.flush()
+    bills['electricity'].reading_id = readings[2].id
+    result = [bills['combined']]
+    for name in ("dol", "gabinet"):
+        local = Local(local=name, tenant=f"Najemca {name}")
+        db_session.add(local)
+        db_session.flush()
+        copies = {}
+        for media in ('water', 'gas', 'electricity'):
+            source = bills[media]
+            columns = {
+                column.key: getattr(source, column.key) for column in source.__table__.columns
+                if column.key not in ('id', 'pdf_path', 'pdf_hash')
+            }
+            copies[media] = type(source)(**{**columns, 'local': name, 'local_id': local.id})
+        db_session.add_all(copies.values())
+        db_session.flush()
+        combined = CombinedBill(
+            period_start="2024-01", period_end="2024-02", local=name, local_id=local.id,
+            water_bill_id=copies['water'].id, gas_bill_id=copies['gas'].id,
+            electricity_bill_id=copies['electricity'].id,
+            total_net_sum=534.33, total_gross_sum=631.48, generated_date=date(2024, 3, 1)
+        )
+        db_session.add(combined)
+        result.append(combined)
+    db_session.commit()
+    return result
+
+
+# ========== ŻĄDANIA I ODPOWIEDZI HTTP ==========
+
+def make_request(**headers) -> Request:
+    """Żądanie GET z podanymi nagłówkami (np. if_none_match='"abc"')."""
+    return Request({
+        'type': 'http',
+        'method': 'GET',
+        'path': '/',
+        'headers': [(name.replace('_', '-').encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def read_body(response) -> bytes:
+    """Treść odpowiedzi strumieniowej."""
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
@@ -0,0 +1,74 @@
+"""
+Testy strumieniowego archiwum ZIP z PDF rachunków.
+"""
+
+import zipfile
+from io import BytesIO
+from pathlib import Path
+import pytest
+from fastapi import HTTPException
+from app.api.routes.bills import download_bills_archive
+from app.models.validation import ValidationResult
+from app.services.combined.bill_archive import collect_archive_entries, stream_archive
+from app.services.water.bill_generator import generate_bill_pdfs
+from tests.conftest import read_body
+
+
+class TestArchive:
+    """Archiwum z zapisanych i renderowanych w locie PDF."""
+
+    def test_persisted_and_rendered_entries(self, db_session, bills, tmp_path, monkeypatch):
+        """Aktualny PDF wody jest kopiowany z dysku, pozostałe renderowane w pamięci."""
+        monkeypatch.chdir(tmp_path)
+        generate_bill_pdfs(db_session, [bills['water']])
+        db_session.commit()
+        water_pdf = (tmp_path / "bills/woda/bill_2024-02_local_gora.pdf").read_bytes()
+
+        entries = collect_archive_entries(db_session, "2024-01", "2024-02", ['water', 'gas', 'electricity', 'combined'])
+        archive = zipfile.ZipFile(BytesIO(b"".join(stream_archive(entries, max_workers=2))))
+
+        assert [entry['name'] for entry in entries if 'path' in entry] == ["water/bill_2024-02_local_gora.pdf"]
+        assert archive.namelist() == [
+            "water/bill_2024-02_local_gora.pdf",
+            "gas/gas_bill_2024-01_local_gora.pdf",
+            "electricity/electricity_bill_2024-02_local_gora.pdf",
+            "combined/combined_bill_2024-01_2024-02_local_gora.pdf",
+        ]
+        assert archive.read("water/bill_2024-02_local_gora.pdf") == water_pdf
+        for name in archive.namelist():
+            assert archive.read(name).startswith(b"%PDF")
+        # Eksport nie zapisuje nowych plików
+        assert sorted(path.name for path in Path(tmp_path, "bills").rglob("*.pdf")) == ["bill_2024-02_local_gora.pdf"]
+
+    def test_export_is_read_only(self, db_session, bills, tmp_path, monkeypatch, count_queries):
+        """Faktura gazu bez wyników walidacji nie jest walidowana przy eksporcie - żadnych zapisów do bazy."""
+        monkeypatch.chdir(tmp_path)
+        db_session.query(ValidationResult).delete()
+        db_session.commit()
+
+        statements = count_queries(lambda: b"".join(stream_archive(
+            collect_archive_entries(db_session, "2024-01", "2024-02", ['gas'])
+        )))
+
+        assert [s for s in statements if not s.lstrip().upper().startswith("SELECT")] == []
+        assert db_session.query(ValidationResult).count() == 0
+
+    def test_route_filters_media_and_period(self, db_session, bills, tmp_path, monkeypatch):
+        """Endpoint zwraca ZIP tylko z wybranych mediów i okresów."""
+        monkeypatch.chdir(tmp_path)
+
+        response = download_bills_archive(period_from="2024-02", period_to="2024-02", media="water,gas", db=db_session)
+        archive = zipfile.ZipFile(BytesIO(read_body(response)))
+
+        assert response.media_type == "application/zip"
+        assert archive.namelist() == ["water/bill_2024-02_local_gora.pdf"]
+
+    def test_invalid_parameters(self, db_session):
+        """Niepoprawny okres lub nieznane medium - 400."""
+        with pytest.raises(HTTPException) as error:
+            download_bills_archive(period_from="2024-1", period_to="2024-02", media="water", db=db_session)
+        assert error.value.status_code == 400
+
+        with pytest.raises(HTTPException) as error:
+            download_bills_archive(period_from="2024-01", period_to="2024-02", media="heat", db=db_session)
+        assert error.value.status_code == 400
@@ -0,0 +1,73 @@
+"""
+Testy indeksu okresów rachunków dla dostępnych okresów rachunków łączonych.
+"""
+
+from app.models.gas import GasBill
+from app.services.combined.manager import CombinedBillingManager
+from app.services.combined.period_index import (
+    BillPeriodIndex,
+    get_bill_period_index,
+    invalidate_bill_period_index
+)
+
+ALL_LOCALS = ["gora", "dol", "gabinet"]
+
+
+def rows(*periods):
+    """Pary (okres, lokal) wszystkich lokali dla podanych okresów."""
+    return [(period, local) for period in periods for local in ALL_LOCALS]
+
+
+class TestBillPeriodIndex:
+    """Testy wyznaczania okresów dwumiesięcznych na zbiorach."""
+
+    def test_media_split_between_months(self):
+        """Medium może mieć rachunki tylko w jednym z dwóch miesięcy."""
+        index = BillPeriodIndex({
+            'water': rows("2024-02"),
+            'gas': rows("2024-01"),
+            'electricity': rows("2024-01", "2024-02"),
+        })
+        assert index.two_month_periods() == [("2024-01", "2024-02")]
+
+    def test_missing_local_and_gap(self):
+        """Brak lokalu w obu miesiącach i przerwa między miesiącami wykluczają okres."""
+        index = BillPeriodIndex({
+            'water': rows("2024-01", "2024-02", "2024-05", "2024-06") + [("2024-12", "gora")],
+            'gas': rows("2024-01", "2024-05", "2024-06", "2024-12") + [("2025-01", "gora")],
+            'electricity': rows("2024-02", "2024-05", "2024-06", "2024-12", "2025-01"),
+        })
+        assert index.consecutive_pairs() == [
+            ("2024-01", "2024-02"), ("2024-05", "2024-06"), ("2024-12", "2025-01")
+        ]
+        assert index.two_month_periods() == [("2024-01", "2024-02"), ("2024-05", "2024-06")]
+        assert index.periods('gas') == {"2024-01", "2024-05", "2024-06", "2024-12", "2025-01"}
+
+
+class TestBillPeriodIndexCache:
+    """Testy budowy indeksu i przebudowy po zapisie rachunków."""
+
+    def test_built_once_with_grouped_queries(self, db_session, combined_bills, count_queries):
+        """Indeks jest budowany trzema zapytaniami, kolejne wywołania nie pytają bazy."""
+        invalidate_bill_period_index()
+        statements = count_queries()
+
+        periods = CombinedBillingManager().get_two_month_periods(db_session)
+        assert periods == [("2024-01", "2024-02")]
+        assert len(statements) == 3
+        assert all("GROUP BY" in statement for statement in statements)
+
+        assert CombinedBillingManager().get_two_month_periods(db_session) == periods
+        assert len(statements) == 3
+
+    def test_rebuilt_after_bill_delete(self, db_session, combined_bills):
+        """Usunięcie rachunku gazu lokalu unieważnia indeks i okres przestaje być dostępny."""
+        invalidate_bill_period_index()
+        index = get_bill_period_index(db_session)
+        assert index.two_month_periods() == [("2024-01", "2024-02")]
+
+        db_session.query(GasBill).filter(GasBill.local == "dol").delete()
+        db_session.commit()
+
+        assert get_bill_period_index(db_session) is not index
+        assert get_bill_period_index(db_session).two_month_periods() == []
@@ -0,0 +1,78 @@
+"""
+Testy podsumowania mediów dla strony głównej dashboardu.
+"""
+
+import json
+from datetime import date
+
+import pytest
+from app.api.routes.dashboard import get_summary
+from app.api.routes.electricity import _electricity_stats
+from app.api.routes.gas import _gas_stats
+from app.core.response_cache import clear_response_cache
+from app.models.electricity import ElectricityReading
+from app.services.combined.dashboard_summary import get_dashboard_summary
+from app.services.combined.invoice_validation import get_validation_summary
+from tests.conftest import make_request
+
+STATS_FIELDS = ("invoices_count", "bills_count", "latest_period", "total_gross_sum")
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    """Każdy test zaczyna bez zapamiętanych odpowiedzi."""
+    clear_response_cache()
+    yield
+    clear_response_cache()
+
+
+class TestDashboardSummary:
+    """Jedno zapytanie na medium, wartości zgodne ze statystykami mediów."""
+
+    def test_matches_media_stats(self, db_engine, db_session, combined_bills):
+        """Liczniki, najnowszy okres i suma brutto jak w /stats gazu i prądu; woda według danych testowych."""
+        summary = get_dashboard_summary(db_engine)
+
+        for media, stats in (("gas", _gas_stats(db_session)), ("electricity", _electricity_stats(db_session))):
+            assert {field: summary[media][field] for field in STATS_FIELDS} == \
+                {field: stats[field] for field in STATS_FIELDS}, media
+        assert summary["water"] == {
+            "locals_count": 3, "readings_count": 2, "invoices_count": 1, "bills_count": 3,
+            "latest_period": "2024-02", "total_gross_sum": pytest.approx(3 * 186.12),
+            "bill_periods": ["2024-02"], "available_periods": ["2024-02"],
+            "validation": summary["water"]["validation"], "anomalies_count": 0
+        }
+        assert summary["gas"]["bill_periods"] == _gas_stats(db_session)["available_periods"]
+        assert summary["electricity"]["bill_periods"] == ["2024-02"]
+        # Odczyt 2023-12 jest poza okresem faktury prądu (2024)
+        assert summary["electricity"]["available_periods"] == ["2024-02", "2024-01"]
+
+    def test_validation_and_anomalies(self, db_engine, db_session, combined_bills):
+        """Wyniki walidacji jak w /invoice-validation/summary; anomalie odczytów liczone per medium."""
+        summary = get_dashboard_summary(db_engine)
+
+        assert {media: summary[media]["validation"] for media in ("water", "gas", "electricity")} == \
+            get_validation_summary(db_session)
+        assert summary["water"]["validation"]["invoices_validated"] == 1
+        assert summary["electricity"]["anomalies_count"] == 0
+        assert "anomalies_count" not in summary["gas"]
+
+    def test_one_query_per_media(self, db_engine, combined_bills, count_queries):
+        """Cztery zapytania (woda, gaz, prąd, rachunki łączone) niezależnie od liczby rekordów."""
+        statements = count_queries(lambda: get_dashboard_summary(db_engine), selects=True)
+
+        assert len(statements) == 4
+
+    def test_flagged_and_unsent(self, db_engine, db_session, combined_bills):
+        """Oznaczone odczyty i niewysłane rachunki łączone są liczone; zmiana odświeża odpowiedź."""
+        first = json.loads(get_summary(make_request(), db=db_session).body)
+        combined_bills[0].email_sent_date = date(2024, 3, 2)
+        db_session.query(ElectricityReading).filter(ElectricityReading.data == "2024-01").update({"is_flagged": True})
+        db_session.commit()
+
+        second = json.loads(get_summary(make_request(), db=db_session).body)
+
+        assert first["combined"]["unsent_count"] == 3
+        assert first["electricity"]["flagged_readings"] == 0
+        assert second["combined"] == {**first["combined"], "unsent_count": 2}
+        assert second["electricity"]["flagged_readings"] == 1
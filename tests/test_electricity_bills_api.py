@@ -0,0 +1,39 @@
+"""
+Testy listy rachunków za prąd (GET /api/electricity/bills/) - stała liczba zapytań.
+"""
+
+from fastapi import Response
+from app.api.routes.electricity import get_bills
+from app.services.electricity.cost_model import invalidate_invoice_cost_models
+from tests.conftest import create_bills
+
+
+def get_bills_uncached(db_session):
+    """get_bills przy pustym cache modeli kosztów."""
+    invalidate_invoice_cost_models()
+    return get_bills(Response(), limit=1000, data=None, local=None, db=db_session)
+
+
+class TestGetBillsQueryCount:
+    """Liczba zapytań listy rachunków nie zależy od rozmiaru strony."""
+
+    def test_constant_query_count(self, db_session, count_queries):
+        """Strona z 2 rachunkami i strona z 60 rachunkami - ta sama liczba zapytań."""
+        create_bills(db_session, invoice_count=1, bills_per_invoice=2)
+        small_page = len(count_queries(lambda: get_bills_uncached(db_session)))
+
+        create_bills(db_session, invoice_count=5, bills_per_invoice=12, first_year=2020)
+        large_page = len(count_queries(lambda: get_bills_uncached(db_session)))
+
+        assert small_page == large_page
+        assert large_page <= 5
+
+    def test_blankiet_and_invoice_fields(self, db_session):
+        """Rachunek zawiera numer faktury i dopasowany blankiet."""
+        create_bills(db_session, invoice_count=1, bills_per_invoice=1)
+
+        bills = get_bills(Response(), data=None, local=None, db=db_session)
+
+        assert bills[0]["numer_faktury"] == "F/0"
+        assert bills[0]["blankiet_numer"] == "B/0"
+        assert bills[0]["okres_rozliczeniowy"] == "01.01.2010 - 31.12.2010"
@@ -5,7 +5,6 @@ Testuje wszystkie scenariusze: dwutaryfowe, jednotaryfowe, migracje.
 
 import pytest
 from datetime import date
-from app.models.electricity import ElectricityReading
 from app.services.electricity.calculator import (
     calculate_dom_usage,
     calculate_dol_usage,
@@ -15,33 +14,7 @@ from app.services.electricity.calculator import (
     get_total_dom_reading,
     get_total_dol_reading
 )
-
-
-def create_reading(
-    data: str,
-    dom_single: bool = True,
-    dom_reading: float = None,
-    dom_I: float = None,
-    dom_II: float = None,
-    dol_single: bool = True,
-    dol_reading: float = None,
-    dol_I: float = None,
-    dol_II: float = None,
-    gabinet: float = 0.0
-) -> ElectricityReading:
-    """Pomocnicza funkcja do tworzenia odczytów testowych."""
-    reading = ElectricityReading()
-    reading.data = data
-    reading.licznik_dom_jednotaryfowy = dom_single
-    reading.odczyt_dom = dom_reading
-    reading.odczyt_dom_I = dom_I
-    reading.odczyt_dom_II = dom_II
-    reading.licznik_dol_jednotaryfowy = dol_single
-    reading.odczyt_dol = dol_reading
-    reading.odczyt_dol_I = dol_I
-    reading.odczyt_dol_II = dol_II
-    reading.odczyt_gabinet = gabinet
-    return reading
+from tests.conftest import create_reading
 
 
 class TestGetTotalReadings:
@@ -0,0 +1,76 @@
+"""
+Testy modelu kosztów faktury prądu (InvoiceCostModel) i jego cache.
+"""
+
+from datetime import date
+from app.models.electricity_invoice import ElectricityInvoiceOplataDystrybucyjna
+from app.services.electricity.cost_calculator import calculate_kwh_cost
+from app.services.electricity.cost_model import (
+    get_invoice_cost_model,
+    invalidate_invoice_cost_models
+)
+from app.services.electricity.manager import ElectricityBillingManager
+from tests.conftest import create_invoice_with_prices
+
+
+class TestInvoiceCostModel:
+    """Testy zawartości modelu kosztów."""
+
+    def test_distribution_periods(self, db_session):
+        """Dwa okresy dystrybucyjne z cenami netto energii i opłat zmiennych."""
+        invoice = create_invoice_with_prices(db_session)
+        periods = ElectricityBillingManager().get_distribution_periods(db_session, invoice)
+
+        assert [(p["od"], p["do"]) for p in periods] == [
+            (date(2021, 11, 1), date(2022, 3, 31)),
+            (date(2022, 4, 1), date(2022, 10, 31)),
+        ]
+        assert periods[0]["cena_1kwh_dzienna"] == 0.51
+        assert periods[1]["cena_1kwh_nocna"] == 0.42
+        assert periods[1]["suma_oplat_stalych"] == 2.0
+
+    def test_zone_costs_and_fixed_fees(self, db_session):
+        """Koszty 1 kWh dla stref i opłaty stałe na lokal."""
+        invoice = create_invoice_with_prices(db_session)
+        model = get_invoice_cost_model(db_session, invoice.id)
+
+        assert set(model.zone_costs) == {"DZIENNA", "NOCNA"}
+        assert model.zone_costs["DZIENNA"]["energia_czynna"] == 0.6
+        assert model.fixed_fees_per_local == 30.0
+        assert model.distribution_kwh_dzienna == 0.03
+        assert calculate_kwh_cost(invoice.id, db_session) == model.kwh_costs()
+
+    def test_missing_invoice(self, db_session):
+        """Brak faktury - brak modelu i puste koszty."""
+        invalidate_invoice_cost_models()
+        assert get_invoice_cost_model(db_session, 999) is None
+        assert calculate_kwh_cost(999, db_session) == {}
+
+
+class TestInvoiceCostModelCache:
+    """Testy cache modeli kosztów."""
+
+    def test_cached_between_calls(self, db_session, count_queries):
+        """Powtórne pobranie modelu nie wykonuje zapytań."""
+        invoice = create_invoice_with_prices(db_session)
+        invoice_id = invoice.id
+        model = get_invoice_cost_model(db_session, invoice_id)
+
+        statements = count_queries()
+        assert get_invoice_cost_model(db_session, invoice_id) is model
+        calculate_kwh_cost(invoice_id, db_session)
+        assert statements == []
+
+    def test_invalidated_after_child_change(self, db_session):
+        """Zmiana opłaty dystrybucyjnej unieważnia model faktury."""
+        invoice = create_invoice_with_prices(db_session)
+        model = get_invoice_cost_model(db_session, invoice.id)
+
+        db_session.query(ElectricityInvoiceOplataDystrybucyjna).filter(
+            ElectricityInvoiceOplataDystrybucyjna.typ_oplaty == "Opłata abonamentowa"
+        ).delete()
+        db_session.commit()
+
+        refreshed = get_invoice_cost_model(db_session, invoice.id)
+        assert refreshed is not model
+        assert refreshed.fixed_fees_per_local == 0.0
@@ -0,0 +1,137 @@
+"""
+Testy zbiorczego generowania rachunków prądu (wszystkie okresy / zakres okresów).
+"""
+
+from datetime import date
+import pytest
+from app.models.electricity import ElectricityBill
+from app.services.electricity.cost_model import invalidate_invoice_cost_models
+from app.services.electricity.invoice_index import invalidate_invoice_period_index
+from app.services.electricity.manager import ElectricityBillingManager
+from tests.conftest import create_period_data, create_reading
+
+
+BILL_COLUMNS = (
+    "data", "local", "invoice_id", "usage_kwh", "usage_kwh_dzienna", "usage_kwh_nocna",
+    "energy_cost_gross", "distribution_cost_gross", "total_net_sum", "total_gross_sum"
+)
+
+
+def add_readings(db_session, months):
+    """Kolejne odczyty dwutaryfowe w okresie faktury (rosnące stany liczników)."""
+    for i, month in enumerate(months, start=1):
+        reading = create_reading(f"2022-{month:02d}", dom_single=False, dom_I=1300.0 + 150 * i, dom_II=600.0 + 50 * i,
+                                 dol_single=False, dol_I=500.0 + 60 * i, dol_II=250.0 + 20 * i, gabinet=150.0 + 30 * i)
+        reading.data_odczytu_licznika = date(2022, month, 10)
+        db_session.add(reading)
+    db_session.commit()
+
+
+def bill_rows(db_session):
+    """Rachunki jako krotki kolumn, posortowane po okresie i lokalu."""
+    bills = db_session.query(ElectricityBill).order_by(ElectricityBill.data, ElectricityBill.local).all()
+    return [tuple(getattr(bill, column) for column in BILL_COLUMNS) for bill in bills]
+
+
+class TestGenerateAllBills:
+    """Testy generate_all_bills."""
+
+    def test_matches_per_period_generation(self, db_session):
+        """Wyniki zbiorcze identyczne z generowaniem okres po okresie."""
+        create_period_data(db_session, ["gora", "dol", "gabinet"])
+        add_readings(db_session, [7, 9])
+        manager = ElectricityBillingManager()
+
+        for period in ["2022-03", "2022-05", "2022-07", "2022-09"]:
+            manager.generate_bills_for_period(db_session, period)
+        expected = bill_rows(db_session)
+        db_session.query(ElectricityBill).delete()
+        db_session.commit()
+
+        result = manager.generate_all_bills(db_session)
+
+        assert result["periods_processed"] == ["2022-03", "2022-05", "2022-07", "2022-09"]
+        assert result["bills_inserted"] == result["bills_count"] == len(expected)
+        assert bill_rows(db_session) == expected
+
+    def test_updates_existing_bills(self, db_session):
+        """Ponowne generowanie aktualizuje rachunki w miejscu."""
+        create_period_data(db_session, ["gora", "dol", "gabinet"])
+        manager = ElectricityBillingManager()
+        manager.generate_all_bills(db_session)
+        ids_before = [bill.id for bill in db_session.query(ElectricityBill).order_by(ElectricityBill.id)]
+
+        result = manager.generate_all_bills(db_session)
+
+        assert result["bills_inserted"] == 0
+        assert result["bills_updated"] == len(ids_before)
+        assert [bill.id for bill in db_session.query(ElectricityBill).order_by(ElectricityBill.id)] == ids_before
+
+    def test_query_count_independent_of_periods(self, db_session, count_queries):
+        """Liczba zapytań nie zależy od liczby okresów."""
+        create_period_data(db_session, ["gora", "dol", "gabinet"])
+        manager = ElectricityBillingManager()
+
+        def count():
+            invalidate_invoice_cost_models()
+            invalidate_invoice_period_index()
+            db_session.query(ElectricityBill).delete()
+            db_session.commit()
+            return len(count_queries(lambda: manager.generate_all_bills(db_session)))
+
+        few = count()
+        add_readings(db_session, [6, 7, 8, 9, 10])
+        many = count()
+
+        assert few == many
+
+
+class TestRegenerateBillsRange:
+    """Testy regenerate_bills_range."""
+
+    def test_only_periods_in_range(self, db_session):
+        """Przeliczane są tylko okresy z zakresu, a ich pdf_path jest czyszczony."""
+        create_period_data(db_session, ["gora", "dol", "gabinet"])
+        add_readings(db_session, [7])
+        manager = ElectricityBillingManager()
+        manager.generate_all_bills(db_session)
+        db_session.query(ElectricityBill).update({"pdf_path": "/nonexistent/bill.pdf"})
+        db_session.commit()
+
+        result = manager.regenerate_bills_range(db_session, "2022-04", "2022-07")
+
+        assert result["periods_processed"] == ["2022-05", "2022-07"]
+        paths = {bill.data: bill.pdf_path for bill in db_session.query(ElectricityBill)}
+        assert paths == {"2022-03": "/nonexistent/bill.pdf", "2022-05": None, "2022-07": None}
+
+    def test_pdfs_removed_only_after_commit(self, db_session, tmp_path, monkeypatch):
+        """Błąd przeliczenia zostawia pliki PDF i pdf_path; po udanym przeliczeniu pliki są usuwane."""
+        create_period_data(db_session, ["gora", "dol", "gabinet"])
+        manager = ElectricityBillingManager()
+        manager.generate_all_bills(db_session)
+        pdf = tmp_path / "bill.pdf"
+        pdf.write_bytes(b"%PDF")
+        db_session.query(ElectricityBill).update({"pdf_path": str(pdf)})
+        db_session.commit()
+
+        def fail(context):
+            raise RuntimeError("obliczenia")
+
+        monkeypatch.setattr(manager, "compute_period_bills", fail)
+        with pytest.raises(RuntimeError):
+            manager.regenerate_bills_range(db_session, "2022-01", "2022-12")
+        db_session.rollback()
+        assert pdf.exists()
+        assert {bill.pdf_path for bill in db_session.query(ElectricityBill)} == {str(pdf)}
+
+        monkeypatch.undo()
+        manager.regenerate_bills_range(db_session, "2022-01", "2022-12")
+        assert not pdf.exists()
+
+    def test_invalid_range(self, db_session):
+        """Błędny format lub odwrócony zakres - ValueError."""
+        manager = ElectricityBillingManager()
+        with pytest.raises(ValueError):
+            manager.regenerate_bills_range(db_session, "2022-5", "2022-07")
+        with pytest.raises(ValueError):
+            manager.regenerate_bills_range(db_session, "2022-07", "2022-05")
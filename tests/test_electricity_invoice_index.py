@@ -0,0 +1,87 @@
+"""
+Testy indeksu przedziałowego mapującego miesiące na faktury prądu.
+"""
+
+from datetime import date
+from app.models.electricity_invoice import ElectricityInvoice
+from app.services.electricity.invoice_index import (
+    InvoicePeriodIndex,
+    get_invoice_period_index,
+    invalidate_invoice_period_index
+)
+from tests.conftest import create_invoice
+
+
+class TestInvoicePeriodIndex:
+    """Testy wyszukiwania faktury dla miesiąca."""
+    
+    def test_month_inside_invoice(self):
+        """Miesiąc w środku okresu faktury."""
+        index = InvoicePeriodIndex([(1, date(2021, 11, 1), date(2022, 10, 31))])
+        assert index.find_invoice_id("2022-03") == 1
+    
+    def test_start_month_counts_from_first_day(self):
+        """Okres zaczynający się w połowie miesiąca pokrywa cały miesiąc początku."""
+        index = InvoicePeriodIndex([(1, date(2021, 11, 15), date(2022, 1, 10))])
+        assert index.find_invoice_id("2021-11") == 1
+        assert index.find_invoice_id("2022-01") == 1
+        assert index.find_invoice_id("2022-02") is None
+    
+    def test_outside_and_invalid(self):
+        """Miesiąc poza fakturami i błędny format."""
+        index = InvoicePeriodIndex([(1, date(2021, 11, 1), date(2022, 10, 31))])
+        assert index.find_invoice_id("2021-10") is None
+        assert index.find_invoice_id("2022-11") is None
+        assert index.find_invoice_id("abc") is None
+    
+    def test_overlap_lower_id_wins(self):
+        """Przy nakładających się fakturach wygrywa faktura o niższym ID."""
+        index = InvoicePeriodIndex([
+            (1, date(2021, 11, 1), date(2022, 11, 14)),
+            (2, date(2022, 11, 15), date(2023, 10, 31)),
+        ])
+        assert index.find_invoice_id("2022-11") == 1
+        assert index.find_invoice_id("2022-12") == 2
+    
+    def test_covered_months(self):
+        """Lista pokrytych miesięcy bez duplikatów, z przerwami między fakturami."""
+        index = InvoicePeriodIndex([
+            (1, date(2021, 11, 20), date(2022, 1, 5)),
+            (2, date(2022, 4, 1), date(2022, 5, 31)),
+        ])
+        assert index.covered_months() == ["2021-11", "2021-12", "2022-01", "2022-04", "2022-05"]
+        assert index.covered_months_between("2022-01", "2022-04") == ["2022-01", "2022-04"]
+        assert index.invoice_count == 2
+
+
+class TestInvoicePeriodIndexInvalidation:
+    """Testy przebudowy indeksu po zapisie faktur."""
+    
+    def test_rebuilt_after_invoice_write(self, db_session):
+        """Dodanie faktury unieważnia indeks."""
+        invalidate_invoice_period_index()
+        db_session.add(create_invoice("F/1", date(2021, 11, 1), date(2022, 10, 31)))
+        db_session.commit()
+        
+        index = get_invoice_period_index(db_session)
+        assert index.find_invoice_id("2022-11") is None
+        assert get_invoice_period_index(db_session) is index
+        
+        db_session.add(create_invoice("F/2", date(2022, 11, 1), date(2023, 10, 31)))
+        db_session.commit()
+        
+        rebuilt = get_invoice_period_index(db_session)
+        assert rebuilt is not index
+        assert rebuilt.find_invoice_id("2022-11") is not None
+    
+    def test_rebuilt_after_bulk_delete(self, db_session):
+        """Masowe usunięcie (query.delete()) również unieważnia indeks."""
+        invalidate_invoice_period_index()
+        db_session.add(create_invoice("F/1", date(2021, 11, 1), date(2022, 10, 31)))
+        db_session.commit()
+        assert get_invoice_period_index(db_session).find_invoice_id("2022-01") is not None
+        
+        db_session.query(ElectricityInvoice).delete()
+        db_session.commit()
+        
+        assert get_invoice_period_index(db_session).find_invoice_id("2022-01") is None
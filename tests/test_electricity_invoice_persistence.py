@@ -0,0 +1,88 @@
+"""
+Testy zapisu szczegółowych faktur prądu (normalizacja danych, zbiorczy zapis, aktualizacja po kluczu).
+"""
+
+import copy
+from app.api.routes.electricity import update_invoice_detailed, verify_and_save_invoice_detailed
+from app.models.electricity_invoice import (
+    ElectricityInvoiceOdczyt,
+    ElectricityInvoiceSprzedazEnergii,
+    ElectricityInvoiceRozliczenieOkres,
+    ElectricityInvoiceTariffTimeline
+)
+from app.services.electricity.invoice_persistence import parse_int_value, parse_value
+from tests.conftest import invoice_payload
+
+
+class TestParsing:
+    """Testy parsowania liczb w formacie polskim."""
+
+    def test_parse_value(self):
+        """Kropki to separatory tysięcy, przecinek - dziesiętny."""
+        assert parse_value({'v': '1.234,56'}, 'v') == 1234.56
+        assert parse_value({'v': '0,3640'}, 'v') == 0.364
+        assert parse_value({'v': ''}, 'v', 23.0) == 23.0
+
+    def test_parse_int_value(self):
+        """Grupy po 3 cyfry po kropce to tysiące, inaczej kropka jest dziesiętna."""
+        assert parse_int_value({'v': '24.320'}, 'v') == 24320
+        assert parse_int_value({'v': '4.5'}, 'v') == 4
+        assert parse_int_value({'v': 'abc'}, 'v', 7) == 7
+
+
+class TestSaveAndUpdate:
+    """Testy zapisu i aktualizacji faktury."""
+
+    def test_save_children(self, db_session):
+        """Pozycje zapisane zbiorczo, duplikaty odczytów i upusty pominięte, okresy z blankietów."""
+        result = verify_and_save_invoice_detailed(invoice_data=invoice_payload(), db=db_session)
+        invoice_id = result["invoice_id"]
+
+        odczyty = db_session.query(ElectricityInvoiceOdczyt).filter_by(invoice_id=invoice_id).all()
+        sprzedaz = db_session.query(ElectricityInvoiceSprzedazEnergii).filter_by(invoice_id=invoice_id).all()
+        okresy = db_session.query(ElectricityInvoiceRozliczenieOkres).filter_by(invoice_id=invoice_id).all()
+
+        assert len(odczyty) == 2
+        assert {o.strefa for o in odczyty} == {"DZIENNA", "NOCNA"}
+        assert [(s.strefa, s.ilosc_kwh) for s in sprzedaz] == [("DZIENNA", 1000), ("NOCNA", 500)]
+        assert [o.numer_okresu for o in okresy] == [1, 2]
+        # Oś taryfowa zbudowana w tej samej transakcji
+        assert db_session.query(ElectricityInvoiceTariffTimeline).filter_by(invoice_id=invoice_id).count() == 1
+
+    def test_update_touches_only_changed_rows(self, db_session, count_queries):
+        """Zmiana jednej ceny - jeden UPDATE, pozostałe wiersze zachowują ID."""
+        payload = invoice_payload()
+        invoice_id = verify_and_save_invoice_detailed(invoice_data=payload, db=db_session)["invoice_id"]
+        ids_before = {s.strefa: s.id for s in db_session.query(ElectricityInvoiceSprzedazEnergii)}
+
+        updated = copy.deepcopy(payload)
+        updated['sprzedaz_energii'][1]['cena'] = '0,3500'
+        statements = count_queries()
+        update_invoice_detailed(invoice_id=invoice_id, invoice_data=updated, db=db_session)
+
+        child_writes = [
+            s for s in statements
+            if s.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")) and "electricity_invoice_" in s
+            and "tariff_timelines" not in s
+        ]
+        assert len(child_writes) == 1
+        assert child_writes[0].lstrip().upper().startswith("UPDATE ELECTRICITY_INVOICE_SPRZEDAZ_ENERGII")
+
+        rows = {s.strefa: s for s in db_session.query(ElectricityInvoiceSprzedazEnergii)}
+        assert {strefa: s.id for strefa, s in rows.items()} == ids_before
+        assert float(rows["NOCNA"].cena_za_kwh) == 0.35
+
+    def test_update_inserts_and_deletes_by_key(self, db_session):
+        """Nowa pozycja jest wstawiana, brakująca - usuwana."""
+        payload = invoice_payload()
+        invoice_id = verify_and_save_invoice_detailed(invoice_data=payload, db=db_session)["invoice_id"]
+
+        updated = copy.deepcopy(payload)
+        updated['sprzedaz_energii'] = [
+            payload['sprzedaz_energii'][0],
+            {'data': '31/10/2022', 'strefa': 'DZIENNA', 'ilosc': '700', 'cena': '0,7000', 'naleznosc': '602,70'},
+        ]
+        update_invoice_detailed(invoice_id=invoice_id, invoice_data=updated, db=db_session)
+
+        rows = db_session.query(ElectricityInvoiceSprzedazEnergii).order_by(ElectricityInvoiceSprzedazEnergii.id).all()
+        assert [(s.data.month, s.strefa) for s in rows] == [(3, "DZIENNA"), (10, "DZIENNA")]
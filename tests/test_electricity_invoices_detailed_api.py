@@ -0,0 +1,76 @@
+"""
+Testy listy i szczegółów faktur prądu (GET /api/electricity/invoices-detailed/) - stała liczba zapytań.
+"""
+
+import copy
+from datetime import date
+from fastapi import Response
+from app.api.routes.electricity import (
+    get_invoice_detailed,
+    get_invoices_detailed,
+    verify_and_save_invoice_detailed
+)
+from app.services.electricity.cost_calculator import calculate_kwh_cost
+from tests.conftest import invoice_payload, save_invoices
+
+
+class TestInvoicesDetailedList:
+    """Testy listy faktur."""
+
+    def test_constant_query_count(self, db_session, count_queries):
+        """Lista z 1 i z 6 fakturami - ta sama liczba zapytań (przy czystej sesji)."""
+        save_invoices(db_session, 1)
+        db_session.expire_all()
+        one = len(count_queries(lambda: get_invoices_detailed(Response(), db=db_session)))
+
+        save_invoices(db_session, 5, first_year=2020)
+        db_session.expire_all()
+        many = len(count_queries(lambda: get_invoices_detailed(Response(), db=db_session)))
+
+        assert one == many
+        assert many <= 3
+
+    def test_kwh_cost_from_loaded_children(self, db_session):
+        """Koszt 1 kWh zgodny z calculate_kwh_cost."""
+        invoice_id = save_invoices(db_session, 1)[0]
+
+        item = get_invoices_detailed(Response(), db=db_session)[0]
+
+        expected = calculate_kwh_cost(invoice_id, db_session)
+        assert item.koszty_kwh_szczegolowe == expected
+        assert item.koszt_1kwh_dzienna == round(expected["DZIENNA"]["suma"], 4)
+        assert item.data_poczatku_okresu == date(2021, 11, 1)
+
+
+class TestInvoiceDetailed:
+    """Testy szczegółów faktury."""
+
+    def test_constant_query_count(self, db_session, count_queries):
+        """Liczba zapytań nie zależy od liczby pozycji podrzędnych (przy czystej sesji)."""
+        small_id = save_invoices(db_session, 1)[0]
+        db_session.expire_all()
+        small = len(count_queries(lambda: get_invoice_detailed(small_id, db=db_session)))
+
+        payload = copy.deepcopy(invoice_payload())
+        payload['numer_faktury'] = "P/duza"
+        payload['oplaty_dystrybucyjne'] += [
+            {'nazwa': f'Opłata {i}', 'jednostka': 'kWh', 'data': '31/10/2022', 'ilosc': '10', 'cena': '0,01'}
+            for i in range(20)
+        ]
+        large_id = verify_and_save_invoice_detailed(invoice_data=payload, db=db_session)["invoice_id"]
+        db_session.expire_all()
+        large = len(count_queries(lambda: get_invoice_detailed(large_id, db=db_session)))
+
+        assert small == large == 6
+
+    def test_response_content(self, db_session):
+        """Odpowiedź zawiera wszystkie pozycje w kolejności zapisu."""
+        invoice_id = save_invoices(db_session, 1)[0]
+
+        response = get_invoice_detailed(invoice_id, db=db_session)
+
+        assert response.invoice.numer_faktury == "P/2010"
+        assert [b.numer_blankietu for b in response.blankiety] == ["B/1", "B/2"]
+        assert [s.strefa for s in response.sprzedaz_energii] == ["DZIENNA", "NOCNA"]
+        assert response.oplaty_dystrybucyjne[0].ilosc_miesiecy == 5
+        assert [r.numer_okresu for r in response.rozliczenie_okresy] == [1, 2]
@@ -0,0 +1,63 @@
+"""
+Testy kontekstu okresu prądu (PeriodContext) i generowania rachunków okresu.
+"""
+
+from datetime import date
+from app.models.electricity import ElectricityBill
+from app.models.water import Local
+from app.services.electricity.cost_model import invalidate_invoice_cost_models
+from app.services.electricity.invoice_index import invalidate_invoice_period_index
+from app.services.electricity.manager import ElectricityBillingManager
+from app.services.electricity.period_context import compute_tenant_period_dates
+from tests.conftest import create_period_data, create_reading
+
+
+def generate_uncached(db_session):
+    """generate_bills_for_period przy pustych cache modeli kosztów i indeksu faktur."""
+    invalidate_invoice_cost_models()
+    invalidate_invoice_period_index()
+    ElectricityBillingManager().generate_bills_for_period(db_session, "2022-05")
+
+
+class TestTenantPeriodDates:
+    """Testy dat okresu najemcy."""
+
+    def test_dates_from_readings(self):
+        """Okres od dnia po poprzednim odczycie do dnia obecnego odczytu."""
+        previous = create_reading("2022-03")
+        previous.data_odczytu_licznika = date(2022, 3, 10)
+        current = create_reading("2022-05")
+        current.data_odczytu_licznika = date(2022, 5, 12)
+        assert compute_tenant_period_dates("2022-05", current, previous) == (date(2022, 3, 11), date(2022, 5, 12))
+
+    def test_first_reading_without_dates(self):
+        """Pierwszy odczyt bez daty - od pierwszego do 10. dnia miesiąca."""
+        current = create_reading("2022-05")
+        assert compute_tenant_period_dates("2022-05", current, None) == (date(2022, 5, 1), date(2022, 5, 10))
+
+
+class TestGenerateBillsForPeriod:
+    """Testy generowania rachunków z kontekstem okresu."""
+
+    def test_context_contents(self, db_session):
+        """Kontekst zawiera odczyty, zużycie i daty okresu najemcy."""
+        create_period_data(db_session, ["gora", "dol", "gabinet"])
+        context = ElectricityBillingManager().build_period_context(db_session, "2022-05")
+
+        assert context.previous_reading.data == "2022-03"
+        assert context.tenant_period == (date(2022, 3, 11), date(2022, 5, 10))
+        assert context.usage_data["dom"]["zuzycie_dom_lacznie"] == 400.0
+        assert [local.local for local in context.locals] == ["gora", "dol", "gabinet"]
+
+    def test_query_count_independent_of_locals(self, db_session, count_queries):
+        """Liczba zapytań SELECT nie rośnie z liczbą lokali (także przy aktualizacji)."""
+        create_period_data(db_session, ["gora", "dol", "gabinet"])
+        few_locals = len(count_queries(lambda: generate_uncached(db_session), selects=True))
+
+        db_session.add_all([Local(local=f"lokal_{i}") for i in range(5)])
+        db_session.commit()
+        many_locals = len(count_queries(lambda: generate_uncached(db_session), selects=True))
+
+        assert many_locals == few_locals
+        bills = db_session.query(ElectricityBill).filter(ElectricityBill.data == "2022-05").all()
+        assert len(bills) == 9  # 8 lokali + DOM
@@ -0,0 +1,121 @@
+"""
+Testy osi taryfowej faktury prądu (TariffTimeline) i jej zapisu w bazie.
+"""
+
+from datetime import date
+from app.models.electricity_invoice import (
+    ElectricityInvoiceOplataDystrybucyjna,
+    ElectricityInvoiceTariffTimeline
+)
+from app.services.electricity.cost_model import get_invoice_cost_model
+from app.services.electricity.manager import ElectricityBillingManager
+from app.services.electricity.tariff_timeline import TariffTimeline
+from tests.conftest import create_invoice_with_prices
+
+
+def period(okres, od, do, dzienna, nocna, stale, vat_rate=0.23):
+    """Okres dystrybucyjny w formacie get_distribution_periods."""
+    return {
+        "okres": okres, "od": od, "do": do,
+        "cena_1kwh_dzienna": dzienna, "cena_1kwh_nocna": nocna, "cena_1kwh_calodobowa": None,
+        "suma_oplat_stalych": stale, "vat_rate": vat_rate
+    }
+
+
+PERIODS = [
+    period("OKRES_DYSTRYBUCYJNY_1", date(2022, 1, 1), date(2022, 1, 31), 0.5, 0.3, 10.0),
+    period("OKRES_DYSTRYBUCYJNY_2", date(2022, 2, 1), date(2022, 3, 31), 0.7, 0.4, 20.0),
+]
+
+
+class TestProrate:
+    """Testy proporcjonalnego liczenia kosztów okresu najemcy."""
+
+    def test_overlapping_periods(self):
+        """Koszt dzielony proporcjonalnie do dni w okresach cenowych."""
+        result = TariffTimeline.from_periods(PERIODS).prorate(
+            date(2022, 1, 22), date(2022, 2, 10), 100.0, 50.0
+        )
+
+        # 10 dni w okresie 1 i 10 dni w okresie 2
+        assert [(d["period"], d["days"]) for d in result["details"]] == [
+            ("OKRES_DYSTRYBUCYJNY_1", 10), ("OKRES_DYSTRYBUCYJNY_2", 10)
+        ]
+        assert result["energy_cost_net"] == round(0.5 * (100 * 0.5 + 50 * 0.3) + 0.5 * (100 * 0.7 + 50 * 0.4), 4)
+        assert result["fixed_fees_net"] == 15.0
+        assert result["energy_cost_gross"] == round(result["energy_cost_net"] * 1.23, 4)
+
+    def test_outside_timeline(self):
+        """Okres najemcy poza osią - zerowe koszty."""
+        result = TariffTimeline.from_periods(PERIODS).prorate(date(2023, 1, 1), date(2023, 2, 1), 100.0, 50.0)
+        assert result["total_gross_sum"] == 0.0
+        assert result["details"] == []
+
+    def test_gap_between_periods(self):
+        """Dni między okresami nie mają cen i nie liczą się do proporcji."""
+        periods = [PERIODS[0], period("OKRES_DYSTRYBUCYJNY_2", date(2022, 3, 1), date(2022, 3, 31), 0.7, 0.4, 20.0)]
+        timeline = TariffTimeline.from_periods(periods)
+
+        result = timeline.prorate(date(2022, 1, 22), date(2022, 3, 10), 100.0, 0.0)
+
+        assert timeline.segment_count == 2
+        assert [d["days"] for d in result["details"]] == [10, 10]
+        assert result["energy_cost_net"] == 60.0
+
+    def test_mixed_vat_rates(self):
+        """Różne stawki VAT w okresach - brutto liczone z każdego okresu osobno."""
+        periods = [PERIODS[0], dict(PERIODS[1], vat_rate=0.08)]
+        timeline = TariffTimeline.from_periods(periods)
+
+        result = timeline.prorate(date(2022, 1, 22), date(2022, 2, 10), 100.0, 0.0)
+
+        assert timeline.uniform_vat_rate is None
+        assert result["energy_cost_gross"] == round(25.0 * 1.23 + 35.0 * 1.08, 4)
+
+
+class TestTimelineRecord:
+    """Testy zapisu osi w tabeli electricity_invoice_tariff_timelines."""
+
+    def test_record_round_trip(self):
+        """Oś odczytana z rekordu ma te same okresy (także z luką)."""
+        periods = [PERIODS[0], period("OKRES_DYSTRYBUCYJNY_2", date(2022, 3, 1), date(2022, 3, 31), 0.7, None, 20.0)]
+        timeline = TariffTimeline.from_periods(periods)
+
+        restored = TariffTimeline.from_record(ElectricityInvoiceTariffTimeline(**timeline.to_record_values()))
+
+        assert restored.periods() == timeline.periods() == periods
+
+    def test_rebuilt_on_commit(self, db_session):
+        """Oś jest zapisywana z fakturą i przebudowywana po zmianie opłat."""
+        invoice = create_invoice_with_prices(db_session)
+        record = db_session.query(ElectricityInvoiceTariffTimeline).filter_by(invoice_id=invoice.id).one()
+        periods = TariffTimeline.from_record(record).periods()
+        assert [(p["od"], p["do"]) for p in periods] == [
+            (date(2021, 11, 1), date(2022, 3, 31)),
+            (date(2022, 4, 1), date(2022, 10, 31)),
+        ]
+
+        oplata = db_session.query(ElectricityInvoiceOplataDystrybucyjna).filter_by(
+            typ_oplaty="Opłata abonamentowa", cena=2.0
+        ).one()
+        oplata.cena = 3.0
+        db_session.commit()
+
+        model = get_invoice_cost_model(db_session, invoice.id)
+        assert model.distribution_periods[1]["suma_oplat_stalych"] == 3.0
+        assert model.vat_rate == 0.23
+
+    def test_manager_uses_cached_timeline(self, db_session):
+        """Rachunek z osi z modelu kosztów jest taki sam jak z listy okresów; oś nie jest budowana ponownie."""
+        invoice = create_invoice_with_prices(db_session)
+        manager = ElectricityBillingManager()
+        timeline = manager.get_tariff_timeline(db_session, invoice)
+
+        assert manager.get_tariff_timeline(db_session, invoice) is timeline
+        from_timeline = manager.calculate_bill_for_period_with_overlapping(
+            date(2022, 3, 1), date(2022, 4, 30), timeline, 100.0, 50.0
+        )
+        from_periods = manager.calculate_bill_for_period_with_overlapping(
+            date(2022, 3, 1), date(2022, 4, 30), manager.get_distribution_periods(db_session, invoice), 100.0, 50.0
+        )
+        assert from_timeline == from_periods
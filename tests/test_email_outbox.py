@@ -0,0 +1,242 @@
+"""
+Testy kolejki wiadomości email i workera wysyłki (lokalny serwer aiosmtpd).
+"""
+
+import email
+import os
+import socket
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from cryptography.fernet import Fernet
+from app.core.email_outbox import SENDING_TIMEOUT, SmtpConfig, deliver_outbox, enqueue_email, retry_failed
+from app.core.file_encryption import decrypt_file_in_memory
+from app.core.mime_stream import MESSAGE_OVERHEAD, file_sha256
+from app.models.email_outbox import EmailOutbox
+
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+
+class RecordingHandler:
+    """Zapisuje odebrane wiadomości; dla wybranych odbiorców najpierw zwraca podane błędy."""
+
+    def __init__(self, failures=None):
+        self.messages = []
+        self.failures = {recipient: list(codes) for recipient, codes in (failures or {}).items()}
+
+    async def handle_DATA(self, server, session, envelope):
+        codes = self.failures.get(envelope.rcpt_tos[0])
+        if codes:
+            return codes.pop(0)
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+class CountingController(controller_module.Controller):
+    """Serwer testowy liczący otwarte połączenia."""
+
+    connections = 0
+
+    def factory(self):
+        self.connections += 1
+        return super().factory()
+
+
+@pytest.fixture
+def smtp_server():
+    """Uruchamia lokalny serwer SMTP; zwraca (controller, handler, config)."""
+    def start(failures=None):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        handler = RecordingHandler(failures)
+        controller = CountingController(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        controller.connections = 0  # Bez połączenia sprawdzającego gotowość serwera
+        started.append(controller)
+        return controller, handler, SmtpConfig("127.0.0.1", port, use_tls=False)
+
+    started = []
+    yield start
+    for controller in started:
+        controller.stop()
+
+
+def enqueue(db_session, count, **kwargs):
+    """Dodaje count wiadomości do kolejki i zwraca ich ID."""
+    ids = [
+        enqueue_email(db_session, 'combined_bill', f"lokal{i}@example.com", f"Rachunek {i}", "Treść", **kwargs).id
+        for i in range(count)
+    ]
+    db_session.commit()
+    return ids
+
+
+class TestDelivery:
+    """Wysyłka wiadomości z kolejki."""
+
+    def test_connections_reused(self, db_session, bills, smtp_server, tmp_path):
+        """Wiadomości są wysyłane przez najwyżej max_workers połączeń; data wysłania rachunku jest zapisana."""
+        controller, handler, config = smtp_server()
+        attachment = tmp_path / "rachunek.pdf"
+        attachment.write_bytes(b"%PDF-test")
+        ids = enqueue(db_session, 5)
+        ids.append(enqueue_email(
+            db_session, 'combined_bill', "gora@example.com", "Rachunek", "Treść",
+            attachment_path=str(attachment), attachment_name="rachunek.pdf",
+            combined_bill_id=bills['combined'].id
+        ).id)
+        db_session.commit()
+
+        results = deliver_outbox(db_session, config, max_workers=2)
+
+        assert sorted(results) == sorted(ids)
+        assert {result['status'] for result in results.values()} == {'sent'}
+        assert len(handler.messages) == 6
+        assert 1 <= controller.connections <= 2
+        assert db_session.query(EmailOutbox).filter(EmailOutbox.status == 'sent').count() == 6
+        assert bills['combined'].email_sent_date is not None
+        assert b"rachunek.pdf" in next(m.content for m in handler.messages if m.rcpt_tos == ["gora@example.com"])
+
+    def test_transient_error_retried(self, db_session, smtp_server):
+        """Błąd 4xx jest ponawiany z opóźnieniem, a wiadomość ostatecznie wysłana."""
+        _, handler, config = smtp_server({"lokal0@example.com": ["451 Try again later"]})
+        ids = enqueue(db_session, 1)
+        delays = []
+
+        result = deliver_outbox(db_session, config, backoff=0.5, sleep=delays.append)[ids[0]]
+
+        assert result['status'] == 'sent'
+        assert result['attempts'] == 2
+        assert delays == [0.5]
+        assert len(handler.messages) == 1
+
+    def test_permanent_error_not_retried(self, db_session, bills, smtp_server):
+        """Błąd 5xx kończy wysyłkę bez ponowień; pozostałe wiadomości są wysyłane."""
+        _, handler, config = smtp_server({"lokal0@example.com": ["550 Mailbox unavailable"]})
+        ids = enqueue(db_session, 2, combined_bill_id=bills['combined'].id)
+
+        results = deliver_outbox(db_session, config, sleep=lambda delay: None)
+        failed = db_session.get(EmailOutbox, ids[0])
+
+        assert results[ids[0]]['status'] == 'failed'
+        assert failed.status == 'failed' and failed.attempts == 1
+        assert "550" in failed.last_error
+        assert results[ids[1]]['status'] == 'sent'
+        assert deliver_outbox(db_session, config) == {}
+
+
+class TestInterruptedAndFailed:
+    """Przerwane i nieudane wysyłki."""
+
+    def test_stale_sending_reclaimed(self, db_session, smtp_server):
+        """Wiadomość 'sending' po SENDING_TIMEOUT jest wysyłana ponownie, a świeżo pobrana - nie."""
+        _, handler, config = smtp_server()
+        stale, recent = enqueue(db_session, 2)
+        db_session.get(EmailOutbox, stale).status = 'sending'
+        db_session.get(EmailOutbox, stale).claimed_at = datetime.now() - SENDING_TIMEOUT - timedelta(minutes=1)
+        db_session.get(EmailOutbox, recent).status = 'sending'
+        db_session.get(EmailOutbox, recent).claimed_at = datetime.now()
+        db_session.commit()
+
+        results = deliver_outbox(db_session, config)
+
+        assert list(results) == [stale]
+        assert results[stale]['status'] == 'sent'
+        assert db_session.get(EmailOutbox, recent).status == 'sending'
+        assert len(handler.messages) == 1
+
+    def test_overlapping_calls_send_once(self, smtp_server, tmp_path):
+        """Wywołanie rozpoczęte w trakcie innego nie pobiera tych samych wiadomości - każda jest wysyłana raz."""
+        _, handler, config = smtp_server()
+        engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}")
+        EmailOutbox.__table__.create(bind=engine)
+        first, second = sessionmaker(bind=engine)(), sessionmaker(bind=engine)()
+        ids = enqueue(first, 3)
+        overlapping = {}
+
+        def run_second_call(conn, cursor, statement, *args):
+            # Drugie wywołanie wykonuje się w całości tuż przed pobraniem wiadomości przez pierwsze
+            if statement.lstrip().upper().startswith("UPDATE EMAIL_OUTBOX") and not overlapping:
+                overlapping['results'] = None  # Bez ponownego wejścia dla UPDATE drugiego wywołania
+                overlapping['results'] = deliver_outbox(second, config)
+
+        event.listen(engine, "before_cursor_execute", run_second_call)
+        try:
+            results = deliver_outbox(first, config)
+        finally:
+            event.remove(engine, "before_cursor_execute", run_second_call)
+            first.close()
+            second.close()
+            engine.dispose()
+
+        assert sorted([*results, *overlapping['results']]) == ids
+        assert sorted(message.rcpt_tos[0] for message in handler.messages) == \
+            [f"lokal{i}@example.com" for i in range(3)]
+
+    def test_retry_failed(self, db_session, smtp_server):
+        """Nieudana wiadomość wraca do kolejki i jest wysyłana przy kolejnej wysyłce."""
+        _, handler, config = smtp_server({"lokal0@example.com": ["550 Mailbox unavailable"]})
+        ids = enqueue(db_session, 2)
+        deliver_outbox(db_session, config, sleep=lambda delay: None)
+
+        assert retry_failed(db_session) == [ids[0]]
+        db_session.commit()
+        result = deliver_outbox(db_session, config)[ids[0]]
+
+        assert result['status'] == 'sent'
+        assert result['attempts'] == 2
+        assert retry_failed(db_session) == []
+        assert len(handler.messages) == 2
+
+
+def attachments(envelopes):
+    """Nazwy i zdekodowane załączniki odebranych wiadomości."""
+    result = []
+    for envelope in envelopes:
+        message = email.message_from_bytes(envelope.content)
+        for part in message.walk():
+            if part.get_content_type() == "application/octet-stream":
+                result.append((part.get_filename().strip(), part.get_payload(decode=True)))
+    return result
+
+
+class TestStreamingMessages:
+    """Wiadomości budowane strumieniowo i dzielenie dużych załączników."""
+
+    def test_large_attachment_split(self, db_session, smtp_server, tmp_path):
+        """Załącznik większy niż limit trafia do kilku wiadomości, których części składają się w całość."""
+        _, handler, config = smtp_server()
+        config = SmtpConfig(config.server, config.port, use_tls=False, max_message_size=MESSAGE_OVERHEAD + 5000)
+        source = tmp_path / "backup.db"
+        source.write_bytes(os.urandom(10000))
+        ids = enqueue(db_session, 1, attachment_path=str(source), attachment_name="backup.db")
+
+        result = deliver_outbox(db_session, config)[ids[0]]
+        parts = attachments(handler.messages)
+
+        assert result['status'] == 'sent'
+        assert [name for name, _ in parts] == ["backup.db.part001", "backup.db.part002", "backup.db.part003"]
+        assert all(len(envelope.content) <= config.max_message_size for envelope in handler.messages)
+        assert b"".join(payload for _, payload in parts) == source.read_bytes()
+        body = email.message_from_bytes(handler.messages[0].content).get_payload(0).get_payload(decode=True)
+        assert file_sha256(str(source)).encode() in body
+
+    def test_encrypted_attachment(self, db_session, smtp_server, tmp_path, monkeypatch):
+        """Szyfrowany załącznik jest odszyfrowywany do treści pliku; plik tymczasowy jest usuwany."""
+        monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "spool"))
+        (tmp_path / "spool").mkdir()
+        _, handler, config = smtp_server()
+        source = tmp_path / "backup.db"
+        source.write_bytes(b"SQLite format 3" * 100)
+        enqueue(db_session, 1, attachment_path=str(source), attachment_name="backup.db.encrypted",
+                encrypt_attachment=True)
+
+        deliver_outbox(db_session, config)
+        [(name, payload)] = attachments(handler.messages)
+
+        assert name == "backup.db.encrypted"
+        assert decrypt_file_in_memory(payload) == source.read_bytes()
+        assert list((tmp_path / "spool").iterdir()) == []
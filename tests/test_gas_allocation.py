@@ -0,0 +1,122 @@
+"""
+Testy podziału kosztów gazu według reguł (gas_allocation_rules) i zbiorczego generowania rachunków.
+"""
+
+from datetime import date
+import pytest
+from app.models.gas import GasAllocationRule, GasBill
+from app.models.water import Local
+from app.services.gas.manager import AllocationSchedule, GasBillingManager
+from tests.conftest import create_gas_invoice
+
+
+def add_locals(db_session):
+    """Lokale gora, dol, gabinet."""
+    db_session.add_all([Local(local=name) for name in ("gora", "dol", "gabinet")])
+    db_session.commit()
+
+
+def bills(db_session, period):
+    """Rachunki okresu jako {lokal: rachunek}."""
+    return {b.local: b for b in db_session.query(GasBill).filter_by(data=period)}
+
+
+class TestAllocationSchedule:
+    """Testy kompilacji reguł w wersje."""
+
+    def test_version_by_date(self):
+        """Wersja wybierana według daty; wersja otwarta obowiązuje poza zamkniętymi."""
+        rules = [
+            GasAllocationRule(local="gora", share=0.5, bears_interest=True, valid_from=None, valid_to=None),
+            GasAllocationRule(local="dol", share=0.5, bears_interest=False, valid_from=None, valid_to=None),
+            GasAllocationRule(local="gora", share=0.6, bears_interest=False, valid_from=date(2024, 1, 1), valid_to=date(2024, 12, 31)),
+            GasAllocationRule(local="dol", share=0.4, bears_interest=True, valid_from=date(2024, 1, 1), valid_to=date(2024, 12, 31)),
+        ]
+        schedule = AllocationSchedule.from_rules(rules)
+
+        assert schedule.version_for(date(2024, 6, 1)).shares == (0.6, 0.4)
+        assert schedule.version_for(date(2024, 6, 1)).interest_local == "dol"
+        assert schedule.version_for(date(2025, 1, 1)).shares == (0.5, 0.5)
+
+    def test_invalid_shares(self):
+        """Udziały muszą sumować się do 1."""
+        with pytest.raises(ValueError):
+            AllocationSchedule.from_rules([
+                GasAllocationRule(local="gora", share=0.5, bears_interest=False, valid_from=None, valid_to=None)
+            ])
+
+
+class TestGenerateGasBills:
+    """Testy generowania rachunków gazu."""
+
+    def test_default_split_with_interest(self, db_session):
+        """Bez reguł w bazie - podział 58/25/17, odsetki płaci gora."""
+        add_locals(db_session)
+        create_gas_invoice(db_session, "2024-03", interest=12.3)
+
+        GasBillingManager().generate_bills_for_period(db_session, "2024-03")
+
+        result = bills(db_session, "2024-03")
+        assert {name: b.cost_share for name, b in result.items()} == {"gora": 0.58, "dol": 0.25, "gabinet": 0.17}
+        assert result["dol"].fuel_cost_gross == 50.0
+        assert result["dol"].total_gross_sum == 125.0
+        assert result["gora"].total_gross_sum == round(290.0 + 12.3, 2)
+
+    def test_rules_from_table(self, db_session):
+        """Reguły z tabeli - udziały i lokal płacący odsetki."""
+        add_locals(db_session)
+        db_session.add_all([
+            GasAllocationRule(local="gora", share=0.5, bears_interest=False),
+            GasAllocationRule(local="dol", share=0.3, bears_interest=True),
+            GasAllocationRule(local="gabinet", share=0.2, bears_interest=False),
+        ])
+        create_gas_invoice(db_session, "2024-03", interest=10.0, detailed=False)
+
+        GasBillingManager().generate_bills_for_period(db_session, "2024-03")
+
+        result = bills(db_session, "2024-03")
+        assert result["gora"].total_gross_sum == 246.0
+        assert result["gora"].fuel_cost_gross == round(246.0 * 0.25, 2)
+        assert result["dol"].total_gross_sum == round(492.0 * 0.3 + 10.0, 2)
+
+    def test_generate_all_single_insert(self, db_session, count_queries):
+        """Wszystkie okresy w jednym przebiegu i jednym INSERT; okresy z rachunkami pominięte."""
+        add_locals(db_session)
+        for month in range(1, 7):
+            create_gas_invoice(db_session, f"2024-{month:02d}")
+        manager = GasBillingManager()
+        manager.generate_bills_for_period(db_session, "2024-01")
+
+        statements = count_queries()
+        result = manager.generate_all_bills(db_session, start="2024-01", end="2024-05")
+
+        assert result["periods_processed"] == ["2024-02", "2024-03", "2024-04", "2024-05"]
+        assert result["periods_skipped"] == ["2024-01"]
+        assert result["bills_generated"] == 12
+        inserts = [s for s in statements if s.lstrip().upper().startswith("INSERT INTO GAS_BILLS")]
+        assert len(inserts) == 1
+        assert db_session.query(GasBill).count() == 15
+
+    def test_local_only_in_later_version(self, db_session):
+        """Lokal obecny tylko w wersji reguł drugiej faktury okresu też dostaje rachunek."""
+        add_locals(db_session)
+        db_session.add_all([
+            GasAllocationRule(local="gora", share=0.5, bears_interest=True, valid_to=date(2024, 3, 14)),
+            GasAllocationRule(local="dol", share=0.5, bears_interest=False, valid_to=date(2024, 3, 14)),
+            GasAllocationRule(local="gora", share=0.5, bears_interest=True, valid_from=date(2024, 3, 15)),
+            GasAllocationRule(local="dol", share=0.25, bears_interest=False, valid_from=date(2024, 3, 15)),
+            GasAllocationRule(local="gabinet", share=0.25, bears_interest=False, valid_from=date(2024, 3, 15)),
+        ])
+        create_gas_invoice(db_session, "2024-03")
+        second = create_gas_invoice(db_session, "2024-03")
+        second.period_start = date(2024, 3, 15)
+        second.invoice_number = "P/2024-03/2"
+        db_session.commit()
+
+        GasBillingManager().generate_bills_for_period(db_session, "2024-03")
+
+        result = bills(db_session, "2024-03")
+        assert set(result) == {"gora", "dol", "gabinet"}
+        assert result["gabinet"].cost_share == 0.25
+        assert result["gabinet"].total_gross_sum == 125.0
+        assert result["dol"].total_gross_sum == 250.0 + 125.0
@@ -0,0 +1,130 @@
+"""
+Testy walidacji faktur (reguły liczone zapytaniem, zapis wyników, walidacja tylko zmienionych faktur).
+"""
+
+from datetime import date
+from app.api.routes.electricity import verify_and_save_invoice_detailed
+from app.models.electricity_invoice import ElectricityInvoiceSprzedazEnergii
+from app.models.gas import GasInvoice
+from app.models.validation import ValidationResult
+from app.services.combined.invoice_validation import (
+    MEDIA,
+    get_validation_results,
+    get_validation_summary,
+    validate_invoices
+)
+from tests.conftest import invoice_payload
+
+
+def create_consistent_gas_invoice(db_session, data):
+    """Faktura gazu spełniająca wszystkie tożsamości arytmetyczne."""
+    year, month = map(int, data.split('-'))
+    invoice = GasInvoice(
+        data=data, period_start=date(year, month, 1), period_stop=date(year, month, 28),
+        previous_reading=100, current_reading=200, fuel_usage_m3=100, fuel_price_net=2, fuel_value_net=200,
+        fuel_vat_amount=46, fuel_value_gross=246, subscription_quantity=2, subscription_price_net=5,
+        subscription_value_net=10, subscription_vat_amount=2.3, subscription_value_gross=12.3,
+        distribution_fixed_quantity=2, distribution_fixed_price_net=10, distribution_fixed_vat_amount=4.6,
+        distribution_fixed_value_gross=24.6, distribution_fixed_value_net=20,
+        distribution_variable_usage_m3=100, distribution_variable_conversion_factor=11,
+        distribution_variable_usage_kwh=1100, distribution_variable_price_net=0.1,
+        distribution_variable_value_net=110, distribution_variable_vat_amount=25.3,
+        distribution_variable_value_gross=135.3, fuel_conversion_factor=11, fuel_usage_kwh=1100,
+        vat_rate=0.23, vat_amount=78.2, total_net_sum=340, total_gross_sum=418.2,
+        late_payment_interest=0, amount_to_pay=418.2, payment_due_date=date(year, month, 28),
+        invoice_number=f"P/{data}"
+    )
+    db_session.add(invoice)
+    db_session.commit()
+    return invoice
+
+
+def failed_rules(db_session, media):
+    return {(r.invoice_id, r.rule) for r in get_validation_results(db_session, media)}
+
+
+class TestGasValidation:
+    """Testy reguł faktur gazu."""
+
+    def test_consistent_invoice(self, db_session):
+        """Poprawna faktura - wszystkie reguły 'ok', wynik per reguła zapisany przy commicie faktury."""
+        invoice = create_consistent_gas_invoice(db_session, "2024-01")
+
+        statuses = {r.status for r in db_session.query(ValidationResult).filter_by(invoice_id=invoice.id)}
+        assert statuses == {'ok'}
+        assert db_session.query(ValidationResult).count() == len(MEDIA['gas'][1])
+
+    def test_mismatch_detected(self, db_session):
+        """Błędna kwota VAT paliwa - błąd reguły VAT i sum VAT."""
+        invoice = create_consistent_gas_invoice(db_session, "2024-01")
+        invoice.fuel_vat_amount = 40
+        db_session.commit()
+
+        assert failed_rules(db_session, 'gas') == {
+            (invoice.id, 'fuel_vat'), (invoice.id, 'fuel_value_gross'), (invoice.id, 'total_vat')
+        }
+        result = get_validation_results(db_session, 'gas')[0]
+        assert result.message.startswith("Paliwo gazowe - VAT: obliczone 46.00 != faktura 40.00")
+
+
+class TestIncrementalValidation:
+    """Testy walidacji przyrostowej."""
+
+    def test_only_changed_invoices(self, db_session):
+        """Commit waliduje tylko zmienione faktury; faktury z wynikami są pomijane."""
+        first = create_consistent_gas_invoice(db_session, "2024-01")
+        second = create_consistent_gas_invoice(db_session, "2024-03")
+        assert validate_invoices(db_session, 'gas')['gas']['validated'] == 0
+        second_ids = [r.id for r in db_session.query(ValidationResult).filter_by(invoice_id=second.id)]
+
+        first.total_net_sum = 350
+        db_session.commit()
+
+        assert [r.id for r in db_session.query(ValidationResult).filter_by(invoice_id=second.id)] == second_ids
+        assert failed_rules(db_session, 'gas') == {(first.id, 'total_net'), (first.id, 'total_gross_from_net_vat')}
+
+    def test_electricity_child_change(self, db_session):
+        """Zmiana pozycji sprzedaży energii waliduje ponownie jej fakturę."""
+        invoice_id = verify_and_save_invoice_detailed(invoice_data=invoice_payload(), db=db_session)["invoice_id"]
+        def sales_deviation():
+            return db_session.query(ValidationResult.expected).filter_by(
+                invoice_id=invoice_id, rule='sales_item_value'
+            ).scalar()
+
+        before = sales_deviation()
+        item = db_session.query(ElectricityInvoiceSprzedazEnergii).first()
+        item.cena_za_kwh = 0.9
+        db_session.commit()
+
+        assert sales_deviation() != before
+        assert validate_invoices(db_session, 'electricity')['electricity']['validated'] == 0
+
+    def test_discarded_on_rollback(self, db_session):
+        """Wycofana zmiana nie zostawia wyników do przeliczenia w kolejnej transakcji."""
+        invoice = create_consistent_gas_invoice(db_session, "2024-01")
+        invoice.total_net_sum = 350
+        db_session.flush()
+        db_session.rollback()
+        db_session.commit()
+
+        assert failed_rules(db_session, 'gas') == set()
+
+
+class TestSummary:
+    """Testy podsumowania dla dashboardu."""
+
+    def test_summary_counts(self, db_session):
+        """Liczba faktur zwalidowanych, z błędami i błędów wg wagi."""
+        create_consistent_gas_invoice(db_session, "2024-01")
+        broken = create_consistent_gas_invoice(db_session, "2024-03")
+        broken.period_stop = date(2024, 2, 1)
+        db_session.commit()
+
+        summary = get_validation_summary(db_session)
+
+        assert summary['gas'] == {
+            'invoices_validated': 2,
+            'invoices_failed': 1,
+            'failed_checks': {'critical': 1, 'warning': 0, 'info': 0}
+        }
+        assert summary['water']['invoices_validated'] == 0
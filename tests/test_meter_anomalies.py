@@ -0,0 +1,115 @@
+"""
+Testy wykrywania anomalii w historii odczytów liczników (mediana/MAD, przetwarzanie przyrostowe).
+"""
+
+from app.models.electricity import ElectricityReading
+from app.models.meter_anomaly import MeterAnomaly, MeterStatistic
+from app.models.water import Reading
+from app.services.combined.meter_anomalies import classify_delta, update_meter_anomalies
+from tests.conftest import create_reading
+
+
+def add_water_readings(db_session, usages, first_year=2020, start=100.0):
+    """Miesięczne odczyty wody o podanym zużyciu licznika głównego (pozostałe liczniki - połowa, ćwierć)."""
+    value = start
+    periods = []
+    for i, usage in enumerate([0.0] + list(usages)):
+        value += usage
+        data = f"{first_year + i // 12}-{i % 12 + 1:02d}"
+        db_session.add(Reading(data=data, water_meter_main=value, water_meter_5=int(value / 2),
+                               water_meter_5a=int(value / 4), water_meter_5b=0))
+        periods.append(data)
+    db_session.commit()
+    return periods
+
+
+def anomalies(db_session, meter="water.water_meter_main"):
+    """Anomalie licznika jako krotki (okres, rodzaj)."""
+    return [
+        (a.data, a.kind)
+        for a in db_session.query(MeterAnomaly).filter_by(meter=meter).order_by(MeterAnomaly.data)
+    ]
+
+
+class TestClassifyDelta:
+    """Testy oceny pojedynczego zużycia."""
+
+    def test_outlier(self):
+        """Zużycie daleko od mediany - odstające."""
+        assert classify_delta(160.0, 100.0, [10.0, 11.0, 9.0, 10.0])[0] == 'outlier'
+        assert classify_delta(111.0, 100.0, [10.0, 11.0, 9.0, 10.0])[0] is None
+
+    def test_negative_and_replacement(self):
+        """Spadek stanu - ujemne zużycie, a spadek do małej wartości - wymiana licznika."""
+        assert classify_delta(95.0, 100.0, None)[0] == 'negative_delta'
+        assert classify_delta(3.0, 100.0, None)[0] == 'meter_replacement'
+        assert classify_delta(5000.0, 100.0, [10.0, 11.0, 9.0])[0] == 'meter_replacement'
+
+
+class TestUpdateMeterAnomalies:
+    """Testy przetwarzania historii odczytów (przy commicie zapisu odczytów)."""
+
+    def test_detects_anomalies(self, db_session):
+        """Skok zużycia i spadek stanu licznika są wykrywane przy zapisie odczytów."""
+        add_water_readings(db_session, [10, 11, 9, 10, 10, 60, 10, -5, 10])
+
+        assert anomalies(db_session) == [("2020-07", "outlier"), ("2020-09", "negative_delta")]
+        # Wszystkie odczyty już przetworzone
+        assert update_meter_anomalies(db_session, 'water')["readings_processed"] == 0
+
+    def test_incremental_processing(self, db_session):
+        """Nowy odczyt aktualizuje tylko statystyki swojego miesiąca."""
+        add_water_readings(db_session, [10, 11, 9, 10, 10])
+        stats_before = {
+            (s.meter, s.month): s.deltas for s in db_session.query(MeterStatistic)
+        }
+
+        db_session.add(Reading(data="2020-07", water_meter_main=200.0, water_meter_5=80,
+                               water_meter_5a=40, water_meter_5b=0))
+        db_session.commit()
+
+        assert anomalies(db_session) == [("2020-07", "outlier")]
+        changed = {
+            (s.meter, s.month) for s in db_session.query(MeterStatistic)
+            if stats_before.get((s.meter, s.month)) != s.deltas
+        }
+        # Odstające zużycie trafia do okna miesiąca 7 i okna wszystkich miesięcy
+        assert ("water.water_meter_main", 7) in changed
+        assert {month for _, month in changed} <= {0, 7}
+
+    def test_history_edit_recomputes(self, db_session):
+        """Poprawka przetworzonego odczytu kasuje stan - historia jest przeliczana od początku."""
+        periods = add_water_readings(db_session, [10, 11, 9, 10, 10, 60, 10])
+        assert anomalies(db_session) == [("2020-07", "outlier")]
+
+        # Stan 2020-07 obniżony o 50 m³ - skok zużycia przesuwa się na 2020-08
+        reading = db_session.query(Reading).filter_by(data=periods[6]).one()
+        reading.water_meter_main -= 50
+        db_session.commit()
+
+        assert anomalies(db_session) == [("2020-08", "outlier")]
+
+    def test_unprocessed_readings(self, db_session):
+        """Odczyty zapisane z pominięciem sesji ORM są przetwarzane przez update_meter_anomalies."""
+        add_water_readings(db_session, [10, 11, 9, 10, 10])
+        db_session.connection().execute(Reading.__table__.insert().values(
+            data="2020-07", water_meter_main=200.0, water_meter_5=80, water_meter_5a=40, water_meter_5b=0
+        ))
+        db_session.commit()
+        assert anomalies(db_session) == []
+
+        result = update_meter_anomalies(db_session, 'water')
+        db_session.commit()
+
+        assert result["readings_processed"] == 1
+        assert anomalies(db_session) == [("2020-07", "outlier")]
+
+    def test_electricity_readings_not_flagged(self, db_session):
+        """Anomalia odczytu prądu nie ustawia ręcznej flagi is_flagged."""
+        for i, gabinet in enumerate([100.0, 110.0, 121.0, 130.0, 141.0, 90.0]):
+            db_session.add(create_reading(f"2022-{i + 1:02d}", dom_reading=1000.0 + 100 * i,
+                                          dol_reading=500.0 + 50 * i, gabinet=gabinet))
+        db_session.commit()
+
+        assert anomalies(db_session, "electricity.gabinet") == [("2022-06", "negative_delta")]
+        assert db_session.query(ElectricityReading).filter_by(is_flagged=True).count() == 0
@@ -0,0 +1,96 @@
+"""
+Testy stronicowania kursorowego i wyboru pól list (app.core.pagination).
+"""
+
+import pytest
+from fastapi import HTTPException, Response
+from app.api.routes.electricity import get_bills, get_invoices_detailed
+from app.core.pagination import NEXT_CURSOR_HEADER
+from tests.conftest import create_bills, save_invoices
+
+
+def walk_pages(fetch, limit):
+    """Pobiera kolejne strony (fetch(response, cursor, limit)) aż do braku kursora."""
+    pages = []
+    cursor = None
+    while True:
+        response = Response()
+        pages.append(fetch(response, cursor, limit))
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+
+
+class TestKeysetPagination:
+    """Strony list wyznaczane kursorem (data, id)."""
+
+    def test_pages_cover_all_rows_in_order(self, db_session):
+        """Kolejne strony zawierają wszystkie rachunki bez powtórzeń, malejąco po (data, id)."""
+        create_bills(db_session, invoice_count=2, bills_per_invoice=12)
+
+        pages = walk_pages(lambda response, cursor, limit: get_bills(
+            response, cursor=cursor, limit=limit, fields="id,data", db=db_session
+        ), limit=5)
+        rows = [(row["data"], row["id"]) for page in pages for row in page]
+
+        assert [len(page) for page in pages] == [5, 5, 5, 5, 4]
+        assert rows == sorted(rows, reverse=True)
+        assert len(set(rows)) == 24
+
+    def test_invoices_detailed_pages(self, db_session):
+        """Lista szczegółowych faktur jest stronicowana tym samym kursorem."""
+        save_invoices(db_session, 3)
+
+        pages = walk_pages(lambda response, cursor, limit: get_invoices_detailed(
+            response, cursor=cursor, limit=limit, db=db_session
+        ), limit=2)
+
+        assert [len(page) for page in pages] == [2, 1]
+        assert [item.rok for page in pages for item in page] == [2012, 2011, 2010]
+
+    def test_without_limit_returns_all_rows(self, db_session):
+        """Bez limit= i cursor= zwracana jest cała lista, bez kursora następnej strony."""
+        create_bills(db_session, invoice_count=3, bills_per_invoice=40)
+        response = Response()
+
+        rows = get_bills(response, fields="id", db=db_session)
+
+        assert len(rows) == 120
+        assert NEXT_CURSOR_HEADER not in response.headers
+
+    def test_invalid_cursor(self, db_session):
+        """Nieprawidłowy kursor - błąd 400."""
+        with pytest.raises(HTTPException) as error:
+            get_bills(Response(), cursor="nie-kursor", db=db_session)
+        assert error.value.status_code == 400
+
+
+class TestFieldSelection:
+    """Parametr fields= ogranicza kolumny w SELECT."""
+
+    def test_only_selected_columns_queried(self, db_session, count_queries):
+        """Bez pól z faktury jest jedno zapytanie, tylko o wybrane kolumny rachunku."""
+        create_bills(db_session, invoice_count=1, bills_per_invoice=3)
+        statements = count_queries()
+
+        bills = get_bills(Response(), fields="local,total_gross_sum", db=db_session)
+
+        assert bills == [{"local": "gora", "total_gross_sum": 2.0}] * 3
+        assert len(statements) == 1
+        assert "pdf_path" not in statements[0] and "electricity_invoices" not in statements[0]
+
+    def test_invoice_fields(self, db_session):
+        """Pola wyliczane z faktury są dostępne w projekcji razem z kolumnami rachunku."""
+        create_bills(db_session, invoice_count=1, bills_per_invoice=1)
+
+        bills = get_bills(Response(), fields="id,numer_faktury,blankiet_numer", db=db_session)
+
+        assert list(bills[0]) == ["id", "numer_faktury", "blankiet_numer"]
+        assert bills[0]["numer_faktury"] == "F/0"
+
+    def test_unknown_field(self, db_session):
+        """Nieznane pole - błąd 400 z listą dostępnych pól."""
+        with pytest.raises(HTTPException) as error:
+            get_bills(Response(), fields="id,haslo", db=db_session)
+        assert error.value.status_code == 400
+        assert "haslo" in error.value.detail
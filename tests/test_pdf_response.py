@@ -0,0 +1,95 @@
+"""
+Testy odpowiedzi z PDF rachunków: podgląd w pamięci, ETag/If-None-Match i Range.
+"""
+
+from pathlib import Path
+from app.api.routes.combined import download_combined_bill
+from app.api.routes.gas import download_gas_bill
+from app.core.pdf_response import parse_range
+from tests.conftest import make_request, read_body
+
+
+class TestPreview:
+    """Podgląd renderowany w pamięci."""
+
+    def test_preview_not_persisted(self, db_session, bills, tmp_path, monkeypatch):
+        """Podgląd zwraca PDF z ETag i nie zapisuje pliku ani ścieżki rachunku."""
+        monkeypatch.chdir(tmp_path)
+
+        response = download_gas_bill(bills['gas'].id, make_request(), preview=True, db=db_session)
+
+        assert response.status_code == 200
+        assert read_body(response).startswith(b"%PDF")
+        # Słaby ETag - PDF zawiera datę wygenerowania, bajty nie są powtarzalne
+        assert response.headers['etag'].startswith('W/"')
+        assert list(tmp_path.iterdir()) == []
+        assert bills['gas'].pdf_path is None
+
+    def test_preview_not_modified(self, db_session, bills, tmp_path, monkeypatch):
+        """Aktualny ETag w If-None-Match daje 304 bez renderowania."""
+        monkeypatch.chdir(tmp_path)
+        etag = download_combined_bill(bills['combined'].id, make_request(), preview=True, db=db_session).headers['etag']
+
+        response = download_combined_bill(
+            bills['combined'].id, make_request(if_none_match=etag), preview=True, db=db_session
+        )
+
+        assert response.status_code == 304
+        assert response.headers['etag'] == etag
+
+
+class TestPersisted:
+    """Zapisane pliki: ETag zgodny z podglądem i zakresy bajtów."""
+
+    def test_etag_matches_preview(self, db_session, bills, tmp_path, monkeypatch):
+        """ETag pliku to pdf_hash - ten sam co dla podglądu niezmienionego rachunku."""
+        monkeypatch.chdir(tmp_path)
+        bill_id = bills['gas'].id
+        preview_etag = download_gas_bill(bill_id, make_request(), preview=True, db=db_session).headers['etag']
+
+        response = download_gas_bill(bill_id, make_request(), db=db_session)
+        not_modified = download_gas_bill(bill_id, make_request(if_none_match=preview_etag), db=db_session)
+
+        assert response.status_code == 200
+        assert response.headers['etag'] == preview_etag
+        assert response.headers['accept-ranges'] == "bytes"
+        assert not_modified.status_code == 304
+
+    def test_range_request(self, db_session, bills, tmp_path, monkeypatch):
+        """Range zwraca 206 z fragmentem pliku, zakres poza plikiem - 416."""
+        monkeypatch.chdir(tmp_path)
+        bill_id = bills['gas'].id
+        download_gas_bill(bill_id, make_request(), db=db_session)
+        content = Path(bills['gas'].pdf_path).read_bytes()
+
+        partial = download_gas_bill(bill_id, make_request(range="bytes=0-9"), db=db_session)
+        outside = download_gas_bill(bill_id, make_request(range=f"bytes={len(content)}-"), db=db_session)
+
+        assert partial.status_code == 206
+        assert read_body(partial) == content[:10]
+        assert partial.headers['content-range'] == f"bytes 0-9/{len(content)}"
+        assert outside.status_code == 416
+
+    def test_if_range(self, db_session, bills, tmp_path, monkeypatch):
+        """If-Range z Last-Modified pliku wznawia pobieranie; słaby ETag w If-Range - cały plik."""
+        monkeypatch.chdir(tmp_path)
+        bill_id = bills['gas'].id
+        full = download_gas_bill(bill_id, make_request(), db=db_session)
+        content = Path(bills['gas'].pdf_path).read_bytes()
+
+        resumed = download_gas_bill(
+            bill_id, make_request(range="bytes=10-", if_range=full.headers['last-modified']), db=db_session
+        )
+        weak = download_gas_bill(
+            bill_id, make_request(range="bytes=10-", if_range=full.headers['etag']), db=db_session
+        )
+
+        assert resumed.status_code == 206
+        assert read_body(resumed) == content[10:]
+        assert weak.status_code == 200
+
+    def test_parse_range(self):
+        """Sufiks, zakres otwarty i kilka zakresów."""
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=500-", 1000) == (500, 999)
+        assert parse_range("bytes=0-1,5-9", 1000) is None
@@ -0,0 +1,168 @@
+"""
+Testy wspólnego modułu PDF (czcionka i style budowane raz), równoległego renderowania
+i generatorów rachunków wszystkich mediów.
+"""
+
+from pathlib import Path
+from app.core.pdf_pipeline import render_views
+from app.core.pdf_toolkit import (
+    get_default_font,
+    get_paragraph_styles,
+    info_table_commands,
+    table_style
+)
+from app.services.combined.bill_generator import build_combined_bill_views, generate_combined_bill_pdf
+from app.services.electricity.cost_model import invalidate_invoice_cost_models
+from app.services.electricity.bill_generator import generate_bill_pdf as generate_electricity_pdf
+from app.services.gas.bill_generator import generate_bill_pdf as generate_gas_pdf
+from app.services.water.bill_generator import build_bill_views, generate_all_bills_for_period, generate_bill_pdfs
+from app.services.water.bill_generator import generate_bill_pdf as generate_water_pdf
+
+
+class TestSharedResources:
+    """Czcionka i style są przygotowywane raz na proces."""
+
+    def test_font_registered_once(self):
+        """Kolejne wywołania korzystają z cache."""
+        font = get_default_font()
+        hits = get_default_font.cache_info().hits
+
+        assert get_default_font() == font
+        assert get_default_font.cache_info().hits == hits + 1
+
+    def test_styles_shared(self):
+        """Style akapitów i tabel są tymi samymi obiektami dla tej samej czcionki."""
+        font = get_default_font()
+
+        assert get_paragraph_styles(font) is get_paragraph_styles(font)
+        assert get_paragraph_styles(font)['title'].fontName == font
+        assert table_style(info_table_commands, font) is table_style(info_table_commands, font)
+
+
+class TestGenerators:
+    """Generatory wszystkich mediów korzystają ze wspólnego szablonu dokumentu."""
+
+    def test_all_generators_render(self, db_session, bills, tmp_path, monkeypatch):
+        """Każdy generator zapisuje poprawny plik PDF."""
+        monkeypatch.chdir(tmp_path)
+
+        paths = [
+            generate_water_pdf(db_session, bills['water']),
+            generate_gas_pdf(db_session, bills['gas']),
+            generate_electricity_pdf(db_session, bills['electricity']),
+            generate_combined_bill_pdf(db_session, bills['combined']),
+        ]
+
+        for path in paths:
+            assert Path(path).read_bytes().startswith(b"%PDF")
+        assert Path(paths[0]).name == "bill_2024-02_local_gora.pdf"
+
+
+class TestPipeline:
+    """Renderowanie modeli widoku w puli procesów z atomowym zapisem plików."""
+
+    def test_pool_renders_views(self, db_session, bills, tmp_path):
+        """Pula procesów renderuje wszystkie rachunki i nie zostawia plików tymczasowych."""
+        view = build_bill_views(db_session, [bills['water']])[0]
+        views = [
+            {**view, 'bill_id': bill_id, 'path': str(tmp_path / f"bill_{bill_id}.pdf")}
+            for bill_id in range(4)
+        ]
+
+        paths, errors = render_views(views, max_workers=2)
+
+        assert errors == {}
+        assert sorted(paths) == [0, 1, 2, 3]
+        for path in paths.values():
+            assert Path(path).read_bytes().startswith(b"%PDF")
+        assert sorted(p.name for p in tmp_path.iterdir()) == [f"bill_{bill_id}.pdf" for bill_id in range(4)]
+
+    def test_failed_render_leaves_no_file(self, tmp_path):
+        """Błąd renderowania jest zwracany dla rachunku, a pod ścieżką nie zostaje żaden plik."""
+        view = {'bill_id': 7, 'path': str(tmp_path / "broken.pdf"), 'blocks': [('unknown',)]}
+
+        paths, errors = render_views([view])
+
+        assert paths == {}
+        assert "unknown" in errors[7]
+        assert list(tmp_path.iterdir()) == []
+
+    def test_period_paths_saved_in_bulk(self, db_session, bills, tmp_path, monkeypatch):
+        """Generowanie okresu zapisuje pdf_path rachunków w bazie."""
+        monkeypatch.chdir(tmp_path)
+
+        files = generate_all_bills_for_period(db_session, "2024-02")
+
+        db_session.refresh(bills['water'])
+        assert files == [str(Path("bills/woda/bill_2024-02_local_gora.pdf"))]
+        assert bills['water'].pdf_path == files[0]
+        assert bills['water'].pdf_hash is not None
+        assert (tmp_path / files[0]).exists()
+
+
+class TestContentHash:
+    """PDF jest renderowany ponownie tylko, gdy zmieniły się jego dane wejściowe."""
+
+    def test_unchanged_bill_skipped(self, db_session, bills, tmp_path, monkeypatch):
+        """Drugie generowanie bez zmian nie renderuje pliku; zmiana kwoty wymusza renderowanie."""
+        monkeypatch.chdir(tmp_path)
+        water = bills['water']
+
+        rendered, unchanged, _ = generate_bill_pdfs(db_session, [water])
+        db_session.commit()
+        assert list(rendered) == [water.id] and unchanged == {}
+
+        rendered, unchanged, _ = generate_bill_pdfs(db_session, [water])
+        db_session.commit()
+        assert rendered == {} and list(unchanged) == [water.id]
+
+        first_hash = water.pdf_hash
+        water.gross_sum = 200
+        db_session.commit()
+        rendered, unchanged, _ = generate_bill_pdfs(db_session, [water])
+        db_session.commit()
+        db_session.refresh(water)
+        assert list(rendered) == [water.id]
+        assert water.pdf_hash != first_hash
+
+    def test_missing_file_rendered_again(self, db_session, bills, tmp_path, monkeypatch):
+        """Usunięty plik jest odtwarzany mimo zgodnego skrótu (pojedynczy rachunek)."""
+        monkeypatch.chdir(tmp_path)
+        gas = bills['gas']
+
+        path = Path(generate_gas_pdf(db_session, gas))
+        modified = path.stat().st_mtime_ns
+        assert Path(generate_gas_pdf(db_session, gas)).stat().st_mtime_ns == modified
+
+        path.unlink()
+        generate_gas_pdf(db_session, gas)
+        assert path.exists()
+
+
+class TestCombinedViews:
+    """Modele widoku rachunków łączonych składane z danych okresu pobranych raz dla wszystkich lokali."""
+
+    def test_query_count_independent_of_locals(self, db_session, combined_bills, count_queries):
+        """Liczba zapytań dla trzech lokali jest taka sama jak dla jednego."""
+        for bill in combined_bills:
+            db_session.refresh(bill)
+        counts = []
+        for selected in (combined_bills[:1], combined_bills):
+            invalidate_invoice_cost_models()
+            counts.append(len(count_queries(lambda: build_combined_bill_views(db_session, selected))))
+
+        assert counts[0] == counts[1]
+
+    def test_view_contents(self, db_session, combined_bills):
+        """Odczyty lokalu i poprzedni odczyt pochodzą z odczytów sąsiednich okresów."""
+        views = build_combined_bill_views(db_session, combined_bills)
+        tables = [
+            dict((row[0], row[1]) for row in block[1])
+            for view in views for block in view['blocks'] if block[0] == 'table'
+        ]
+
+        assert [view['bill_id'] for view in views] == [bill.id for bill in combined_bills]
+        assert tables[0]['Lokal:'] == "gora"
+        assert {'Odczyty licznika:': "180.00", 'Poprzedni odczyt:': "140.00", 'Zużycie:': "200.00 kWh"} in tables
+        assert {'Odczyty licznika:': "450.00", 'Poprzedni odczyt:': "350.00", 'Zużycie:': "200.00 kWh"} in tables
+        assert {'Odczyty licznika:': "65.00 m³", 'Poprzedni odczyt:': "50.00 m³", 'Zużycie:': "15.00 m³"} in tables
@@ -0,0 +1,87 @@
+"""
+Testy cache odpowiedzi zależnych od wersji tabel (ETag, 304).
+"""
+
+import json
+import pytest
+from app.api.routes.combined import get_available_periods
+from app.api.routes.gas import get_gas_stats
+from app.core.change_tracking import table_versions
+from app.core.response_cache import clear_response_cache
+from app.models.combined import CombinedBill
+from app.models.gas import GasBill
+from tests.conftest import make_request
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    """Każdy test zaczyna bez zapamiętanych odpowiedzi (wersje tabel są wspólne dla baz testowych)."""
+    clear_response_cache()
+    yield
+    clear_response_cache()
+
+
+class TestTableVersions:
+    """Liczniki wersji tabel."""
+
+    def test_flush_and_commit_bump_version(self, db_session, bills):
+        """Zmiana rachunku zwiększa wersję jego tabeli (flush i commit); inne tabele bez zmian."""
+        before = table_versions(["gas_bills", "bills"])
+
+        bills['gas'].total_gross_sum = 300
+        db_session.commit()
+        after = table_versions(["gas_bills", "bills"])
+
+        assert after[0] > before[0]
+        assert after[1] == before[1]
+
+
+class TestCachedResponses:
+    """Odpowiedzi z cache do zmiany tabel, z których powstały."""
+
+    def test_repeated_poll_without_queries(self, db_session, bills, count_queries):
+        """Druga odpowiedź bez zmian w tabelach nie wykonuje zapytań; treść i ETag są te same."""
+        first = get_gas_stats(make_request(), db=db_session)
+        statements = count_queries()
+        second = get_gas_stats(make_request(), db=db_session)
+
+        assert statements == []
+        assert second.body == first.body
+        assert second.headers["etag"] == first.headers["etag"]
+        assert json.loads(first.body)["bills_count"] == 1
+
+    def test_not_modified(self, db_session, bills):
+        """Aktualny ETag w If-None-Match - 304 bez treści."""
+        etag = get_gas_stats(make_request(), db=db_session).headers["etag"]
+
+        response = get_gas_stats(make_request(if_none_match=etag), db=db_session)
+
+        assert response.status_code == 304
+        assert response.body == b""
+        assert response.headers["etag"] == etag
+
+    def test_write_invalidates(self, db_session, bills):
+        """Zapis do zależnej tabeli zmienia treść i ETag; stary ETag nie daje 304."""
+        first = get_gas_stats(make_request(), db=db_session)
+        db_session.add(GasBill(**{
+            column.key: getattr(bills['gas'], column.key) for column in GasBill.__table__.columns
+            if column.key not in ('id', 'pdf_path', 'pdf_hash')
+        } | {'local': 'dol'}))
+        db_session.commit()
+
+        response = get_gas_stats(make_request(if_none_match=first.headers["etag"]), db=db_session)
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != first.headers["etag"]
+        assert json.loads(response.body)["bills_count"] == 2
+
+    def test_combined_periods_follow_combined_bills(self, db_session, combined_bills):
+        """Lista okresów łączonych jest przebudowywana po usunięciu rachunku łączonego."""
+        first = json.loads(get_available_periods(make_request(), db=db_session).body)
+        db_session.query(CombinedBill).delete()
+        db_session.commit()
+
+        second = json.loads(get_available_periods(make_request(), db=db_session).body)
+
+        assert first["available_periods_with_bills"] == [["2024-01", "2024-02"]]
+        assert second["available_periods_without_bills"] == [["2024-01", "2024-02"]]
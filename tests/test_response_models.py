@@ -0,0 +1,61 @@
+"""
+Testy typowanych modeli odpowiedzi list i serializacji przez ORJSONResponse.
+"""
+
+import pytest
+from datetime import date
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.testclient import TestClient
+from app.api.routes.electricity import router as electricity_router
+from app.api.routes.gas import router as gas_router
+from app.core.database import get_db
+from app.models.electricity import ElectricityReading
+from tests.conftest import create_bills
+
+
+@pytest.fixture
+def client(db_session):
+    """Aplikacja z routerami prądu i gazu (domyślnie ORJSONResponse) na testowej bazie."""
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.include_router(electricity_router)
+    app.include_router(gas_router)
+    app.dependency_overrides[get_db] = lambda: db_session
+    return TestClient(app)
+
+
+class TestListResponseModels:
+    """Pola odpowiedzi odpowiadają kolumnom listy; daty jako 'YYYY-MM-DD'."""
+
+    def test_selected_fields_only(self, client, db_session):
+        """fields= - odpowiedź zawiera tylko wybrane pola, także wyliczane z faktury."""
+        create_bills(db_session, invoice_count=1, bills_per_invoice=1)
+
+        response = client.get("/api/electricity/bills/", params={"fields": "id,total_gross_sum,blankiet_poczatek"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == [{"id": 1, "total_gross_sum": 2.0, "blankiet_poczatek": "2010-01-01"}]
+
+    def test_reading_conversions(self, client, db_session):
+        """Odczyty: data jako tekst, flagi jako bool, odczyty jako float (brak odczytu - null)."""
+        db_session.add(ElectricityReading(
+            data="2024-01", data_odczytu_licznika=date(2024, 1, 10), licznik_dom_jednotaryfowy=False,
+            odczyt_dom_I=100, odczyt_dom_II=50, licznik_dol_jednotaryfowy=True, odczyt_dol=20, odczyt_gabinet=5
+        ))
+        db_session.commit()
+
+        reading = client.get("/api/electricity/readings").json()[0]
+
+        assert reading["data_odczytu_licznika"] == "2024-01-10"
+        assert reading["is_main_meter_single_tariff"] is False
+        assert reading["main_reading_t1"] == 100.0
+        assert reading["main_reading"] is None
+        assert reading["gabinet_reading"] == 5.0
+        assert reading["is_flagged"] is False
+
+    def test_row_mapping_for_period(self, client, bills):
+        """Rachunki gazu za okres - wiersze kolumn (bez obiektów ORM) z polami okresu."""
+        response = client.get("/api/gas/bills/period/2024-01")
+
+        assert response.json() == [{"id": bills['gas'].id, "data": "2024-01", "local": "gora", "total_gross_sum": 285.36}]
@@ -0,0 +1,167 @@
+"""
+Testy budowania i serwowania zasobów statycznych (minifikacja, skróty, .gz, kompresja JSON).
+"""
+
+import gzip
+from types import SimpleNamespace
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.testclient import TestClient
+from app.core import static_assets
+from app.core.compression import TextGZipMiddleware, accepted_encodings
+from app.core.static_assets import (
+    BUILD_DIR_NAME,
+    IMMUTABLE_CACHE_CONTROL,
+    PrecompressedStaticFiles,
+    build_static_assets,
+    clear_page_cache,
+    minify_css,
+    minify_js,
+    page_response,
+)
+
+LARGE_SCRIPT = "\n".join(f"    // Funkcja {i}\n    function f{i}() {{\n        return {i};\n    }}" for i in range(200))
+PAGE = f"""<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body {{ color: red; }}
+    </style>
+</head>
+<body>
+    <script>
+        const small = 1;
+    </script>
+    <script>
+{LARGE_SCRIPT}
+    </script>
+</body>
+</html>
+"""
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    """Katalog plików statycznych ze stroną dashboard.html."""
+    (tmp_path / "dashboard.html").write_text(PAGE, encoding="utf-8")
+    clear_page_cache()
+    yield tmp_path
+    clear_page_cache()
+
+
+@pytest.fixture
+def client(static_dir):
+    """Aplikacja z katalogiem statycznym, stroną dashboardu i kompresją odpowiedzi tekstowych."""
+    app = FastAPI()
+    app.add_middleware(TextGZipMiddleware, minimum_size=100)
+    app.mount("/static", PrecompressedStaticFiles(directory=static_dir), name="static")
+
+    @app.get("/dashboard")
+    def dashboard(request: Request):
+        return page_response(request, static_dir, "dashboard.html")
+
+    @app.get("/data")
+    def data():
+        return JSONResponse([{"okres": "2024-01", "suma": 100.0}] * 50)
+
+    @app.get("/pdf")
+    def pdf():
+        return Response(b"%PDF" * 500, media_type="application/pdf")
+
+    return TestClient(app)
+
+
+class TestMinification:
+    """Minifikacja bez zmiany napisów i literałów szablonowych."""
+
+    def test_css(self):
+        """Komentarze i białe znaki usunięte, treść napisów bez zmian."""
+        css = "/* nagłówek */\na > b ,  c {\n    content: '  x  ';\n    margin: 0 auto;\n}\n"
+
+        assert minify_css(css) == "a>b,c{content:'  x  ';margin:0 auto}"
+
+    def test_js_keeps_template_literals(self):
+        """Wcięcia i komentarze w kodzie usunięte; linie wewnątrz `...` zachowane."""
+        js = "    // komentarz\n    const html = `\n        <div>\n    // to nie komentarz\n    `;\n\n    call(html);  \n"
+
+        assert minify_js(js) == "const html = `\n        <div>\n    // to nie komentarz\n    `;\ncall(html);"
+
+
+class TestBuild:
+    """Budowanie strony: pliki ze skrótem treści i warianty .gz."""
+
+    def test_build_and_skip_unchanged(self, static_dir):
+        """CSS i duży skrypt wydzielone do plików, mały skrypt zostaje w HTML; druga budowa nic nie robi."""
+        built = build_static_assets(static_dir)["dashboard.html"]
+        html = (static_dir / BUILD_DIR_NAME / "dashboard.html").read_text(encoding="utf-8")
+        script = next(name for name in built if name.endswith(".js"))
+
+        assert f'<script src="/static/build/{script}"></script>' in html
+        assert "<script>const small = 1;</script>" in html
+        assert '<link rel="stylesheet" href="/static/build/dashboard.' in html and "<style>" not in html
+        assert gzip.decompress((static_dir / BUILD_DIR_NAME / f"{script}.gz").read_bytes()) == \
+            (static_dir / BUILD_DIR_NAME / script).read_bytes()
+        assert build_static_assets(static_dir) == {}
+
+    def test_changed_source_replaces_assets(self, static_dir):
+        """Po zmianie źródła powstaje plik z nowym skrótem, stary jest usuwany."""
+        first = build_static_assets(static_dir)["dashboard.html"]
+        (static_dir / "dashboard.html").write_text(PAGE.replace("return 1;", "return -1;"), encoding="utf-8")
+
+        second = build_static_assets(static_dir)["dashboard.html"]
+        old_script = next(name for name in first if name.endswith(".js"))
+
+        assert old_script not in second
+        assert not (static_dir / BUILD_DIR_NAME / old_script).exists()
+
+    def test_rebuild_when_brotli_becomes_available(self, static_dir, monkeypatch):
+        """Po instalacji brotli niezmieniona strona jest budowana ponownie z wariantami .br."""
+        monkeypatch.setattr(static_assets, "brotli", None)
+        first = build_static_assets(static_dir)["dashboard.html"]
+
+        monkeypatch.setattr(static_assets, "brotli", SimpleNamespace(compress=lambda data, quality: data[::-1]))
+        second = build_static_assets(static_dir)["dashboard.html"]
+
+        assert not any(name.endswith(".br") for name in first)
+        assert "dashboard.html.br" in second
+        assert build_static_assets(static_dir) == {}
+
+
+class TestServing:
+    """Wybór wariantu według Accept-Encoding, nagłówki cache, kompresja JSON."""
+
+    def test_precompressed_fingerprinted_asset(self, client, static_dir):
+        """Plik ze skrótem: wariant .gz dla klienta z gzip, bez kodowania dla pozostałych; cache na rok."""
+        script = next(name for name in build_static_assets(static_dir)["dashboard.html"] if name.endswith(".js"))
+
+        compressed = client.get(f"/static/build/{script}", headers={"Accept-Encoding": "gzip"})
+        plain = client.get(f"/static/build/{script}", headers={"Accept-Encoding": "identity"})
+
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert compressed.headers["content-type"].startswith("text/javascript")
+        assert compressed.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert compressed.content == plain.content  # httpx dekoduje gzip
+        assert "content-encoding" not in plain.headers
+
+    def test_page_from_memory_with_etag(self, client, static_dir):
+        """Strona zbudowana, w wariancie gzip; aktualny ETag - 304."""
+        build_static_assets(static_dir)
+
+        response = client.get("/dashboard", headers={"Accept-Encoding": "gzip"})
+        again = client.get("/dashboard", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "/static/build/dashboard." in response.text
+        assert again.status_code == 304
+
+    def test_gzip_only_text(self, client):
+        """JSON jest kompresowany w locie, PDF nie."""
+        assert client.get("/data", headers={"Accept-Encoding": "gzip"}).headers["content-encoding"] == "gzip"
+        pdf = client.get("/pdf", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in pdf.headers
+        assert pdf.content == b"%PDF" * 500
+
+    def test_accepted_encodings(self):
+        """Kodowania z q=0 są pomijane."""
+        assert accepted_encodings("gzip;q=0, br, deflate;q=0.5") == {"br", "deflate"}
@@ -0,0 +1,116 @@
+"""
+Mikrobenchmark serializacji listy rachunków za prąd do JSON.
+
+Na bazie SQLite w pamięci z N rachunkami porównuje:
+1. Wersję sprzed typowanych modeli: obiekty ORM, słownik budowany pole po polu,
+   response_model=List[dict], jsonable_encoder i JSONResponse (json.dumps).
+2. Wersję obecną: wiersze kolumn jako słowniki (bez obiektów ORM), model ElectricityBillListItem
+   (walidacja i serializacja w pydantic-core) i ORJSONResponse.
+3. Samo kodowanie tej samej treści: JSONResponse vs ORJSONResponse.
+
+Użycie:
+    python tools/benchmark_json_serialization.py [liczba_rachunków] [powtórzenia]
+"""
+
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+# Dodaj główny katalog projektu do ścieżki
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401 - rejestruje wszystkie modele w Base.metadata
+from app.api.routes.electricity import BILL_LIST_COLUMNS, ElectricityBillListItem
+from app.core.database import Base
+from app.models.electricity import ElectricityBill
+
+
+def create_session(count: int):
+    """Sesja bazy w pamięci z `count` rachunkami za prąd."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    ElectricityBill.__table__.create(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.bulk_insert_mappings(ElectricityBill, [
+        {
+            "data": f"{2000 + i // 36:04d}-{i // 3 % 12 + 1:02d}", "local": ("gora", "dol", "gabinet")[i % 3],
+            "usage_kwh": 100.5 + i, "usage_kwh_dzienna": 70.25, "usage_kwh_nocna": 30.25,
+            "energy_cost_gross": 80.12, "distribution_cost_gross": 40.06, "total_net_sum": 97.66,
+            "total_gross_sum": 120.18, "pdf_path": f"bills/prad/rachunek_{i}.pdf"
+        }
+        for i in range(count)
+    ])
+    session.commit()
+    return session
+
+
+def serialize_orm_dicts(session) -> bytes:
+    """Obiekty ORM, słownik pole po polu, jsonable_encoder i JSONResponse."""
+    bills = session.query(ElectricityBill).order_by(ElectricityBill.data.desc(), ElectricityBill.id.desc()).all()
+    content = [{
+        "id": bill.id, "data": bill.data, "local": bill.local, "reading_id": bill.reading_id,
+        "invoice_id": bill.invoice_id, "local_id": bill.local_id, "usage_kwh": bill.usage_kwh,
+        "usage_kwh_dzienna": bill.usage_kwh_dzienna, "usage_kwh_nocna": bill.usage_kwh_nocna,
+        "energy_cost_gross": bill.energy_cost_gross, "distribution_cost_gross": bill.distribution_cost_gross,
+        "total_net_sum": bill.total_net_sum, "total_gross_sum": bill.total_gross_sum, "pdf_path": bill.pdf_path
+    } for bill in bills]
+    # response_model=List[dict]: walidacja listy słowników, potem jsonable_encoder
+    content = TypeAdapter(List[dict]).validate_python(content)
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def serialize_typed_rows(session, adapter: TypeAdapter) -> bytes:
+    """Wiersze kolumn (słowniki), model ElectricityBillListItem i ORJSONResponse (jak FastAPI z response_model)."""
+    rows = session.query(*(column.label(name) for name, column in BILL_LIST_COLUMNS.items())).order_by(
+        ElectricityBill.data.desc(), ElectricityBill.id.desc()
+    ).all()
+    items = adapter.validate_python([row._asdict() for row in rows])
+    content = adapter.dump_python(items, mode="json", exclude_unset=True)
+    return ORJSONResponse(content).body
+
+
+def measure(function, repeats: int) -> float:
+    """Średni czas wywołania w ms."""
+    function()  # rozgrzewka
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    session = create_session(count)
+    adapter = TypeAdapter(List[ElectricityBillListItem])
+    content = [row._asdict() for row in session.query(*BILL_LIST_COLUMNS.values()).all()]
+
+    print("=" * 60)
+    print(f"LISTA RACHUNKÓW ZA PRĄD ({count} rachunków, {repeats} powtórzeń)")
+    print("=" * 60)
+    before = measure(lambda: serialize_orm_dicts(session), repeats)
+    after = measure(lambda: serialize_typed_rows(session, adapter), repeats)
+    print(f"ORM + dict + JSONResponse:       {before:8.1f} ms")
+    print(f"Wiersze + model + ORJSONResponse:{after:9.1f} ms  (x{before / after:.1f})")
+
+    print("\n" + "=" * 60)
+    print("KODOWANIE TEJ SAMEJ TREŚCI")
+    print("=" * 60)
+    standard = measure(lambda: JSONResponse(content).body, repeats)
+    fast = measure(lambda: ORJSONResponse(content).body, repeats)
+    print(f"JSONResponse:    {standard:8.1f} ms")
+    print(f"ORJSONResponse:  {fast:8.1f} ms  (x{standard / fast:.1f})")
+    session.close()
+
+
+if __name__ == "__main__":
+    main()
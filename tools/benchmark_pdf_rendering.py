@@ -0,0 +1,153 @@
+"""
+Mikrobenchmark generowania PDF rachunków.
+
+1. Przygotowanie czcionki i stylów: wersja sprzed app.core.pdf_toolkit (TTFont,
+   getSampleStyleSheet i ParagraphStyle przy każdym rachunku) vs wersja współdzielona.
+2. Czas renderowania jednego rachunku dla każdego medium i rachunków łączonych -
+   na kopii bazy, w katalogu tymczasowym (baza i folder bills/ nie są zmieniane).
+3. Renderowanie wszystkich rachunków wody: jeden proces vs pula procesów
+   (app.core.pdf_pipeline.render_views).
+
+Użycie:
+    python tools/benchmark_pdf_rendering.py [liczba_rachunków_na_medium] [powtórzenia]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Dodaj główny katalog projektu do ścieżki
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from reportlab.lib import colors
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import TableStyle
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import DATABASE_URL
+from app.core.pdf_pipeline import render_views
+from app.core.pdf_toolkit import (
+    FONT_PATHS,
+    WINDOWS_FONT_PATHS,
+    get_default_font,
+    get_paragraph_styles,
+    info_table_commands,
+    summary_table_commands,
+    table_style
+)
+from app.models.combined import CombinedBill
+from app.models.electricity import ElectricityBill
+from app.models.gas import GasBill
+from app.models.water import Bill
+from app.services.combined.bill_generator import generate_combined_bill_pdf
+from app.services.electricity.bill_generator import generate_bill_pdf as generate_electricity_pdf
+from app.services.gas.bill_generator import generate_bill_pdf as generate_gas_pdf
+from app.services.water.bill_generator import build_bill_views as build_water_views
+from app.services.water.bill_generator import generate_bill_pdf as generate_water_pdf
+
+
+def per_bill_setup_uncached() -> None:
+    """Przygotowanie czcionki i stylów tak jak przed wspólnym modułem (przy każdym rachunku)."""
+    font_name = 'Helvetica'
+    for font_path in (*WINDOWS_FONT_PATHS, *FONT_PATHS):
+        if Path(font_path).exists():
+            pdfmetrics.registerFont(TTFont('Arial', font_path))
+            font_name = 'Arial'
+            break
+    styles = getSampleStyleSheet()
+    ParagraphStyle('CustomTitle', parent=styles['Heading5'], fontSize=12,
+                   textColor=colors.HexColor('#2c5aa0'), spaceAfter=1*mm, fontName=font_name)
+    ParagraphStyle('CustomHeading', parent=styles['Heading3'], fontSize=11,
+                   textColor=colors.HexColor('#2c5aa0'), spaceBefore=2*mm, spaceAfter=1*mm, fontName=font_name)
+    TableStyle(info_table_commands(font_name))
+    TableStyle(summary_table_commands(font_name))
+
+
+def per_bill_setup_cached() -> None:
+    """Przygotowanie czcionki i stylów przez app.core.pdf_toolkit."""
+    font_name = get_default_font()
+    get_paragraph_styles(font_name)
+    table_style(info_table_commands, font_name)
+    table_style(summary_table_commands, font_name)
+
+
+def measure(function, repeats: int) -> float:
+    """Średni czas wywołania w milisekundach."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print("=" * 60)
+    print("PRZYGOTOWANIE CZCIONKI I STYLÓW (na rachunek)")
+    print("=" * 60)
+    uncached = measure(per_bill_setup_uncached, 20)
+    cached = measure(per_bill_setup_cached, 20)
+    print(f"Bez współdzielenia: {uncached:8.2f} ms")
+    print(f"pdf_toolkit:        {cached:8.2f} ms")
+
+    if not Path(DATABASE_URL).exists():
+        print(f"\n[INFO] Brak bazy {DATABASE_URL} - pomijam renderowanie rachunków")
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Kopia bazy - generator gazu zapisuje pdf_path i sumy rachunku
+        db_copy = Path(workdir) / "benchmark.db"
+        shutil.copy(DATABASE_URL, db_copy)
+        engine = create_engine(f"sqlite:///{db_copy}")
+        db = sessionmaker(bind=engine)()
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            print("\n" + "=" * 60)
+            print(f"RENDEROWANIE RACHUNKU (do {limit} rachunków, {repeats} powtórzenia)")
+            print("=" * 60)
+            for label, model, render in (
+                ("Woda", Bill, generate_water_pdf),
+                ("Gaz", GasBill, generate_gas_pdf),
+                ("Prąd", ElectricityBill, generate_electricity_pdf),
+                ("Łączone", CombinedBill, generate_combined_bill_pdf),
+            ):
+                if not inspect(engine).has_table(model.__tablename__):
+                    print(f"{label:10} brak tabeli {model.__tablename__}")
+                    continue
+                bills = db.query(model).limit(limit).all()
+                if label == "Prąd":
+                    bills = [bill for bill in bills if bill.invoice_id is not None]
+                if not bills:
+                    print(f"{label:10} brak rachunków")
+                    continue
+                elapsed = measure(lambda: [render(db, bill) for bill in bills], repeats) / len(bills)
+                print(f"{label:10} {elapsed:8.2f} ms / rachunek ({len(bills)} rachunków)")
+            
+            if inspect(engine).has_table(Bill.__tablename__):
+                views = build_water_views(db, db.query(Bill).all())
+                if views:
+                    print("\n" + "=" * 60)
+                    print(f"RENDEROWANIE WSZYSTKICH RACHUNKÓW WODY ({len(views)} rachunków)")
+                    print("=" * 60)
+                    serial = measure(lambda: render_views(views, max_workers=1), 1)
+                    parallel = measure(lambda: render_views(views), 1)
+                    print(f"Jeden proces:       {serial:8.0f} ms")
+                    print(f"Pula ({os.cpu_count()} CPU):{parallel:11.0f} ms")
+        finally:
+            os.chdir(cwd)
+            db.close()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
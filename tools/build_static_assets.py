@@ -0,0 +1,38 @@
+"""
+Budowanie zasobów statycznych stron (minifikacja, skróty treści w nazwach, .gz/.br).
+
+Aplikacja buduje zmienione strony przy starcie; narzędzie pozwala zbudować je
+wcześniej (np. przy wdrożeniu) i pokazuje rozmiary plików.
+
+Użycie:
+    python tools/build_static_assets.py [--force]
+"""
+
+import sys
+from pathlib import Path
+
+# Dodaj główny katalog projektu do ścieżki
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.config import settings
+from app.core.static_assets import BUILD_DIR_NAME, build_static_assets
+
+
+def main():
+    static_dir = project_root / settings.static_dir
+    built = build_static_assets(static_dir, force="--force" in sys.argv[1:])
+    if not built:
+        print("[INFO] Zasoby statyczne są aktualne")
+        return
+
+    build_dir = static_dir / BUILD_DIR_NAME
+    for page, files in built.items():
+        source_size = (static_dir / page).stat().st_size
+        print(f"[OK] {page} ({source_size / 1024:.1f} KB źródła)")
+        for name in files:
+            print(f"    {name:45} {(build_dir / name).stat().st_size / 1024:8.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
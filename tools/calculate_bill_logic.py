@@ -30,6 +30,7 @@ from app.models.electricity_invoice import (
 )
 from app.models.electricity import ElectricityReading
 from app.services.electricity.calculator import calculate_all_usage, get_previous_reading
+from app.services.electricity.tariff_timeline import build_distribution_periods, group_energy_sales
 
 
 def get_invoice_by_number(db: Session, invoice_number: str) -> Optional[ElectricityInvoice]:
@@ -187,10 +188,9 @@ def get_distribution_periods(
     """
     II. Wyłaniamy okresy z "Rozliczenie usługa dystrybucji".
     
-    Pobieramy dane z electricity_invoice_oplaty_dystrybucyjne i electricity_invoice_sprzedaz_energii.
+    Okresy i ceny pochodzą z build_distribution_periods (ta sama logika co w rozliczeniu
+    rachunków); dodatkowo podajemy ilości kWh ze sprzedaży energii dla każdego okresu.
     """
-    periods = []
-    
     # Pobieramy opłaty dystrybucyjne, sortowane po dacie
     oplaty = db.query(ElectricityInvoiceOplataDystrybucyjna).filter(
         ElectricityInvoiceOplataDystrybucyjna.invoice_id == invoice.id
@@ -201,255 +201,14 @@ def get_distribution_periods(
         ElectricityInvoiceSprzedazEnergii.invoice_id == invoice.id
     ).order_by(ElectricityInvoiceSprzedazEnergii.data).all()
     
-    if not oplaty:
-        return periods
-    
-    # Okres rozliczeniowy faktury
-    period_start_year = invoice.data_poczatku_okresu.year
-    period_start = date(period_start_year, 11, 1)
-    period_end = date(period_start_year + 1, 10, 31)
+    periods = build_distribution_periods(invoice.data_poczatku_okresu, invoice.typ_taryfy, oplaty, sprzedaz)
+    sprzedaz_grouped = group_energy_sales(invoice.typ_taryfy, sprzedaz)
     
-    # Grupujemy opłaty po datach (okresach)
-    unique_dates = sorted(set(o.data for o in oplaty))
-    
-    # Sprzedaż energii ma data = None, więc dopasowujemy po kolejności
-    # Grupujemy sprzedaż po kolejności - para dzienna+nocna lub całodobowa
-    sprzedaz_grouped = []
-    if invoice.typ_taryfy == "DWUTARYFOWA":
-        # Dla dwutaryfowej: pary dzienna+nocna
-        i = 0
-        while i < len(sprzedaz):
-            dzienna = None
-            nocna = None
-            if i < len(sprzedaz) and sprzedaz[i].strefa == "DZIENNA":
-                dzienna = sprzedaz[i]
-                i += 1
-            if i < len(sprzedaz) and sprzedaz[i].strefa == "NOCNA":
-                nocna = sprzedaz[i]
-                i += 1
-            if dzienna or nocna:
-                sprzedaz_grouped.append({"dzienna": dzienna, "nocna": nocna})
-    else:
-        # Dla całodobowej: pojedyncze pozycje
-        for s in sprzedaz:
-            sprzedaz_grouped.append({"calodobowa": s})
-    
-    current_start = period_start
-    
-    for i, dist_date in enumerate(unique_dates):
-        # Okres dystrybucyjny kończy się w dacie z opłat
-        dist_period_end = dist_date
-        
-        # Pobieramy sprzedaż energii dla tego okresu (po kolejności)
+    for i, period in enumerate(periods):
         sprzedaz_period = sprzedaz_grouped[i] if i < len(sprzedaz_grouped) else {}
-        
-        # Pobieramy opłaty dla tego okresu
-        oplaty_period = [o for o in oplaty if o.data == dist_date]
-        
-        # Ilość kWh z sprzedaży energii
-        dzienna_sprzedaz = sprzedaz_period.get("dzienna")
-        nocna_sprzedaz = sprzedaz_period.get("nocna")
-        calodobowa_sprzedaz = sprzedaz_period.get("calodobowa")
-        
-        ilosc_kwh_dzienna = dzienna_sprzedaz.ilosc_kwh if dzienna_sprzedaz else 0
-        ilosc_kwh_nocna = nocna_sprzedaz.ilosc_kwh if nocna_sprzedaz else 0
-        ilosc_kwh_calodobowa = calodobowa_sprzedaz.ilosc_kwh if calodobowa_sprzedaz else 0
-        
-        # Ceny za 1kWh z sprzedaży energii
-        cena_dzienna = None
-        cena_nocna = None
-        cena_calodobowa = None
-        
-        # Maksymalna rozsądna cena za 1 kWh (w zł) - jeśli większa, to prawdopodobnie błąd w danych
-        MAX_REASONABLE_PRICE_PER_KWH = 5.0
-        
-        if sprzedaz_period.get("dzienna") and sprzedaz_period["dzienna"].ilosc_kwh > 0:
-            cena_raw = float(sprzedaz_period["dzienna"].cena_za_kwh)
-            # Walidacja: jeśli cena jest zbyt wysoka, może być błąd w danych
-            # Sprawdzamy też, czy może być to całkowita kwota zamiast ceny za kWh
-            if cena_raw > MAX_REASONABLE_PRICE_PER_KWH:
-                # Może być to całkowita kwota - sprawdźmy, czy należność / ilość daje rozsądną cenę
-                naleznosc = float(sprzedaz_period["dzienna"].naleznosc)
-                ilosc = float(sprzedaz_period["dzienna"].ilosc_kwh)
-                if ilosc > 0:
-                    cena_z_naleznosci = naleznosc / ilosc
-                    if cena_z_naleznosci <= MAX_REASONABLE_PRICE_PER_KWH:
-                        # Użyj ceny obliczonej z należności
-                        cena_dzienna = cena_z_naleznosci
-                        print(f"UWAGA: Cena dzienna {cena_raw} za kWh jest zbyt wysoka. Używam ceny z należności: {cena_z_naleznosci}")
-                    else:
-                        # Użyj wartości z bazy, ale z ostrzeżeniem
-                        cena_dzienna = cena_raw
-                        print(f"UWAGA: Cena dzienna {cena_raw} za kWh jest bardzo wysoka - możliwy błąd w danych!")
-                else:
-                    cena_dzienna = cena_raw
-            else:
-                cena_dzienna = cena_raw
-                
-        if sprzedaz_period.get("nocna") and sprzedaz_period["nocna"].ilosc_kwh > 0:
-            cena_raw = float(sprzedaz_period["nocna"].cena_za_kwh)
-            if cena_raw > MAX_REASONABLE_PRICE_PER_KWH:
-                naleznosc = float(sprzedaz_period["nocna"].naleznosc)
-                ilosc = float(sprzedaz_period["nocna"].ilosc_kwh)
-                if ilosc > 0:
-                    cena_z_naleznosci = naleznosc / ilosc
-                    if cena_z_naleznosci <= MAX_REASONABLE_PRICE_PER_KWH:
-                        cena_nocna = cena_z_naleznosci
-                        print(f"UWAGA: Cena nocna {cena_raw} za kWh jest zbyt wysoka. Używam ceny z należności: {cena_z_naleznosci}")
-                    else:
-                        cena_nocna = cena_raw
-                        print(f"UWAGA: Cena nocna {cena_raw} za kWh jest bardzo wysoka - możliwy błąd w danych!")
-                else:
-                    cena_nocna = cena_raw
-            else:
-                cena_nocna = cena_raw
-                
-        if sprzedaz_period.get("calodobowa") and sprzedaz_period["calodobowa"].ilosc_kwh > 0:
-            cena_raw = float(sprzedaz_period["calodobowa"].cena_za_kwh)
-            if cena_raw > MAX_REASONABLE_PRICE_PER_KWH:
-                naleznosc = float(sprzedaz_period["calodobowa"].naleznosc)
-                ilosc = float(sprzedaz_period["calodobowa"].ilosc_kwh)
-                if ilosc > 0:
-                    cena_z_naleznosci = naleznosc / ilosc
-                    if cena_z_naleznosci <= MAX_REASONABLE_PRICE_PER_KWH:
-                        cena_calodobowa = cena_z_naleznosci
-                        print(f"UWAGA: Cena całodobowa {cena_raw} za kWh jest zbyt wysoka. Używam ceny z należności: {cena_z_naleznosci}")
-                    else:
-                        cena_calodobowa = cena_raw
-                        print(f"UWAGA: Cena całodobowa {cena_raw} za kWh jest bardzo wysoka - możliwy błąd w danych!")
-                else:
-                    cena_calodobowa = cena_raw
-            else:
-                cena_calodobowa = cena_raw
-        
-        # Opłaty dystrybucyjne
-        oplata_jakosciowa_dzienna = None
-        oplata_jakosciowa_nocna = None
-        oplata_zmienna_sieciowa_dzienna = None
-        oplata_zmienna_sieciowa_nocna = None
-        oplata_oze_dzienna = None
-        oplata_oze_nocna = None
-        oplata_kogeneracyjna_dzienna = None
-        oplata_kogeneracyjna_nocna = None
-        
-        oplata_stala_sieciowa = None
-        oplata_przejściowa = None
-        oplata_abonamentowa = None
-        oplata_mocowa = None
-        
-        for o in oplaty_period:
-            typ_oplaty_upper = o.typ_oplaty.upper()
-            if o.jednostka == "kWh":
-                if "JAKOŚCIOWA" in typ_oplaty_upper or "JAKOSCIOWA" in typ_oplaty_upper:
-                    if o.strefa == "DZIENNA":
-                        oplata_jakosciowa_dzienna = float(o.cena)
-                    elif o.strefa == "NOCNA":
-                        oplata_jakosciowa_nocna = float(o.cena)
-                elif "ZMIENNA SIECIOWA" in typ_oplaty_upper:
-                    if o.strefa == "DZIENNA":
-                        oplata_zmienna_sieciowa_dzienna = float(o.cena)
-                    elif o.strefa == "NOCNA":
-                        oplata_zmienna_sieciowa_nocna = float(o.cena)
-                elif "OZE" in typ_oplaty_upper:
-                    if o.strefa == "DZIENNA":
-                        oplata_oze_dzienna = float(o.cena)
-                    elif o.strefa == "NOCNA":
-                        oplata_oze_nocna = float(o.cena)
-                elif "KOGENERACYJNA" in typ_oplaty_upper or "KOGENERACYJNA" in typ_oplaty_upper:
-                    if o.strefa == "DZIENNA":
-                        oplata_kogeneracyjna_dzienna = float(o.cena)
-                    elif o.strefa == "NOCNA":
-                        oplata_kogeneracyjna_nocna = float(o.cena)
-            elif o.jednostka == "zł/mc":
-                if "STAŁA SIECIOWA" in typ_oplaty_upper or "STALA SIECIOWA" in typ_oplaty_upper:
-                    oplata_stala_sieciowa = float(o.cena)
-                elif "PRZEJŚCIOWA" in typ_oplaty_upper or "PRZEJSCIOWA" in typ_oplaty_upper:
-                    oplata_przejściowa = float(o.cena)
-                elif "ABONAMENTOWA" in typ_oplaty_upper:
-                    oplata_abonamentowa = float(o.cena)
-                elif "MOCOWA" in typ_oplaty_upper:
-                    oplata_mocowa = float(o.cena)
-        
-        # Obliczamy cenę za 1kWh dla okresu
-        cena_1kwh_dzienna = None
-        cena_1kwh_nocna = None
-        cena_1kwh_calodobowa = None
-        
-        if cena_dzienna is not None:
-            cena_1kwh_dzienna = cena_dzienna
-            if oplata_jakosciowa_dzienna is not None:
-                cena_1kwh_dzienna += oplata_jakosciowa_dzienna
-            if oplata_zmienna_sieciowa_dzienna is not None:
-                cena_1kwh_dzienna += oplata_zmienna_sieciowa_dzienna
-            if oplata_oze_dzienna is not None:
-                cena_1kwh_dzienna += oplata_oze_dzienna
-            if oplata_kogeneracyjna_dzienna is not None:
-                cena_1kwh_dzienna += oplata_kogeneracyjna_dzienna
-            # Zaokrąglenie do 4 miejsc po przecinku
-            cena_1kwh_dzienna = round(cena_1kwh_dzienna, 4)
-        
-        if cena_nocna is not None:
-            cena_1kwh_nocna = cena_nocna
-            if oplata_jakosciowa_nocna is not None:
-                cena_1kwh_nocna += oplata_jakosciowa_nocna
-            if oplata_zmienna_sieciowa_nocna is not None:
-                cena_1kwh_nocna += oplata_zmienna_sieciowa_nocna
-            if oplata_oze_nocna is not None:
-                cena_1kwh_nocna += oplata_oze_nocna
-            if oplata_kogeneracyjna_nocna is not None:
-                cena_1kwh_nocna += oplata_kogeneracyjna_nocna
-            # Zaokrąglenie do 4 miejsc po przecinku
-            cena_1kwh_nocna = round(cena_1kwh_nocna, 4)
-        
-        if cena_calodobowa is not None:
-            cena_1kwh_calodobowa = cena_calodobowa
-            # Dla całodobowej opłaty mogą być bez strefy
-            for o in oplaty_period:
-                if o.jednostka == "kWh" and (o.strefa is None or o.strefa == "CAŁODOBOWA"):
-                    if o.typ_oplaty in ["OPŁATA JAKOŚCIOWA", "OPŁATA ZMIENNA SIECIOWA", 
-                                        "OPŁATA OZE", "OPŁATA KOGENERACYJNA"]:
-                        cena_1kwh_calodobowa += float(o.cena)
-        
-        # Suma opłat stałych
-        suma_oplat_stalych = 0
-        if oplata_stala_sieciowa is not None:
-            suma_oplat_stalych += oplata_stala_sieciowa
-        if oplata_przejściowa is not None:
-            suma_oplat_stalych += oplata_przejściowa
-        if oplata_abonamentowa is not None:
-            suma_oplat_stalych += oplata_abonamentowa
-        if oplata_mocowa is not None:
-            suma_oplat_stalych += oplata_mocowa
-        
-        periods.append({
-            "okres": f"OKRES_DYSTRYBUCYJNY_{i+1}",
-            "od": current_start,
-            "do": dist_period_end,
-            "ilosc_kwh_dzienna": ilosc_kwh_dzienna,
-            "ilosc_kwh_nocna": ilosc_kwh_nocna,
-            "ilosc_kwh_calodobowa": ilosc_kwh_calodobowa,
-            "cena_dzienna": cena_dzienna,
-            "cena_nocna": cena_nocna,
-            "cena_calodobowa": cena_calodobowa,
-            "oplata_jakosciowa_dzienna": oplata_jakosciowa_dzienna,
-            "oplata_jakosciowa_nocna": oplata_jakosciowa_nocna,
-            "oplata_zmienna_sieciowa_dzienna": oplata_zmienna_sieciowa_dzienna,
-            "oplata_zmienna_sieciowa_nocna": oplata_zmienna_sieciowa_nocna,
-            "oplata_oze_dzienna": oplata_oze_dzienna,
-            "oplata_oze_nocna": oplata_oze_nocna,
-            "oplata_kogeneracyjna_dzienna": oplata_kogeneracyjna_dzienna,
-            "oplata_kogeneracyjna_nocna": oplata_kogeneracyjna_nocna,
-            "cena_1kwh_dzienna": cena_1kwh_dzienna,
-            "cena_1kwh_nocna": cena_1kwh_nocna,
-            "cena_1kwh_calodobowa": cena_1kwh_calodobowa,
-            "oplata_stala_sieciowa": oplata_stala_sieciowa,
-            "oplata_przejściowa": oplata_przejściowa,
-            "oplata_abonamentowa": oplata_abonamentowa,
-            "oplata_mocowa": oplata_mocowa,
-            "suma_oplat_stalych": suma_oplat_stalych
-        })
-        
-        current_start = dist_period_end + timedelta(days=1)
+        for strefa in ("dzienna", "nocna", "calodobowa"):
+            pozycja = sprzedaz_period.get(strefa)
+            period[f"ilosc_kwh_{strefa}"] = pozycja.ilosc_kwh if pozycja else 0
     
     return periods
 
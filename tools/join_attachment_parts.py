@@ -0,0 +1,87 @@
+"""
+Składanie załącznika email podzielonego na części (nazwa.part001, nazwa.part002, ...).
+
+Załączniki większe niż limit rozmiaru wiadomości serwera SMTP (smtp_max_message_size)
+są wysyłane w kilku wiadomościach - patrz app.core.mime_stream. Narzędzie łączy
+części w kolejności numerów i opcjonalnie sprawdza SHA-256 podany w treści wiadomości.
+Złożony backup (.encrypted) odszyfrowuje się funkcją deszyfrowania w aplikacji.
+
+Użycie:
+    python tools/join_attachment_parts.py backup.db.encrypted.part001 --sha256 <skrót>
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+# Dodaj główny katalog projektu do ścieżki
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.mime_stream import CHUNK_SIZE, file_sha256
+
+PART_PATTERN = re.compile(r"^(?P<name>.+)\.part(?P<index>\d{3,})$")
+
+
+def find_parts(first_part: Path) -> list:
+    """Zwraca wszystkie części załącznika (z katalogu pierwszej części) posortowane po numerze."""
+    match = PART_PATTERN.match(first_part.name)
+    if not match:
+        raise ValueError(f"Nazwa pliku nie jest częścią załącznika (*.partNNN): {first_part.name}")
+    name = match.group("name")
+    parts = {}
+    for path in first_part.parent.iterdir():
+        part = PART_PATTERN.match(path.name)
+        if part and part.group("name") == name:
+            parts[int(part.group("index"))] = path
+    missing = [index for index in range(1, max(parts) + 1) if index not in parts]
+    if missing:
+        raise ValueError(f"Brak części: {', '.join(f'{index:03d}' for index in missing)}")
+    return [parts[index] for index in sorted(parts)]
+
+
+def join_parts(parts: list, output: Path) -> None:
+    """Łączy części w jeden plik (porcjami)."""
+    with open(output, "wb") as target:
+        for part in parts:
+            with open(part, "rb") as source:
+                while chunk := source.read(CHUNK_SIZE):
+                    target.write(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Składanie załącznika email podzielonego na części",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Przykłady użycia:
+  python tools/join_attachment_parts.py pobrane/backup.db.encrypted.part001
+  python tools/join_attachment_parts.py backup.db.encrypted.part001 --sha256 3f2a... -o backup.db.encrypted
+        """
+    )
+    parser.add_argument("first_part", help="Dowolna część załącznika (pozostałe muszą być w tym samym katalogu)")
+    parser.add_argument("-o", "--output", help="Plik wynikowy (domyślnie nazwa bez .partNNN)")
+    parser.add_argument("--sha256", help="Oczekiwany SHA-256 całego załącznika (z treści wiadomości)")
+    args = parser.parse_args()
+
+    first_part = Path(args.first_part)
+    try:
+        parts = find_parts(first_part)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    output = Path(args.output) if args.output else first_part.parent / PART_PATTERN.match(first_part.name).group("name")
+    join_parts(parts, output)
+    print(f"[OK] Połączono {len(parts)} części -> {output}")
+
+    if args.sha256:
+        if file_sha256(str(output)) != args.sha256.lower():
+            print("[ERROR] SHA-256 złożonego pliku nie zgadza się z podanym - część mogła zostać uszkodzona")
+            sys.exit(1)
+        print("[OK] SHA-256 zgodny")
+
+
+if __name__ == "__main__":
+    main()
@@ -348,7 +348,7 @@ def print_period_calculations(db: Session, period: str):
             result_overlapping = manager.calculate_bill_for_period_with_overlapping(
                 tenant_start,
                 tenant_end,
-                distribution_periods,
+                manager.get_tariff_timeline(db, invoice),
                 detailed_costs['usage_kwh_dzienna'] or 0.0,
                 detailed_costs['usage_kwh_nocna'] or 0.0,
                 usage_kwh_calodobowa
@@ -109,7 +109,7 @@ def test_period_logic():
             result = manager.calculate_bill_for_period_with_overlapping(
                 start_date,
                 end_date,
-                distribution_periods,
+                manager.get_tariff_timeline(db, test_invoice),
                 usage_dzienna,
                 usage_nocna
             )
@@ -68,7 +68,7 @@ def test_overlapping_two_periods():
         result = manager.calculate_bill_for_period_with_overlapping(
             tenant_start,
             tenant_end,
-            distribution_periods,
+            manager.get_tariff_timeline(db, invoice),
             usage_dzienna,
             usage_nocna
         )
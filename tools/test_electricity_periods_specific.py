@@ -79,7 +79,7 @@ def test_specific_invoice():
             result = manager.calculate_bill_for_period_with_overlapping(
                 tenant_start,
                 tenant_end,
-                distribution_periods,
+                manager.get_tariff_timeline(db, invoice),
                 usage_dzienna,
                 usage_nocna
             )
@@ -182,7 +182,7 @@ def verify_invoice_calculation(invoice_number: str, periods: list[str]):
                     result = manager.calculate_bill_for_period_with_overlapping(
                         tenant_period_start,
                         tenant_period_end,
-                        distribution_periods,
+                        manager.get_tariff_timeline(db, invoice),
                         local_usage_dzienna or 0.0,
                         local_usage_nocna or 0.0,
                         usage_kwh_calodobowa